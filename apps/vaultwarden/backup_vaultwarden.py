@@ -6,6 +6,21 @@ Configuração via CLI ou variáveis de ambiente:
 - VAULTWARDEN_BACKUP_TARGET: destino base dos snapshots (default: /srv/homelab/backups/vaultwarden)
 - VAULTWARDEN_BACKUP_LOG: arquivo de log (default: <TARGET>/vaultwarden_backup.log)
 - VAULTWARDEN_BACKUP_RETENTION: quantidade de snapshots a manter (default: 7)
+- VAULTWARDEN_BACKUP_ENGINE: rsync (hardlinks), native (hardlinks sem rsync) ou chunkstore (dedup por chunks)
+  (default: rsync)
+- VAULTWARDEN_BACKUP_JOURNAL: 1 para usar o journal de estado dos arquivos (no-op/--files-from) (default: 0)
+- VAULTWARDEN_BACKUP_CATALOG: 0 desliga o registro no catálogo SQLite (default: 1)
+- VAULTWARDEN_BACKUP_LINK_GENERATIONS: snapshots usados como --link-dest, até 20 (default: 1)
+- VAULTWARDEN_BACKUP_USAGE: 0 desliga o índice de uso de disco por snapshot (default: 1)
+- VAULTWARDEN_BACKUP_CACHE_FRIENDLY: 1 para liberar do page cache o que o backup tocou (default: 0)
+- VAULTWARDEN_BACKUP_RESUME: 0 descarta snapshots interrompidos em vez de retomá-los (default: 1)
+- VAULTWARDEN_BACKUP_EXCLUDE_PROFILES: perfis de exclusão separados por vírgula, ex.: icon_cache (default: nenhum)
+- VAULTWARDEN_BACKUP_EXCLUDE_FILE: JSON com perfis próprios/substitutos (default: só os embutidos)
+- VAULTWARDEN_BACKUP_REPLICAS: destinos extras para cada snapshot, ex.: /mnt/usb=20,/mnt/nas (MiB/s; default: nenhum)
+
+O banco `db.sqlite3` não é copiado pelo rsync (nem seus `-wal`/`-shm`): um
+estágio próprio usa a API de backup online do SQLite, em passos de páginas,
+para gravar uma cópia consistente no snapshot sem travar o servidor.
 
 Uso típico:
     python apps/vaultwarden/backup_vaultwarden.py --dry-run
@@ -14,18 +29,53 @@ from __future__ import annotations
 
 import argparse
 import datetime as dt
+import hashlib
 import json
 import logging
 import os
+import sqlite3
 import subprocess
 import sys
-import shutil
+import time
+from contextlib import closing
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Any, Iterable, List, Optional, Sequence
+
+if __package__ in (None, ""):
+    # Execução direta como script: expõe a raiz do repositório para importar `core.backup`.
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from core.backup import (
+    catalog,
+    chunkstore,
+    export,
+    journal,
+    linkdest,
+    native,
+    offsite,
+    pagecache,
+    profiles,
+    pruning,
+    replicate,
+    restore,
+    rsync_progress,
+    staging,
+    usage,
+    verify,
+)
 
 DEFAULT_SOURCE_PATH = Path("/srv/homelab/vaultwarden/data")
 DEFAULT_TARGET_PATH = Path("/srv/homelab/backups/vaultwarden")
 DEFAULT_RETENTION_VALUE = 7
+ENGINE_RSYNC = "rsync"
+ENGINE_CHUNKSTORE = "chunkstore"
+ENGINE_NATIVE = "native"
+ENGINES = (ENGINE_RSYNC, ENGINE_CHUNKSTORE, ENGINE_NATIVE)
+SQLITE_DB_NAME = "db.sqlite3"
+# Arquivos do banco vivo que o rsync nunca deve copiar (o estágio SQLite grava a cópia consistente).
+SQLITE_EXCLUDES = tuple(f"/{SQLITE_DB_NAME}{suffix}" for suffix in ("", "-wal", "-shm", "-journal"))
+DEFAULT_SQLITE_PAGES = 1024
+DEFAULT_SQLITE_SLEEP = 0.05
 
 
 def _env_path(var_name: str, fallback: Path) -> Path:
@@ -41,41 +91,131 @@ def build_rsync_command(
     snapshot_dir: Path,
     link_dest: Optional[Path],
     dry_run: bool = False,
+    files_from: Optional[Path] = None,
+    excludes: Sequence[str] = (),
+    extra_link_dests: Sequence[Path] = (),
 ) -> List[str]:
-    """Monta comando rsync idempotente para snapshots com hardlinks."""
+    """Monta comando rsync idempotente para snapshots com hardlinks.
+
+    `excludes` recebe padrões rsync ancorados (ex.: SQLITE_EXCLUDES).
+    `extra_link_dests` acrescenta gerações mais antigas como --link-dest, consultadas em ordem.
+
+    `files_from` restringe a cópia à lista (NUL-separada) gerada pelo journal;
+    nesse modo --ignore-times garante inode novo e o clone em hardlinks do
+    snapshot anterior nunca é alterado no lugar.
+    """
 
     cmd: List[str] = [
         "rsync",
         "-a",
         "--delete",
         "--numeric-ids",
+        f"--partial-dir={staging.PARTIAL_DIRNAME}",
         "--info=progress2",
     ]
 
-    if link_dest:
-        cmd.extend(["--link-dest", str(link_dest.resolve())])
+    for base in ([link_dest] if link_dest else []) + list(extra_link_dests):
+        cmd.extend(["--link-dest", str(base.resolve())])
 
     if dry_run:
         cmd.append("--dry-run")
 
+    if files_from:
+        cmd.extend([f"--files-from={files_from}", "--from0", "--ignore-times"])
+
+    for pattern in excludes:
+        cmd.append(f"--exclude={pattern}")
+
     cmd.extend([f"{source.resolve()}/", f"{snapshot_dir.resolve()}/"])
     return cmd
 
 
 def prune_snapshots(snapshots_dir: Path, keep: int) -> list[Path]:
-    """Remove snapshots mais antigos que o limite desejado."""
+    """Remove snapshots mais antigos que o limite desejado.
+
+    Os expirados são apenas renomeados para `<target>/trash/`; a remoção física
+    fica para `_purge_trash`, depois do status gravado.
+    """
 
     snapshots = sorted([p for p in snapshots_dir.iterdir() if p.is_dir()])
     if len(snapshots) <= keep:
         return []
 
     to_remove = snapshots[:-keep]
-    for snap in to_remove:
-        shutil.rmtree(snap, ignore_errors=True)
+    pruning.move_to_trash(to_remove, snapshots_dir.parent / pruning.TRASH_DIRNAME)
     return to_remove
 
 
-def _write_status(target_dir: Path, success: bool, message: str, snapshot: Optional[Path]) -> None:
+def _update_catalog(target: Path, snapshot_dir: Path, removed: list[Path]) -> Optional[dict[str, int]]:
+    """Registra o snapshot novo e esquece os expirados; falhas não derrubam o backup."""
+
+    db_path = target / catalog.CATALOG_NAME
+    try:
+        summary = catalog.record_snapshot(db_path, snapshot_dir)
+        catalog.forget_snapshots(db_path, [snap.name for snap in removed])
+    except (sqlite3.Error, OSError) as exc:
+        logging.warning("Falha ao atualizar catálogo %s: %s", db_path, exc)
+        return None
+    logging.info("Catálogo atualizado: %s arquivos, %s bytes", summary.files, summary.bytes)
+    return {"files": summary.files, "bytes": summary.bytes}
+
+
+def _purge_trash(target: Path, workers: int, rate: float) -> Optional[dict[str, int]]:
+    """Apaga a lixeira depois do status gravado; retorna estatísticas se havia algo a apagar."""
+
+    stats = pruning.purge_trash(target / pruning.TRASH_DIRNAME, workers=workers, rate=rate)
+    if not stats.entries:
+        return None
+    logging.info(
+        "Lixeira limpa: %s snapshots, %s entradas, %s inodes e %s bytes liberados (%s erros)",
+        stats.snapshots,
+        stats.entries,
+        stats.inodes,
+        stats.bytes,
+        stats.errors,
+    )
+    return stats.as_dict()
+
+
+def _collect_chunk_garbage(target: Path, snapshots_dir: Path) -> None:
+    """Após a retenção, remove chunks que nenhum manifesto restante referencia."""
+
+    store_dir = target / chunkstore.CHUNKS_DIRNAME
+    if not store_dir.is_dir():
+        return
+    removed, freed = chunkstore.collect_garbage(store_dir, snapshots_dir)
+    logging.info("Chunks sem referência removidos: %s (%s bytes liberados)", removed, freed)
+
+
+def _update_usage(target: Path, retention: int) -> Optional[dict[str, int]]:
+    """Indexa o snapshot novo no relatório de uso; falhas não derrubam o backup."""
+
+    try:
+        report = usage.update(target, retention)
+    except (OSError, ValueError) as exc:
+        logging.warning("Falha ao atualizar relatório de uso: %s", exc)
+        return None
+    latest = report.snapshots[-1] if report.snapshots else None
+    info = {
+        "total_bytes": report.total_bytes,
+        "latest_unique_bytes": latest.unique_bytes if latest else 0,
+        "next_prune_frees_bytes": report.freed_by_pruning[0] if report.freed_by_pruning else 0,
+    }
+    logging.info(
+        "Uso em disco: %s bytes no total, %s exclusivos do snapshot novo",
+        info["total_bytes"],
+        info["latest_unique_bytes"],
+    )
+    return info
+
+
+def _write_status(
+    target_dir: Path,
+    success: bool,
+    message: str,
+    snapshot: Optional[Path],
+    extra: Optional[dict[str, Any]] = None,
+) -> None:
     status_file = target_dir / "last_run.json"
     payload = {
         "timestamp": dt.datetime.now().isoformat(),
@@ -83,6 +223,8 @@ def _write_status(target_dir: Path, success: bool, message: str, snapshot: Optio
         "message": message,
         "snapshot": str(snapshot) if snapshot else None,
     }
+    if extra:
+        payload.update(extra)
     status_file.write_text(json.dumps(payload, indent=2), encoding="utf-8")
 
 
@@ -113,10 +255,286 @@ def _latest_snapshot_link(target: Path) -> Optional[Path]:
 
 
 def _update_latest_symlink(target: Path, snapshot_dir: Path) -> None:
-    latest = target / "latest"
-    if latest.exists() or latest.is_symlink():
-        latest.unlink()
-    latest.symlink_to(snapshot_dir)
+    staging.point_latest(target, snapshot_dir)
+
+
+def _run_rsync(
+    cmd: List[str],
+    reporter: Optional[rsync_progress.ProgressReporter] = None,
+    label: str = "rsync",
+    cache_friendly: bool = False,
+) -> int:
+    if cache_friendly:
+        cmd = pagecache.wrap_command(cmd)
+    return rsync_progress.stream_rsync(cmd, reporter=reporter, label=label)
+
+
+def _run_files_from(
+    source: Path,
+    target: Path,
+    snapshot_dir: Path,
+    previous: Path,
+    diff: journal.JournalDiff,
+    reporter: Optional[rsync_progress.ProgressReporter] = None,
+    excludes: Sequence[str] = (),
+    cache_friendly: bool = False,
+) -> int:
+    """Clona o snapshot anterior em hardlinks e copia só o que o journal marcou como alterado."""
+
+    try:
+        journal.clone_snapshot(previous, snapshot_dir)
+    except subprocess.CalledProcessError as exc:
+        logging.error("Falha ao clonar snapshot anterior: %s", exc)
+        return exc.returncode or 1
+    journal.remove_deleted(snapshot_dir, diff.deleted)
+    if not diff.changed:
+        return 0
+    files_from = journal.write_files_from(target / ".files-from", diff.changed)
+    try:
+        cmd = build_rsync_command(source, snapshot_dir, None, files_from=files_from, excludes=excludes)
+        return _run_rsync(cmd, reporter, cache_friendly=cache_friendly)
+    finally:
+        files_from.unlink(missing_ok=True)
+
+
+def backup_sqlite_db(
+    source_db: Path,
+    dest_db: Path,
+    pages: int = DEFAULT_SQLITE_PAGES,
+    sleep: float = DEFAULT_SQLITE_SLEEP,
+) -> dict[str, Any]:
+    """Copia o banco vivo com a API de backup online do SQLite.
+
+    A cópia anda `pages` páginas por passo e dorme `sleep` segundos entre passos,
+    liberando o lock para o Vaultwarden atender requisições. Grava em arquivo
+    temporário e renomeia no fim, então o snapshot nunca tem um banco pela metade.
+    Retorna páginas copiadas, passos e duração, para medir o impacto no servidor.
+    """
+
+    progress: dict[str, int] = {"steps": 0, "pages": 0}
+
+    def _on_progress(status: int, remaining: int, total: int) -> None:
+        progress["steps"] += 1
+        progress["pages"] = total
+
+    tmp_db = dest_db.with_name(dest_db.name + ".tmp")
+    tmp_db.unlink(missing_ok=True)
+    started = time.monotonic()
+    with closing(sqlite3.connect(source_db, timeout=30)) as src:
+        with closing(sqlite3.connect(tmp_db)) as dst:
+            src.backup(dst, pages=pages, progress=_on_progress, sleep=sleep)
+            # Cópia autocontida: sem WAL no snapshot (o Vaultwarden reativa WAL ao abrir após um restore).
+            dst.execute("PRAGMA journal_mode=DELETE")
+    duration = time.monotonic() - started
+    source_stat = source_db.stat()
+    os.chmod(tmp_db, source_stat.st_mode & 0o7777)
+    if os.geteuid() == 0:
+        os.chown(tmp_db, source_stat.st_uid, source_stat.st_gid)
+    os.replace(tmp_db, dest_db)
+    return {"pages": progress["pages"], "steps": progress["steps"], "duration_s": round(duration, 3)}
+
+
+def _dedupe_against_previous(dest_db: Path, previous_db: Path) -> bool:
+    """Troca a cópia por hardlink da anterior quando o conteúdo é idêntico."""
+
+    if not previous_db.is_file() or previous_db.stat().st_size != dest_db.stat().st_size:
+        return False
+    if _sha256(previous_db) != _sha256(dest_db):
+        return False
+    tmp_link = dest_db.with_name(dest_db.name + ".link")
+    tmp_link.unlink(missing_ok=True)
+    os.link(previous_db, tmp_link)
+    os.replace(tmp_link, dest_db)
+    return True
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _run_sqlite_stage(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    pages: int,
+    sleep: float,
+) -> tuple[int, dict[str, Any]]:
+    source_db = source / SQLITE_DB_NAME
+    if not source_db.is_file():
+        logging.info("Banco %s não encontrado; estágio SQLite ignorado", source_db)
+        return 0, {}
+    try:
+        info = backup_sqlite_db(source_db, snapshot_dir / SQLITE_DB_NAME, pages=pages, sleep=sleep)
+        info["deduplicated"] = bool(link_dest) and _dedupe_against_previous(
+            snapshot_dir / SQLITE_DB_NAME, link_dest / SQLITE_DB_NAME
+        )
+    except (sqlite3.Error, OSError) as exc:
+        logging.error("Falha no backup online do SQLite: %s", exc)
+        return 1, {}
+    logging.info(
+        "SQLite: %s páginas em %s passos, %.2fs (hardlink com snapshot anterior: %s)",
+        info["pages"],
+        info["steps"],
+        info["duration_s"],
+        info["deduplicated"],
+    )
+    return 0, {"sqlite": info}
+
+
+def _measure_exclusions(source: Path, rules: Sequence[profiles.ExcludeRule]) -> profiles.ExclusionReport:
+    report = profiles.measure(source, rules)
+    for rule in report.rules:
+        logging.info(
+            "Exclusão [%s] %s: %s caminhos, %s arquivos, %s bytes pulados",
+            rule.profile,
+            rule.pattern,
+            rule.matches,
+            rule.files,
+            rule.bytes,
+        )
+    logging.info("Perfis de exclusão: %s arquivos e %s bytes fora do snapshot", report.files, report.bytes)
+    return report
+
+
+def _replicate(
+    snapshot_dir: Path, replicas: Sequence[replicate.ReplicaTarget], retention: int
+) -> list[dict[str, object]]:
+    results = replicate.replicate(snapshot_dir, replicas, retention)
+    for result in results:
+        if result.success:
+            logging.info(
+                "Réplica %s: %s (%s hardlinks, %s copiados, %s bytes em %.1fs)",
+                result.target,
+                result.message or "snapshot replicado",
+                result.linked,
+                result.copied,
+                result.bytes_copied,
+                result.duration_s,
+            )
+        else:
+            logging.error("Réplica %s falhou: %s", result.target, result.message)
+    return [result.as_dict() for result in results]
+
+
+def _log_page_cache(info: dict[str, Any]) -> None:
+    if "kept_ratio" in info:
+        logging.info(
+            "Page cache: %.0f%% do Active(file) preservado (%s arquivos liberados)",
+            info["kept_ratio"] * 100,
+            info["dropped"]["files"],
+        )
+
+
+def _run_native(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    dry_run: bool,
+    workers: int = native.DEFAULT_WORKERS,
+    extra_link_dests: Sequence[Path] = (),
+    excludes: Sequence[str] = (),
+    resume: bool = False,
+    dropper: Optional[pagecache.CacheDropper] = None,
+) -> tuple[int, dict[str, Any]]:
+    stats = native.copy_tree(
+        source,
+        snapshot_dir,
+        link_dest,
+        workers=workers,
+        excludes=excludes,
+        dry_run=dry_run,
+        extra_link_dests=extra_link_dests,
+        resume=resume,
+        dropper=dropper,
+    )
+    logging.info(
+        "Engine native: %s arquivos (%s hardlinks, %s copiados, %s retomados, %s bytes copiados)",
+        stats.files,
+        stats.linked,
+        stats.copied,
+        stats.resumed,
+        stats.bytes_copied,
+    )
+    for message in stats.messages:
+        logging.error("Falha ao copiar %s", message)
+    return native.returncode(stats), {"native": stats.as_dict()}
+
+
+def _measure_links(snapshot_dir: Path, previous: Optional[Path]) -> dict[str, object]:
+    report = linkdest.measure_links(snapshot_dir, previous)
+    logging.info(
+        "Hardlinks: %s bytes reaproveitados (%s de gerações antigas), %s bytes copiados (economia %.1f%%)",
+        report.bytes_linked,
+        report.bytes_linked_older,
+        report.bytes_copied,
+        report.savings_ratio * 100,
+    )
+    return report.as_dict()
+
+
+def _run_chunkstore(
+    source: Path,
+    target: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    dry_run: bool,
+    excludes: Sequence[str] = (),
+    sqlite_stage: bool = True,
+    sqlite_pages: int = DEFAULT_SQLITE_PAGES,
+    sqlite_sleep: float = DEFAULT_SQLITE_SLEEP,
+    dropper: Optional[pagecache.CacheDropper] = None,
+) -> tuple[int, dict[str, Any]]:
+    extra: dict[str, Any] = {}
+    substitutes: dict[str, Path] = {}
+    staged_db = snapshot_dir / f"{SQLITE_DB_NAME}.stage"
+    if sqlite_stage:
+        # Os arquivos vivos (db, -wal, -shm) nunca entram em chunks: no lugar do banco vai a cópia
+        # feita pela API de backup online, consistente mesmo com o Vaultwarden gravando.
+        excludes = [*(pattern.lstrip("/") for pattern in SQLITE_EXCLUDES), *excludes]
+        source_db = source / SQLITE_DB_NAME
+        if source_db.is_file() and not dry_run:
+            try:
+                extra["sqlite"] = backup_sqlite_db(source_db, staged_db, pages=sqlite_pages, sleep=sqlite_sleep)
+            except (sqlite3.Error, OSError) as exc:
+                logging.error("Falha no backup online do SQLite: %s", exc)
+                staged_db.unlink(missing_ok=True)
+                return 1, {}
+            substitutes[SQLITE_DB_NAME] = staged_db
+            logging.info(
+                "SQLite: %s páginas em %s passos, %.2fs (cópia para o chunkstore)",
+                extra["sqlite"]["pages"],
+                extra["sqlite"]["steps"],
+                extra["sqlite"]["duration_s"],
+            )
+    try:
+        stats = chunkstore.backup_tree(
+            source,
+            snapshot_dir,
+            target / chunkstore.CHUNKS_DIRNAME,
+            previous=link_dest,
+            dry_run=dry_run,
+            excludes=excludes,
+            substitutes=substitutes,
+            dropper=dropper,
+        )
+    except OSError as exc:
+        logging.error("Falha no chunkstore: %s", exc)
+        return 1, {}
+    finally:
+        staged_db.unlink(missing_ok=True)
+    logging.info(
+        "Chunkstore: %s arquivos (%s reaproveitados), %s chunks novos, %s bytes gravados",
+        stats.files,
+        stats.files_reused,
+        stats.chunks_new,
+        stats.bytes_stored,
+    )
+    extra["chunkstore"] = stats.as_dict()
+    return 0, extra
 
 
 def run_backup(
@@ -125,43 +543,193 @@ def run_backup(
     log_file: Path,
     retention: int,
     dry_run: bool = False,
+    engine: str = ENGINE_RSYNC,
+    use_journal: bool = False,
+    purge_workers: int = pruning.DEFAULT_PURGE_WORKERS,
+    purge_rate: float = 0.0,
+    use_catalog: bool = True,
+    sqlite_stage: bool = True,
+    sqlite_pages: int = DEFAULT_SQLITE_PAGES,
+    sqlite_sleep: float = DEFAULT_SQLITE_SLEEP,
+    cache_friendly: bool = False,
+    link_generations: int = 1,
+    use_usage: bool = True,
+    resume: bool = True,
+    exclude_rules: Sequence[profiles.ExcludeRule] = (),
+    replicas: Sequence[replicate.ReplicaTarget] = (),
 ) -> int:
     _configure_logging(log_file)
     snapshots_dir = _ensure_dirs(target)
-    snapshot_dir = snapshots_dir / _timestamp()
-
-    link_dest = _latest_snapshot_link(target)
-    rsync_cmd = build_rsync_command(source, snapshot_dir, link_dest, dry_run=dry_run)
-
-    logging.info("Iniciando backup do Vaultwarden")
-    logging.info("Origem: %s", source)
-    logging.info("Snapshot: %s", snapshot_dir)
-    if link_dest:
-        logging.info("Usando link-dest: %s", link_dest)
-
-    snapshot_dir.mkdir(parents=True, exist_ok=True)
-
-    result = subprocess.run(rsync_cmd, text=True, capture_output=True)
-    if result.stdout:
-        logging.info(result.stdout.strip())
-    if result.stderr:
-        logging.warning(result.stderr.strip())
-
-    if result.returncode != 0:
-        msg = f"Backup falhou com código {result.returncode}"
-        logging.error(msg)
-        _write_status(target, False, msg, snapshot_dir)
-        return result.returncode
-
-    _update_latest_symlink(target, snapshot_dir)
-    removed = prune_snapshots(snapshots_dir, keep=retention)
-    if removed:
-        logging.info("Snapshots antigos removidos: %s", ", ".join(str(r.name) for r in removed))
-
-    success_msg = "Backup concluído com sucesso"
-    logging.info(success_msg)
-    _write_status(target, True, success_msg, snapshot_dir)
-    return 0
+    try:
+        lock = staging.acquire_lock(target)
+    except staging.LockBusy as exc:
+        logging.error("Outro backup do Vaultwarden em andamento; execução abortada (%s)", exc)
+        return staging.LOCK_BUSY_CODE
+    with lock:
+        snapshot_dir, resumed = staging.prepare_snapshot(target, _timestamp(), resume=resume)
+        link_dest = _latest_snapshot_link(target)
+        excludes = (SQLITE_EXCLUDES if sqlite_stage else ()) + tuple(profiles.rsync_patterns(exclude_rules))
+        older_link_dests = linkdest.select_link_dests(snapshots_dir, link_dest, link_generations)[1:]
+        rsync_cmd = build_rsync_command(
+            source, snapshot_dir, link_dest, dry_run=dry_run, excludes=excludes, extra_link_dests=older_link_dests
+        )
+
+        logging.info("Iniciando backup do Vaultwarden")
+        logging.info("Origem: %s", source)
+        logging.info("Snapshot: %s", snapshot_dir)
+        if resumed:
+            logging.info("Retomando snapshot interrompido: %s", snapshot_dir.name)
+        if link_dest:
+            logging.info("Usando link-dest: %s", link_dest)
+        if older_link_dests:
+            logging.info("Gerações anteriores como link-dest: %s", ", ".join(p.name for p in older_link_dests))
+
+        extra: dict[str, Any] = {"engine": engine}
+        if resumed:
+            extra["resumed"] = True
+        scan: Optional[journal.JournalScan] = None
+        if use_journal:
+            scan = journal.scan(
+                source,
+                target / journal.JOURNAL_NAME,
+                snapshot_dir.name,
+                expected_snapshot=link_dest.name if link_dest else None,
+            )
+            diff = scan.diff
+            extra["journal"] = {"entries": diff.entries, "changed": len(diff.changed), "deleted": len(diff.deleted)}
+            # Um snapshot interrompido precisa ser concluído, mesmo sem alterações.
+            if diff.unchanged and not resumed:
+                scan.discard()
+                msg = "Nenhuma alteração desde o último snapshot; backup ignorado (no-op)"
+                logging.info(msg)
+                extra["noop"] = True
+                _write_status(target, True, msg, link_dest, extra)
+                _purge_trash(target, purge_workers, purge_rate)
+                return 0
+            logging.info(
+                "Journal: %s entradas, %s alteradas, %s removidas (comparável: %s)",
+                diff.entries,
+                len(diff.changed),
+                len(diff.deleted),
+                diff.comparable,
+            )
+
+        excluded_paths: list[str] = []
+        if exclude_rules:
+            exclusions = _measure_exclusions(source, exclude_rules)
+            excluded_paths = exclusions.paths
+            extra["exclusions"] = exclusions.as_dict()
+
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        reporter = rsync_progress.ProgressReporter(target / rsync_progress.PROGRESS_FILENAME)
+        cache_before = pagecache.sample() if cache_friendly else None
+        # Nas engines em Python o cache é liberado arquivo a arquivo; o rsync depende do nocache.
+        dropper = pagecache.CacheDropper() if cache_friendly and engine != ENGINE_RSYNC and not dry_run else None
+
+        if engine == ENGINE_CHUNKSTORE:
+            returncode, engine_extra = _run_chunkstore(
+                source,
+                target,
+                snapshot_dir,
+                link_dest,
+                dry_run,
+                excludes=excluded_paths,
+                sqlite_stage=sqlite_stage,
+                sqlite_pages=sqlite_pages,
+                sqlite_sleep=sqlite_sleep,
+                dropper=dropper,
+            )
+            extra.update(engine_extra)
+        elif engine == ENGINE_NATIVE:
+            returncode, engine_extra = _run_native(
+                source,
+                snapshot_dir,
+                link_dest,
+                dry_run,
+                # A native compara caminhos exatos: as regras dos perfis entram já resolvidas.
+                excludes=[*(SQLITE_EXCLUDES if sqlite_stage else ()), *excluded_paths],
+                extra_link_dests=older_link_dests,
+                resume=resumed,
+                dropper=dropper,
+            )
+            extra.update(engine_extra)
+        elif scan is not None and scan.diff.comparable and link_dest and not dry_run and not resumed:
+            extra["journal"]["mode"] = "files-from"
+            returncode = _run_files_from(
+                source, target, snapshot_dir, link_dest, scan.diff, reporter, excludes, cache_friendly=cache_friendly
+            )
+        else:
+            returncode = _run_rsync(rsync_cmd, reporter, cache_friendly=cache_friendly)
+        reporter.finish()
+
+        # Na chunkstore a cópia online do SQLite já foi feita dentro de _run_chunkstore.
+        if returncode == 0 and sqlite_stage and engine != ENGINE_CHUNKSTORE and not dry_run:
+            returncode, sqlite_extra = _run_sqlite_stage(source, snapshot_dir, link_dest, sqlite_pages, sqlite_sleep)
+            extra.update(sqlite_extra)
+
+        if cache_friendly and not dry_run:
+            # O banco SQLite é sempre regravado pelo estágio próprio, por fora da engine e do files-from.
+            files_from_mode = extra.get("journal", {}).get("mode") == "files-from"
+            changed: Optional[list[str]] = None
+            if files_from_mode and scan is not None:
+                changed = [*scan.diff.changed, SQLITE_DB_NAME]
+            elif engine == ENGINE_NATIVE:
+                changed = [SQLITE_DB_NAME] if sqlite_stage else []
+            extra["page_cache"] = pagecache.release(
+                cache_before, source, snapshot_dir, changed=changed, dropper=dropper
+            )
+            _log_page_cache(extra["page_cache"])
+
+        if returncode != 0:
+            msg = f"Backup falhou com código {returncode}"
+            logging.error(msg)
+            if scan is not None:
+                scan.discard()
+            if not dry_run:
+                logging.info("Snapshot incompleto mantido em %s para a próxima execução retomar", snapshot_dir)
+            _write_status(target, False, msg, snapshot_dir, extra)
+            return returncode
+
+        if scan is not None:
+            if dry_run:
+                scan.discard()
+            else:
+                scan.commit()
+        snapshot_dir = staging.promote(snapshot_dir, snapshots_dir)
+        # A medição percorre o snapshot inteiro; só se paga quando há gerações antigas a comparar.
+        if link_generations > 1 and engine != ENGINE_CHUNKSTORE and not dry_run:
+            extra["links"] = _measure_links(snapshot_dir, link_dest)
+        _update_latest_symlink(target, snapshot_dir)
+        removed = prune_snapshots(snapshots_dir, keep=retention)
+        if removed:
+            logging.info("Snapshots antigos removidos: %s", ", ".join(str(r.name) for r in removed))
+            verify.forget_snapshots(target / verify.VERIFY_DB_NAME, [r.name for r in removed])
+            _collect_chunk_garbage(target, snapshots_dir)
+        if use_catalog and not dry_run:
+            catalog_info = _update_catalog(target, snapshot_dir, removed)
+            if catalog_info:
+                extra["catalog"] = catalog_info
+        if use_usage and not dry_run:
+            usage_info = _update_usage(target, retention)
+            if usage_info:
+                extra["usage"] = usage_info
+
+        success_msg = "Backup concluído com sucesso"
+        logging.info(success_msg)
+        _write_status(target, True, success_msg, snapshot_dir, extra)
+
+        if replicas and not dry_run:
+            if engine == ENGINE_CHUNKSTORE:
+                logging.warning("Replicação não suportada na engine chunkstore; réplicas ignoradas")
+            else:
+                extra["replication"] = _replicate(snapshot_dir, replicas, retention)
+                _write_status(target, True, success_msg, snapshot_dir, extra)
+
+        purge = _purge_trash(target, purge_workers, purge_rate)
+        if purge:
+            extra["prune"] = purge
+            _write_status(target, True, success_msg, snapshot_dir, extra)
+        return 0
 
 
 def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
@@ -169,6 +737,16 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
     default_target = _env_path("VAULTWARDEN_BACKUP_TARGET", DEFAULT_TARGET_PATH)
     default_log = _env_path("VAULTWARDEN_BACKUP_LOG", default_target / "vaultwarden_backup.log")
     default_retention = int(os.getenv("VAULTWARDEN_BACKUP_RETENTION", str(DEFAULT_RETENTION_VALUE)))
+    default_engine = os.getenv("VAULTWARDEN_BACKUP_ENGINE", ENGINE_RSYNC)
+    default_journal = os.getenv("VAULTWARDEN_BACKUP_JOURNAL", "0") == "1"
+    default_catalog = os.getenv("VAULTWARDEN_BACKUP_CATALOG", "1") == "1"
+    default_resume = os.getenv("VAULTWARDEN_BACKUP_RESUME", "1") == "1"
+    default_exclude_profiles = os.getenv("VAULTWARDEN_BACKUP_EXCLUDE_PROFILES", "")
+    default_exclude_file = os.getenv("VAULTWARDEN_BACKUP_EXCLUDE_FILE")
+    default_replicas = os.getenv("VAULTWARDEN_BACKUP_REPLICAS", "")
+    default_cache_friendly = os.getenv("VAULTWARDEN_BACKUP_CACHE_FRIENDLY", "0") == "1"
+    default_link_generations = int(os.getenv("VAULTWARDEN_BACKUP_LINK_GENERATIONS", "1"))
+    default_usage = os.getenv("VAULTWARDEN_BACKUP_USAGE", "1") == "1"
 
     parser = argparse.ArgumentParser(description="Backup incremental do Vaultwarden com rsync")
     parser.add_argument("--source", default=default_source, type=Path, help="Diretório de dados do Vaultwarden")
@@ -180,23 +758,158 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
         type=int,
         help="Quantidade de snapshots a manter (FIFO)",
     )
+    parser.add_argument(
+        "--engine",
+        default=default_engine,
+        choices=ENGINES,
+        help="rsync (snapshots com hardlinks), native (mesmo layout, cópia em Python com copy_file_range) "
+        "ou chunkstore (dedup por chunks, manifesto por snapshot)",
+    )
+    parser.add_argument(
+        "--journal",
+        default=default_journal,
+        action=argparse.BooleanOptionalAction,
+        help="Compara a origem com o journal do último snapshot: pula se nada mudou ou copia só os alterados",
+    )
+    parser.add_argument(
+        "--purge-workers",
+        default=pruning.DEFAULT_PURGE_WORKERS,
+        type=int,
+        help="Threads que apagam snapshots expirados da lixeira",
+    )
+    parser.add_argument(
+        "--purge-rate",
+        default=0.0,
+        type=float,
+        help="Limite de operações de remoção por segundo na lixeira (0 = sem limite)",
+    )
+    parser.add_argument(
+        "--catalog",
+        default=default_catalog,
+        action=argparse.BooleanOptionalAction,
+        help="Registra a lista de arquivos do snapshot no catálogo SQLite do destino",
+    )
+    parser.add_argument(
+        "--sqlite-stage",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Copia db.sqlite3 via backup online do SQLite (e exclui o banco vivo/WAL do rsync)",
+    )
+    parser.add_argument(
+        "--sqlite-pages",
+        default=DEFAULT_SQLITE_PAGES,
+        type=int,
+        help="Páginas copiadas por passo do backup online (-1 = tudo de uma vez)",
+    )
+    parser.add_argument(
+        "--sqlite-sleep",
+        default=DEFAULT_SQLITE_SLEEP,
+        type=float,
+        help="Pausa em segundos entre passos do backup online, liberando o banco para o servidor",
+    )
+    parser.add_argument(
+        "--cache-friendly",
+        default=default_cache_friendly,
+        action=argparse.BooleanOptionalAction,
+        help="Libera do page cache o que o backup leu/gravou (fadvise DONTNEED, `nocache` se instalado)",
+    )
+    parser.add_argument(
+        "--link-generations",
+        default=default_link_generations,
+        type=int,
+        help="Snapshots usados como --link-dest (latest + mais novos, até 20) para reaproveitar arquivos que voltaram",
+    )
+    parser.add_argument(
+        "--usage",
+        default=default_usage,
+        action=argparse.BooleanOptionalAction,
+        help="Atualiza o índice de uso de disco (exclusivo/compartilhado por snapshot) após o backup",
+    )
+    parser.add_argument(
+        "--resume",
+        default=default_resume,
+        action=argparse.BooleanOptionalAction,
+        help="Retoma o snapshot interrompido em <target>/incomplete (com --no-resume ele vai para a lixeira)",
+    )
+    parser.add_argument(
+        "--exclude-profiles",
+        default=default_exclude_profiles,
+        help="Perfis de exclusão de dados regeneráveis, separados por vírgula "
+        f"(embutidos: {', '.join(profiles.BUILTIN_PROFILES['vaultwarden'])})",
+    )
+    parser.add_argument(
+        "--exclude-file",
+        default=Path(default_exclude_file) if default_exclude_file else None,
+        type=Path,
+        help='JSON com perfis próprios ou que substituem os embutidos ({"vaultwarden": {"nome": ["/padrão/"]}})',
+    )
+    parser.add_argument(
+        "--replicas",
+        default=default_replicas,
+        help="Destinos extras que recebem cada snapshot concluído (delta com hardlinks), separados por vírgula; "
+        "'caminho=MiB/s' limita a vazão daquele destino",
+    )
     parser.add_argument("--dry-run", action="store_true", help="Apenas imprime comando rsync (não copia)")
+
+    subparsers = parser.add_subparsers(dest="command")
+    catalog.add_parser(subparsers)
+    verify.add_parser(subparsers)
+    restore.add_parser(subparsers)
+    usage.add_parser(subparsers)
+    offsite.add_parser(subparsers)
+    export.add_parser(subparsers)
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[Iterable[str]] = None) -> int:
     args = parse_args(argv)
 
+    if args.command == "catalog":
+        return catalog.run_command(args, args.target)
+    if args.command == "verify":
+        return verify.run_command(args, args.target)
+    if args.command == "restore":
+        return restore.run_command(args, args.target)
+    if args.command == "usage":
+        return usage.run_command(args, args.target)
+    if args.command == "offsite":
+        return offsite.run_command(args, args.target)
+    if args.command in ("export", "extract"):
+        return export.run_command(args, args.target)
+
     if not args.source.exists():
         sys.stderr.write(f"Origem inexistente: {args.source}\n")
         return 2
 
+    try:
+        exclude_rules = profiles.resolve(
+            "vaultwarden", profiles.parse_names(args.exclude_profiles), args.exclude_file
+        )
+        replicas = replicate.parse_targets(args.replicas)
+    except ValueError as exc:
+        sys.stderr.write(f"{exc}\n")
+        return 2
+
     return run_backup(
         source=args.source,
         target=args.target,
         log_file=args.log_file,
         retention=args.retention,
         dry_run=args.dry_run,
+        engine=args.engine,
+        use_journal=args.journal,
+        purge_workers=args.purge_workers,
+        purge_rate=args.purge_rate,
+        use_catalog=args.catalog,
+        sqlite_stage=args.sqlite_stage,
+        sqlite_pages=args.sqlite_pages,
+        sqlite_sleep=args.sqlite_sleep,
+        cache_friendly=args.cache_friendly,
+        link_generations=args.link_generations,
+        use_usage=args.usage,
+        resume=args.resume,
+        exclude_rules=exclude_rules,
+        replicas=replicas,
     )
 
 
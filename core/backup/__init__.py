@@ -0,0 +1 @@
+"""Componentes compartilhados pelas rotinas de backup (Nextcloud, Vaultwarden)."""
@@ -0,0 +1,241 @@
+"""Catálogo SQLite dos snapshots com índice por arquivo.
+
+Cada execução bem-sucedida registra a lista de arquivos do snapshot (caminho,
+tamanho, mtime, inode) em `<target>/catalog.sqlite3`, em lotes e com commits
+incrementais. Caminhos são internados numa tabela própria, então o histórico de
+um arquivo é uma busca por índice e a busca por glob usa o prefixo constante do
+padrão. Estatísticas por snapshot ficam na tabela `snapshots` e não exigem
+percorrer as árvores de backup.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from core.backup import chunkstore, journal
+
+CATALOG_NAME = "catalog.sqlite3"
+BATCH_SIZE = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    recorded_at TEXT NOT NULL,
+    files INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    path_id INTEGER NOT NULL,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    kind INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER,
+    PRIMARY KEY (path_id, snapshot_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_snapshot ON entries(snapshot_id);
+"""
+
+
+@dataclass
+class CatalogEntry:
+    snapshot: str
+    path: str
+    size: int
+    mtime_ns: int
+    inode: Optional[int]
+
+
+@dataclass
+class SnapshotSummary:
+    name: str
+    recorded_at: str
+    files: int
+    bytes: int
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _snapshot_states(snapshot_dir: Path) -> Iterator[journal.FileState]:
+    if chunkstore.has_manifest(snapshot_dir):
+        kinds = {"f": journal.KIND_FILE, "d": journal.KIND_DIR, "l": journal.KIND_SYMLINK}
+        for record in chunkstore.read_manifest(snapshot_dir):
+            yield journal.FileState(
+                record["path"], kinds[record["type"]], 0, record.get("size", 0), record["mtime_ns"]
+            )
+        return
+    yield from journal.walk_state(snapshot_dir)
+
+
+def record_snapshot(db_path: Path, snapshot_dir: Path, batch_size: int = BATCH_SIZE) -> SnapshotSummary:
+    """Registra arquivos e symlinks do snapshot em lotes; marca completo ao final."""
+
+    recorded_at = dt.datetime.now().isoformat()
+    with closing(connect(db_path)) as conn:
+        with conn:
+            conn.execute("DELETE FROM snapshots WHERE name = ?", (snapshot_dir.name,))
+            snapshot_id = conn.execute(
+                "INSERT INTO snapshots (name, recorded_at) VALUES (?, ?)", (snapshot_dir.name, recorded_at)
+            ).lastrowid
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS staging "
+            "(path TEXT, kind INTEGER, size INTEGER, mtime_ns INTEGER, inode INTEGER)"
+        )
+        files = 0
+        total_bytes = 0
+        batch: list[tuple] = []
+        for state in _snapshot_states(snapshot_dir):
+            if state.kind == journal.KIND_DIR:
+                continue
+            if state.kind == journal.KIND_FILE:
+                files += 1
+                total_bytes += state.size
+            batch.append((state.path, state.kind, state.size, state.mtime_ns, state.inode or None))
+            if len(batch) >= batch_size:
+                _flush(conn, snapshot_id, batch)
+                batch = []
+        _flush(conn, snapshot_id, batch)
+        with conn:
+            conn.execute(
+                "UPDATE snapshots SET files = ?, bytes = ?, complete = 1 WHERE id = ?",
+                (files, total_bytes, snapshot_id),
+            )
+    return SnapshotSummary(snapshot_dir.name, recorded_at, files, total_bytes)
+
+
+def _flush(conn: sqlite3.Connection, snapshot_id: int, batch: list[tuple]) -> None:
+    if not batch:
+        return
+    with conn:
+        conn.executemany("INSERT INTO staging VALUES (?, ?, ?, ?, ?)", batch)
+        conn.execute("INSERT OR IGNORE INTO paths (path) SELECT path FROM staging")
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (path_id, snapshot_id, kind, size, mtime_ns, inode) "
+            "SELECT p.id, ?, s.kind, s.size, s.mtime_ns, s.inode FROM staging s JOIN paths p ON p.path = s.path",
+            (snapshot_id,),
+        )
+        conn.execute("DELETE FROM staging")
+
+
+def forget_snapshots(db_path: Path, names: Iterable[str]) -> int:
+    """Remove snapshots (e caminhos órfãos) do catálogo; retorna quantos existiam."""
+
+    names = list(names)
+    if not names or not db_path.exists():
+        return 0
+    with closing(connect(db_path)) as conn, conn:
+        placeholders = ",".join("?" for _ in names)
+        removed = conn.execute(f"DELETE FROM snapshots WHERE name IN ({placeholders})", names).rowcount
+        conn.execute("DELETE FROM paths WHERE NOT EXISTS (SELECT 1 FROM entries e WHERE e.path_id = paths.id)")
+    return removed
+
+
+def _normalize(path: str) -> str:
+    return path.lstrip("/")
+
+
+def search(db_path: Path, pattern: str, limit: Optional[int] = None) -> list[CatalogEntry]:
+    """Busca por glob (sintaxe GLOB do SQLite, sensível a maiúsculas) em todos os snapshots."""
+
+    query = (
+        "SELECT s.name, p.path, e.size, e.mtime_ns, e.inode FROM paths p "
+        "JOIN entries e ON e.path_id = p.id JOIN snapshots s ON s.id = e.snapshot_id "
+        "WHERE p.path GLOB ? AND s.complete = 1 ORDER BY p.path, s.name"
+    )
+    params: list = [_normalize(pattern)]
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    with closing(connect(db_path)) as conn:
+        return [CatalogEntry(*row) for row in conn.execute(query, params)]
+
+
+def history(db_path: Path, path: str) -> list[CatalogEntry]:
+    """Todas as ocorrências de um caminho, do snapshot mais antigo ao mais novo."""
+
+    with closing(connect(db_path)) as conn:
+        rows = conn.execute(
+            "SELECT s.name, p.path, e.size, e.mtime_ns, e.inode FROM paths p "
+            "JOIN entries e ON e.path_id = p.id JOIN snapshots s ON s.id = e.snapshot_id "
+            "WHERE p.path = ? AND s.complete = 1 ORDER BY s.name",
+            (_normalize(path),),
+        )
+        return [CatalogEntry(*row) for row in rows]
+
+
+def versions(entries: list[CatalogEntry]) -> list[tuple[CatalogEntry, CatalogEntry]]:
+    """Agrupa ocorrências consecutivas idênticas (tamanho, mtime, inode) em versões (primeira, última)."""
+
+    grouped: list[tuple[CatalogEntry, CatalogEntry]] = []
+    for entry in entries:
+        if grouped:
+            first, last = grouped[-1]
+            if (last.size, last.mtime_ns, last.inode) == (entry.size, entry.mtime_ns, entry.inode):
+                grouped[-1] = (first, entry)
+                continue
+        grouped.append((entry, entry))
+    return grouped
+
+
+def snapshot_stats(db_path: Path) -> list[SnapshotSummary]:
+    with closing(connect(db_path)) as conn:
+        rows = conn.execute(
+            "SELECT name, recorded_at, files, bytes FROM snapshots WHERE complete = 1 ORDER BY name"
+        )
+        return [SnapshotSummary(*row) for row in rows]
+
+
+def _format_mtime(mtime_ns: int) -> str:
+    return dt.datetime.fromtimestamp(mtime_ns / 1e9).isoformat(timespec="seconds")
+
+
+def add_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser("catalog", help="Consulta o catálogo SQLite dos snapshots")
+    actions = parser.add_subparsers(dest="catalog_action", required=True)
+    search_parser = actions.add_parser("search", help="Busca caminhos por glob em todos os snapshots")
+    search_parser.add_argument("pattern", help="Glob relativo à raiz do snapshot (ex.: 'data/alice/files/*.ods')")
+    search_parser.add_argument("--limit", type=int, default=None, help="Máximo de resultados")
+    history_parser = actions.add_parser("history", help="Histórico de versões de um arquivo")
+    history_parser.add_argument("path", help="Caminho relativo à raiz do snapshot")
+    actions.add_parser("stats", help="Arquivos e bytes por snapshot (sem percorrer as árvores)")
+
+
+def run_command(args: argparse.Namespace, target: Path) -> int:
+    db_path = target / CATALOG_NAME
+    if not db_path.exists():
+        print(f"[ERRO] Catálogo inexistente: {db_path}")
+        return 2
+    if args.catalog_action == "search":
+        results = search(db_path, args.pattern, limit=args.limit)
+        for entry in results:
+            print(f"{entry.snapshot}  {entry.size:>12}  {_format_mtime(entry.mtime_ns)}  {entry.path}")
+        return 0 if results else 1
+    if args.catalog_action == "history":
+        grouped = versions(history(db_path, args.path))
+        for index, (first, last) in enumerate(grouped, start=1):
+            print(
+                f"v{index}  {first.snapshot} .. {last.snapshot}  {first.size:>12}  {_format_mtime(first.mtime_ns)}"
+            )
+        return 0 if grouped else 1
+    for summary in snapshot_stats(db_path):
+        print(f"{summary.name}  arquivos={summary.files}  bytes={summary.bytes}  registrado={summary.recorded_at}")
+    return 0
@@ -0,0 +1,402 @@
+"""Engine de backup com deduplicação por chunks definidos pelo conteúdo (CDC).
+
+Cada arquivo é cortado por conteúdo (hash de janela no estilo FastCDC) em
+pedaços de tamanho variável; os chunks são gravados uma única vez em
+`<target>/chunks/<id[:2]>/<id>`
+(id = sha256 do conteúdo, compressão zlib) e cada snapshot guarda apenas um
+manifesto `manifest.jsonl.gz` com a lista de chunks por arquivo. Como os cortes
+dependem do conteúdo, alterar um bloco de um arquivo grande gera só alguns
+chunks novos em vez de uma cópia completa.
+
+Arquivos com mesmo tamanho/mtime do manifesto anterior reaproveitam a lista de
+chunks sem serem relidos. A retenção vira coleta de lixo: chunks sem referência
+em nenhum manifesto restante são apagados (`collect_garbage`).
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import stat
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Mapping, Optional
+
+from core.backup.pagecache import CacheDropper
+
+CHUNKS_DIRNAME = "chunks"
+MANIFEST_NAME = "manifest.jsonl.gz"
+MANIFEST_VERSION = 1
+
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+COMPRESSION_LEVEL = 3
+
+# Janela do hash: cada posição mistura o byte atual com os 3 anteriores (deslocados 1, 2 e 3 bits),
+# como o gear do FastCDC, mas calculado para o bloco inteiro com operações em C (translate e
+# XOR de inteiros grandes) em vez de um laço Python por byte.
+_WINDOW_SHIFTS = (9, 18, 27)
+_CONTEXT = 3
+# Tabela determinística: o mesmo conteúdo sempre corta nos mesmos pontos entre execuções.
+_GEAR = bytes(hashlib.sha256(bytes([i])).digest()[0] for i in range(256))
+# Marca a posição quando o bit alto do hash da janela está ligado (probabilidade 1/2).
+_MARK = bytes(value >> 7 for value in range(256))
+
+
+def _marks(data: bytes, context: bytes = bytes(_CONTEXT)) -> bytes:
+    """Um byte 0/1 por posição de `data`; `context` são os bytes que precedem o bloco no stream."""
+
+    window = bytes(context[-_CONTEXT:]).rjust(_CONTEXT, b"\0") + data
+    mixed = base = int.from_bytes(window.translate(_GEAR), "little")
+    for shift in _WINDOW_SHIFTS:
+        mixed ^= base << shift
+    return mixed.to_bytes(len(window) + 4, "little")[_CONTEXT : len(window)].translate(_MARK)
+
+
+def _runs(avg_size: int) -> tuple[bytes, bytes]:
+    bits = avg_size.bit_length() - 1
+    # Normalização do FastCDC: sequência de marcas mais longa (corte mais raro) antes da média,
+    # mais curta depois. Uma sequência de r marcas aparece, em média, a cada ~2^(r+1) bytes.
+    return b"\x01" * bits, b"\x01" * max(1, bits - 2)
+
+
+def _cut(marks: bytes | bytearray, length: int, min_size: int, avg_size: int, max_size: int) -> int:
+    if length <= min_size:
+        return length
+    limit = min(length, max_size)
+    normal = min(limit, avg_size)
+    strict, loose = _runs(avg_size)
+    # O corte vem logo após a última marca da sequência e nunca antes de min_size + 1.
+    found = marks.find(strict, max(0, min_size - len(strict) + 1), normal)
+    if found >= 0:
+        return found + len(strict)
+    found = marks.find(loose, max(0, normal - len(loose) + 1), limit)
+    if found >= 0:
+        return found + len(loose)
+    return limit
+
+
+def find_cut(
+    data: bytes,
+    min_size: int = MIN_CHUNK_SIZE,
+    avg_size: int = AVG_CHUNK_SIZE,
+    max_size: int = MAX_CHUNK_SIZE,
+) -> int:
+    """Retorna o tamanho do próximo chunk no início de `data`."""
+
+    return _cut(_marks(data[:max_size]), len(data), min_size, avg_size, max_size)
+
+
+def iter_chunks(
+    stream: BinaryIO,
+    min_size: int = MIN_CHUNK_SIZE,
+    avg_size: int = AVG_CHUNK_SIZE,
+    max_size: int = MAX_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Lê o stream em blocos de `max_size` e produz chunks definidos pelo conteúdo.
+
+    As marcas de corte são calculadas uma vez por bloco lido, com os últimos bytes do bloco
+    anterior como contexto, então cada byte passa pelo hash uma única vez.
+    """
+
+    buffer = bytearray()
+    marks = bytearray()
+    context = bytes(_CONTEXT)
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            block = stream.read(max_size)
+            if not block:
+                eof = True
+                break
+            marks += _marks(block, context)
+            context = (context + block)[-_CONTEXT:]
+            buffer += block
+        if not buffer:
+            return
+        cut = _cut(marks, len(buffer), min_size, avg_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+        del marks[:cut]
+
+
+@dataclass
+class ChunkStoreStats:
+    files: int = 0
+    files_reused: int = 0
+    dirs: int = 0
+    symlinks: int = 0
+    bytes_total: int = 0
+    bytes_read: int = 0
+    chunks_total: int = 0
+    chunks_new: int = 0
+    bytes_new: int = 0
+    bytes_stored: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class ChunkStore:
+    """Armazém de chunks endereçados por conteúdo em disco."""
+
+    def __init__(self, root: Path, dropper: Optional[CacheDropper] = None):
+        self.root = root
+        self.dropper = dropper
+        self._known: set[str] = set()
+
+    def chunk_path(self, chunk_id: str) -> Path:
+        return self.root / chunk_id[:2] / chunk_id
+
+    def has(self, chunk_id: str) -> bool:
+        if chunk_id in self._known:
+            return True
+        if self.chunk_path(chunk_id).exists():
+            self._known.add(chunk_id)
+            return True
+        return False
+
+    def put(self, data: bytes, dry_run: bool = False) -> tuple[str, int]:
+        """Grava o chunk se ainda não existir; retorna (id, bytes comprimidos gravados)."""
+
+        chunk_id = hashlib.sha256(data).hexdigest()
+        if self.has(chunk_id):
+            return chunk_id, 0
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        if not dry_run:
+            path = self.chunk_path(chunk_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            with tmp.open("wb") as handle:
+                handle.write(compressed)
+                if self.dropper is not None:
+                    handle.flush()
+                    self.dropper.written(handle.fileno(), str(path), len(compressed))
+            os.replace(tmp, path)
+        self._known.add(chunk_id)
+        return chunk_id, len(compressed)
+
+    def get(self, chunk_id: str) -> bytes:
+        data = zlib.decompress(self.chunk_path(chunk_id).read_bytes())
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f"Chunk corrompido: {chunk_id}")
+        return data
+
+
+def read_manifest(snapshot_dir: Path) -> Iterator[dict]:
+    """Itera as entradas do manifesto de um snapshot (pula o cabeçalho)."""
+
+    with gzip.open(snapshot_dir / MANIFEST_NAME, "rt", encoding="utf-8") as handle:
+        for lineno, line in enumerate(handle):
+            if lineno == 0:
+                continue
+            yield json.loads(line)
+
+
+def has_manifest(snapshot_dir: Path) -> bool:
+    return (snapshot_dir / MANIFEST_NAME).is_file()
+
+
+def _walk(source: Path, excludes: frozenset[str] = frozenset()) -> Iterator[tuple[str, os.DirEntry]]:
+    stack = [("", str(source))]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                rel = f"{prefix}{entry.name}"
+                if rel in excludes:
+                    continue
+                yield rel, entry
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((f"{rel}/", entry.path))
+
+
+def backup_tree(
+    source: Path,
+    snapshot_dir: Path,
+    store_dir: Path,
+    previous: Optional[Path] = None,
+    dry_run: bool = False,
+    excludes: Iterable[str] = (),
+    substitutes: Optional[Mapping[str, Path]] = None,
+    dropper: Optional[CacheDropper] = None,
+) -> ChunkStoreStats:
+    """Gera o manifesto de `source` em `snapshot_dir`, gravando só chunks inéditos.
+
+    `excludes` são caminhos relativos (arquivos ou diretórios inteiros) deixados de fora.
+    `substitutes` mapeia caminho relativo -> arquivo de fora da origem gravado no lugar dele
+    (ex.: cópia consistente do banco SQLite em vez do arquivo vivo, que deve estar em `excludes`).
+    `dropper` libera do page cache cada arquivo lido e cada chunk gravado assim que termina.
+    """
+
+    store = ChunkStore(store_dir, dropper=dropper)
+    stats = ChunkStoreStats()
+    previous_files: dict[str, dict] = {}
+    if previous is not None and has_manifest(previous):
+        previous_files = {e["path"]: e for e in read_manifest(previous) if e["type"] == "f"}
+
+    manifest = snapshot_dir / MANIFEST_NAME
+    tmp_manifest = manifest.with_name(manifest.name + ".tmp")
+    if not dry_run:
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        out = gzip.open(tmp_manifest, "wt", encoding="utf-8")
+    else:
+        out = open(os.devnull, "w", encoding="utf-8")
+
+    with out:
+        header = {"version": MANIFEST_VERSION, "source": str(source)}
+        out.write(json.dumps(header) + "\n")
+        for rel, entry in _walk(source, frozenset(p.strip("/") for p in excludes)):
+            st = entry.stat(follow_symlinks=False)
+            record = {
+                "path": rel,
+                "mode": stat.S_IMODE(st.st_mode),
+                "uid": st.st_uid,
+                "gid": st.st_gid,
+                "mtime_ns": st.st_mtime_ns,
+            }
+            if stat.S_ISDIR(st.st_mode):
+                record["type"] = "d"
+                stats.dirs += 1
+            elif stat.S_ISLNK(st.st_mode):
+                record["type"] = "l"
+                record["target"] = os.readlink(entry.path)
+                stats.symlinks += 1
+            elif stat.S_ISREG(st.st_mode):
+                record["type"] = "f"
+                record["size"] = st.st_size
+                stats.files += 1
+                stats.bytes_total += st.st_size
+                old = previous_files.get(rel)
+                if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                    record["chunks"] = old["chunks"]
+                    stats.files_reused += 1
+                else:
+                    record["chunks"] = _store_file(Path(entry.path), store, stats, dry_run)
+                stats.chunks_total += len(record["chunks"])
+            else:
+                # Sockets, FIFOs e devices não fazem sentido em um volume de dados.
+                continue
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        for rel, path in sorted((substitutes or {}).items()):
+            st = path.stat()
+            record = {
+                "path": rel,
+                "mode": stat.S_IMODE(st.st_mode),
+                "uid": st.st_uid,
+                "gid": st.st_gid,
+                "mtime_ns": st.st_mtime_ns,
+                "type": "f",
+                "size": st.st_size,
+                "chunks": _store_file(path, store, stats, dry_run),
+            }
+            stats.files += 1
+            stats.bytes_total += st.st_size
+            stats.chunks_total += len(record["chunks"])
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    if not dry_run:
+        os.replace(tmp_manifest, manifest)
+    return stats
+
+
+def _store_file(path: Path, store: ChunkStore, stats: ChunkStoreStats, dry_run: bool) -> list[str]:
+    chunk_ids: list[str] = []
+    read = 0
+    with path.open("rb") as handle:
+        for chunk in iter_chunks(handle):
+            read += len(chunk)
+            stats.bytes_read += len(chunk)
+            chunk_id, stored = store.put(chunk, dry_run=dry_run)
+            if stored:
+                stats.chunks_new += 1
+                stats.bytes_new += len(chunk)
+                stats.bytes_stored += stored
+            chunk_ids.append(chunk_id)
+        if store.dropper is not None:
+            store.dropper.read(handle.fileno(), read)
+    return chunk_ids
+
+
+def restore_tree(snapshot_dir: Path, store_dir: Path, destination: Path) -> int:
+    """Reconstrói a árvore do manifesto em `destination`; retorna arquivos restaurados."""
+
+    store = ChunkStore(store_dir)
+    destination.mkdir(parents=True, exist_ok=True)
+    directories: list[dict] = []
+    restored = 0
+    for record in read_manifest(snapshot_dir):
+        path = destination / record["path"]
+        kind = record["type"]
+        if kind == "d":
+            path.mkdir(parents=True, exist_ok=True)
+            directories.append(record)
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if kind == "l":
+            if path.is_symlink() or path.exists():
+                path.unlink()
+            os.symlink(record["target"], path)
+            apply_metadata(path, record, follow_symlinks=False)
+            continue
+        restore_file(record, store, path)
+        restored += 1
+    # Diretórios por último (e de baixo para cima) para o mtime não ser alterado pelos filhos.
+    for record in reversed(directories):
+        apply_metadata(destination / record["path"], record)
+    return restored
+
+
+def restore_file(record: dict, store: ChunkStore, path: Path) -> int:
+    """Remonta o arquivo do registro em `path` por um temporário com troca atômica; retorna bytes gravados."""
+
+    tmp = path.with_name(path.name + ".restore-tmp")
+    tmp.unlink(missing_ok=True)
+    written = 0
+    with tmp.open("wb") as handle:
+        for chunk_id in record["chunks"]:
+            data = store.get(chunk_id)
+            handle.write(data)
+            written += len(data)
+    apply_metadata(tmp, record)
+    os.replace(tmp, path)
+    return written
+
+
+def apply_metadata(path: Path, record: dict, follow_symlinks: bool = True) -> None:
+    if os.geteuid() == 0:
+        os.chown(path, record["uid"], record["gid"], follow_symlinks=follow_symlinks)
+    if follow_symlinks:
+        os.chmod(path, record["mode"])
+    os.utime(path, ns=(record["mtime_ns"], record["mtime_ns"]), follow_symlinks=follow_symlinks)
+
+
+def collect_garbage(store_dir: Path, snapshots_dir: Path) -> tuple[int, int]:
+    """Apaga chunks sem referência nos manifestos restantes.
+
+    Retorna (chunks removidos, bytes liberados).
+    """
+
+    referenced: set[str] = set()
+    for snapshot in snapshots_dir.iterdir():
+        if snapshot.is_dir() and has_manifest(snapshot):
+            for record in read_manifest(snapshot):
+                referenced.update(record.get("chunks", ()))
+
+    removed = 0
+    freed = 0
+    if not store_dir.is_dir():
+        return removed, freed
+    for bucket in store_dir.iterdir():
+        if not bucket.is_dir():
+            continue
+        for chunk in bucket.iterdir():
+            if chunk.name in referenced:
+                continue
+            freed += chunk.stat().st_size
+            chunk.unlink()
+            removed += 1
+    return removed, freed
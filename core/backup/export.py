@@ -0,0 +1,447 @@
+"""Exportação de um snapshot como arquivo único `tar.zst` (cold storage, entrega).
+
+O snapshot vira um stream tar (`tarfile`, formato PAX, hardlinks preservados)
+que segue por pipe para o `zstd -T0` e dele direto para os arquivos de saída:
+nada é montado em disco nem mantido em memória além de buffers fixos.
+
+O stream comprimido é uma sequência de frames zstd independentes, cada um com
+até `--frame-size` bytes de tar (um processo zstd multi-thread por frame). A
+concatenação continua sendo um `.tar.zst` comum (`zstd -dc x.tar.zst | tar -x`),
+mas com o índice `<nome>.index.jsonl.gz` (offset de cada membro no tar e a
+tabela de frames) o subcomando `extract` descomprime só os frames que cobrem o
+arquivo pedido.
+
+Com `--volume-size` a saída é fatiada em volumes de tamanho fixo
+(`<nome>.tar.zst.001`, `.002`...); `cat <nome>.tar.zst.* | zstd -dc | tar -x`
+restaura tudo. O SHA-256 de cada volume vai na última linha do índice.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import IO, Iterator, Optional, Sequence
+
+from core.backup import chunkstore, restore
+
+MIB = 1024 * 1024
+DEFAULT_FRAME_SIZE = 64 * MIB
+DEFAULT_LEVEL = 3
+INDEX_SUFFIX = ".index.jsonl.gz"
+_CHUNK = MIB
+
+
+class ExportError(RuntimeError):
+    pass
+
+
+@dataclass
+class ExportReport:
+    snapshot: str
+    files: int = 0
+    bytes: int = 0
+    tar_bytes: int = 0
+    compressed_bytes: int = 0
+    frames: int = 0
+    volumes: list[str] = field(default_factory=list)
+    index: str = ""
+    duration_s: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.tar_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+    def as_dict(self) -> dict[str, object]:
+        return asdict(self)
+
+
+def compressor_command(level: int = DEFAULT_LEVEL, threads: int = 0) -> list[str]:
+    return ["zstd", f"-T{threads}", f"-{level}", "-q", "-c"]
+
+
+class _VolumeWriter:
+    """Grava o stream comprimido em volumes de tamanho fixo (0 = arquivo único)."""
+
+    def __init__(self, base: Path, volume_size: int = 0):
+        self.base = base
+        self.volume_size = volume_size
+        self.offset = 0
+        self.volumes: list[dict[str, object]] = []
+        self._handle: Optional[IO[bytes]] = None
+        self._hash = hashlib.sha256()
+        self._written = 0
+
+    def _path(self, number: int) -> Path:
+        if not self.volume_size:
+            return self.base
+        return self.base.with_name(f"{self.base.name}.{number:03d}")
+
+    def _close_volume(self) -> None:
+        if self._handle is None:
+            return
+        self._handle.close()
+        path = self._path(len(self.volumes) + 1)
+        self.volumes.append({"name": path.name, "bytes": self._written, "sha256": self._hash.hexdigest()})
+        self._handle, self._hash, self._written = None, hashlib.sha256(), 0
+
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if self._handle is None:
+                self._handle = self._path(len(self.volumes) + 1).open("wb")
+            room = self.volume_size - self._written if self.volume_size else len(view)
+            piece = view[:room]
+            self._handle.write(piece)
+            self._hash.update(piece)
+            self._written += len(piece)
+            self.offset += len(piece)
+            view = view[len(piece) :]
+            if self.volume_size and self._written >= self.volume_size:
+                self._close_volume()
+
+    def close(self) -> None:
+        self._close_volume()
+
+
+class _FrameStream:
+    """Arquivo (só escrita) entregue ao `tarfile`: corta o tar em frames zstd independentes."""
+
+    def __init__(self, output: _VolumeWriter, compressor: Sequence[str], frame_size: int):
+        self.output = output
+        self.compressor = list(compressor)
+        self.frame_size = frame_size
+        self.position = 0
+        self.frames: list[list[int]] = []
+        self._proc: Optional[subprocess.Popen[bytes]] = None
+        self._pump: Optional[threading.Thread] = None
+        self._frame_start = 0
+        self._frame_offset = 0
+        self._error: Optional[BaseException] = None
+
+    def tell(self) -> int:
+        return self.position
+
+    def _drain(self, stdout: IO[bytes]) -> None:
+        try:
+            for block in iter(lambda: stdout.read(_CHUNK), b""):
+                self.output.write(block)
+        except BaseException as exc:  # noqa: BLE001 - repassado para a thread principal
+            self._error = exc
+
+    def _open_frame(self) -> None:
+        try:
+            self._proc = subprocess.Popen(
+                self.compressor, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            raise ExportError(f"compressor não encontrado: {self.compressor[0]}") from None
+        self._frame_start = self.position
+        self._frame_offset = self.output.offset
+        assert self._proc.stdout is not None
+        self._pump = threading.Thread(target=self._drain, args=(self._proc.stdout,), daemon=True)
+        self._pump.start()
+
+    def _close_frame(self) -> None:
+        if self._proc is None:
+            return
+        assert self._proc.stdin is not None and self._pump is not None
+        self._proc.stdin.close()
+        self._pump.join()
+        code = self._proc.wait()
+        self._proc = None
+        if self._error is not None:
+            raise self._error
+        if code != 0:
+            raise ExportError(f"compressor falhou ({code}): {' '.join(self.compressor)}")
+        tar_bytes = self.position - self._frame_start
+        self.frames.append([self._frame_start, tar_bytes, self._frame_offset, self.output.offset - self._frame_offset])
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while view:
+            if self._proc is None:
+                self._open_frame()
+            assert self._proc is not None and self._proc.stdin is not None
+            piece = view[: self.frame_size - (self.position - self._frame_start)]
+            try:
+                self._proc.stdin.write(piece)
+            except BrokenPipeError:
+                raise ExportError(f"compressor encerrou no meio do frame: {' '.join(self.compressor)}") from None
+            self.position += len(piece)
+            view = view[len(piece) :]
+            if self.position - self._frame_start >= self.frame_size:
+                self._close_frame()
+        return len(data)
+
+    def close(self) -> None:
+        self._close_frame()
+
+    def abort(self) -> None:
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.wait()
+            if self._pump is not None:
+                self._pump.join()
+            self._proc = None
+
+
+def _walk(root: Path) -> Iterator[str]:
+    """Caminhos relativos em ordem estável; diretório antes do conteúdo."""
+
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        with os.scandir(os.path.join(root, rel)) as entries:
+            names = sorted(entry.name for entry in entries)
+        subdirs = []
+        for name in names:
+            child = f"{rel}/{name}" if rel else name
+            yield child
+            if stat.S_ISDIR(os.lstat(os.path.join(root, child)).st_mode):
+                subdirs.append(child)
+        stack.extend(reversed(subdirs))
+
+
+def _member_type(info: tarfile.TarInfo) -> str:
+    if info.isreg():
+        return "f"
+    if info.isdir():
+        return "d"
+    if info.issym():
+        return "l"
+    if info.islnk():
+        return "h"
+    return "o"
+
+
+def export_snapshot(
+    snapshot_dir: Path,
+    output_dir: Path,
+    name: Optional[str] = None,
+    volume_size: int = 0,
+    frame_size: int = DEFAULT_FRAME_SIZE,
+    compressor: Optional[Sequence[str]] = None,
+) -> ExportReport:
+    """Gera `<name>.tar.zst` (ou volumes) e o índice em `output_dir`."""
+
+    if frame_size <= 0:
+        raise ValueError("frame_size deve ser positivo")
+    started = time.monotonic()
+    name = name or snapshot_dir.name
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report = ExportReport(snapshot=snapshot_dir.name)
+    volumes = _VolumeWriter(output_dir / f"{name}.tar.zst", volume_size)
+    stream = _FrameStream(volumes, compressor or compressor_command(), frame_size)
+    index_path = output_dir / f"{name}{INDEX_SUFFIX}"
+    index_tmp = index_path.with_name(index_path.name + ".tmp")
+    # Só arquivos com mais de um link no snapshot (mesmo critério do tarfile para gerar hardlinks).
+    linked: dict[str, tuple[int, int]] = {}
+    try:
+        with index_tmp.open("wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) as index:
+            with tarfile.open(fileobj=stream, mode="w", format=tarfile.PAX_FORMAT) as tar:
+                for rel in _walk(snapshot_dir):
+                    path = os.path.join(snapshot_dir, rel)
+                    info = tar.gettarinfo(path, arcname=rel)
+                    header = tar.offset
+                    if info.isreg():
+                        with open(path, "rb") as source:
+                            tar.addfile(info, source)
+                        report.files += 1
+                        report.bytes += info.size
+                    else:
+                        tar.addfile(info)
+                    padded = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE if info.isreg() else 0
+                    record = {
+                        "path": rel,
+                        "type": _member_type(info),
+                        "header": header,
+                        "offset": tar.offset - padded,
+                        "size": info.size if info.isreg() else 0,
+                    }
+                    if info.issym() or info.islnk():
+                        record["link"] = info.linkname
+                    if info.islnk():
+                        # Os dados ficam no primeiro membro do inode; o índice aponta direto para eles.
+                        record["offset"], record["size"] = linked.get(info.linkname, (0, 0))
+                    elif info.isreg() and os.lstat(path).st_nlink > 1:
+                        linked[rel] = (record["offset"], record["size"])
+                    index.write((json.dumps(record, separators=(",", ":")) + "\n").encode())
+            stream.close()
+            volumes.close()
+            summary = {
+                "summary": True,
+                "snapshot": snapshot_dir.name,
+                "tar_bytes": stream.position,
+                "volume_size": volume_size,
+                # [offset no tar, bytes de tar, offset comprimido, bytes comprimidos]
+                "frames": stream.frames,
+                "volumes": volumes.volumes,
+            }
+            index.write((json.dumps(summary, separators=(",", ":")) + "\n").encode())
+    except BaseException:
+        stream.abort()
+        volumes.close()
+        for volume in volumes.volumes:
+            (output_dir / str(volume["name"])).unlink(missing_ok=True)
+        index_tmp.unlink(missing_ok=True)
+        raise
+    os.replace(index_tmp, index_path)
+    report.tar_bytes = stream.position
+    report.compressed_bytes = volumes.offset
+    report.frames = len(stream.frames)
+    report.volumes = [str(volume["name"]) for volume in volumes.volumes]
+    report.index = index_path.name
+    report.duration_s = round(time.monotonic() - started, 3)
+    return report
+
+
+def _read_index(index_path: Path) -> Iterator[dict]:
+    with gzip.open(index_path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            yield json.loads(line)
+
+
+def _find_member(index_path: Path, member: str) -> tuple[dict, dict]:
+    found: Optional[dict] = None
+    summary: dict = {}
+    wanted = member.strip("/")
+    for record in _read_index(index_path):
+        if record.get("summary"):
+            summary = record
+        elif record["path"] == wanted:
+            found = record
+    if found is None:
+        raise ExportError(f"arquivo não está no índice: {member}")
+    if found["type"] not in ("f", "h"):
+        raise ExportError(f"{member} não é um arquivo regular ({found['type']})")
+    return found, summary
+
+
+def _read_compressed(directory: Path, summary: dict, offset: int, length: int) -> Iterator[bytes]:
+    """Bytes comprimidos no intervalo pedido, atravessando volumes se preciso."""
+
+    volume_size = summary["volume_size"]
+    names = [volume["name"] for volume in summary["volumes"]]
+    while length > 0:
+        number, inner = divmod(offset, volume_size) if volume_size else (0, offset)
+        with (directory / names[number]).open("rb") as handle:
+            handle.seek(inner)
+            available = (volume_size - inner) if volume_size else length
+            remaining = min(length, available)
+            while remaining:
+                block = handle.read(min(_CHUNK, remaining))
+                if not block:
+                    raise ExportError(f"volume truncado: {names[number]}")
+                yield block
+                remaining -= len(block)
+                length -= len(block)
+                offset += len(block)
+
+
+def extract_member(index_path: Path, member: str, destination: IO[bytes]) -> int:
+    """Escreve o conteúdo de `member` em `destination` descomprimindo só os frames necessários."""
+
+    record, summary = _find_member(index_path, member)
+    start, end = record["offset"], record["offset"] + record["size"]
+    frames = [f for f in summary["frames"] if f[0] < end and f[0] + f[1] > start] if record["size"] else []
+    if not frames:
+        return 0
+    proc = subprocess.Popen(["zstd", "-dc", "-q"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert proc.stdin is not None and proc.stdout is not None
+
+    def _feed() -> None:
+        try:
+            for block in _read_compressed(index_path.parent, summary, frames[0][2], sum(f[3] for f in frames)):
+                proc.stdin.write(block)
+        except BrokenPipeError:
+            pass
+        finally:
+            proc.stdin.close()
+
+    feeder = threading.Thread(target=_feed, daemon=True)
+    feeder.start()
+    position, written = frames[0][0], 0
+    for block in iter(lambda: proc.stdout.read(_CHUNK), b""):
+        lo, hi = max(start - position, 0), min(end - position, len(block))
+        if lo < hi:
+            destination.write(block[lo:hi])
+            written += hi - lo
+        position += len(block)
+    feeder.join()
+    if proc.wait() != 0 or written != record["size"]:
+        raise ExportError(f"falha ao descomprimir {member} ({written}/{record['size']} bytes)")
+    return written
+
+
+def add_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser("export", help="Exporta um snapshot como tar.zst em stream (volumes + índice)")
+    parser.add_argument("snapshot", help="Nome do snapshot ou 'latest'")
+    parser.add_argument("output", type=Path, help="Diretório onde gravar o .tar.zst e o índice")
+    parser.add_argument("--volume-size", type=int, default=0, help="Fatia a saída em volumes de N MiB (0 = único)")
+    parser.add_argument(
+        "--frame-size", type=int, default=DEFAULT_FRAME_SIZE // MIB,
+        help="MiB de tar por frame zstd independente (granularidade do extract)",
+    )
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="Nível do zstd")
+    parser.add_argument("--threads", type=int, default=0, help="Threads do zstd (0 = todos os núcleos)")
+
+    parser = subparsers.add_parser("extract", help="Extrai um arquivo de um export tar.zst usando o índice")
+    parser.add_argument("index", type=Path, help=f"Índice do export (<nome>{INDEX_SUFFIX})")
+    parser.add_argument("member", help="Caminho do arquivo dentro do snapshot")
+    parser.add_argument("destination", type=Path, help="Arquivo de saída")
+
+
+def run_command(args: argparse.Namespace, target: Path) -> int:
+    if shutil.which("zstd") is None:
+        print("[ERRO] zstd não encontrado no PATH")
+        return 2
+    if args.command == "extract":
+        if not args.index.is_file():
+            print(f"[ERRO] Índice inexistente: {args.index}")
+            return 2
+        tmp = args.destination.with_name(args.destination.name + ".tmp")
+        try:
+            with tmp.open("wb") as handle:
+                size = extract_member(args.index, args.member, handle)
+        except ExportError as exc:
+            tmp.unlink(missing_ok=True)
+            print(f"[ERRO] {exc}")
+            return 1
+        os.replace(tmp, args.destination)
+        print(f"{args.member} -> {args.destination} ({size} bytes)")
+        return 0
+
+    snapshot_dir = restore.resolve_snapshot(target, args.snapshot)
+    if not snapshot_dir.is_dir():
+        print(f"[ERRO] Snapshot inexistente: {snapshot_dir}")
+        return 2
+    if chunkstore.has_manifest(snapshot_dir):
+        print("[ERRO] Export exige snapshots com hardlinks (engine rsync ou native); use restore antes")
+        return 2
+    try:
+        report = export_snapshot(
+            snapshot_dir,
+            args.output,
+            volume_size=args.volume_size * MIB,
+            frame_size=args.frame_size * MIB,
+            compressor=compressor_command(args.level, args.threads),
+        )
+    except (ExportError, ValueError, OSError) as exc:
+        print(f"[ERRO] Export falhou: {exc}")
+        return 1
+    print(
+        f"snapshot={report.snapshot}  arquivos={report.files}  tar={report.tar_bytes} bytes  "
+        f"comprimido={report.compressed_bytes} bytes ({report.ratio:.2f}x)  frames={report.frames}  "
+        f"volumes={len(report.volumes)}  índice={report.index}  tempo={report.duration_s}s"
+    )
+    return 0
@@ -0,0 +1,230 @@
+"""Journal persistente do estado dos arquivos da origem (path, inode, tamanho, mtime).
+
+A cada execução a origem é percorrida com `os.scandir` em ordem determinística
+(pré-ordem, filhos ordenados por nome) e comparada, em streaming, com o journal
+do snapshot anterior. O journal usa front coding (prefixo compartilhado com o
+caminho anterior) e registros binários de tamanho fixo, então ocupa poucas
+dezenas de bytes por entrada e a comparação não precisa carregar tudo em memória.
+
+O resultado permite dois atalhos:
+- nada mudou: o backup vira "no-op" e nenhum snapshot é criado;
+- poucas mudanças: o snapshot anterior é clonado com hardlinks e o rsync recebe
+  apenas a lista de caminhos alterados (`--files-from`).
+"""
+from __future__ import annotations
+
+import contextlib
+import os
+import shutil
+import stat
+import struct
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+JOURNAL_NAME = "journal.bin"
+_MAGIC = b"HLJ1"
+_HEADER = struct.Struct("<4sH")
+# prefixo compartilhado, tamanho do sufixo, tipo, inode, tamanho, mtime_ns
+_RECORD = struct.Struct("<HHBQQq")
+
+KIND_FILE = 0
+KIND_DIR = 1
+KIND_SYMLINK = 2
+KIND_OTHER = 3
+
+
+class FileState(NamedTuple):
+    path: str
+    kind: int
+    inode: int
+    size: int
+    mtime_ns: int
+
+
+def _kind(mode: int) -> int:
+    if stat.S_ISREG(mode):
+        return KIND_FILE
+    if stat.S_ISDIR(mode):
+        return KIND_DIR
+    if stat.S_ISLNK(mode):
+        return KIND_SYMLINK
+    return KIND_OTHER
+
+
+def walk_state(source: Path) -> Iterator[FileState]:
+    """Percorre a origem em pré-ordem com filhos ordenados, sem seguir symlinks."""
+
+    def _recurse(prefix: str, directory: str) -> Iterator[FileState]:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            st = entry.stat(follow_symlinks=False)
+            rel = prefix + entry.name
+            kind = _kind(st.st_mode)
+            # Tamanho de diretório varia por filesystem e não indica mudança de conteúdo.
+            size = st.st_size if kind != KIND_DIR else 0
+            yield FileState(rel, kind, st.st_ino, size, st.st_mtime_ns)
+            if kind == KIND_DIR:
+                yield from _recurse(rel + "/", entry.path)
+
+    yield from _recurse("", str(source))
+
+
+def _encode(path: str) -> bytes:
+    return os.fsencode(path)
+
+
+def write_journal(handle: BinaryIO, snapshot_name: str, states: Iterator[FileState]) -> Iterator[FileState]:
+    """Grava o journal conforme as entradas passam (gerador de passagem)."""
+
+    name = snapshot_name.encode("utf-8")
+    handle.write(_HEADER.pack(_MAGIC, len(name)))
+    handle.write(name)
+    previous = b""
+    for state in states:
+        raw = _encode(state.path)
+        shared = 0
+        limit = min(len(previous), len(raw), 0xFFFF)
+        while shared < limit and previous[shared] == raw[shared]:
+            shared += 1
+        suffix = raw[shared:]
+        handle.write(_RECORD.pack(shared, len(suffix), state.kind, state.inode, state.size, state.mtime_ns))
+        handle.write(suffix)
+        previous = raw
+        yield state
+
+
+def read_journal(handle: BinaryIO) -> tuple[str, Iterator[FileState]]:
+    """Retorna (nome do snapshot, iterador das entradas) de um journal aberto."""
+
+    magic, name_len = _HEADER.unpack(handle.read(_HEADER.size))
+    if magic != _MAGIC:
+        raise ValueError("Journal com formato desconhecido")
+    snapshot_name = handle.read(name_len).decode("utf-8")
+
+    def _records() -> Iterator[FileState]:
+        previous = b""
+        while True:
+            head = handle.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            shared, suffix_len, kind, inode, size, mtime_ns = _RECORD.unpack(head)
+            raw = previous[:shared] + handle.read(suffix_len)
+            previous = raw
+            yield FileState(os.fsdecode(raw), kind, inode, size, mtime_ns)
+
+    return snapshot_name, _records()
+
+
+def _sort_key(path: str) -> list[str]:
+    return path.split("/")
+
+
+@dataclass
+class JournalDiff:
+    """Diferença entre o estado atual da origem e o journal anterior."""
+
+    comparable: bool
+    entries: int = 0
+    changed: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+
+    @property
+    def unchanged(self) -> bool:
+        return self.comparable and not self.changed and not self.deleted
+
+
+def diff_states(previous: Iterator[FileState], current: Iterator[FileState]) -> JournalDiff:
+    """Compara dois fluxos ordenados da mesma forma (merge em streaming)."""
+
+    result = JournalDiff(comparable=True)
+    old = next(previous, None)
+    for state in current:
+        result.entries += 1
+        key = _sort_key(state.path)
+        while old is not None and _sort_key(old.path) < key:
+            result.deleted.append(old.path)
+            old = next(previous, None)
+        if old is not None and old.path == state.path:
+            if old[1:] != state[1:]:
+                result.changed.append(state.path)
+            old = next(previous, None)
+        else:
+            result.changed.append(state.path)
+    while old is not None:
+        result.deleted.append(old.path)
+        old = next(previous, None)
+    return result
+
+
+class JournalScan:
+    """Varredura da origem que prepara o próximo journal sem substituí-lo ainda.
+
+    O novo journal é escrito em um arquivo temporário e só vira o oficial com
+    `commit()`, chamado depois que o snapshot correspondente terminou com sucesso.
+    """
+
+    def __init__(self, journal_path: Path, diff: JournalDiff, pending: Path):
+        self.journal_path = journal_path
+        self.diff = diff
+        self._pending = pending
+
+    def commit(self) -> None:
+        os.replace(self._pending, self.journal_path)
+
+    def discard(self) -> None:
+        self._pending.unlink(missing_ok=True)
+
+
+def scan(source: Path, journal_path: Path, snapshot_name: str, expected_snapshot: Optional[str]) -> JournalScan:
+    """Percorre `source`, compara com o journal existente e grava o journal pendente.
+
+    O journal anterior só é usado se descrever `expected_snapshot` (o snapshot
+    apontado por `latest`); caso contrário a diferença é marcada como não comparável.
+    """
+
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    pending = journal_path.with_name(journal_path.name + ".pending")
+    with pending.open("wb") as out, contextlib.ExitStack() as stack:
+        states = write_journal(out, snapshot_name, walk_state(source))
+        previous_states: Optional[Iterator[FileState]] = None
+        if expected_snapshot is not None and journal_path.is_file():
+            handle = stack.enter_context(journal_path.open("rb"))
+            try:
+                previous_name, records = read_journal(handle)
+            except (ValueError, struct.error):
+                previous_name, records = None, None
+            if previous_name == expected_snapshot:
+                previous_states = records
+        if previous_states is None:
+            diff = JournalDiff(comparable=False, entries=sum(1 for _ in states))
+        else:
+            diff = diff_states(previous_states, states)
+    return JournalScan(journal_path, diff, pending)
+
+
+def clone_snapshot(previous: Path, snapshot_dir: Path) -> None:
+    """Cria o novo snapshot como cópia em hardlinks do anterior (`cp -al`)."""
+
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["cp", "-al", f"{previous}/.", f"{snapshot_dir}/"], check=True)
+
+
+def remove_deleted(snapshot_dir: Path, deleted: list[str]) -> None:
+    """Remove do snapshot clonado os caminhos que sumiram da origem."""
+
+    for rel in deleted:
+        path = snapshot_dir / rel
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.is_symlink() or path.exists():
+            path.unlink()
+
+
+def write_files_from(path: Path, changed: list[str]) -> Path:
+    """Grava a lista para `rsync --files-from --from0` (separada por NUL)."""
+
+    path.write_bytes(b"".join(_encode(rel) + b"\0" for rel in changed))
+    return path
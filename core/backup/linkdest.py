@@ -0,0 +1,114 @@
+"""Várias gerações como `--link-dest` e medição do que virou hardlink.
+
+Com só o snapshot mais recente como base, um arquivo que sumiu e voltou
+(movido e devolvido, restaurado da lixeira do Nextcloud, renomeado de volta)
+é copiado inteiro, mesmo que um snapshot mais antigo tenha os mesmos bytes no
+mesmo caminho. O rsync aceita até 20 `--link-dest` e usa o primeiro que casar;
+`select_link_dests` escolhe o `latest` seguido dos snapshots mais novos.
+
+`measure_links` percorre o snapshot recém-criado e separa bytes em hardlink
+(nlink > 1) de bytes copiados (nlink == 1), além de contar quantos hardlinks
+vieram de gerações anteriores ao `latest`, que é a economia desta opção.
+"""
+from __future__ import annotations
+
+import os
+import stat
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+# Limite do rsync (MAX_BASIS_DIRS) para --link-dest/--compare-dest/--copy-dest.
+MAX_LINK_DESTS = 20
+
+
+@dataclass
+class LinkReport:
+    files_linked: int = 0
+    files_copied: int = 0
+    bytes_linked: int = 0
+    bytes_copied: int = 0
+    files_linked_older: int = 0
+    bytes_linked_older: int = 0
+
+    @property
+    def savings_ratio(self) -> float:
+        total = self.bytes_linked + self.bytes_copied
+        return self.bytes_linked / total if total else 0.0
+
+    def as_dict(self) -> dict[str, object]:
+        data: dict[str, object] = asdict(self)
+        data["savings_ratio"] = round(self.savings_ratio, 4)
+        return data
+
+
+def select_link_dests(
+    snapshots_dir: Path,
+    latest: Optional[Path],
+    generations: int,
+    exclude: Optional[Path] = None,
+) -> list[Path]:
+    """Retorna até `generations` snapshots (máx. 20): o `latest` primeiro, depois os mais novos."""
+
+    generations = max(0, min(generations, MAX_LINK_DESTS))
+    if generations == 0 or latest is None:
+        return []
+    chosen = [latest]
+    skip = {latest.resolve()}
+    if exclude is not None:
+        skip.add(exclude.resolve())
+    if snapshots_dir.is_dir():
+        candidates = sorted((p for p in snapshots_dir.iterdir() if p.is_dir()), reverse=True)
+        for snapshot in candidates:
+            if len(chosen) >= generations:
+                break
+            if snapshot.resolve() not in skip:
+                chosen.append(snapshot)
+    return chosen
+
+
+def measure_links(snapshot_dir: Path, latest: Optional[Path] = None) -> LinkReport:
+    """Conta arquivos regulares do snapshot em hardlink x copiados.
+
+    Um hardlink cujo inode difere do mesmo caminho em `latest` (ou que não existe
+    lá) veio de uma geração mais antiga.
+    """
+
+    report = LinkReport()
+    stack = [("", str(snapshot_dir))]
+    latest_root = str(latest) if latest else None
+    while stack:
+        prefix, directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            rel = f"{prefix}{entry.name}"
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                stack.append((f"{rel}/", entry.path))
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            if st.st_nlink <= 1:
+                report.files_copied += 1
+                report.bytes_copied += st.st_size
+                continue
+            report.files_linked += 1
+            report.bytes_linked += st.st_size
+            if latest_root is not None and not _same_inode(os.path.join(latest_root, rel), st):
+                report.files_linked_older += 1
+                report.bytes_linked_older += st.st_size
+    return report
+
+
+def _same_inode(path: str, st: os.stat_result) -> bool:
+    try:
+        other = os.lstat(path)
+    except OSError:
+        return False
+    return other.st_ino == st.st_ino and other.st_dev == st.st_dev
@@ -0,0 +1,430 @@
+"""Engine de cópia em Python, sem depender do rsync.
+
+Gera o mesmo layout de `rsync -a --numeric-ids --link-dest=<anterior>`:
+arquivos iguais ao snapshot anterior (mesmo tamanho, mtime, modo e dono) viram
+hardlinks; os demais são copiados com `os.copy_file_range` (cópia no kernel,
+reflink em btrfs/xfs), com fallback para `os.sendfile` e, por fim, cópia em
+buffer. Modo, dono (quando root), mtime, links simbólicos, FIFOs e devices
+são preservados; diretórios recebem os metadados no fim, de baixo para cima.
+
+A árvore é percorrida por um pool de threads: cada diretório vira uma tarefa
+e os arquivos são processados em lotes, então `lstat`/`open` de diretórios
+diferentes se sobrepõem. Como cada decisão passa pelo Python, as estatísticas
+(hardlinks, bytes copiados) ficam disponíveis sem parsear a saída do rsync.
+
+Com `resume=True` o destino pode ter sobrado de uma execução interrompida:
+arquivos já completos (mesmo tamanho, mtime, modo e dono da origem) são
+mantidos, os incompletos são refeitos e o que sumiu da origem é removido.
+"""
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import stat
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+from core.backup.pagecache import CacheDropper
+from core.backup.pruning import RateLimiter
+
+DEFAULT_WORKERS = 4
+FILE_BATCH_SIZE = 256
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_ERROR_MESSAGES = 20
+# Mesmo código do rsync para "transferência parcial": o snapshot não é promovido.
+PARTIAL_TRANSFER_CODE = 23
+
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+@dataclass
+class NativeStats:
+    files: int = 0
+    dirs: int = 0
+    symlinks: int = 0
+    specials: int = 0
+    linked: int = 0
+    copied: int = 0
+    bytes_linked: int = 0
+    bytes_copied: int = 0
+    skipped: int = 0
+    resumed: int = 0
+    # Hardlinks recusados pelo sistema de arquivos (EMLINK, EXDEV, EPERM) que viraram cópia.
+    link_fallbacks: int = 0
+    errors: int = 0
+    messages: list[str] = field(default_factory=list)
+
+    def add(self, other: "NativeStats") -> None:
+        for name in (
+            "files",
+            "dirs",
+            "symlinks",
+            "specials",
+            "linked",
+            "copied",
+            "bytes_linked",
+            "bytes_copied",
+            "skipped",
+            "resumed",
+            "link_fallbacks",
+            "errors",
+        ):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        room = MAX_ERROR_MESSAGES - len(self.messages)
+        if room > 0:
+            self.messages.extend(other.messages[:room])
+
+    def error(self, path: str, exc: OSError) -> None:
+        self.errors += 1
+        if len(self.messages) < MAX_ERROR_MESSAGES:
+            self.messages.append(f"{path}: {exc.strerror or exc}")
+
+    def as_dict(self) -> dict[str, object]:
+        return asdict(self)
+
+
+def _normalize_excludes(excludes: Iterable[str]) -> frozenset[str]:
+    """Aceita os padrões ancorados usados no rsync (ex.: "/db.sqlite3") como caminhos relativos."""
+
+    return frozenset(pattern.strip("/") for pattern in excludes if pattern.strip("/"))
+
+
+def _same_file(st: os.stat_result, previous: os.stat_result) -> bool:
+    """Critério do `--link-dest`: conteúdo presumido igual e atributos idênticos."""
+
+    return (
+        stat.S_ISREG(previous.st_mode)
+        and st.st_size == previous.st_size
+        and st.st_mtime_ns == previous.st_mtime_ns
+        and st.st_mode == previous.st_mode
+        and st.st_uid == previous.st_uid
+        and st.st_gid == previous.st_gid
+    )
+
+
+def copy_data(src_fd: int, dst_fd: int, size: int, limiter: Optional[RateLimiter] = None) -> int:
+    """Copia `size` bytes entre descritores: copy_file_range -> sendfile -> read/write.
+
+    `limiter` (em bytes/s) é consultado a cada bloco copiado.
+    """
+
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                if limiter is not None:
+                    limiter.acquire(n)
+            if copied >= size:
+                return copied
+        except OSError as exc:
+            if exc.errno not in _FALLBACK_ERRNOS or copied:
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            while copied < size:
+                n = os.sendfile(dst_fd, src_fd, copied, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                if limiter is not None:
+                    limiter.acquire(n)
+            if copied >= size:
+                return copied
+        except OSError as exc:
+            if exc.errno not in _FALLBACK_ERRNOS or copied:
+                raise
+    # Arquivo cresceu durante a cópia ou syscalls indisponíveis: termina em buffer.
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dst_fd, copied, os.SEEK_SET)
+    while True:
+        block = os.read(src_fd, COPY_CHUNK_SIZE)
+        if not block:
+            break
+        os.write(dst_fd, block)
+        copied += len(block)
+        if limiter is not None:
+            limiter.acquire(len(block))
+    return copied
+
+
+def apply_metadata(path: str, st: os.stat_result, follow_symlinks: bool = True) -> None:
+    # chown antes do chmod: trocar o dono limpa setuid/setgid.
+    if os.geteuid() == 0:
+        os.chown(path, st.st_uid, st.st_gid, follow_symlinks=follow_symlinks)
+    if follow_symlinks:
+        os.chmod(path, stat.S_IMODE(st.st_mode))
+    if follow_symlinks or os.utime in os.supports_follow_symlinks:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=follow_symlinks)
+
+
+def _copy_file(
+    src: str,
+    dst: str,
+    st: os.stat_result,
+    limiter: Optional[RateLimiter] = None,
+    dropper: Optional[CacheDropper] = None,
+) -> int:
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            copied = copy_data(src_fd, dst_fd, st.st_size, limiter)
+            if dropper is not None:
+                dropper.read(src_fd, copied)
+                dropper.written(dst_fd, dst, copied)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    apply_metadata(dst, st)
+    return copied
+
+
+def _remove_path(path: str) -> None:
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if stat.S_ISDIR(st.st_mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+class _TreeCopier:
+    def __init__(
+        self,
+        source: Path,
+        snapshot_dir: Path,
+        link_dests: Sequence[Path],
+        excludes: frozenset[str],
+        dry_run: bool,
+        resume: bool = False,
+        limiter: Optional[RateLimiter] = None,
+        dropper: Optional[CacheDropper] = None,
+    ):
+        self.source = str(source)
+        self.snapshot_dir = str(snapshot_dir)
+        self.link_dests = [str(path) for path in link_dests]
+        self.excludes = excludes
+        self.dry_run = dry_run
+        self.resume = resume and not dry_run
+        self.limiter = limiter
+        self.dropper = dropper
+
+    def scan_dir(self, rel: str) -> tuple[NativeStats, list[str], list[tuple[str, os.stat_result]], list]:
+        """Lista um diretório: cria subdiretórios no destino e devolve os demais itens para processar."""
+
+        stats = NativeStats()
+        subdirs: list[str] = []
+        items: list[tuple[str, os.stat_result]] = []
+        dir_meta: list[tuple[str, os.stat_result]] = []
+        src_dir = os.path.join(self.source, rel) if rel else self.source
+        names: set[str] = set()
+        try:
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    if child in self.excludes:
+                        continue
+                    names.add(entry.name)
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        if stat.S_ISDIR(st.st_mode):
+                            stats.dirs += 1
+                            if not self.dry_run:
+                                self._make_dir(os.path.join(self.snapshot_dir, child))
+                            subdirs.append(child)
+                            dir_meta.append((child, st))
+                        else:
+                            items.append((child, st))
+                    except OSError as exc:
+                        stats.error(child, exc)
+        except OSError as exc:
+            stats.error(rel or ".", exc)
+            return stats, subdirs, items, dir_meta
+        if self.resume:
+            self._remove_extraneous(rel, names, stats)
+        return stats, subdirs, items, dir_meta
+
+    def _make_dir(self, path: str) -> None:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            if not self.resume:
+                raise
+            if os.path.isdir(path) and not os.path.islink(path):
+                return
+            _remove_path(path)
+            os.mkdir(path, 0o700)
+
+    def _remove_extraneous(self, rel: str, names: set[str], stats: NativeStats) -> None:
+        """Na retomada, apaga do destino o que não existe mais na origem (como o --delete)."""
+
+        dst_dir = os.path.join(self.snapshot_dir, rel) if rel else self.snapshot_dir
+        try:
+            existing = os.listdir(dst_dir)
+        except OSError:
+            return
+        for name in existing:
+            if name not in names:
+                child = f"{rel}/{name}" if rel else name
+                try:
+                    _remove_path(os.path.join(dst_dir, name))
+                except OSError as exc:
+                    stats.error(child, exc)
+
+    def process_items(self, items: list[tuple[str, os.stat_result]]) -> NativeStats:
+        stats = NativeStats()
+        for rel, st in items:
+            try:
+                self._process(rel, st, stats)
+            except OSError as exc:
+                stats.error(rel, exc)
+        return stats
+
+    def _process(self, rel: str, st: os.stat_result, stats: NativeStats) -> None:
+        src = os.path.join(self.source, rel)
+        dst = os.path.join(self.snapshot_dir, rel)
+        mode = st.st_mode
+        if self.resume and self._resumable(dst, st, stats):
+            return
+        if stat.S_ISREG(mode):
+            stats.files += 1
+            previous = self._previous(rel, st)
+            if previous is not None and self._link(previous, dst, stats):
+                stats.linked += 1
+                stats.bytes_linked += st.st_size
+                return
+            stats.bytes_copied += st.st_size if self.dry_run else _copy_file(src, dst, st, self.limiter, self.dropper)
+            stats.copied += 1
+        elif stat.S_ISLNK(mode):
+            stats.symlinks += 1
+            if not self.dry_run:
+                os.symlink(os.readlink(src), dst)
+                apply_metadata(dst, st, follow_symlinks=False)
+        elif stat.S_ISFIFO(mode) or ((stat.S_ISCHR(mode) or stat.S_ISBLK(mode)) and os.geteuid() == 0):
+            stats.specials += 1
+            if not self.dry_run:
+                os.mknod(dst, mode, st.st_rdev)
+                apply_metadata(dst, st)
+        else:
+            # Sockets e devices sem root: o rsync também os ignora ("skipping non-regular file").
+            stats.skipped += 1
+
+    def _link(self, previous: str, dst: str, stats: NativeStats) -> bool:
+        """Cria o hardlink; se o sistema de arquivos recusar, o arquivo é copiado (como o rsync)."""
+
+        if self.dry_run:
+            return True
+        try:
+            os.link(previous, dst)
+        except OSError:
+            # EMLINK (inode no limite de links), EXDEV, EPERM (ex.: protected_hardlinks).
+            stats.link_fallbacks += 1
+            return False
+        return True
+
+    def _resumable(self, dst: str, st: os.stat_result, stats: NativeStats) -> bool:
+        """Mantém um arquivo regular já completo; qualquer outra sobra é apagada para ser refeita."""
+
+        try:
+            current = os.lstat(dst)
+        except FileNotFoundError:
+            return False
+        if stat.S_ISREG(st.st_mode) and _same_file(st, current):
+            stats.files += 1
+            stats.resumed += 1
+            return True
+        _remove_path(dst)
+        return False
+
+    def _previous(self, rel: str, st: os.stat_result) -> Optional[str]:
+        """Primeiro candidato a hardlink, na ordem dos `--link-dest` (como o rsync)."""
+
+        for base in self.link_dests:
+            path = os.path.join(base, rel)
+            try:
+                if _same_file(st, os.lstat(path)):
+                    return path
+            except OSError:
+                continue
+        return None
+
+
+def copy_tree(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path] = None,
+    workers: int = DEFAULT_WORKERS,
+    excludes: Iterable[str] = (),
+    dry_run: bool = False,
+    extra_link_dests: Sequence[Path] = (),
+    resume: bool = False,
+    limiter: Optional[RateLimiter] = None,
+    dropper: Optional[CacheDropper] = None,
+) -> NativeStats:
+    """Copia `source` para `snapshot_dir` reaproveitando hardlinks de `link_dest`.
+
+    `extra_link_dests` são gerações mais antigas consultadas depois de `link_dest`.
+
+    `snapshot_dir` deve estar vazio (snapshot novo), exceto com `resume=True`,
+    que completa um snapshot interrompido. `limiter` limita os bytes copiados por
+    segundo (hardlinks não contam). `dropper` libera do page cache cada arquivo
+    copiado logo após a cópia (modo amigável ao cache). Erros por arquivo são contabilizados em
+    `errors`/`messages` sem interromper a cópia.
+    """
+
+    copier = _TreeCopier(
+        source.resolve(),
+        snapshot_dir,
+        [path.resolve() for path in ([link_dest] if link_dest else []) + list(extra_link_dests)],
+        _normalize_excludes(excludes),
+        dry_run,
+        resume,
+        limiter,
+        dropper,
+    )
+    if not dry_run:
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+    stats = NativeStats()
+    directories: list[tuple[str, os.stat_result]] = [("", source.stat())]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending: set[Future] = {pool.submit(copier.scan_dir, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if isinstance(result, NativeStats):
+                    stats.add(result)
+                    continue
+                dir_stats, subdirs, items, dir_meta = result
+                stats.add(dir_stats)
+                directories.extend(dir_meta)
+                for start in range(0, len(items), FILE_BATCH_SIZE):
+                    pending.add(pool.submit(copier.process_items, items[start : start + FILE_BATCH_SIZE]))
+                for rel in subdirs:
+                    pending.add(pool.submit(copier.scan_dir, rel))
+
+    if not dry_run:
+        # Metadados de diretório por último, dos mais profundos para a raiz, para o mtime não mudar.
+        for rel, st in sorted(directories, key=lambda item: item[0].count("/") + bool(item[0]), reverse=True):
+            path = os.path.join(str(snapshot_dir), rel) if rel else str(snapshot_dir)
+            try:
+                apply_metadata(path, st)
+            except OSError as exc:
+                stats.error(rel or ".", exc)
+    return stats
+
+
+def returncode(stats: NativeStats) -> int:
+    return PARTIAL_TRANSFER_CODE if stats.errors else 0
+
@@ -0,0 +1,485 @@
+"""Exportação offsite de snapshots para um bucket S3 compatível.
+
+Enviar milhões de arquivos pequenos do Nextcloud um objeto por vez pelo uplink
+de casa não termina nunca. Aqui o snapshot (ou só o delta contra o último
+exportado) é empacotado em poucos arquivos `tar.gz` grandes, cada um enviado
+em upload multipart com partes em paralelo.
+
+O delta é barato graças aos hardlinks: um arquivo cujo inode é o mesmo no
+snapshot exportado anteriormente não mudou. A comparação anda pelos dois
+snapshots diretório a diretório, então caminhos removidos também são
+registrados sem manter a lista inteira em memória.
+
+Cada arquivo `.tar.gz` tem SHA-256 registrado no manifesto (e nos metadados
+do objeto) e cada parte vai com `Content-MD5`, verificado pelo servidor. O
+progresso fica em `<target>/offsite/pending.json`. Snapshots são imutáveis e
+os arquivos são gerados de forma determinística (gzip com mtime 0, ordem
+fixa), então uma exportação interrompida reaproveita o upload multipart em
+aberto e só envia as partes que o servidor ainda não tem. O `manifest.json`
+é o último objeto gravado e marca a exportação como completa.
+
+Layout no bucket: `<prefix>/<snapshot>/archive-00001.tar.gz`, `index.jsonl.gz`
+(caminho -> arquivo `.tar.gz`, mais os removidos) e `manifest.json`.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import stat
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from core.backup import chunkstore, restore, s3, staging
+
+OFFSITE_DIRNAME = "offsite"
+STATE_NAME = "state.json"
+PENDING_NAME = "pending.json"
+STAGING_DIRNAME = "staging"
+MIB = 1024 * 1024
+DEFAULT_ARCHIVE_SIZE = 512 * MIB
+DEFAULT_PART_SIZE = 16 * MIB
+MIN_PART_SIZE = 5 * MIB
+MAX_PARTS = 10000
+DEFAULT_WORKERS = 4
+DEFAULT_COMPRESS_LEVEL = 6
+HISTORY_LIMIT = 50
+
+
+@dataclass(frozen=True)
+class Entry:
+    path: str
+    kind: str  # "f" arquivo, "l" symlink, "d" diretório
+    size: int = 0
+
+
+@dataclass
+class ExportReport:
+    snapshot: str
+    base: Optional[str] = None
+    entries: int = 0
+    files: int = 0
+    bytes: int = 0
+    deleted: int = 0
+    archives: int = 0
+    archive_bytes: int = 0
+    parts_uploaded: int = 0
+    parts_reused: int = 0
+    bytes_uploaded: int = 0
+    resumed: bool = False
+    manifest_key: str = ""
+    message: str = ""
+    duration_s: float = 0.0
+
+    def as_dict(self) -> dict[str, object]:
+        return asdict(self)
+
+
+@dataclass
+class _Pending:
+    path: Path
+    data: dict[str, Any] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def save(self) -> None:
+        with self.lock:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(self.data, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def _scan(path: str) -> dict[str, os.DirEntry]:
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry for entry in entries}
+    except FileNotFoundError:
+        return {}
+
+
+def plan_delta(snapshot_dir: Path, base_dir: Optional[Path]) -> tuple[list[Entry], list[str]]:
+    """Entradas do snapshot a exportar (todas, sem base) e caminhos removidos desde a base."""
+
+    entries: list[Entry] = []
+    deleted: list[str] = []
+    # (relativo, existe na base como diretório)
+    stack: list[tuple[str, bool]] = [("", base_dir is not None)]
+    while stack:
+        rel, in_base = stack.pop()
+        current = _scan(os.path.join(snapshot_dir, rel))
+        previous = _scan(os.path.join(base_dir, rel)) if in_base and base_dir is not None else {}
+        for name in sorted(previous.keys() - current.keys()):
+            deleted.append(f"{rel}/{name}" if rel else name)
+        subdirs: list[tuple[str, bool]] = []
+        for name in sorted(current):
+            child = f"{rel}/{name}" if rel else name
+            entry = current[name]
+            st = entry.stat(follow_symlinks=False)
+            old = previous.get(name)
+            old_st = old.stat(follow_symlinks=False) if old is not None else None
+            if stat.S_ISDIR(st.st_mode):
+                old_is_dir = old_st is not None and stat.S_ISDIR(old_st.st_mode)
+                if not old_is_dir:
+                    entries.append(Entry(child, "d"))
+                subdirs.append((child, old_is_dir))
+            elif stat.S_ISREG(st.st_mode):
+                if old_st is None or (old_st.st_dev, old_st.st_ino) != (st.st_dev, st.st_ino):
+                    entries.append(Entry(child, "f", st.st_size))
+            elif stat.S_ISLNK(st.st_mode):
+                if (
+                    old_st is None
+                    or not stat.S_ISLNK(old_st.st_mode)
+                    or os.readlink(old.path) != os.readlink(entry.path)
+                ):
+                    entries.append(Entry(child, "l"))
+        # Ordem de saída estável: subdiretórios em ordem alfabética.
+        stack.extend(reversed(subdirs))
+    return entries, deleted
+
+
+def assign_archives(entries: list[Entry], archive_size: int) -> list[list[Entry]]:
+    """Agrupa as entradas em arquivos de até ~`archive_size` bytes (um arquivo grande fica sozinho)."""
+
+    archives: list[list[Entry]] = []
+    current: list[Entry] = []
+    current_size = 0
+    for entry in entries:
+        if current and current_size + entry.size > archive_size:
+            archives.append(current)
+            current, current_size = [], 0
+        current.append(entry)
+        current_size += entry.size
+    if current:
+        archives.append(current)
+    return archives
+
+
+def _plan_digest(archives: list[list[Entry]], base: Optional[str]) -> str:
+    digest = hashlib.sha256(f"{base}\n".encode())
+    for number, group in enumerate(archives, 1):
+        for entry in group:
+            digest.update(f"{number}\0{entry.kind}\0{entry.size}\0{entry.path}\n".encode())
+    return digest.hexdigest()
+
+
+class _HashingWriter(io.RawIOBase):
+    def __init__(self, handle: io.BufferedWriter):
+        self.handle = handle
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        self.handle.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+def build_archive(
+    snapshot_dir: Path, entries: list[Entry], destination: Path, compress_level: int = DEFAULT_COMPRESS_LEVEL
+) -> tuple[str, int]:
+    """Grava o tar.gz determinístico das entradas; retorna (sha256, tamanho)."""
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destination.with_name(destination.name + ".tmp")
+    with tmp.open("wb") as handle:
+        writer = _HashingWriter(handle)
+        with gzip.GzipFile(filename="", mode="wb", fileobj=writer, compresslevel=compress_level, mtime=0) as gz:
+            with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for entry in entries:
+                    path = os.path.join(snapshot_dir, entry.path)
+                    info = tar.gettarinfo(path, arcname=entry.path)
+                    if info.isreg():
+                        with open(path, "rb") as source:
+                            tar.addfile(info, source)
+                    else:
+                        tar.addfile(info)
+    os.replace(tmp, destination)
+    return writer.sha256.hexdigest(), writer.size
+
+
+def upload_file(
+    client: s3.S3Client,
+    path: Path,
+    key: str,
+    sha256: str,
+    record: dict[str, Any],
+    pending: _Pending,
+    report: ExportReport,
+    part_size: int = DEFAULT_PART_SIZE,
+    workers: int = DEFAULT_WORKERS,
+) -> None:
+    """Upload multipart com partes em paralelo, retomando o upload registrado em `record`."""
+
+    size = path.stat().st_size
+    part_size = max(part_size, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    count = max(1, math.ceil(size / part_size))
+    upload_id = record.get("upload_id")
+    existing: dict[int, tuple[str, int]] = {}
+    if upload_id:
+        try:
+            existing = client.list_parts(key, upload_id)
+            report.resumed = True
+        except s3.S3Error as exc:
+            if exc.status != 404:
+                raise
+            upload_id = None
+    if not upload_id:
+        upload_id = client.create_multipart_upload(key, {"sha256": sha256})
+        record["upload_id"] = upload_id
+        pending.save()
+
+    counters_lock = threading.Lock()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+
+        def _send(number: int) -> tuple[int, str]:
+            data = os.pread(fd, part_size, (number - 1) * part_size)
+            md5 = hashlib.md5(data).hexdigest()
+            known = existing.get(number)
+            if known is not None and known[0] == md5 and known[1] == len(data):
+                with counters_lock:
+                    report.parts_reused += 1
+                return number, md5
+            etag = client.upload_part(key, upload_id, number, data)
+            with counters_lock:
+                report.parts_uploaded += 1
+                report.bytes_uploaded += len(data)
+            return number, etag
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            etags = dict(pool.map(_send, range(1, count + 1)))
+    finally:
+        os.close(fd)
+    client.complete_multipart_upload(key, upload_id, etags)
+
+
+def _load_json(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _abort_stale(client: s3.S3Client, data: dict[str, Any]) -> None:
+    for record in data.get("uploads", {}).values():
+        if record.get("upload_id") and not record.get("done"):
+            try:
+                client.abort_multipart_upload(record["key"], record["upload_id"])
+            except s3.S3Error:
+                pass
+
+
+def _write_index(destination: Path, archives: list[list[Entry]], names: list[str], deleted: list[str]) -> None:
+    tmp = destination.with_name(destination.name + ".tmp")
+    with tmp.open("wb") as handle, gzip.GzipFile(filename="", mode="wb", fileobj=handle, mtime=0) as gz:
+        for name, group in zip(names, archives):
+            for entry in group:
+                record = {"path": entry.path, "type": entry.kind, "size": entry.size, "archive": name}
+                gz.write((json.dumps(record, separators=(",", ":")) + "\n").encode())
+        for path in deleted:
+            gz.write((json.dumps({"path": path, "deleted": True}, separators=(",", ":")) + "\n").encode())
+    os.replace(tmp, destination)
+
+
+def export_snapshot(
+    snapshot_dir: Path,
+    target: Path,
+    client: s3.S3Client,
+    prefix: str,
+    full: bool = False,
+    archive_size: int = DEFAULT_ARCHIVE_SIZE,
+    part_size: int = DEFAULT_PART_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+) -> ExportReport:
+    """Exporta `snapshot_dir` (ou o delta contra o último exportado) para o bucket."""
+
+    started = time.monotonic()
+    name = snapshot_dir.name
+    offsite_dir = target / OFFSITE_DIRNAME
+    staging_dir = offsite_dir / STAGING_DIRNAME
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    state = _load_json(offsite_dir / STATE_NAME)
+    report = ExportReport(snapshot=name)
+
+    base_name = None if full else state.get("last_exported")
+    if base_name == name:
+        report.base = base_name
+        report.message = "snapshot já exportado"
+        return report
+    base_dir = target / "snapshots" / base_name if base_name else None
+    if base_dir is not None and not base_dir.is_dir():
+        # A base saiu da retenção local: sem ela não há como calcular o delta.
+        base_name, base_dir = None, None
+    report.base = base_name
+
+    entries, deleted = plan_delta(snapshot_dir, base_dir)
+    archives = assign_archives(entries, archive_size)
+    names = [f"archive-{number:05d}.tar.gz" for number in range(1, len(archives) + 1)]
+    digest = _plan_digest(archives, base_name)
+    report.entries = len(entries)
+    report.files = sum(1 for entry in entries if entry.kind == "f")
+    report.bytes = sum(entry.size for entry in entries)
+    report.deleted = len(deleted)
+    report.archives = len(archives)
+
+    pending = _Pending(offsite_dir / PENDING_NAME, _load_json(offsite_dir / PENDING_NAME))
+    if pending.data.get("snapshot") != name or pending.data.get("plan") != digest:
+        _abort_stale(client, pending.data)
+        for leftover in staging_dir.iterdir():
+            leftover.unlink()
+        pending.data = {"snapshot": name, "base": base_name, "plan": digest, "uploads": {}}
+        pending.save()
+    uploads: dict[str, Any] = pending.data["uploads"]
+
+    def _stage_and_upload(object_name: str, build) -> dict[str, Any]:
+        key = f"{prefix}/{name}/{object_name}"
+        record = uploads.setdefault(object_name, {"key": key})
+        if record.get("done"):
+            return record
+        local = staging_dir / object_name
+        if not (record.get("sha256") and local.is_file() and local.stat().st_size == record.get("size")):
+            sha256, size = build(local)
+            if record.get("sha256") not in (None, sha256) and record.get("upload_id"):
+                # Conteúdo diferente do que começou a subir: o upload antigo não serve mais.
+                _abort_stale(client, {"uploads": {object_name: record}})
+                record.pop("upload_id", None)
+            record.update(sha256=sha256, size=size)
+            pending.save()
+        upload_file(client, local, key, record["sha256"], record, pending, report, part_size, workers)
+        record["done"] = True
+        pending.save()
+        local.unlink(missing_ok=True)
+        return record
+
+    manifest_archives = []
+    for object_name, group in zip(names, archives):
+        record = _stage_and_upload(
+            object_name, lambda dest, group=group: build_archive(snapshot_dir, group, dest, compress_level)
+        )
+        report.archive_bytes += record["size"]
+        manifest_archives.append(
+            {
+                "key": record["key"],
+                "sha256": record["sha256"],
+                "size": record["size"],
+                "entries": len(group),
+                "bytes": sum(entry.size for entry in group),
+            }
+        )
+
+    def _build_index(dest: Path) -> tuple[str, int]:
+        _write_index(dest, archives, names, deleted)
+        return hashlib.sha256(dest.read_bytes()).hexdigest(), dest.stat().st_size
+
+    index = _stage_and_upload("index.jsonl.gz", _build_index)
+
+    manifest = {
+        "snapshot": name,
+        "base": base_name,
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "archives": manifest_archives,
+        "index": {"key": index["key"], "sha256": index["sha256"]},
+        "entries": report.entries,
+        "files": report.files,
+        "bytes": report.bytes,
+        "deleted": report.deleted,
+    }
+    report.manifest_key = f"{prefix}/{name}/manifest.json"
+    client.put_object(report.manifest_key, json.dumps(manifest, indent=2).encode("utf-8"))
+
+    history = state.get("exports", [])
+    history.append({"snapshot": name, "base": base_name, "archives": len(archives), "bytes": report.archive_bytes})
+    state.update(last_exported=name, exports=history[-HISTORY_LIMIT:])
+    tmp = offsite_dir / (STATE_NAME + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, offsite_dir / STATE_NAME)
+    (offsite_dir / PENDING_NAME).unlink(missing_ok=True)
+    report.duration_s = round(time.monotonic() - started, 3)
+    return report
+
+
+def add_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser(
+        "offsite", help="Exporta um snapshot (ou o delta) para bucket S3 em arquivos tar.gz com upload multipart"
+    )
+    parser.add_argument("snapshot", nargs="?", default="latest", help="Nome do snapshot ou 'latest' (default)")
+    parser.add_argument("--full", action="store_true", help="Exporta o snapshot inteiro, sem delta")
+    parser.add_argument("--endpoint", default=os.getenv("BACKUP_S3_ENDPOINT"), help="URL do S3 (BACKUP_S3_ENDPOINT)")
+    parser.add_argument("--bucket", default=os.getenv("BACKUP_S3_BUCKET"), help="Bucket (BACKUP_S3_BUCKET)")
+    parser.add_argument("--prefix", default=None, help="Prefixo das chaves (default: nome do diretório de destino)")
+    parser.add_argument(
+        "--archive-size", type=int, default=DEFAULT_ARCHIVE_SIZE // MIB, help="Tamanho alvo de cada tar.gz em MiB"
+    )
+    parser.add_argument(
+        "--part-size", type=int, default=DEFAULT_PART_SIZE // MIB, help="Tamanho de cada parte do multipart em MiB"
+    )
+    parser.add_argument(
+        "--upload-workers", type=int, default=DEFAULT_WORKERS, help="Partes enviadas em paralelo"
+    )
+    parser.add_argument(
+        "--compress-level", type=int, default=DEFAULT_COMPRESS_LEVEL, help="Nível do gzip (1 = mais rápido)"
+    )
+
+
+def run_command(args: argparse.Namespace, target: Path) -> int:
+    snapshot_dir = restore.resolve_snapshot(target, args.snapshot)
+    if not snapshot_dir.is_dir():
+        print(f"[ERRO] Snapshot inexistente: {snapshot_dir}")
+        return 2
+    if chunkstore.has_manifest(snapshot_dir):
+        print("[ERRO] Exportação offsite exige snapshots com hardlinks (engine rsync ou native)")
+        return 2
+    access_key = os.getenv("BACKUP_S3_ACCESS_KEY")
+    secret_key = os.getenv("BACKUP_S3_SECRET_KEY")
+    if not (args.endpoint and args.bucket and access_key and secret_key):
+        print("[ERRO] Configure BACKUP_S3_ENDPOINT, BACKUP_S3_BUCKET, BACKUP_S3_ACCESS_KEY e BACKUP_S3_SECRET_KEY")
+        return 2
+    credentials = s3.Credentials(access_key, secret_key, os.getenv("BACKUP_S3_REGION", s3.DEFAULT_REGION))
+    client = s3.S3Client(args.endpoint, args.bucket, credentials)
+    offsite_dir = target / OFFSITE_DIRNAME
+    offsite_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        lock = staging.BackupLock(offsite_dir / staging.LOCK_NAME)
+        lock.acquire()
+    except staging.LockBusy as exc:
+        print(f"[ERRO] Outra exportação em andamento: {exc}")
+        return staging.LOCK_BUSY_CODE
+    with lock:
+        try:
+            report = export_snapshot(
+                snapshot_dir,
+                target,
+                client,
+                prefix=(args.prefix or target.name).strip("/"),
+                full=args.full,
+                archive_size=args.archive_size * MIB,
+                part_size=args.part_size * MIB,
+                workers=args.upload_workers,
+                compress_level=args.compress_level,
+            )
+        except (s3.S3Error, OSError) as exc:
+            print(f"[ERRO] Exportação interrompida (será retomada na próxima execução): {exc}")
+            return 1
+    if report.message:
+        print(f"{report.snapshot}: {report.message}")
+        return 0
+    print(
+        f"snapshot={report.snapshot}  base={report.base or '-'}  entradas={report.entries}  "
+        f"removidos={report.deleted}  arquivos_tar={report.archives} ({report.archive_bytes} bytes)  "
+        f"partes={report.parts_uploaded} enviadas/{report.parts_reused} reaproveitadas  tempo={report.duration_s}s"
+    )
+    return 0
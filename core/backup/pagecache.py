@@ -0,0 +1,300 @@
+"""Modo amigável ao page cache para as rotinas de backup.
+
+Ler a árvore de dados inteira empurra para fora do cache as páginas quentes do
+Postgres e do PHP-FPM. Com o modo ativo, as páginas tocadas pelo backup são
+devolvidas ao kernel com `posix_fadvise(POSIX_FADV_DONTNEED)` logo depois de
+cada arquivo, e não só no fim da cópia:
+
+- engines native e chunkstore: `CacheDropper` aplica o fadvise na origem assim
+  que o arquivo é lido e no destino assim que é gravado (ver a classe);
+- rsync: roda embrulhado pelo `nocache` (LD_PRELOAD que aplica o fadvise em
+  cada arquivo ao fechar; o provisionamento instala o pacote).
+
+No fim, `release` só revisita o que foi gravado nesta execução (os arquivos do
+snapshot com um único link, ou a lista do `--files-from`): hardlinks para a
+geração anterior não foram lidos nem gravados e não passam por `fdatasync`.
+
+`sample` lê `/proc/meminfo` antes e depois para medir quanto do cache de arquivos
+ativo (`Active(file)`) sobreviveu ao backup.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import stat
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+MEMINFO_PATH = Path("/proc/meminfo")
+NOCACHE_BINARY = "nocache"
+DEFAULT_WRITEBACK_LAG = 64
+
+
+@dataclass
+class CacheSample:
+    """Recorte do `/proc/meminfo` relevante para o page cache (valores em bytes)."""
+
+    cached: int = 0
+    active_file: int = 0
+    inactive_file: int = 0
+    dirty: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class DropStats:
+    files: int = 0
+    bytes: int = 0
+    errors: int = 0
+
+    def add(self, other: "DropStats") -> None:
+        self.files += other.files
+        self.bytes += other.bytes
+        self.errors += other.errors
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+def read_meminfo(path: Path = MEMINFO_PATH) -> dict[str, int]:
+    """Converte o `/proc/meminfo` em um dicionário chave -> bytes."""
+
+    values: dict[str, int] = {}
+    with path.open(encoding="ascii") as handle:
+        for line in handle:
+            key, _, rest = line.partition(":")
+            fields = rest.split()
+            if not fields:
+                continue
+            value = int(fields[0])
+            if len(fields) > 1 and fields[1] == "kB":
+                value *= 1024
+            values[key.strip()] = value
+    return values
+
+
+def sample(path: Path = MEMINFO_PATH) -> Optional[CacheSample]:
+    """Amostra o page cache; retorna None fora do Linux ou sem acesso ao meminfo."""
+
+    try:
+        info = read_meminfo(path)
+    except OSError:
+        return None
+    return CacheSample(
+        cached=info.get("Cached", 0),
+        active_file=info.get("Active(file)", 0),
+        inactive_file=info.get("Inactive(file)", 0),
+        dirty=info.get("Dirty", 0),
+    )
+
+
+def compare(before: Optional[CacheSample], after: Optional[CacheSample]) -> dict[str, object]:
+    """Resume a variação do cache; `kept_ratio` é a fração do `Active(file)` preservada."""
+
+    if before is None or after is None:
+        return {}
+    kept = min(after.active_file, before.active_file)
+    ratio = kept / before.active_file if before.active_file else 1.0
+    return {
+        "before": before.as_dict(),
+        "after": after.as_dict(),
+        "cached_delta": after.cached - before.cached,
+        "kept_ratio": round(ratio, 4),
+    }
+
+
+def nocache_available() -> bool:
+    return shutil.which(NOCACHE_BINARY) is not None
+
+
+def wrap_command(cmd: Sequence[str]) -> list[str]:
+    """Prefixa o comando com `nocache` quando disponível; senão devolve-o intacto."""
+
+    if nocache_available():
+        return [NOCACHE_BINARY, *cmd]
+    return list(cmd)
+
+
+def drop_file(path: Path, sync: bool = False) -> Optional[int]:
+    """Aplica `POSIX_FADV_DONTNEED` ao arquivo e retorna o tamanho dele (None se não for arquivo regular).
+
+    Com `sync=True` faz `fdatasync` antes, para que páginas recém-gravadas também saiam do cache.
+    """
+
+    if not hasattr(os, "posix_fadvise"):
+        return None
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    try:
+        info = os.fstat(fd)
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        size = info.st_size
+        if sync:
+            os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        return size
+    finally:
+        os.close(fd)
+
+
+def _walk_files(root: Path) -> Iterable[Path]:
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield Path(entry.path)
+        except OSError:
+            continue
+
+
+def drop_paths(root: Path, rel_paths: Optional[Iterable[str]] = None, sync: bool = False) -> DropStats:
+    """Libera do cache os arquivos de `root` (todos, ou só `rel_paths`, relativos a `root`)."""
+
+    stats = DropStats()
+    if not root.exists():
+        return stats
+    candidates = _walk_files(root) if rel_paths is None else (root / rel for rel in rel_paths)
+    for path in candidates:
+        try:
+            size = drop_file(path, sync=sync)
+        except OSError:
+            # Links (O_NOFOLLOW) e arquivos removidos no meio do caminho não contam como liberados.
+            stats.errors += 1
+            continue
+        if size is not None:
+            stats.files += 1
+            stats.bytes += size
+    return stats
+
+
+class CacheDropper:
+    """Libera o cache arquivo a arquivo durante a cópia (engines native e chunkstore).
+
+    As páginas lidas estão limpas e saem no primeiro fadvise. As gravadas ainda
+    estão sujas: o fadvise só dispara a escrita delas, então o arquivo entra numa
+    fila e recebe um segundo fadvise quando outros `lag` arquivos já passaram (a
+    escrita terminou nesse meio tempo). `finish` faz `fdatasync` apenas do que
+    sobrou na fila. Pode ser compartilhado entre as threads da engine native.
+    """
+
+    def __init__(self, lag: int = DEFAULT_WRITEBACK_LAG):
+        self.lag = max(0, lag)
+        self.stats = DropStats()
+        self._pending: deque[str] = deque()
+        self._lock = threading.Lock()
+
+    def read(self, fd: int, size: int) -> None:
+        """Descarta as páginas de um arquivo que acabou de ser lido."""
+
+        self._count(_fadvise(fd), size)
+
+    def written(self, fd: int, path: str, size: int) -> None:
+        """Dispara a escrita de um arquivo recém-gravado e o agenda para o segundo fadvise."""
+
+        self._count(_fadvise(fd), size)
+        overflow: Optional[str] = None
+        with self._lock:
+            self._pending.append(path)
+            if len(self._pending) > self.lag:
+                overflow = self._pending.popleft()
+        if overflow is not None:
+            self._redrop(overflow, sync=False)
+
+    def finish(self) -> DropStats:
+        with self._lock:
+            pending, self._pending = list(self._pending), deque()
+        for path in pending:
+            self._redrop(path, sync=True)
+        return self.stats
+
+    def _count(self, ok: bool, size: int) -> None:
+        with self._lock:
+            if ok:
+                self.stats.files += 1
+                self.stats.bytes += size
+            else:
+                self.stats.errors += 1
+
+    def _redrop(self, path: str, sync: bool) -> None:
+        try:
+            drop_file(Path(path), sync=sync)
+        except OSError:
+            with self._lock:
+                self.stats.errors += 1
+
+
+def _fadvise(fd: int) -> bool:
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        return False
+    return True
+
+
+def written_files(root: Path) -> list[str]:
+    """Caminhos (relativos a `root`) dos arquivos regulares com um único link.
+
+    Num snapshot com `--link-dest`, são os arquivos gravados nesta execução; os
+    demais são hardlinks para gerações anteriores (arquivos com hardlinks entre si
+    na própria origem também ficam de fora, o que só deixa de liberá-los).
+    """
+
+    written: list[str] = []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(root / rel if rel else root) as entries:
+                for entry in entries:
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(child)
+                    elif entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_nlink == 1:
+                        written.append(child)
+        except OSError:
+            continue
+    return written
+
+
+def release(
+    before: Optional[CacheSample],
+    read_root: Path,
+    written_root: Path,
+    changed: Optional[Sequence[str]] = None,
+    written_dirs: Sequence[Path] = (),
+    dropper: Optional[CacheDropper] = None,
+) -> dict[str, object]:
+    """Fecha a liberação do cache ao fim do backup e mede o resultado.
+
+    Com `dropper` a árvore já foi liberada arquivo a arquivo: só a fila dele é
+    sincronizada, mais os caminhos de `changed` (gravados por fora da engine).
+    Sem ele, os arquivos gravados são `changed` (modo `--files-from` do journal)
+    ou, na falta da lista, os de `written_root` com um único link; cada um é
+    liberado na origem e, depois de `fdatasync`, no snapshot. `written_dirs` são
+    diretórios gravados por inteiro (ex.: dump do banco).
+    """
+
+    dropped = dropper.finish() if dropper is not None else DropStats()
+    if changed is None and dropper is None:
+        changed = written_files(written_root)
+    if changed:
+        dropped.add(drop_paths(read_root, changed))
+        dropped.add(drop_paths(written_root, changed, sync=True))
+    for directory in written_dirs:
+        dropped.add(drop_paths(directory, sync=True))
+    info = compare(before, sample())
+    info["dropped"] = dropped.as_dict()
+    info["nocache"] = nocache_available()
+    return info
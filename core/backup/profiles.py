@@ -0,0 +1,239 @@
+"""Perfis de exclusão para dados regeneráveis.
+
+Previews do Nextcloud, caches de CSS/JS, uploads em andamento e o `icon_cache`
+do Vaultwarden são recriados pelos próprios serviços, mas respondem por boa
+parte do que muda de uma noite para outra. Cada serviço tem perfis nomeados
+embutidos (`BUILTIN_PROFILES`); um arquivo JSON opcional acrescenta perfis ou
+substitui os embutidos de mesmo nome:
+
+    {"nextcloud": {"previews": ["/data/appdata_*/preview/"], "raw": ["/data/*/files/RAW/"]}}
+
+As regras seguem a sintaxe de exclude do rsync restrita a padrões ancorados:
+começam com `/` (raiz da origem), `*`/`?`/`[...]` casam dentro de um único
+componente e a barra final limita a regra a diretórios. Como todo padrão é
+ancorado, `measure` só desce na árvore até a profundidade da regra e percorre
+apenas as subárvores excluídas para somar arquivos e bytes pulados por regra.
+"""
+from __future__ import annotations
+
+import fnmatch
+import json
+import os
+import stat
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+_GLOB_CHARS = "*?["
+
+BUILTIN_PROFILES: dict[str, dict[str, tuple[str, ...]]] = {
+    "nextcloud": {
+        # Miniaturas geradas sob demanda (ou por `occ preview:generate-all`).
+        "previews": ("/data/appdata_*/preview/",),
+        # SCSS/JS compilados do tema e caches por usuário.
+        "caches": ("/data/appdata_*/css/", "/data/appdata_*/js/", "/data/*/cache/"),
+        # Pedaços de uploads em andamento; o cliente reenvia se o upload não terminou.
+        "uploads": ("/data/*/uploads/",),
+    },
+    "vaultwarden": {
+        "icon_cache": ("/icon_cache/",),
+        "tmp": ("/tmp/",),
+    },
+}
+
+
+@dataclass(frozen=True)
+class ExcludeRule:
+    profile: str
+    pattern: str
+
+    @property
+    def components(self) -> list[str]:
+        return self.pattern.strip("/").split("/")
+
+    @property
+    def dir_only(self) -> bool:
+        return self.pattern.endswith("/")
+
+
+@dataclass
+class RuleStats:
+    profile: str
+    pattern: str
+    matches: int = 0
+    files: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class ExclusionReport:
+    rules: list[RuleStats] = field(default_factory=list)
+    # Caminhos relativos efetivamente excluídos (entrada das engines native/chunkstore).
+    paths: list[str] = field(default_factory=list)
+
+    @property
+    def files(self) -> int:
+        return sum(rule.files for rule in self.rules)
+
+    @property
+    def bytes(self) -> int:
+        return sum(rule.bytes for rule in self.rules)
+
+    def as_dict(self) -> dict[str, object]:
+        return {
+            "profiles": sorted({rule.profile for rule in self.rules}),
+            "files": self.files,
+            "bytes": self.bytes,
+            "rules": [asdict(rule) for rule in self.rules],
+        }
+
+
+def _validate(pattern: str) -> str:
+    if not isinstance(pattern, str) or not pattern.startswith("/") or not pattern.strip("/"):
+        raise ValueError(f"regra de exclusão precisa ser ancorada em '/': {pattern!r}")
+    if "**" in pattern or "//" in pattern:
+        raise ValueError(f"regra de exclusão não suporta '**' nem componentes vazios: {pattern!r}")
+    return pattern
+
+
+def load_profiles(service: str, overrides_file: Optional[Path] = None) -> dict[str, tuple[str, ...]]:
+    """Perfis do serviço: embutidos + os do arquivo (que substituem os de mesmo nome)."""
+
+    available = dict(BUILTIN_PROFILES.get(service, {}))
+    if overrides_file is not None:
+        try:
+            data = json.loads(overrides_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            raise ValueError(f"arquivo de perfis inválido ({overrides_file}): {exc}") from None
+        custom = data.get(service, {}) if isinstance(data, dict) else None
+        if not isinstance(custom, dict):
+            raise ValueError(f"arquivo de perfis inválido ({overrides_file}): '{service}' deve ser um objeto")
+        for name, patterns in custom.items():
+            if not isinstance(patterns, list):
+                raise ValueError(f"perfil '{name}' deve ser uma lista de padrões")
+            available[name] = tuple(_validate(pattern) for pattern in patterns)
+    return available
+
+
+def resolve(service: str, names: Iterable[str], overrides_file: Optional[Path] = None) -> list[ExcludeRule]:
+    """Regras dos perfis pedidos, na ordem; nome desconhecido levanta ValueError."""
+
+    available = load_profiles(service, overrides_file)
+    rules: list[ExcludeRule] = []
+    for name in names:
+        if name not in available:
+            known = ", ".join(sorted(available)) or "nenhum"
+            raise ValueError(f"perfil de exclusão desconhecido para {service}: {name} (disponíveis: {known})")
+        rules.extend(ExcludeRule(name, _validate(pattern)) for pattern in available[name])
+    return rules
+
+
+def parse_names(value: str) -> list[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def rsync_patterns(rules: Sequence[ExcludeRule]) -> list[str]:
+    return [rule.pattern for rule in rules]
+
+
+def rebase(patterns: Sequence[str], relative: str) -> Optional[list[str]]:
+    """Reancora padrões na subárvore `relative` (shards do rsync).
+
+    Retorna None se algum padrão exclui a própria subárvore.
+    """
+
+    prefix = relative.strip("/").split("/")
+    rebased: list[str] = []
+    for pattern in patterns:
+        parts = pattern.strip("/").split("/")
+        if len(parts) < len(prefix) or not all(
+            fnmatch.fnmatchcase(name, glob) for name, glob in zip(prefix, parts)
+        ):
+            continue
+        if len(parts) == len(prefix):
+            return None
+        rebased.append("/" + "/".join(parts[len(prefix) :]) + ("/" if pattern.endswith("/") else ""))
+    return rebased
+
+
+def _expand(source: str, rule: ExcludeRule) -> list[tuple[str, os.stat_result]]:
+    """Caminhos da origem que casam com a regra, descendo só até a profundidade dela."""
+
+    level: list[str] = [""]
+    components = rule.components
+    found: list[tuple[str, os.stat_result]] = []
+    for depth, glob in enumerate(components):
+        last = depth == len(components) - 1
+        next_level: list[str] = []
+        for rel in level:
+            directory = os.path.join(source, rel) if rel else source
+            if any(c in glob for c in _GLOB_CHARS):
+                try:
+                    with os.scandir(directory) as entries:
+                        names = sorted(e.name for e in entries if fnmatch.fnmatchcase(e.name, glob))
+                except OSError:
+                    continue
+            else:
+                names = [glob]
+            for name in names:
+                child = f"{rel}/{name}" if rel else name
+                try:
+                    st = os.lstat(os.path.join(source, child))
+                except OSError:
+                    continue
+                is_dir = stat.S_ISDIR(st.st_mode)
+                if not last:
+                    if is_dir:
+                        next_level.append(child)
+                elif is_dir or not rule.dir_only:
+                    found.append((child, st))
+        level = next_level
+    return found
+
+
+def _tree_size(path: str, st: os.stat_result) -> tuple[int, int]:
+    if not stat.S_ISDIR(st.st_mode):
+        return 1, st.st_size
+    files = size = 0
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        child = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(child.st_mode):
+                        stack.append(entry.path)
+                    else:
+                        files += 1
+                        size += child.st_size
+        except OSError:
+            continue
+    return files, size
+
+
+def measure(source: Path, rules: Sequence[ExcludeRule]) -> ExclusionReport:
+    """Resolve as regras na origem e soma arquivos/bytes pulados por regra.
+
+    Um caminho coberto por mais de uma regra conta só na primeira.
+    """
+
+    root = str(source)
+    report = ExclusionReport()
+    claimed: list[str] = []
+    for rule in rules:
+        stats = RuleStats(rule.profile, rule.pattern)
+        for rel, st in _expand(root, rule):
+            if any(rel == path or rel.startswith(f"{path}/") for path in claimed):
+                continue
+            files, size = _tree_size(os.path.join(root, rel), st)
+            stats.matches += 1
+            stats.files += files
+            stats.bytes += size
+            claimed.append(rel)
+        report.rules.append(stats)
+    report.paths = claimed
+    return report
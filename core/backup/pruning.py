@@ -0,0 +1,216 @@
+"""Retenção em duas fases: mover para a lixeira e apagar em segundo plano.
+
+Snapshots expirados são renomeados para `<target>/trash/` (rename atômico no
+mesmo filesystem), então a retenção vale na hora e o `latest`/`last_run.json`
+não esperam a remoção. Depois, `purge_trash` apaga a lixeira com um pool de
+threads usando `os.scandir` sobre descritores e `unlink`/`rmdir` relativos
+(`dir_fd`, equivalente ao `unlinkat`), com limite opcional de operações por
+segundo para não saturar o disco. Uma execução interrompida deixa a lixeira
+parcialmente apagada e a próxima chamada simplesmente continua de onde parou.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable
+
+TRASH_DIRNAME = "trash"
+DEFAULT_PURGE_WORKERS = 2
+# Quantidade mínima de unidades de trabalho por worker antes de parar de expandir a árvore.
+_UNITS_PER_WORKER = 4
+_MAX_EXPAND_DEPTH = 3
+
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_NOFOLLOW", 0)
+
+
+@dataclass
+class PurgeStats:
+    """Resultado da limpeza: `inodes`/`bytes` contam só o que foi de fato liberado.
+
+    Arquivos com outros hardlinks (nlink > 1) somam em `entries`, mas não liberam espaço.
+    """
+
+    entries: int = 0
+    inodes: int = 0
+    bytes: int = 0
+    errors: int = 0
+    snapshots: int = 0
+
+    def add(self, other: "PurgeStats") -> None:
+        self.entries += other.entries
+        self.inodes += other.inodes
+        self.bytes += other.bytes
+        self.errors += other.errors
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class RateLimiter:
+    """Limita operações (ou bytes, via `amount`) por segundo entre várias threads (0 = sem limite)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + amount / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+def move_to_trash(snapshots: Iterable[Path], trash_dir: Path) -> list[Path]:
+    """Renomeia snapshots para a lixeira; retorna os novos caminhos."""
+
+    trash_dir.mkdir(parents=True, exist_ok=True)
+    moved: list[Path] = []
+    for snapshot in snapshots:
+        destination = trash_dir / snapshot.name
+        suffix = 1
+        while destination.exists():
+            destination = trash_dir / f"{snapshot.name}.{suffix}"
+            suffix += 1
+        os.rename(snapshot, destination)
+        moved.append(destination)
+    return moved
+
+
+def _unlink_entry(dir_fd: int, entry: os.DirEntry, limiter: RateLimiter, stats: PurgeStats) -> None:
+    try:
+        st = entry.stat(follow_symlinks=False)
+        limiter.acquire()
+        os.unlink(entry.name, dir_fd=dir_fd)
+    except FileNotFoundError:
+        return
+    except OSError:
+        stats.errors += 1
+        return
+    stats.entries += 1
+    if st.st_nlink <= 1:
+        stats.inodes += 1
+        stats.bytes += st.st_blocks * 512
+
+
+def _rmdir(parent_fd: int, name: str, limiter: RateLimiter, stats: PurgeStats) -> None:
+    limiter.acquire()
+    try:
+        os.rmdir(name, dir_fd=parent_fd)
+    except FileNotFoundError:
+        return
+    except OSError:
+        stats.errors += 1
+        return
+    stats.entries += 1
+    stats.inodes += 1
+
+
+def _purge_tree(parent_fd: int, name: str, limiter: RateLimiter, stats: PurgeStats) -> None:
+    """Apaga recursivamente `name` (relativo a `parent_fd`) e o próprio diretório."""
+
+    try:
+        fd = os.open(name, _DIR_FLAGS, dir_fd=parent_fd)
+    except FileNotFoundError:
+        return
+    except OSError:
+        stats.errors += 1
+        return
+    try:
+        with os.scandir(fd) as it:
+            entries = list(it)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                _purge_tree(fd, entry.name, limiter, stats)
+            else:
+                _unlink_entry(fd, entry, limiter, stats)
+    finally:
+        os.close(fd)
+    _rmdir(parent_fd, name, limiter, stats)
+
+
+def _expand(
+    roots: list[Path],
+    workers: int,
+    limiter: RateLimiter,
+    stats: PurgeStats,
+) -> tuple[list[Path], list[Path]]:
+    """Desce alguns níveis para gerar unidades de trabalho paralelas.
+
+    Arquivos encontrados no caminho são apagados já; retorna (unidades, diretórios
+    expandidos que precisam de rmdir no final, do mais raso ao mais fundo).
+    """
+
+    units = list(roots)
+    expanded: list[Path] = []
+    depth = 0
+    while units and len(units) < workers * _UNITS_PER_WORKER and depth < _MAX_EXPAND_DEPTH:
+        next_units: list[Path] = []
+        for unit in units:
+            try:
+                fd = os.open(unit, _DIR_FLAGS)
+            except FileNotFoundError:
+                continue
+            try:
+                with os.scandir(fd) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            next_units.append(unit / entry.name)
+                        else:
+                            _unlink_entry(fd, entry, limiter, stats)
+            finally:
+                os.close(fd)
+            expanded.append(unit)
+        units = next_units
+        depth += 1
+    return units, expanded
+
+
+def purge_trash(trash_dir: Path, workers: int = DEFAULT_PURGE_WORKERS, rate: float = 0.0) -> PurgeStats:
+    """Apaga tudo o que estiver na lixeira (inclusive sobras de execuções interrompidas)."""
+
+    stats = PurgeStats()
+    if not trash_dir.is_dir():
+        return stats
+    workers = max(1, workers)
+    limiter = RateLimiter(rate)
+    roots = []
+    for entry in sorted(trash_dir.iterdir()):
+        if entry.is_dir() and not entry.is_symlink():
+            roots.append(entry)
+        else:
+            entry.unlink(missing_ok=True)
+            stats.entries += 1
+    stats.snapshots = len(roots)
+
+    units, expanded = _expand(roots, workers, limiter, stats)
+
+    def _work(unit: Path) -> PurgeStats:
+        local = PurgeStats()
+        parent_fd = os.open(unit.parent, _DIR_FLAGS)
+        try:
+            _purge_tree(parent_fd, unit.name, limiter, local)
+        finally:
+            os.close(parent_fd)
+        return local
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for partial in pool.map(_work, units):
+            stats.add(partial)
+
+    for directory in reversed(expanded):
+        parent_fd = os.open(directory.parent, _DIR_FLAGS)
+        try:
+            _rmdir(parent_fd, directory.name, limiter, stats)
+        finally:
+            os.close(parent_fd)
+    return stats
+
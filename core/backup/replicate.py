@@ -0,0 +1,187 @@
+"""Replicação dos snapshots concluídos para destinos extras (ex.: segundo disco USB).
+
+Em vez de um rsync da árvore inteira de snapshots, cada destino recebe só o
+snapshot recém-promovido, copiado pela engine native com o `latest` do próprio
+destino como `--link-dest`: arquivos iguais viram hardlinks lá (mesma estrutura
+de hardlinks do destino principal) e só o delta trafega.
+
+Os destinos são escritos em paralelo, cada um com seu limite de vazão
+(`/mnt/usb=20` = 20 MiB/s) e com a mesma mecânica do destino principal: lock
+exclusivo, montagem em `incomplete/` com retomada, promoção atômica para
+`snapshots/` + `latest` e retenção. Um destino ausente (disco não montado) é
+apenas reportado; nada é criado no ponto de montagem vazio.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional, Sequence
+
+from core.backup import native, pruning, staging
+
+MIB = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class ReplicaTarget:
+    path: Path
+    # Limite de vazão em MiB/s (0 = sem limite).
+    bwlimit_mib: float = 0.0
+
+
+@dataclass
+class ReplicaResult:
+    target: str
+    snapshot: str
+    success: bool = False
+    message: str = ""
+    link_dest: Optional[str] = None
+    resumed: bool = False
+    files: int = 0
+    linked: int = 0
+    copied: int = 0
+    bytes_linked: int = 0
+    bytes_copied: int = 0
+    errors: int = 0
+    pruned: list[str] = field(default_factory=list)
+    duration_s: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.bytes_copied / self.duration_s if self.duration_s else 0.0
+
+    def as_dict(self) -> dict[str, object]:
+        data = asdict(self)
+        data["throughput_bps"] = round(self.throughput)
+        return data
+
+
+def parse_targets(value: str) -> list[ReplicaTarget]:
+    """Lê "caminho[=MiB/s],caminho..." (formato de `*_BACKUP_REPLICAS`)."""
+
+    targets: list[ReplicaTarget] = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        path, _, rate = item.partition("=")
+        try:
+            limit = float(rate) if rate.strip() else 0.0
+        except ValueError:
+            raise ValueError(f"limite de vazão inválido para a réplica {path}: {rate!r}") from None
+        if limit < 0:
+            raise ValueError(f"limite de vazão negativo para a réplica {path}: {rate!r}")
+        targets.append(ReplicaTarget(Path(path.strip()), limit))
+    return targets
+
+
+def _latest(replica: Path) -> Optional[Path]:
+    latest = replica / "latest"
+    if latest.is_symlink() and latest.is_dir():
+        return latest.resolve()
+    return None
+
+
+def _prepare(replica: Path, name: str) -> tuple[Path, bool]:
+    """Diretório de trabalho com o nome do snapshot; reaproveita o pendente mais novo."""
+
+    pending = staging.pending_snapshots(replica)
+    reuse = pending.pop() if pending else None
+    if pending:
+        pruning.move_to_trash(pending, replica / pruning.TRASH_DIRNAME)
+    work = replica / staging.INCOMPLETE_DIRNAME / name
+    if reuse is None:
+        return work, False
+    if reuse != work:
+        # Réplica anterior interrompida: seus arquivos servem de base para este snapshot.
+        os.rename(reuse, work)
+    return work, True
+
+
+def _prune(replica: Path, retention: int) -> list[str]:
+    snapshots = sorted(p for p in (replica / "snapshots").iterdir() if p.is_dir())
+    if retention <= 0 or len(snapshots) <= retention:
+        return []
+    expired = snapshots[:-retention]
+    pruning.move_to_trash(expired, replica / pruning.TRASH_DIRNAME)
+    return [p.name for p in expired]
+
+
+def replicate_snapshot(
+    snapshot_dir: Path,
+    target: ReplicaTarget,
+    retention: int,
+    workers: int = native.DEFAULT_WORKERS,
+) -> ReplicaResult:
+    """Replica `snapshot_dir` em `target`; falhas viram `success=False` com mensagem."""
+
+    started = time.monotonic()
+    replica = target.path
+    result = ReplicaResult(target=str(replica), snapshot=snapshot_dir.name)
+    if not replica.is_dir():
+        result.message = "destino indisponível (disco não montado?)"
+        return result
+    try:
+        lock = staging.acquire_lock(replica)
+    except staging.LockBusy as exc:
+        result.message = str(exc)
+        return result
+    try:
+        with lock:
+            _replicate_locked(snapshot_dir, target, retention, workers, result)
+    except OSError as exc:
+        result.success = False
+        result.message = f"{exc.strerror or exc}"
+    result.duration_s = round(time.monotonic() - started, 3)
+    return result
+
+
+def _replicate_locked(
+    snapshot_dir: Path, target: ReplicaTarget, retention: int, workers: int, result: ReplicaResult
+) -> None:
+    replica = target.path
+    snapshots_dir = replica / "snapshots"
+    snapshots_dir.mkdir(exist_ok=True)
+    if (snapshots_dir / snapshot_dir.name).is_dir():
+        result.success = True
+        result.message = "snapshot já replicado"
+        return
+
+    previous = _latest(replica)
+    work, result.resumed = _prepare(replica, snapshot_dir.name)
+    result.link_dest = previous.name if previous else None
+    limiter = pruning.RateLimiter(target.bwlimit_mib * MIB) if target.bwlimit_mib > 0 else None
+    stats = native.copy_tree(snapshot_dir, work, previous, workers=workers, resume=result.resumed, limiter=limiter)
+    result.files = stats.files
+    result.linked = stats.linked
+    result.copied = stats.copied
+    result.bytes_linked = stats.bytes_linked
+    result.bytes_copied = stats.bytes_copied
+    result.errors = stats.errors
+    if stats.errors:
+        # Fica em incomplete/: a próxima replicação retoma dali.
+        result.message = "; ".join(stats.messages[:3])
+        return
+
+    final = staging.promote(work, snapshots_dir)
+    staging.point_latest(replica, final)
+    result.pruned = _prune(replica, retention)
+    pruning.purge_trash(replica / pruning.TRASH_DIRNAME)
+    result.success = True
+
+
+def replicate(
+    snapshot_dir: Path,
+    targets: Sequence[ReplicaTarget],
+    retention: int,
+    workers: int = native.DEFAULT_WORKERS,
+) -> list[ReplicaResult]:
+    """Replica o snapshot em todos os destinos ao mesmo tempo (uma thread por destino)."""
+
+    if not targets:
+        return []
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        return list(pool.map(lambda target: replicate_snapshot(snapshot_dir, target, retention, workers), targets))
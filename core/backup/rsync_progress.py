@@ -0,0 +1,191 @@
+"""Execução do rsync com leitura em streaming da saída e progresso estruturado.
+
+O `--info=progress2` do rsync reescreve a mesma linha com `\\r`; aqui stdout e
+stderr são lidos em blocos pequenos e quebrados em `\\r`/`\\n`, de modo que a
+memória fica constante durante toda a execução. Linhas de progresso viram
+`Progress` (bytes, percentual, taxa, arquivos a verificar) e são repassadas a um
+`ProgressReporter`, que loga em intervalo limitado e mantém um JSON de progresso
+para monitoração externa.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Sequence
+
+PROGRESS_FILENAME = "progress.json"
+READ_SIZE = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024
+MAX_LOGGED_LINES = 500
+DEFAULT_LOG_INTERVAL = 30.0
+DEFAULT_WRITE_INTERVAL = 2.0
+
+_UNITS = {"": 1, "K": 1024, "k": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+_PROGRESS_RE = re.compile(
+    r"^\s*(?P<bytes>[\d,.]+)(?P<bunit>[KMGT]?)\s+(?P<percent>\d+)%\s+"
+    r"(?P<rate>[\d,.]+)(?P<runit>[kKMGT]?)B/s\s+(?P<elapsed>\d+:\d{2}:\d{2})"
+    r"(?:\s+\(xfr#(?P<xfr>\d+),\s+(?:ir|to)-chk=(?P<remaining>\d+)/(?P<total>\d+)\))?"
+)
+
+
+@dataclass
+class Progress:
+    bytes: int
+    percent: int
+    rate_bps: float
+    elapsed: str
+    transfers: Optional[int] = None
+    to_check_remaining: Optional[int] = None
+    to_check_total: Optional[int] = None
+
+
+def _number(raw: str) -> float:
+    return float(raw.replace(",", ""))
+
+
+def parse_progress2(line: str) -> Optional[Progress]:
+    """Converte uma linha de `--info=progress2` em `Progress` (None se não for progresso)."""
+
+    match = _PROGRESS_RE.match(line)
+    if not match:
+        return None
+    groups = match.groupdict()
+    return Progress(
+        bytes=int(_number(groups["bytes"]) * _UNITS[groups["bunit"]]),
+        percent=int(groups["percent"]),
+        rate_bps=_number(groups["rate"]) * _UNITS[groups["runit"]],
+        elapsed=groups["elapsed"],
+        transfers=int(groups["xfr"]) if groups["xfr"] else None,
+        to_check_remaining=int(groups["remaining"]) if groups["remaining"] else None,
+        to_check_total=int(groups["total"]) if groups["total"] else None,
+    )
+
+
+def iter_lines(fd: int) -> Iterator[str]:
+    """Lê o descritor em blocos e produz linhas separadas por `\\r` ou `\\n`.
+
+    Linhas maiores que MAX_LINE_BYTES são emitidas em pedaços para manter o buffer limitado.
+    """
+
+    pending = b""
+    while True:
+        block = os.read(fd, READ_SIZE)
+        if not block:
+            break
+        pending += block
+        parts = re.split(rb"[\r\n]", pending)
+        pending = parts.pop()
+        for part in parts:
+            if part:
+                yield part.decode("utf-8", "replace")
+        while len(pending) > MAX_LINE_BYTES:
+            yield pending[:MAX_LINE_BYTES].decode("utf-8", "replace")
+            pending = pending[MAX_LINE_BYTES:]
+    if pending:
+        yield pending.decode("utf-8", "replace")
+
+
+class ProgressReporter:
+    """Agrega o progresso de um ou mais rsync (shards) com escrita limitada por tempo.
+
+    Thread-safe: vários workers podem chamar `update` com rótulos diferentes.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        log_interval: float = DEFAULT_LOG_INTERVAL,
+        write_interval: float = DEFAULT_WRITE_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.log_interval = log_interval
+        self.write_interval = write_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._last_log: dict[str, float] = {}
+        self._last_write = float("-inf")
+
+    def update(self, label: str, progress: Progress) -> None:
+        now = self._clock()
+        with self._lock:
+            self._entries[label] = asdict(progress)
+            if now - self._last_log.get(label, float("-inf")) >= self.log_interval:
+                self._last_log[label] = now
+                logging.info(
+                    "Progresso %s: %s%% (%s bytes, %.1f MB/s, a verificar %s/%s)",
+                    label,
+                    progress.percent,
+                    progress.bytes,
+                    progress.rate_bps / 1024**2,
+                    progress.to_check_remaining,
+                    progress.to_check_total,
+                )
+            if now - self._last_write >= self.write_interval:
+                self._last_write = now
+                self._write(running=True)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {label: dict(entry) for label, entry in self._entries.items()}
+
+    def finish(self) -> None:
+        with self._lock:
+            self._write(running=False)
+
+    def _write(self, running: bool) -> None:
+        if self.path is None:
+            return
+        payload = {"updated": dt.datetime.now().isoformat(), "running": running, "entries": self._entries}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def _log_stderr(fd: int, label: str) -> None:
+    logged = 0
+    suppressed = 0
+    for line in iter_lines(fd):
+        if logged < MAX_LOGGED_LINES:
+            logging.warning("[%s] %s", label, line)
+            logged += 1
+        else:
+            suppressed += 1
+    if suppressed:
+        logging.warning("[%s] %s linhas adicionais de stderr omitidas", label, suppressed)
+
+
+def stream_rsync(
+    cmd: Sequence[str],
+    reporter: Optional[ProgressReporter] = None,
+    label: str = "rsync",
+) -> int:
+    """Executa o rsync lendo stdout/stderr em streaming; retorna o código de saída."""
+
+    proc = subprocess.Popen(list(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    assert proc.stdout is not None and proc.stderr is not None
+    stderr_thread = threading.Thread(target=_log_stderr, args=(proc.stderr.fileno(), label), daemon=True)
+    stderr_thread.start()
+    logged = 0
+    for line in iter_lines(proc.stdout.fileno()):
+        progress = parse_progress2(line)
+        if progress is not None:
+            if reporter is not None:
+                reporter.update(label, progress)
+        elif logged < MAX_LOGGED_LINES:
+            logging.info("[%s] %s", label, line.strip())
+            logged += 1
+    returncode = proc.wait()
+    stderr_thread.join()
+    proc.stdout.close()
+    proc.stderr.close()
+    return returncode
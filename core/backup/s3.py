@@ -0,0 +1,231 @@
+"""Cliente mínimo de S3 compatível (MinIO, Garage, B2, AWS) só com a stdlib.
+
+Assinatura AWS Signature V4 e endereçamento path-style (`<endpoint>/<bucket>/<key>`),
+que é o que servidores S3 auto-hospedados aceitam sem DNS curinga. Cobre o
+necessário para a exportação offsite: PUT/GET de objetos e o ciclo de upload
+multipart (iniciar, enviar partes, listar partes já enviadas, concluir, abortar).
+Falhas transitórias (5xx, conexão) são repetidas com backoff exponencial.
+"""
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import hashlib
+import hmac
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Callable, Mapping, Optional
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+DEFAULT_REGION = "us-east-1"
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 120
+_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+# (método, url, headers, corpo) -> (status, headers, corpo)
+Transport = Callable[[str, str, Mapping[str, str], bytes], tuple[int, dict[str, str], bytes]]
+
+
+class S3Error(RuntimeError):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(f"S3 {status} {code}: {message}")
+        self.status = status
+        self.code = code
+
+
+@dataclass(frozen=True)
+class Credentials:
+    access_key: str
+    secret_key: str
+    region: str = DEFAULT_REGION
+
+
+def _quote(value: str, safe: str = "-_.~") -> str:
+    return urllib.parse.quote(value, safe=safe)
+
+
+def sign_request(
+    method: str,
+    url: str,
+    headers: dict[str, str],
+    payload_sha256: str,
+    credentials: Credentials,
+    now: Optional[dt.datetime] = None,
+    service: str = "s3",
+) -> dict[str, str]:
+    """Acrescenta `x-amz-date`, `x-amz-content-sha256` e `Authorization` (SigV4) aos headers."""
+
+    now = now or dt.datetime.now(dt.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    day = amz_date[:8]
+    parsed = urllib.parse.urlsplit(url)
+    signed = {key.lower(): str(value).strip() for key, value in headers.items()}
+    signed["host"] = parsed.netloc
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_sha256
+
+    query = urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+    canonical_query = "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query))
+    names = sorted(signed)
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in names)
+    signed_headers = ";".join(names)
+    canonical_request = "\n".join(
+        [method, parsed.path or "/", canonical_query, canonical_headers, signed_headers, payload_sha256]
+    )
+    scope = f"{day}/{credentials.region}/{service}/aws4_request"
+    string_to_sign = "\n".join(
+        ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+    )
+    key = f"AWS4{credentials.secret_key}".encode()
+    for part in (day, credentials.region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    result = dict(headers)
+    result["x-amz-date"] = amz_date
+    result["x-amz-content-sha256"] = payload_sha256
+    result["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={credentials.access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return result
+
+
+def urllib_transport(
+    method: str, url: str, headers: Mapping[str, str], body: bytes
+) -> tuple[int, dict[str, str], bytes]:
+    request = urllib.request.Request(url, data=body if body else None, method=method, headers=dict(headers))
+    try:
+        with urllib.request.urlopen(request, timeout=DEFAULT_TIMEOUT) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, dict(exc.headers), exc.read()
+
+
+def _error_from(status: int, body: bytes) -> S3Error:
+    code, message = "Erro", body[:200].decode("utf-8", "replace")
+    try:
+        root = ET.fromstring(body)
+        code = root.findtext("Code") or code
+        message = root.findtext("Message") or message
+    except ET.ParseError:
+        pass
+    return S3Error(status, code, message)
+
+
+def _find(node: ET.Element, name: str) -> list[ET.Element]:
+    # Alguns servidores respondem com namespace, outros sem.
+    return node.findall(f"{_NS}{name}") + node.findall(name)
+
+
+def _text(node: ET.Element, name: str) -> str:
+    found = _find(node, name)
+    return (found[0].text or "") if found else ""
+
+
+class S3Client:
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        credentials: Credentials,
+        transport: Transport = urllib_transport,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 1.0,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.credentials = credentials
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+
+    def _url(self, key: str, query: str = "") -> str:
+        url = f"{self.endpoint}/{_quote(self.bucket)}/{_quote(key, safe='/-_.~')}"
+        return f"{url}?{query}" if query else url
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        query: str = "",
+        body: bytes = b"",
+        headers: Optional[dict[str, str]] = None,
+    ) -> tuple[dict[str, str], bytes]:
+        url = self._url(key, query)
+        payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+        attempt = 0
+        while True:
+            signed = sign_request(method, url, dict(headers or {}), payload_hash, self.credentials)
+            try:
+                status, response_headers, response_body = self.transport(method, url, signed, body)
+            except (urllib.error.URLError, OSError) as exc:
+                if attempt >= self.retries:
+                    raise S3Error(0, "Conexao", str(exc)) from None
+            else:
+                if status < 300:
+                    return {k.lower(): v for k, v in response_headers.items()}, response_body
+                if status < 500 or attempt >= self.retries:
+                    raise _error_from(status, response_body)
+            time.sleep(self.backoff * (2**attempt))
+            attempt += 1
+
+    def put_object(self, key: str, data: bytes, metadata: Optional[Mapping[str, str]] = None) -> str:
+        headers = {"Content-MD5": base64.b64encode(hashlib.md5(data).digest()).decode()}
+        headers.update({f"x-amz-meta-{k}": v for k, v in (metadata or {}).items()})
+        response_headers, _ = self._request("PUT", key, body=data, headers=headers)
+        return response_headers.get("etag", "").strip('"')
+
+    def get_object(self, key: str) -> bytes:
+        return self._request("GET", key)[1]
+
+    def create_multipart_upload(self, key: str, metadata: Optional[Mapping[str, str]] = None) -> str:
+        headers = {f"x-amz-meta-{k}": v for k, v in (metadata or {}).items()}
+        _, body = self._request("POST", key, query="uploads=", headers=headers)
+        upload_id = _text(ET.fromstring(body), "UploadId")
+        if not upload_id:
+            raise S3Error(200, "SemUploadId", "resposta sem UploadId")
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        query = f"partNumber={part_number}&uploadId={_quote(upload_id)}"
+        headers = {"Content-MD5": base64.b64encode(hashlib.md5(data).digest()).decode()}
+        response_headers, _ = self._request("PUT", key, query=query, body=data, headers=headers)
+        return response_headers.get("etag", "").strip('"')
+
+    def list_parts(self, key: str, upload_id: str) -> dict[int, tuple[str, int]]:
+        """Partes já recebidas pelo servidor: número -> (etag, tamanho)."""
+
+        parts: dict[int, tuple[str, int]] = {}
+        marker = 0
+        while True:
+            query = f"part-number-marker={marker}&uploadId={_quote(upload_id)}"
+            _, body = self._request("GET", key, query=query)
+            root = ET.fromstring(body)
+            for part in _find(root, "Part"):
+                number = int(_text(part, "PartNumber"))
+                parts[number] = (_text(part, "ETag").strip('"'), int(_text(part, "Size") or 0))
+            if _text(root, "IsTruncated").lower() != "true":
+                return parts
+            marker = int(_text(root, "NextPartNumberMarker") or max(parts, default=0))
+
+    def complete_multipart_upload(self, key: str, upload_id: str, etags: Mapping[int, str]) -> str:
+        body = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>\"{etags[number]}\"</ETag></Part>"
+            for number in sorted(etags)
+        )
+        payload = f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode()
+        _, response = self._request("POST", key, query=f"uploadId={_quote(upload_id)}", body=payload)
+        root = ET.fromstring(response)
+        if root.tag.endswith("Error"):
+            # O S3 pode responder 200 com erro no corpo quando a conclusão falha no meio.
+            raise _error_from(500, response)
+        return _text(root, "ETag").strip('"')
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self._request("DELETE", key, query=f"uploadId={_quote(upload_id)}")
@@ -0,0 +1,141 @@
+"""Snapshots em andamento: lock exclusivo, retomada e promoção atômica.
+
+Um backup nunca escreve direto em `<target>/snapshots/`. O snapshot é montado
+em `<target>/incomplete/<timestamp>/` e só depois de concluído é renomeado
+para `snapshots/` (rename no mesmo filesystem) e apontado pelo `latest`, que é
+trocado com `symlink` temporário + `os.replace`. Assim retenção, catálogo,
+verificação e uso de disco nunca enxergam um snapshot pela metade.
+
+Se a execução é interrompida (queda de energia, reboot do Pi), a árvore fica
+em `incomplete/` e a próxima execução a retoma: o rsync (ou a engine native)
+roda sobre o que já foi transferido e reaproveita os arquivos parciais
+guardados em `.rsync-partial`. Um `flock` em `<target>/.backup.lock` impede
+que o timer do systemd e uma execução manual rodem ao mesmo tempo.
+"""
+from __future__ import annotations
+
+import errno
+import fcntl
+import os
+from pathlib import Path
+from typing import Optional
+
+from core.backup import pruning
+
+LOCK_NAME = ".backup.lock"
+INCOMPLETE_DIRNAME = "incomplete"
+# Relativo ao diretório de cada arquivo: o rsync exclui esse nome da transferência sozinho.
+PARTIAL_DIRNAME = ".rsync-partial"
+# EX_TEMPFAIL: outra execução segura o lock; o timer tenta de novo no próximo disparo.
+LOCK_BUSY_CODE = 75
+
+
+class LockBusy(RuntimeError):
+    """O lock do destino já pertence a outra execução."""
+
+
+class BackupLock:
+    """`flock` exclusivo e não bloqueante; o arquivo guarda o PID do dono."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            holder = os.read(fd, 32).decode("ascii", "replace").strip()
+            os.close(fd)
+            if exc.errno in (errno.EWOULDBLOCK, errno.EAGAIN):
+                raise LockBusy(f"lock {self.path} em uso (pid {holder or '?'})") from None
+            raise
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode("ascii"))
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        # O arquivo fica no lugar: apagá-lo abriria uma corrida com quem está esperando o lock.
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self) -> "BackupLock":
+        if self._fd is None:
+            self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+def acquire_lock(target: Path) -> BackupLock:
+    """Adquire o lock do destino ou levanta `LockBusy`."""
+
+    lock = BackupLock(target / LOCK_NAME)
+    lock.acquire()
+    return lock
+
+
+def pending_snapshots(target: Path) -> list[Path]:
+    incomplete_dir = target / INCOMPLETE_DIRNAME
+    if not incomplete_dir.is_dir():
+        return []
+    return sorted(p for p in incomplete_dir.iterdir() if p.is_dir() and not p.is_symlink())
+
+
+def prepare_snapshot(target: Path, name: str, resume: bool = True) -> tuple[Path, bool]:
+    """Escolhe o diretório de trabalho do snapshot; retorna (caminho, retomado).
+
+    Com `resume`, o snapshot interrompido mais recente é reaproveitado (mantém o
+    nome original). Os demais pendentes, ou todos sem `resume`, vão para a lixeira.
+    O diretório de um snapshot novo não é criado aqui.
+    """
+
+    pending = pending_snapshots(target)
+    chosen = pending.pop() if resume and pending else None
+    if pending:
+        pruning.move_to_trash(pending, target / pruning.TRASH_DIRNAME)
+    if chosen is not None:
+        return chosen, True
+    return target / INCOMPLETE_DIRNAME / name, False
+
+
+def promote(work_dir: Path, snapshots_dir: Path) -> Path:
+    """Move o snapshot concluído para `snapshots/` com um único rename."""
+
+    final = snapshots_dir / work_dir.name
+    if final.exists():
+        raise FileExistsError(errno.EEXIST, "snapshot já existe", str(final))
+    os.rename(work_dir, final)
+    _fsync_dir(snapshots_dir)
+    _fsync_dir(work_dir.parent)
+    return final
+
+
+def point_latest(target: Path, snapshot_dir: Path) -> None:
+    """Aponta `latest` para `snapshot_dir` sem janela em que o link não existe."""
+
+    latest = target / "latest"
+    tmp = target / ".latest.tmp"
+    if tmp.is_symlink() or tmp.exists():
+        tmp.unlink()
+    tmp.symlink_to(snapshot_dir)
+    os.replace(tmp, latest)
+    _fsync_dir(target)
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,340 @@
+"""Uso de disco por snapshot ciente de hardlinks.
+
+Com `--link-dest`, o `du` do destino conta cada inode uma vez só na primeira
+árvore que encontra e precisa percorrer tudo a cada chamada. Aqui cada snapshot
+é percorrido uma única vez (`os.scandir`) e vira um índice binário compacto em
+`<target>/usage/<snapshot>.idx`: inodes ordenados e o espaço alocado de cada um
+(`st_blocks * 512`), 16 bytes por inode. A indexação ordena lotes de tamanho fixo
+e os despeja em runs num arquivo temporário, então a memória não cresce com o
+número de arquivos do snapshot.
+
+O relatório faz um merge em streaming dos índices, lidos do disco em blocos de
+`_READ_PAIRS` pares (memória proporcional ao número de snapshots, não de
+arquivos), e calcula, por snapshot, bytes referenciados, exclusivos (só aquele
+snapshot referencia o inode) e compartilhados, além de quanto a retenção liberaria. O resultado fica em
+`usage/summary.json`; após cada backup só o snapshot novo é indexado, então o
+comando `usage` responde na hora.
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+import stat
+import struct
+import tempfile
+from array import array
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+USAGE_DIRNAME = "usage"
+SUMMARY_NAME = "summary.json"
+INDEX_SUFFIX = ".idx"
+_MAGIC = b"HLU1"
+_HEADER = struct.Struct("<4sQQ")
+# Pares (inode, bytes) ordenados em memória antes de cada run ir para o disco.
+RUN_ENTRIES = 1 << 16
+_READ_PAIRS = 4096
+
+
+@dataclass
+class SnapshotUsage:
+    name: str
+    files: int = 0
+    inodes: int = 0
+    referenced_bytes: int = 0
+    unique_bytes: int = 0
+
+    @property
+    def shared_bytes(self) -> int:
+        return self.referenced_bytes - self.unique_bytes
+
+
+@dataclass
+class UsageReport:
+    snapshots: list[SnapshotUsage] = field(default_factory=list)
+    total_bytes: int = 0
+    retention: Optional[int] = None
+    projected_free_bytes: int = 0
+    # freed_by_pruning[k] = bytes liberados ao remover os k+1 snapshots mais antigos.
+    freed_by_pruning: list[int] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, object]:
+        data = asdict(self)
+        for entry, snapshot in zip(data["snapshots"], self.snapshots):
+            entry["shared_bytes"] = snapshot.shared_bytes
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UsageReport":
+        snapshots = [
+            SnapshotUsage(**{k: v for k, v in entry.items() if k != "shared_bytes"}) for entry in data["snapshots"]
+        ]
+        return cls(
+            snapshots=snapshots,
+            total_bytes=data["total_bytes"],
+            retention=data.get("retention"),
+            projected_free_bytes=data.get("projected_free_bytes", 0),
+            freed_by_pruning=data.get("freed_by_pruning", []),
+        )
+
+
+def index_snapshot(snapshot_dir: Path, index_path: Path) -> tuple[int, int]:
+    """Grava o índice (inode, bytes alocados) do snapshot; retorna (arquivos, inodes).
+
+    Os pares são ordenados em lotes de `RUN_ENTRIES` e gravados como runs num
+    arquivo temporário; o índice sai do merge dos runs, com inodes repetidos
+    (hardlinks dentro do próprio snapshot) contados uma vez.
+    """
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    files = 0
+    batch: list[tuple[int, int]] = []
+    runs: list[tuple[int, int]] = []
+    with tempfile.TemporaryFile(dir=index_path.parent) as spill:
+        stack = [str(snapshot_dir)]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if stat.S_ISDIR(st.st_mode):
+                            stack.append(entry.path)
+                            continue
+                        files += 1
+                        # Diretórios ficam de fora: cada snapshot tem os seus e não são compartilhados.
+                        batch.append((st.st_ino, st.st_blocks * 512))
+                        if len(batch) >= RUN_ENTRIES:
+                            runs.append(_spill_run(batch, spill))
+            except OSError:
+                continue
+        if batch:
+            runs.append(_spill_run(batch, spill))
+        spill.flush()
+
+        tmp = index_path.with_name(index_path.name + ".tmp")
+        with tmp.open("w+b") as handle, tempfile.TemporaryFile(dir=index_path.parent) as sizes_file:
+            handle.write(_HEADER.pack(_MAGIC, files, 0))
+            count = 0
+            last = -1
+            inodes, sizes = array("Q"), array("Q")
+            for ino, size in heapq.merge(*(_iter_run(spill, offset, length) for offset, length in runs)):
+                if ino == last:
+                    continue
+                last = ino
+                inodes.append(ino)
+                sizes.append(size)
+                if len(inodes) >= _READ_PAIRS:
+                    count += _flush_pairs(inodes, sizes, handle, sizes_file)
+            count += _flush_pairs(inodes, sizes, handle, sizes_file)
+            sizes_file.seek(0)
+            while block := sizes_file.read(1 << 20):
+                handle.write(block)
+            handle.seek(0)
+            handle.write(_HEADER.pack(_MAGIC, files, count))
+    os.replace(tmp, index_path)
+    return files, count
+
+
+def _spill_run(batch: list[tuple[int, int]], spill: BinaryIO) -> tuple[int, int]:
+    """Ordena o lote e o grava como (inode, bytes) intercalados; devolve (offset, pares)."""
+
+    batch.sort()
+    offset = spill.tell()
+    pairs = array("Q")
+    for ino, size in batch:
+        pairs.append(ino)
+        pairs.append(size)
+    pairs.tofile(spill)
+    length = len(batch)
+    batch.clear()
+    return offset, length
+
+
+def _iter_run(spill: BinaryIO, offset: int, length: int) -> Iterator[tuple[int, int]]:
+    fd = spill.fileno()
+    while length:
+        take = min(length, _READ_PAIRS)
+        pairs = array("Q")
+        pairs.frombytes(os.pread(fd, take * 16, offset))
+        yield from zip(pairs[0::2], pairs[1::2])
+        offset += take * 16
+        length -= take
+
+
+def _flush_pairs(inodes: array, sizes: array, handle: BinaryIO, sizes_file: BinaryIO) -> int:
+    count = len(inodes)
+    inodes.tofile(handle)
+    sizes.tofile(sizes_file)
+    del inodes[:], sizes[:]
+    return count
+
+
+def _read_header(handle: BinaryIO, index_path: Path) -> tuple[int, int]:
+    magic, files, count = _HEADER.unpack(handle.read(_HEADER.size))
+    if magic != _MAGIC:
+        raise ValueError(f"índice de uso inválido: {index_path}")
+    return files, count
+
+
+def read_index(index_path: Path) -> tuple[int, array, array]:
+    with index_path.open("rb") as handle:
+        files, count = _read_header(handle, index_path)
+        inodes = array("Q")
+        sizes = array("Q")
+        inodes.fromfile(handle, count)
+        sizes.fromfile(handle, count)
+    return files, inodes, sizes
+
+
+def _iter_index(position: int, handle: BinaryIO, count: int) -> Iterator[tuple[int, int, int]]:
+    """Lê (inode, posição, bytes) do disco em blocos de `_READ_PAIRS`: inodes e tamanhos em offsets fixos."""
+
+    fd = handle.fileno()
+    inodes_at = _HEADER.size
+    sizes_at = _HEADER.size + count * 8
+    done = 0
+    while done < count:
+        take = min(count - done, _READ_PAIRS)
+        inodes, sizes = array("Q"), array("Q")
+        inodes.frombytes(os.pread(fd, take * 8, inodes_at + done * 8))
+        sizes.frombytes(os.pread(fd, take * 8, sizes_at + done * 8))
+        if len(inodes) != take or len(sizes) != take:
+            raise ValueError(f"índice de uso truncado: {handle.name}")
+        for ino, size in zip(inodes, sizes):
+            yield ino, position, size
+        done += take
+
+
+def compute(indexes: list[tuple[str, Path]], retention: Optional[int] = None) -> UsageReport:
+    """Combina os índices (do mais antigo ao mais novo) em um relatório de uso."""
+
+    with ExitStack() as stack:
+        snapshots: list[SnapshotUsage] = []
+        streams = []
+        for position, (name, index_path) in enumerate(indexes):
+            handle = stack.enter_context(index_path.open("rb"))
+            files, count = _read_header(handle, index_path)
+            snapshots.append(SnapshotUsage(name=name, files=files, inodes=count))
+            streams.append(_iter_index(position, handle, count))
+        return _merge(snapshots, streams, retention)
+
+
+def _merge(snapshots: list[SnapshotUsage], streams: list, retention: Optional[int]) -> UsageReport:
+    # bytes_by_newest[i]: bytes de inodes cuja referência mais nova é o snapshot i.
+    bytes_by_newest = [0] * len(snapshots)
+    total = 0
+    current_ino: Optional[int] = None
+    holders: list[int] = []
+    current_size = 0
+
+    def _flush() -> None:
+        nonlocal total
+        if current_ino is None:
+            return
+        total += current_size
+        for position in holders:
+            snapshots[position].referenced_bytes += current_size
+        if len(holders) == 1:
+            snapshots[holders[0]].unique_bytes += current_size
+        bytes_by_newest[max(holders)] += current_size
+
+    for ino, position, size in heapq.merge(*streams):
+        if ino != current_ino:
+            _flush()
+            current_ino, holders, current_size = ino, [], size
+        holders.append(position)
+    _flush()
+
+    freed = []
+    running = 0
+    for value in bytes_by_newest:
+        running += value
+        freed.append(running)
+    report = UsageReport(snapshots=snapshots, total_bytes=total, retention=retention, freed_by_pruning=freed)
+    if retention is not None and 0 <= retention < len(snapshots):
+        report.projected_free_bytes = freed[len(snapshots) - retention - 1]
+    return report
+
+
+def update(target: Path, retention: Optional[int] = None) -> UsageReport:
+    """Indexa snapshots novos, descarta índices de snapshots removidos e regrava o resumo."""
+
+    snapshots_dir = target / "snapshots"
+    usage_dir = target / USAGE_DIRNAME
+    names = sorted(p.name for p in snapshots_dir.iterdir() if p.is_dir()) if snapshots_dir.is_dir() else []
+    usage_dir.mkdir(parents=True, exist_ok=True)
+    for stale in usage_dir.glob(f"*{INDEX_SUFFIX}"):
+        if stale.name[: -len(INDEX_SUFFIX)] not in names:
+            stale.unlink()
+    indexes = []
+    for name in names:
+        index_path = usage_dir / f"{name}{INDEX_SUFFIX}"
+        if not index_path.exists():
+            index_snapshot(snapshots_dir / name, index_path)
+        indexes.append((name, index_path))
+    report = compute(indexes, retention)
+    summary = usage_dir / SUMMARY_NAME
+    tmp = summary.with_name(summary.name + ".tmp")
+    tmp.write_text(json.dumps(report.as_dict(), indent=2), encoding="utf-8")
+    os.replace(tmp, summary)
+    return report
+
+
+def load_cached(target: Path, retention: Optional[int] = None) -> Optional[UsageReport]:
+    """Resumo em cache, se ainda corresponde aos snapshots em disco e à retenção pedida."""
+
+    summary = target / USAGE_DIRNAME / SUMMARY_NAME
+    snapshots_dir = target / "snapshots"
+    if not summary.exists() or not snapshots_dir.is_dir():
+        return None
+    try:
+        report = UsageReport.from_dict(json.loads(summary.read_text(encoding="utf-8")))
+    except (ValueError, KeyError, TypeError):
+        return None
+    names = sorted(p.name for p in snapshots_dir.iterdir() if p.is_dir())
+    if [s.name for s in report.snapshots] != names or report.retention != retention:
+        return None
+    return report
+
+
+def add_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser("usage", help="Uso de disco por snapshot (exclusivo/compartilhado) e projeção")
+    parser.add_argument("--refresh", action="store_true", help="Ignora o cache e recalcula o resumo")
+
+
+def _human(value: int) -> str:
+    amount = float(value)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if amount < 1024:
+            return f"{amount:.1f} {unit}"
+        amount /= 1024
+    return f"{amount:.1f} TiB"
+
+
+def run_command(args: argparse.Namespace, target: Path) -> int:
+    if not (target / "snapshots").is_dir():
+        print(f"[ERRO] Diretório de snapshots inexistente: {target / 'snapshots'}")
+        return 2
+    retention = getattr(args, "retention", None)
+    report = None if args.refresh else load_cached(target, retention)
+    if report is None:
+        report = update(target, retention)
+    for snapshot in report.snapshots:
+        print(
+            f"{snapshot.name}  arquivos={snapshot.files}  referenciado={_human(snapshot.referenced_bytes)}  "
+            f"exclusivo={_human(snapshot.unique_bytes)}  compartilhado={_human(snapshot.shared_bytes)}"
+        )
+    print(f"total em disco (sem duplicar hardlinks): {_human(report.total_bytes)}")
+    if report.freed_by_pruning:
+        print(f"remover o snapshot mais antigo libera: {_human(report.freed_by_pruning[0])}")
+    if report.retention is not None:
+        print(f"retenção {report.retention}: libera {_human(report.projected_free_bytes)}")
+    return 0
@@ -6,6 +6,22 @@ logs detalhados. Configurável via CLI ou variáveis de ambiente:
 - NEXTCLOUD_BACKUP_TARGET: destino base para snapshots (default: /srv/homelab/backups/nextcloud)
 - NEXTCLOUD_BACKUP_LOG: arquivo de log (default: <TARGET>/nextcloud_backup.log)
 - NEXTCLOUD_BACKUP_RETENTION: quantos snapshots manter (default: 7)
+- NEXTCLOUD_BACKUP_JOBS: workers rsync em paralelo; >1 ativa o modo por shards (default: 1)
+- NEXTCLOUD_BACKUP_ENGINE: rsync (hardlinks), native (hardlinks sem rsync) ou chunkstore (dedup por chunks)
+  (default: rsync)
+- NEXTCLOUD_BACKUP_JOURNAL: 1 para usar o journal de estado dos arquivos (no-op/--files-from) (default: 0)
+- NEXTCLOUD_BACKUP_CATALOG: 0 desliga o registro no catálogo SQLite (default: 1)
+- NEXTCLOUD_BACKUP_LINK_GENERATIONS: snapshots usados como --link-dest, até 20 (default: 1)
+- NEXTCLOUD_BACKUP_USAGE: 0 desliga o índice de uso de disco por snapshot (default: 1)
+- NEXTCLOUD_BACKUP_DB_DUMP: 1 para gerar dump do PostgreSQL em <TARGET>/db/<snapshot> (default: 0)
+- NEXTCLOUD_BACKUP_DB_FORMAT: custom, plain ou directory (default: custom)
+- NEXTCLOUD_BACKUP_COMPOSE_FILE: compose da stack core usado no `docker compose exec` do pg_dump
+- NEXTCLOUD_BACKUP_TWO_PHASE: 1 para passe morno online + delta final em modo manutenção (default: 0)
+- NEXTCLOUD_BACKUP_CACHE_FRIENDLY: 1 para não despejar o page cache do Postgres/PHP-FPM (default: 0)
+- NEXTCLOUD_BACKUP_RESUME: 0 descarta snapshots interrompidos em vez de retomá-los (default: 1)
+- NEXTCLOUD_BACKUP_EXCLUDE_PROFILES: perfis de exclusão separados por vírgula, ex.: previews,caches (default: nenhum)
+- NEXTCLOUD_BACKUP_EXCLUDE_FILE: JSON com perfis próprios/substitutos (default: só os embutidos)
+- NEXTCLOUD_BACKUP_REPLICAS: destinos extras para cada snapshot, ex.: /mnt/usb=20,/mnt/nas (MiB/s; default: nenhum)
 
 Para ver opções:
     python backup_nextcloud.py --help
@@ -17,15 +33,52 @@ import datetime as dt
 import json
 import logging
 import os
+import sqlite3
 import subprocess
 import sys
-import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+if __package__ in (None, ""):
+    # Execução direta como script: expõe a raiz do repositório para importar `core.backup`.
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from core.backup import (
+    catalog,
+    chunkstore,
+    export,
+    journal,
+    linkdest,
+    native,
+    offsite,
+    pagecache,
+    profiles,
+    pruning,
+    replicate,
+    restore,
+    rsync_progress,
+    staging,
+    usage,
+    verify,
+)
+from core.nextcloud import db_dump
 
 DEFAULT_SOURCE_PATH = Path("/srv/homelab/nextcloud/data")
 DEFAULT_TARGET_PATH = Path("/srv/homelab/backups/nextcloud")
 DEFAULT_RETENTION_VALUE = 7
+DEFAULT_JOBS_VALUE = 1
+ENGINE_RSYNC = "rsync"
+ENGINE_CHUNKSTORE = "chunkstore"
+ENGINE_NATIVE = "native"
+ENGINES = (ENGINE_RSYNC, ENGINE_CHUNKSTORE, ENGINE_NATIVE)
+# Diretório de dados do Nextcloud dentro do volume (/var/www/html/data): cada usuário e appdata_* vira um shard.
+NEXTCLOUD_DATA_SUBDIR = "data"
+REST_SHARD_NAME = "_resto"
+
+OccRunner = Callable[[Sequence[str]], subprocess.CompletedProcess[str]]
 
 
 def _env_path(var_name: str, fallback: Path) -> Path:
@@ -41,11 +94,20 @@ def build_rsync_command(
     snapshot_dir: Path,
     link_dest: Optional[Path],
     dry_run: bool = False,
+    excludes: Sequence[str] = (),
+    files_from: Optional[Path] = None,
+    extra_link_dests: Sequence[Path] = (),
 ) -> List[str]:
     """Monta comando rsync idempotente.
 
     Usa --delete para remover arquivos apagados na origem e --link-dest para
-    reutilizar hardlinks do snapshot anterior quando existir.
+    reutilizar hardlinks do snapshot anterior quando existir; --partial-dir
+    guarda arquivos pela metade para a retomada continuar deles. `extra_link_dests`
+    acrescenta gerações mais antigas, consultadas em ordem. `excludes` recebe
+    padrões rsync ancorados (ex.: "/data/alice/") usados pelo shard "resto".
+    `files_from` restringe a cópia à lista (NUL-separada) gerada pelo journal;
+    nesse modo --ignore-times garante inode novo e o clone em hardlinks do
+    snapshot anterior nunca é alterado no lugar.
     """
 
     cmd: List[str] = [
@@ -53,23 +115,121 @@ def build_rsync_command(
         "-a",
         "--delete",
         "--numeric-ids",
+        f"--partial-dir={staging.PARTIAL_DIRNAME}",
         "--info=progress2",
     ]
 
-    if link_dest:
-        cmd.extend(["--link-dest", str(link_dest.resolve())])
+    for base in ([link_dest] if link_dest else []) + list(extra_link_dests):
+        cmd.extend(["--link-dest", str(base.resolve())])
 
     if dry_run:
         cmd.append("--dry-run")
 
+    if files_from:
+        cmd.extend([f"--files-from={files_from}", "--from0", "--ignore-times"])
+
+    for pattern in excludes:
+        cmd.append(f"--exclude={pattern}")
+
     cmd.extend([f"{source.resolve()}/", f"{snapshot_dir.resolve()}/"])
     return cmd
 
 
+@dataclass(frozen=True)
+class Shard:
+    """Partição da origem copiada por um worker rsync próprio.
+
+    `relative` é o subdiretório da origem (None para o shard "resto", que cobre
+    tudo fora dos demais shards via `excludes`).
+    """
+
+    name: str
+    relative: Optional[Path] = None
+    excludes: tuple[str, ...] = ()
+
+
+@dataclass
+class ShardResult:
+    name: str
+    returncode: int
+    duration: float
+
+
+def _escape_rsync_pattern(name: str) -> str:
+    return "".join(f"\\{ch}" if ch in "*?[\\" else ch for ch in name)
+
+
+def partition_source(source: Path) -> list[Shard]:
+    """Divide a origem em shards de nível superior.
+
+    Se existir `data/` (datadirectory do Nextcloud), cada subdiretório dele
+    (usuários, appdata_*, files_external...) vira um shard; caso contrário os
+    subdiretórios da própria origem são usados. Arquivos soltos e o restante da
+    árvore ficam no shard "resto", que exclui os caminhos já cobertos.
+    """
+
+    data_dir = source / NEXTCLOUD_DATA_SUBDIR
+    base = data_dir if data_dir.is_dir() and not data_dir.is_symlink() else source
+    prefix = Path(NEXTCLOUD_DATA_SUBDIR) if base is data_dir else Path()
+
+    shards: list[Shard] = []
+    for entry in sorted(base.iterdir()):
+        if entry.is_dir() and not entry.is_symlink():
+            relative = prefix / entry.name
+            shards.append(Shard(name=relative.as_posix(), relative=relative))
+
+    excludes = tuple(
+        "/" + "/".join(_escape_rsync_pattern(part) for part in shard.relative.parts) + "/"
+        for shard in shards
+        if shard.relative is not None
+    )
+    shards.append(Shard(name=REST_SHARD_NAME, excludes=excludes))
+    return shards
+
+
+def build_shard_command(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    shard: Shard,
+    dry_run: bool = False,
+    extra_link_dests: Sequence[Path] = (),
+    excludes: Sequence[str] = (),
+) -> List[str]:
+    """Monta o comando rsync de um shard, ajustando origem, destino e --link-dest.
+
+    `excludes` são os padrões dos perfis de exclusão, ancorados na origem inteira
+    e reancorados na subárvore do shard.
+    """
+
+    if shard.relative is None:
+        return build_rsync_command(
+            source,
+            snapshot_dir,
+            link_dest,
+            dry_run=dry_run,
+            excludes=shard.excludes + tuple(excludes),
+            extra_link_dests=extra_link_dests,
+        )
+
+    shard_link_dest = None
+    if link_dest and (link_dest / shard.relative).is_dir():
+        shard_link_dest = link_dest / shard.relative
+    return build_rsync_command(
+        source / shard.relative,
+        snapshot_dir / shard.relative,
+        shard_link_dest,
+        dry_run=dry_run,
+        excludes=shard.excludes + tuple(profiles.rebase(excludes, shard.relative.as_posix()) or ()),
+        extra_link_dests=[p / shard.relative for p in extra_link_dests if (p / shard.relative).is_dir()],
+    )
+
+
 def prune_snapshots(snapshots_dir: Path, keep: int) -> list[Path]:
     """Remove snapshots mais antigos que o limite desejado.
 
-    Retorna lista de snapshots removidos para log/testes.
+    Os expirados são apenas renomeados para `<target>/trash/` (a remoção física
+    fica para `_purge_trash`). Retorna lista de snapshots removidos para log/testes.
     """
 
     snapshots = sorted([p for p in snapshots_dir.iterdir() if p.is_dir()])
@@ -77,12 +237,97 @@ def prune_snapshots(snapshots_dir: Path, keep: int) -> list[Path]:
         return []
 
     to_remove = snapshots[:-keep]
-    for snap in to_remove:
-        shutil.rmtree(snap, ignore_errors=True)
+    pruning.move_to_trash(to_remove, snapshots_dir.parent / pruning.TRASH_DIRNAME)
     return to_remove
 
 
-def _write_status(target_dir: Path, success: bool, message: str, snapshot: Optional[Path]) -> None:
+def _update_catalog(target: Path, snapshot_dir: Path, removed: list[Path]) -> Optional[dict[str, int]]:
+    """Registra o snapshot novo e esquece os expirados; falhas não derrubam o backup."""
+
+    db_path = target / catalog.CATALOG_NAME
+    try:
+        summary = catalog.record_snapshot(db_path, snapshot_dir)
+        catalog.forget_snapshots(db_path, [snap.name for snap in removed])
+    except (sqlite3.Error, OSError) as exc:
+        logging.warning("Falha ao atualizar catálogo %s: %s", db_path, exc)
+        return None
+    logging.info("Catálogo atualizado: %s arquivos, %s bytes", summary.files, summary.bytes)
+    return {"files": summary.files, "bytes": summary.bytes}
+
+
+def _update_usage(target: Path, retention: int) -> Optional[dict[str, int]]:
+    """Indexa o snapshot novo no relatório de uso; falhas não derrubam o backup."""
+
+    try:
+        report = usage.update(target, retention)
+    except (OSError, ValueError) as exc:
+        logging.warning("Falha ao atualizar relatório de uso: %s", exc)
+        return None
+    latest = report.snapshots[-1] if report.snapshots else None
+    info = {
+        "total_bytes": report.total_bytes,
+        "latest_unique_bytes": latest.unique_bytes if latest else 0,
+        "next_prune_frees_bytes": report.freed_by_pruning[0] if report.freed_by_pruning else 0,
+    }
+    logging.info(
+        "Uso em disco: %s bytes no total, %s exclusivos do snapshot novo",
+        info["total_bytes"],
+        info["latest_unique_bytes"],
+    )
+    return info
+
+
+def _run_db_stage(
+    target: Path,
+    snapshot_name: str,
+    config: db_dump.DumpConfig,
+    runner: db_dump.Runner,
+) -> tuple[int, dict[str, Any]]:
+    destination = target / db_dump.DB_DIRNAME / snapshot_name
+    logging.info("Iniciando dump do PostgreSQL (%s) em %s", config.dump_format, destination)
+    try:
+        info = db_dump.dump_database(config, destination, runner=runner)
+    except (db_dump.DumpError, OSError) as exc:
+        logging.error("Falha no dump do PostgreSQL: %s", exc)
+        return 1, {"db_dump": {"error": str(exc)}}
+    logging.info("Dump do PostgreSQL: %s bytes em %.1fs (%s)", info["bytes"], info["duration_s"], info["compressor"])
+    return 0, {"db_dump": info}
+
+
+def _purge_trash(target: Path, workers: int, rate: float) -> Optional[dict[str, int]]:
+    """Apaga a lixeira depois do status gravado; retorna estatísticas se havia algo a apagar."""
+
+    stats = pruning.purge_trash(target / pruning.TRASH_DIRNAME, workers=workers, rate=rate)
+    if not stats.entries:
+        return None
+    logging.info(
+        "Lixeira limpa: %s snapshots, %s entradas, %s inodes e %s bytes liberados (%s erros)",
+        stats.snapshots,
+        stats.entries,
+        stats.inodes,
+        stats.bytes,
+        stats.errors,
+    )
+    return stats.as_dict()
+
+
+def _collect_chunk_garbage(target: Path, snapshots_dir: Path) -> None:
+    """Após a retenção, remove chunks que nenhum manifesto restante referencia."""
+
+    store_dir = target / chunkstore.CHUNKS_DIRNAME
+    if not store_dir.is_dir():
+        return
+    removed, freed = chunkstore.collect_garbage(store_dir, snapshots_dir)
+    logging.info("Chunks sem referência removidos: %s (%s bytes liberados)", removed, freed)
+
+
+def _write_status(
+    target_dir: Path,
+    success: bool,
+    message: str,
+    snapshot: Optional[Path],
+    extra: Optional[dict[str, Any]] = None,
+) -> None:
     status_file = target_dir / "last_run.json"
     payload = {
         "timestamp": dt.datetime.now().isoformat(),
@@ -90,6 +335,8 @@ def _write_status(target_dir: Path, success: bool, message: str, snapshot: Optio
         "message": message,
         "snapshot": str(snapshot) if snapshot else None,
     }
+    if extra:
+        payload.update(extra)
     status_file.write_text(json.dumps(payload, indent=2), encoding="utf-8")
 
 
@@ -120,10 +367,304 @@ def _latest_snapshot_link(target: Path) -> Optional[Path]:
 
 
 def _update_latest_symlink(target: Path, snapshot_dir: Path) -> None:
-    latest = target / "latest"
-    if latest.exists() or latest.is_symlink():
-        latest.unlink()
-    latest.symlink_to(snapshot_dir)
+    staging.point_latest(target, snapshot_dir)
+
+
+def _run_rsync(
+    cmd: List[str],
+    reporter: Optional[rsync_progress.ProgressReporter] = None,
+    label: str = "rsync",
+    cache_friendly: bool = False,
+) -> int:
+    if cache_friendly:
+        cmd = pagecache.wrap_command(cmd)
+    return rsync_progress.stream_rsync(cmd, reporter=reporter, label=label)
+
+
+def _run_files_from(
+    source: Path,
+    target: Path,
+    snapshot_dir: Path,
+    previous: Path,
+    diff: journal.JournalDiff,
+    reporter: Optional[rsync_progress.ProgressReporter] = None,
+    cache_friendly: bool = False,
+    excludes: Sequence[str] = (),
+) -> int:
+    """Clona o snapshot anterior em hardlinks e copia só o que o journal marcou como alterado."""
+
+    try:
+        journal.clone_snapshot(previous, snapshot_dir)
+    except subprocess.CalledProcessError as exc:
+        logging.error("Falha ao clonar snapshot anterior: %s", exc)
+        return exc.returncode or 1
+    journal.remove_deleted(snapshot_dir, diff.deleted)
+    if not diff.changed:
+        return 0
+    files_from = journal.write_files_from(target / ".files-from", diff.changed)
+    try:
+        cmd = build_rsync_command(source, snapshot_dir, None, files_from=files_from, excludes=excludes)
+        return _run_rsync(cmd, reporter, cache_friendly=cache_friendly)
+    finally:
+        files_from.unlink(missing_ok=True)
+
+
+def _run_native(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    dry_run: bool,
+    workers: int = native.DEFAULT_WORKERS,
+    extra_link_dests: Sequence[Path] = (),
+    resume: bool = False,
+    excludes: Sequence[str] = (),
+    dropper: Optional[pagecache.CacheDropper] = None,
+) -> tuple[int, dict[str, Any]]:
+    stats = native.copy_tree(
+        source,
+        snapshot_dir,
+        link_dest,
+        workers=workers,
+        excludes=excludes,
+        dry_run=dry_run,
+        extra_link_dests=extra_link_dests,
+        resume=resume,
+        dropper=dropper,
+    )
+    logging.info(
+        "Engine native: %s arquivos (%s hardlinks, %s copiados, %s retomados, %s bytes copiados)",
+        stats.files,
+        stats.linked,
+        stats.copied,
+        stats.resumed,
+        stats.bytes_copied,
+    )
+    for message in stats.messages:
+        logging.error("Falha ao copiar %s", message)
+    return native.returncode(stats), {"native": stats.as_dict()}
+
+
+def _measure_links(snapshot_dir: Path, previous: Optional[Path]) -> dict[str, object]:
+    report = linkdest.measure_links(snapshot_dir, previous)
+    logging.info(
+        "Hardlinks: %s bytes reaproveitados (%s de gerações antigas), %s bytes copiados (economia %.1f%%)",
+        report.bytes_linked,
+        report.bytes_linked_older,
+        report.bytes_copied,
+        report.savings_ratio * 100,
+    )
+    return report.as_dict()
+
+
+def _run_chunkstore(
+    source: Path,
+    target: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    dry_run: bool,
+    excludes: Sequence[str] = (),
+    dropper: Optional[pagecache.CacheDropper] = None,
+) -> tuple[int, dict[str, Any]]:
+    try:
+        stats = chunkstore.backup_tree(
+            source,
+            snapshot_dir,
+            target / chunkstore.CHUNKS_DIRNAME,
+            previous=link_dest,
+            dry_run=dry_run,
+            excludes=excludes,
+            dropper=dropper,
+        )
+    except OSError as exc:
+        logging.error("Falha no chunkstore: %s", exc)
+        return 1, {}
+    logging.info(
+        "Chunkstore: %s arquivos (%s reaproveitados), %s chunks novos, %s bytes gravados",
+        stats.files,
+        stats.files_reused,
+        stats.chunks_new,
+        stats.bytes_stored,
+    )
+    return 0, {"chunkstore": stats.as_dict()}
+
+
+def run_sharded_rsync(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    jobs: int,
+    dry_run: bool = False,
+    reporter: Optional[rsync_progress.ProgressReporter] = None,
+    cache_friendly: bool = False,
+    extra_link_dests: Sequence[Path] = (),
+    excludes: Sequence[str] = (),
+) -> list[ShardResult]:
+    """Executa um rsync por shard com até `jobs` processos simultâneos no mesmo snapshot."""
+
+    shards = [
+        shard
+        for shard in partition_source(source)
+        # Shard inteiro coberto por um perfil de exclusão: nem entra na fila.
+        if shard.relative is None or profiles.rebase(excludes, shard.relative.as_posix()) is not None
+    ]
+    for shard in shards:
+        if shard.relative is not None:
+            (snapshot_dir / shard.relative).parent.mkdir(parents=True, exist_ok=True)
+
+    def _run_shard(shard: Shard) -> ShardResult:
+        cmd = build_shard_command(
+            source,
+            snapshot_dir,
+            link_dest,
+            shard,
+            dry_run=dry_run,
+            extra_link_dests=extra_link_dests,
+            excludes=excludes,
+        )
+        started = time.monotonic()
+        returncode = _run_rsync(cmd, reporter, label=shard.name, cache_friendly=cache_friendly)
+        duration = time.monotonic() - started
+        logging.info("Shard %s finalizado em %.1fs (código %s)", shard.name, duration, returncode)
+        return ShardResult(name=shard.name, returncode=returncode, duration=duration)
+
+    logging.info("Modo shards: %s partições com %s workers", len(shards), jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_run_shard, shards))
+
+
+def _run_shards(
+    source: Path,
+    snapshot_dir: Path,
+    link_dest: Optional[Path],
+    jobs: int,
+    dry_run: bool,
+    reporter: rsync_progress.ProgressReporter,
+    cache_friendly: bool = False,
+    extra_link_dests: Sequence[Path] = (),
+    excludes: Sequence[str] = (),
+) -> tuple[int, list[dict[str, Any]]]:
+    shard_results = run_sharded_rsync(
+        source,
+        snapshot_dir,
+        link_dest,
+        jobs,
+        dry_run=dry_run,
+        reporter=reporter,
+        cache_friendly=cache_friendly,
+        extra_link_dests=extra_link_dests,
+        excludes=excludes,
+    )
+    summary = [{"name": r.name, "returncode": r.returncode, "duration_s": round(r.duration, 3)} for r in shard_results]
+    failed = [r for r in shard_results if r.returncode != 0]
+    if failed:
+        logging.error("Shards com falha: %s", ", ".join(r.name for r in failed))
+    return (failed[0].returncode if failed else 0), summary
+
+
+def _measure_exclusions(source: Path, rules: Sequence[profiles.ExcludeRule]) -> profiles.ExclusionReport:
+    report = profiles.measure(source, rules)
+    for rule in report.rules:
+        logging.info(
+            "Exclusão [%s] %s: %s caminhos, %s arquivos, %s bytes pulados",
+            rule.profile,
+            rule.pattern,
+            rule.matches,
+            rule.files,
+            rule.bytes,
+        )
+    logging.info("Perfis de exclusão: %s arquivos e %s bytes fora do snapshot", report.files, report.bytes)
+    return report
+
+
+def _replicate(
+    snapshot_dir: Path, replicas: Sequence[replicate.ReplicaTarget], retention: int
+) -> list[dict[str, object]]:
+    results = replicate.replicate(snapshot_dir, replicas, retention)
+    for result in results:
+        if result.success:
+            logging.info(
+                "Réplica %s: %s (%s hardlinks, %s copiados, %s bytes em %.1fs)",
+                result.target,
+                result.message or "snapshot replicado",
+                result.linked,
+                result.copied,
+                result.bytes_copied,
+                result.duration_s,
+            )
+        else:
+            logging.error("Réplica %s falhou: %s", result.target, result.message)
+    return [result.as_dict() for result in results]
+
+
+def _log_page_cache(info: dict[str, Any]) -> None:
+    if "kept_ratio" in info:
+        logging.info(
+            "Page cache: %.0f%% do Active(file) preservado (%s arquivos liberados)",
+            info["kept_ratio"] * 100,
+            info["dropped"]["files"],
+        )
+
+
+def _run_cmd(cmd: Sequence[str]) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(list(cmd), check=False, capture_output=True, text=True)
+
+
+def build_occ_command(compose_file: Path, occ_args: Sequence[str]) -> List[str]:
+    return [
+        "docker",
+        "compose",
+        "-f",
+        str(compose_file),
+        "exec",
+        "-T",
+        "-u",
+        "www-data",
+        "nextcloud",
+        "php",
+        "occ",
+        *occ_args,
+    ]
+
+
+def set_maintenance_mode(enabled: bool, compose_file: Path, runner: OccRunner = _run_cmd) -> tuple[bool, str]:
+    flag = "--on" if enabled else "--off"
+    result = runner(build_occ_command(compose_file, ["maintenance:mode", flag]))
+    output = result.stdout.strip() or result.stderr.strip()
+    return result.returncode == 0, output
+
+
+def run_maintenance_window(
+    final_pass: Callable[[], int],
+    compose_file: Path,
+    runner: OccRunner = _run_cmd,
+    clock: Callable[[], float] = time.monotonic,
+) -> tuple[int, dict[str, Any]]:
+    """Liga o modo manutenção, roda o passe final e sempre desliga no fim.
+
+    Retorna (código, métricas) com o downtime medido entre o `--on` e o `--off`.
+    """
+
+    ok, output = set_maintenance_mode(True, compose_file, runner)
+    if not ok:
+        logging.error("Falha ao ligar modo manutenção: %s", output)
+        return 1, {"error": output}
+    enabled_at = clock()
+    logging.info("Modo manutenção ligado")
+    returncode = 1
+    try:
+        returncode = final_pass()
+    finally:
+        disabled, output = set_maintenance_mode(False, compose_file, runner)
+        downtime = clock() - enabled_at
+        if disabled:
+            logging.info("Modo manutenção desligado após %.1fs", downtime)
+        else:
+            logging.error("Falha ao desligar modo manutenção (verifique manualmente!): %s", output)
+    info: dict[str, Any] = {"downtime_s": round(downtime, 3), "disabled": disabled}
+    if not disabled:
+        info["error"] = output
+        returncode = returncode or 1
+    return returncode, info
 
 
 def run_backup(
@@ -132,43 +673,246 @@ def run_backup(
     log_file: Path,
     retention: int,
     dry_run: bool = False,
+    jobs: int = DEFAULT_JOBS_VALUE,
+    engine: str = ENGINE_RSYNC,
+    use_journal: bool = False,
+    purge_workers: int = pruning.DEFAULT_PURGE_WORKERS,
+    purge_rate: float = 0.0,
+    use_catalog: bool = True,
+    db_config: Optional[db_dump.DumpConfig] = None,
+    db_runner: db_dump.Runner = db_dump.spawn,
+    two_phase: bool = False,
+    compose_file: Path = db_dump.DEFAULT_COMPOSE_FILE,
+    occ_runner: OccRunner = _run_cmd,
+    cache_friendly: bool = False,
+    link_generations: int = 1,
+    use_usage: bool = True,
+    resume: bool = True,
+    exclude_rules: Sequence[profiles.ExcludeRule] = (),
+    replicas: Sequence[replicate.ReplicaTarget] = (),
 ) -> int:
     _configure_logging(log_file)
     snapshots_dir = _ensure_dirs(target)
-    snapshot_dir = snapshots_dir / _timestamp()
+    try:
+        lock = staging.acquire_lock(target)
+    except staging.LockBusy as exc:
+        logging.error("Outro backup do Nextcloud em andamento; execução abortada (%s)", exc)
+        return staging.LOCK_BUSY_CODE
+    with lock:
+        snapshot_dir, resumed = staging.prepare_snapshot(target, _timestamp(), resume=resume)
+        link_dest = _latest_snapshot_link(target)
+        older_link_dests = linkdest.select_link_dests(snapshots_dir, link_dest, link_generations)[1:]
+        profile_excludes = profiles.rsync_patterns(exclude_rules)
+        rsync_cmd = build_rsync_command(
+            source,
+            snapshot_dir,
+            link_dest,
+            dry_run=dry_run,
+            excludes=profile_excludes,
+            extra_link_dests=older_link_dests,
+        )
+
+        logging.info("Iniciando backup do Nextcloud")
+        logging.info("Origem: %s", source)
+        logging.info("Snapshot: %s", snapshot_dir)
+        if resumed:
+            logging.info("Retomando snapshot interrompido: %s", snapshot_dir.name)
+        if link_dest:
+            logging.info("Usando link-dest: %s", link_dest)
+        if older_link_dests:
+            logging.info("Gerações anteriores como link-dest: %s", ", ".join(p.name for p in older_link_dests))
+
+        extra: dict[str, Any] = {"engine": engine}
+        if resumed:
+            extra["resumed"] = True
+        scan: Optional[journal.JournalScan] = None
+        if use_journal:
+            scan = journal.scan(
+                source,
+                target / journal.JOURNAL_NAME,
+                snapshot_dir.name,
+                expected_snapshot=link_dest.name if link_dest else None,
+            )
+            diff = scan.diff
+            extra["journal"] = {"entries": diff.entries, "changed": len(diff.changed), "deleted": len(diff.deleted)}
+            # Com dump do banco ativo o snapshot é sempre gerado: o journal só enxerga os arquivos.
+            # Um snapshot interrompido também precisa ser concluído, mesmo sem alterações.
+            if diff.unchanged and db_config is None and not resumed:
+                scan.discard()
+                msg = "Nenhuma alteração desde o último snapshot; backup ignorado (no-op)"
+                logging.info(msg)
+                extra["noop"] = True
+                _write_status(target, True, msg, link_dest, extra)
+                _purge_trash(target, purge_workers, purge_rate)
+                return 0
+            logging.info(
+                "Journal: %s entradas, %s alteradas, %s removidas (comparável: %s)",
+                diff.entries,
+                len(diff.changed),
+                len(diff.deleted),
+                diff.comparable,
+            )
+
+        excluded_paths: list[str] = []
+        if exclude_rules:
+            exclusions = _measure_exclusions(source, exclude_rules)
+            excluded_paths = exclusions.paths
+            extra["exclusions"] = exclusions.as_dict()
+
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        reporter = rsync_progress.ProgressReporter(target / rsync_progress.PROGRESS_FILENAME)
+        if two_phase and engine != ENGINE_RSYNC:
+            logging.warning("Modo em duas fases só vale para a engine rsync; seguindo em passe único")
+            two_phase = False
 
-    link_dest = _latest_snapshot_link(target)
-    rsync_cmd = build_rsync_command(source, snapshot_dir, link_dest, dry_run=dry_run)
+        cache_before = pagecache.sample() if cache_friendly else None
+        # Nas engines em Python o cache é liberado arquivo a arquivo; o rsync depende do nocache.
+        dropper = pagecache.CacheDropper() if cache_friendly and engine != ENGINE_RSYNC and not dry_run else None
+        warm_started = time.monotonic()
+        if engine == ENGINE_CHUNKSTORE:
+            returncode, engine_extra = _run_chunkstore(
+                source, target, snapshot_dir, link_dest, dry_run, excludes=excluded_paths, dropper=dropper
+            )
+            extra.update(engine_extra)
+        elif engine == ENGINE_NATIVE:
+            workers = jobs if jobs > 1 else native.DEFAULT_WORKERS
+            returncode, engine_extra = _run_native(
+                source,
+                snapshot_dir,
+                link_dest,
+                dry_run,
+                workers,
+                extra_link_dests=older_link_dests,
+                resume=resumed,
+                excludes=excluded_paths,
+                dropper=dropper,
+            )
+            extra.update(engine_extra)
+        elif scan is not None and scan.diff.comparable and link_dest and not dry_run and not resumed:
+            extra["journal"]["mode"] = "files-from"
+            returncode = _run_files_from(
+                source,
+                target,
+                snapshot_dir,
+                link_dest,
+                scan.diff,
+                reporter,
+                cache_friendly=cache_friendly,
+                excludes=profile_excludes,
+            )
+        elif jobs > 1:
+            returncode, extra["shards"] = _run_shards(
+                source,
+                snapshot_dir,
+                link_dest,
+                jobs,
+                dry_run,
+                reporter,
+                cache_friendly=cache_friendly,
+                extra_link_dests=older_link_dests,
+                excludes=profile_excludes,
+            )
+        else:
+            returncode = _run_rsync(rsync_cmd, reporter, cache_friendly=cache_friendly)
 
-    logging.info("Iniciando backup do Nextcloud")
-    logging.info("Origem: %s", source)
-    logging.info("Snapshot: %s", snapshot_dir)
-    if link_dest:
-        logging.info("Usando link-dest: %s", link_dest)
+        if returncode == 0 and two_phase and not dry_run:
+            warm_duration = time.monotonic() - warm_started
+            logging.info("Passe morno concluído em %.1fs; iniciando janela de manutenção", warm_duration)
 
-    snapshot_dir.mkdir(parents=True, exist_ok=True)
+            def _final_pass() -> int:
+                started = time.monotonic()
+                if jobs > 1:
+                    code, extra["final_shards"] = _run_shards(
+                        source,
+                        snapshot_dir,
+                        link_dest,
+                        jobs,
+                        False,
+                        reporter,
+                        cache_friendly=cache_friendly,
+                        extra_link_dests=older_link_dests,
+                        excludes=profile_excludes,
+                    )
+                else:
+                    code = _run_rsync(rsync_cmd, reporter, label="delta", cache_friendly=cache_friendly)
+                extra["final_pass_s"] = round(time.monotonic() - started, 3)
+                if code == 0 and db_config is not None:
+                    code, db_extra = _run_db_stage(target, snapshot_dir.name, db_config, db_runner)
+                    extra.update(db_extra)
+                return code
 
-    result = subprocess.run(rsync_cmd, text=True, capture_output=True)
-    if result.stdout:
-        logging.info(result.stdout.strip())
-    if result.stderr:
-        logging.warning(result.stderr.strip())
+            returncode, maintenance = run_maintenance_window(_final_pass, compose_file, occ_runner)
+            maintenance["warm_pass_s"] = round(warm_duration, 3)
+            maintenance["final_pass_s"] = extra.pop("final_pass_s", None)
+            extra["maintenance"] = maintenance
+        elif returncode == 0 and db_config is not None and not dry_run:
+            returncode, db_extra = _run_db_stage(target, snapshot_dir.name, db_config, db_runner)
+            extra.update(db_extra)
+        reporter.finish()
 
-    if result.returncode != 0:
-        msg = f"Backup falhou com código {result.returncode}"
-        logging.error(msg)
-        _write_status(target, False, msg, snapshot_dir)
-        return result.returncode
+        if cache_friendly and not dry_run:
+            files_from_mode = extra.get("journal", {}).get("mode") == "files-from" and not two_phase
+            extra["page_cache"] = pagecache.release(
+                cache_before,
+                source,
+                snapshot_dir,
+                changed=scan.diff.changed if files_from_mode and scan is not None else None,
+                written_dirs=[target / db_dump.DB_DIRNAME / snapshot_dir.name],
+                dropper=dropper,
+            )
+            _log_page_cache(extra["page_cache"])
 
-    _update_latest_symlink(target, snapshot_dir)
-    removed = prune_snapshots(snapshots_dir, keep=retention)
-    if removed:
-        logging.info("Snapshots antigos removidos: %s", ", ".join(str(r.name) for r in removed))
+        if returncode != 0:
+            msg = f"Backup falhou com código {returncode}"
+            logging.error(msg)
+            if scan is not None:
+                scan.discard()
+            if not dry_run:
+                logging.info("Snapshot incompleto mantido em %s para a próxima execução retomar", snapshot_dir)
+            _write_status(target, False, msg, snapshot_dir, extra)
+            return returncode
 
-    success_msg = "Backup concluído com sucesso"
-    logging.info(success_msg)
-    _write_status(target, True, success_msg, snapshot_dir)
-    return 0
+        if scan is not None:
+            if dry_run:
+                scan.discard()
+            else:
+                scan.commit()
+        snapshot_dir = staging.promote(snapshot_dir, snapshots_dir)
+        # A medição percorre o snapshot inteiro; só se paga quando há gerações antigas a comparar.
+        if link_generations > 1 and engine != ENGINE_CHUNKSTORE and not dry_run:
+            extra["links"] = _measure_links(snapshot_dir, link_dest)
+        _update_latest_symlink(target, snapshot_dir)
+        removed = prune_snapshots(snapshots_dir, keep=retention)
+        if removed:
+            logging.info("Snapshots antigos removidos: %s", ", ".join(str(r.name) for r in removed))
+            verify.forget_snapshots(target / verify.VERIFY_DB_NAME, [r.name for r in removed])
+            _collect_chunk_garbage(target, snapshots_dir)
+            db_dump.prune_dumps(target / db_dump.DB_DIRNAME, {p.name for p in snapshots_dir.iterdir() if p.is_dir()})
+        if use_catalog and not dry_run:
+            catalog_info = _update_catalog(target, snapshot_dir, removed)
+            if catalog_info:
+                extra["catalog"] = catalog_info
+        if use_usage and not dry_run:
+            usage_info = _update_usage(target, retention)
+            if usage_info:
+                extra["usage"] = usage_info
+
+        success_msg = "Backup concluído com sucesso"
+        logging.info(success_msg)
+        _write_status(target, True, success_msg, snapshot_dir, extra)
+
+        if replicas and not dry_run:
+            if engine == ENGINE_CHUNKSTORE:
+                logging.warning("Replicação não suportada na engine chunkstore; réplicas ignoradas")
+            else:
+                extra["replication"] = _replicate(snapshot_dir, replicas, retention)
+                _write_status(target, True, success_msg, snapshot_dir, extra)
+
+        purge = _purge_trash(target, purge_workers, purge_rate)
+        if purge:
+            extra["prune"] = purge
+            _write_status(target, True, success_msg, snapshot_dir, extra)
+        return 0
 
 
 def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
@@ -176,6 +920,21 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
     default_target = _env_path("NEXTCLOUD_BACKUP_TARGET", DEFAULT_TARGET_PATH)
     default_log = _env_path("NEXTCLOUD_BACKUP_LOG", default_target / "nextcloud_backup.log")
     default_retention = int(os.getenv("NEXTCLOUD_BACKUP_RETENTION", str(DEFAULT_RETENTION_VALUE)))
+    default_jobs = int(os.getenv("NEXTCLOUD_BACKUP_JOBS", str(DEFAULT_JOBS_VALUE)))
+    default_engine = os.getenv("NEXTCLOUD_BACKUP_ENGINE", ENGINE_RSYNC)
+    default_journal = os.getenv("NEXTCLOUD_BACKUP_JOURNAL", "0") == "1"
+    default_catalog = os.getenv("NEXTCLOUD_BACKUP_CATALOG", "1") == "1"
+    default_db_dump = os.getenv("NEXTCLOUD_BACKUP_DB_DUMP", "0") == "1"
+    default_db_format = os.getenv("NEXTCLOUD_BACKUP_DB_FORMAT", "custom")
+    default_compose = _env_path("NEXTCLOUD_BACKUP_COMPOSE_FILE", db_dump.DEFAULT_COMPOSE_FILE)
+    default_two_phase = os.getenv("NEXTCLOUD_BACKUP_TWO_PHASE", "0") == "1"
+    default_cache_friendly = os.getenv("NEXTCLOUD_BACKUP_CACHE_FRIENDLY", "0") == "1"
+    default_link_generations = int(os.getenv("NEXTCLOUD_BACKUP_LINK_GENERATIONS", "1"))
+    default_usage = os.getenv("NEXTCLOUD_BACKUP_USAGE", "1") == "1"
+    default_resume = os.getenv("NEXTCLOUD_BACKUP_RESUME", "1") == "1"
+    default_exclude_profiles = os.getenv("NEXTCLOUD_BACKUP_EXCLUDE_PROFILES", "")
+    default_exclude_file = os.getenv("NEXTCLOUD_BACKUP_EXCLUDE_FILE")
+    default_replicas = os.getenv("NEXTCLOUD_BACKUP_REPLICAS", "")
 
     parser = argparse.ArgumentParser(description="Backup incremental do Nextcloud com rsync")
     parser.add_argument("--source", default=default_source, type=Path, help="Diretório de dados do Nextcloud")
@@ -187,23 +946,176 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
         type=int,
         help="Quantidade de snapshots a manter (FIFO)",
     )
+    parser.add_argument(
+        "--jobs",
+        default=default_jobs,
+        type=int,
+        help="Workers rsync em paralelo; >1 divide a origem em shards (usuários, appdata_*, resto). "
+        "Na engine native, threads do pool de cópia",
+    )
+    parser.add_argument(
+        "--engine",
+        default=default_engine,
+        choices=ENGINES,
+        help="rsync (snapshots com hardlinks), native (mesmo layout, cópia em Python com copy_file_range) "
+        "ou chunkstore (dedup por chunks, manifesto por snapshot)",
+    )
+    parser.add_argument(
+        "--journal",
+        default=default_journal,
+        action=argparse.BooleanOptionalAction,
+        help="Compara a origem com o journal do último snapshot: pula se nada mudou ou copia só os alterados",
+    )
+    parser.add_argument(
+        "--purge-workers",
+        default=pruning.DEFAULT_PURGE_WORKERS,
+        type=int,
+        help="Threads que apagam snapshots expirados da lixeira",
+    )
+    parser.add_argument(
+        "--purge-rate",
+        default=0.0,
+        type=float,
+        help="Limite de operações de remoção por segundo na lixeira (0 = sem limite)",
+    )
+    parser.add_argument(
+        "--catalog",
+        default=default_catalog,
+        action=argparse.BooleanOptionalAction,
+        help="Registra a lista de arquivos do snapshot no catálogo SQLite do destino",
+    )
+    parser.add_argument(
+        "--db-dump",
+        default=default_db_dump,
+        action=argparse.BooleanOptionalAction,
+        help="Gera dump do PostgreSQL (pg_dump no contêiner, comprimido em stream) junto do snapshot",
+    )
+    parser.add_argument(
+        "--db-format", default=default_db_format, choices=db_dump.DUMP_FORMATS, help="Formato do pg_dump"
+    )
+    parser.add_argument("--db-jobs", default=2, type=int, help="Jobs paralelos do pg_dump no formato directory")
+    parser.add_argument(
+        "--compose-file",
+        default=default_compose,
+        type=Path,
+        help="Compose da stack core (serviços nextcloud/postgres)",
+    )
+    parser.add_argument(
+        "--two-phase",
+        default=default_two_phase,
+        action=argparse.BooleanOptionalAction,
+        help="Passe morno online e delta final (+ dump) com `occ maintenance:mode` ligado",
+    )
+    parser.add_argument(
+        "--cache-friendly",
+        default=default_cache_friendly,
+        action=argparse.BooleanOptionalAction,
+        help="Libera do page cache o que o backup leu/gravou (fadvise DONTNEED, `nocache` se instalado)",
+    )
+    parser.add_argument(
+        "--link-generations",
+        default=default_link_generations,
+        type=int,
+        help="Snapshots usados como --link-dest (latest + mais novos, até 20) para reaproveitar arquivos que voltaram",
+    )
+    parser.add_argument(
+        "--usage",
+        default=default_usage,
+        action=argparse.BooleanOptionalAction,
+        help="Atualiza o índice de uso de disco (exclusivo/compartilhado por snapshot) após o backup",
+    )
+    parser.add_argument(
+        "--resume",
+        default=default_resume,
+        action=argparse.BooleanOptionalAction,
+        help="Retoma o snapshot interrompido em <target>/incomplete (com --no-resume ele vai para a lixeira)",
+    )
+    parser.add_argument(
+        "--exclude-profiles",
+        default=default_exclude_profiles,
+        help="Perfis de exclusão de dados regeneráveis, separados por vírgula "
+        f"(embutidos: {', '.join(profiles.BUILTIN_PROFILES['nextcloud'])})",
+    )
+    parser.add_argument(
+        "--exclude-file",
+        default=Path(default_exclude_file) if default_exclude_file else None,
+        type=Path,
+        help='JSON com perfis próprios ou que substituem os embutidos ({"nextcloud": {"nome": ["/padrão/"]}})',
+    )
+    parser.add_argument(
+        "--replicas",
+        default=default_replicas,
+        help="Destinos extras que recebem cada snapshot concluído (delta com hardlinks), separados por vírgula; "
+        "'caminho=MiB/s' limita a vazão daquele destino",
+    )
     parser.add_argument("--dry-run", action="store_true", help="Apenas imprime comando rsync (não copia)")
+
+    subparsers = parser.add_subparsers(dest="command")
+    catalog.add_parser(subparsers)
+    verify.add_parser(subparsers)
+    restore.add_parser(subparsers)
+    usage.add_parser(subparsers)
+    offsite.add_parser(subparsers)
+    export.add_parser(subparsers)
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[Iterable[str]] = None) -> int:
     args = parse_args(argv)
 
+    if args.command == "catalog":
+        return catalog.run_command(args, args.target)
+    if args.command == "verify":
+        return verify.run_command(args, args.target)
+    if args.command == "restore":
+        return restore.run_command(args, args.target)
+    if args.command == "usage":
+        return usage.run_command(args, args.target)
+    if args.command == "offsite":
+        return offsite.run_command(args, args.target)
+    if args.command in ("export", "extract"):
+        return export.run_command(args, args.target)
+
     if not args.source.exists():
         sys.stderr.write(f"Origem inexistente: {args.source}\n")
         return 2
 
+    try:
+        exclude_rules = profiles.resolve(
+            "nextcloud", profiles.parse_names(args.exclude_profiles), args.exclude_file
+        )
+        replicas = replicate.parse_targets(args.replicas)
+    except ValueError as exc:
+        sys.stderr.write(f"{exc}\n")
+        return 2
+
+    db_config = None
+    if args.db_dump:
+        db_config = db_dump.DumpConfig(
+            compose_file=args.compose_file, dump_format=args.db_format, jobs=args.db_jobs
+        )
+
     return run_backup(
         source=args.source,
         target=args.target,
         log_file=args.log_file,
         retention=args.retention,
         dry_run=args.dry_run,
+        jobs=args.jobs,
+        engine=args.engine,
+        use_journal=args.journal,
+        purge_workers=args.purge_workers,
+        purge_rate=args.purge_rate,
+        use_catalog=args.catalog,
+        db_config=db_config,
+        two_phase=args.two_phase,
+        compose_file=args.compose_file,
+        cache_friendly=args.cache_friendly,
+        link_generations=args.link_generations,
+        use_usage=args.usage,
+        resume=args.resume,
+        exclude_rules=exclude_rules,
+        replicas=replicas,
     )
 
 
@@ -0,0 +1,200 @@
+"""Estágio de dump do PostgreSQL do Nextcloud para os snapshots de backup.
+
+O `pg_dump` roda dentro do contêiner `postgres` da stack core (via
+`docker compose exec -T`) por um runner injetável, no mesmo espírito dos
+`Runner` de `infra/provision`. A saída vai direto, por pipe do sistema, para um
+compressor multi-thread (zstd -T0, pigz ou gzip como fallback) e dele para o
+arquivo final: o dump nunca passa pela memória do Python nem é gravado sem
+compressão.
+
+Formatos:
+- custom/plain: stream único `pg_dump | compressor > nextcloud.<fmt>.<ext>`;
+- directory: `pg_dump -Fd -j N` dentro do contêiner (arquivos por tabela já
+  comprimidos em paralelo pelo próprio pg_dump), exportado como tar em stream.
+"""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Callable, Optional, Sequence
+
+DB_DIRNAME = "db"
+DUMP_FORMATS = ("custom", "plain", "directory")
+DEFAULT_COMPOSE_FILE = Path(__file__).resolve().parents[1] / "docker-compose.yml"
+CONTAINER_DUMP_DIR = "/tmp/nextcloud-backup-dump"
+_STDERR_TAIL = 4096
+
+Runner = Callable[[Sequence[str]], "subprocess.Popen[bytes]"]
+
+
+def spawn(cmd: Sequence[str]) -> "subprocess.Popen[bytes]":
+    return subprocess.Popen(list(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+@dataclass
+class DumpConfig:
+    compose_file: Path = DEFAULT_COMPOSE_FILE
+    service: str = "postgres"
+    user: str = "nextcloud"
+    database: str = "nextcloud"
+    dump_format: str = "custom"
+    jobs: int = 2
+    compression_level: int = 3
+    compressor: Optional[list[str]] = None
+    extra_args: list[str] = field(default_factory=list)
+
+
+def default_compressor(level: int = 3) -> tuple[list[str], str]:
+    """Escolhe o compressor disponível: (comando, extensão)."""
+
+    if shutil.which("zstd"):
+        return ["zstd", "-T0", f"-{level}", "-q", "-c"], "zst"
+    if shutil.which("pigz"):
+        return ["pigz", f"-{level}", "-c"], "gz"
+    return ["gzip", f"-{level}", "-c"], "gz"
+
+
+def _compressor_extension(cmd: Sequence[str]) -> str:
+    name = Path(cmd[0]).name
+    return "zst" if name.startswith("zstd") else "gz"
+
+
+def build_exec_prefix(config: DumpConfig) -> list[str]:
+    return ["docker", "compose", "-f", str(config.compose_file), "exec", "-T", config.service]
+
+
+def build_pg_dump_command(config: DumpConfig) -> list[str]:
+    cmd = build_exec_prefix(config) + ["pg_dump", "-U", config.user, "-d", config.database]
+    if config.dump_format == "directory":
+        cmd += [
+            "--format=directory",
+            f"--jobs={config.jobs}",
+            f"--compress={config.compression_level}",
+            f"--file={CONTAINER_DUMP_DIR}",
+        ]
+    elif config.dump_format == "custom":
+        # Compressão interna desligada: quem comprime é o compressor multi-thread do host.
+        cmd += ["--format=custom", "--compress=0"]
+    else:
+        cmd += ["--format=plain"]
+    return cmd + list(config.extra_args)
+
+
+class _StderrTail(threading.Thread):
+    """Drena o stderr de um processo guardando só o final (memória limitada)."""
+
+    def __init__(self, stream: Optional[IO[bytes]]):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.tail = b""
+
+    def run(self) -> None:
+        if self.stream is None:
+            return
+        for block in iter(lambda: self.stream.read(4096), b""):
+            self.tail = (self.tail + block)[-_STDERR_TAIL:]
+
+    def text(self) -> str:
+        self.join()
+        return self.tail.decode("utf-8", "replace").strip()
+
+
+class DumpError(RuntimeError):
+    pass
+
+
+def _stream_to_file(
+    producer_cmd: Sequence[str],
+    destination: Path,
+    runner: Runner,
+    compressor: Optional[Sequence[str]],
+) -> None:
+    """Liga `producer | compressor > destination` só com pipes do sistema."""
+
+    tmp = destination.with_name(destination.name + ".tmp")
+    with tmp.open("wb") as out:
+        producer = runner(producer_cmd)
+        producer_err = _StderrTail(producer.stderr)
+        producer_err.start()
+        if compressor:
+            comp = subprocess.Popen(list(compressor), stdin=producer.stdout, stdout=out, stderr=subprocess.PIPE)
+            # O pai não deve segurar o pipe: se o compressor morrer, o produtor recebe SIGPIPE.
+            assert producer.stdout is not None
+            producer.stdout.close()
+            comp_err = _StderrTail(comp.stderr)
+            comp_err.start()
+            comp_code = comp.wait()
+        else:
+            assert producer.stdout is not None
+            shutil.copyfileobj(producer.stdout, out, 1024 * 1024)
+            producer.stdout.close()
+            comp_code, comp_err = 0, None
+        producer_code = producer.wait()
+    if producer_code != 0:
+        tmp.unlink(missing_ok=True)
+        raise DumpError(f"Dump falhou ({producer_code}): {producer_err.text()}")
+    if comp_code != 0:
+        tmp.unlink(missing_ok=True)
+        raise DumpError(f"compressor falhou ({comp_code}): {comp_err.text() if comp_err else ''}")
+    tmp.replace(destination)
+
+
+def _run_checked(cmd: Sequence[str], runner: Runner) -> None:
+    proc = runner(cmd)
+    _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise DumpError(f"Comando falhou ({proc.returncode}): {' '.join(cmd)}: {stderr.decode(errors='replace')}")
+
+
+def dump_database(config: DumpConfig, destination_dir: Path, runner: Runner = spawn) -> dict:
+    """Gera o dump em `destination_dir`; retorna metadados para o `last_run.json`."""
+
+    if config.dump_format not in DUMP_FORMATS:
+        raise ValueError(f"Formato de dump inválido: {config.dump_format}")
+    destination_dir.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    exec_prefix = build_exec_prefix(config)
+
+    if config.dump_format == "directory":
+        _run_checked(exec_prefix + ["rm", "-rf", CONTAINER_DUMP_DIR], runner)
+        try:
+            _run_checked(build_pg_dump_command(config), runner)
+            destination = destination_dir / f"{config.database}.directory.tar"
+            tar_cmd = exec_prefix + ["tar", "-cf", "-", "-C", CONTAINER_DUMP_DIR, "."]
+            _stream_to_file(tar_cmd, destination, runner, compressor=None)
+        finally:
+            _run_checked(exec_prefix + ["rm", "-rf", CONTAINER_DUMP_DIR], runner)
+        compressor_name = f"pg_dump -Z{config.compression_level} (jobs={config.jobs})"
+    else:
+        if config.compressor:
+            compressor, extension = list(config.compressor), _compressor_extension(config.compressor)
+        else:
+            compressor, extension = default_compressor(config.compression_level)
+        destination = destination_dir / f"{config.database}.{config.dump_format}.{extension}"
+        _stream_to_file(build_pg_dump_command(config), destination, runner, compressor)
+        compressor_name = " ".join(compressor)
+
+    return {
+        "format": config.dump_format,
+        "file": str(destination),
+        "bytes": destination.stat().st_size,
+        "duration_s": round(time.monotonic() - started, 3),
+        "compressor": compressor_name,
+    }
+
+
+def prune_dumps(db_root: Path, keep_names: set[str]) -> list[Path]:
+    """Remove dumps cujo snapshot correspondente não existe mais."""
+
+    removed: list[Path] = []
+    if not db_root.is_dir():
+        return removed
+    for entry in sorted(db_root.iterdir()):
+        if entry.is_dir() and entry.name not in keep_names:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed.append(entry)
+    return removed
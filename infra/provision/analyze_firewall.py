@@ -0,0 +1,852 @@
+"""Análise do ruleset de firewall do host (US-012).
+
+`validate_firewall.py` olha o sintoma (portas abertas); aqui o alvo é o ruleset
+que o `host_provision.sh` monta com UFW e o que o Docker acrescenta por cima.
+Lê `nft -j list ruleset` (JSON) ou, sem nft, `iptables-save`/`ip6tables-save`,
+sempre por um runner injetável (como em `validate_host.py`), e reporta:
+
+- custo por caminho: quantas regras um pacote percorre em cada hook (pior caso,
+  contando as chains chamadas por jump) e para pacotes de exemplo (portas
+  liberadas, uma porta fechada, conexão estabelecida);
+- regras sombreadas (nunca casam porque uma regra anterior com veredito final
+  cobre todos os pacotes delas) e redundantes (mesmo veredito);
+- listas lineares de portas: regras seguidas que só mudam a porta e deveriam
+  virar set/multiport (ou verdict map, quando cada porta pula para uma chain);
+- chains do Docker: portas publicadas por DNAT passam pelo FORWARD e não pelo
+  INPUT do UFW; sem filtro em DOCKER-USER ficam expostas mesmo com `ufw deny`.
+
+A avaliação entende protocolo, portas, endereços, interfaces e estado do
+conntrack; regras com outros critérios contam no custo mas nunca são tratadas
+como casadas nem usadas para sombrear outras.
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import ipaddress
+import json
+import shlex
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional, Sequence
+
+Runner = Callable[[list[str]], "subprocess.CompletedProcess[str]"]
+
+TERMINAL_VERDICTS = {"accept", "drop", "reject"}
+DEFAULT_MAX_RULES = 50
+DEFAULT_LINEAR_THRESHOLD = 4
+DEFAULT_SAMPLE_TCP = (22, 80, 443, 8080)
+DEFAULT_SAMPLE_UDP = (51820,)
+# Porta que ninguém libera: mostra o caminho até a política (pior caso real).
+CLOSED_SAMPLE_PORT = 3306
+DEFAULT_WAN_INTERFACE = "eth0"
+_EXTERNAL_SOURCE = {"ip": "203.0.113.10", "ip6": "2001:db8::10"}
+_HOST_ADDRESS = {"ip": "192.0.2.2", "ip6": "2001:db8::2"}
+_IPTABLES_HOOKS = {
+    ("filter", "INPUT"): "input",
+    ("filter", "FORWARD"): "forward",
+    ("filter", "OUTPUT"): "output",
+    ("nat", "PREROUTING"): "prerouting",
+    ("nat", "INPUT"): "input",
+    ("nat", "OUTPUT"): "output",
+    ("nat", "POSTROUTING"): "postrouting",
+    ("mangle", "PREROUTING"): "prerouting",
+    ("mangle", "INPUT"): "input",
+    ("mangle", "FORWARD"): "forward",
+    ("mangle", "OUTPUT"): "output",
+    ("mangle", "POSTROUTING"): "postrouting",
+    ("raw", "PREROUTING"): "prerouting",
+    ("raw", "OUTPUT"): "output",
+}
+# Prioridades padrão do iptables (mesmos valores do nft) para ordenar chains do mesmo hook.
+_IPTABLES_PRIORITY = {"raw": -300, "mangle": -150, "nat": -100, "filter": 0}
+
+
+def _run_cmd(cmd: list[str]) -> subprocess.CompletedProcess[str]:
+    try:
+        return subprocess.run(cmd, check=False, capture_output=True, text=True)
+    except FileNotFoundError as exc:
+        return subprocess.CompletedProcess(cmd, 127, stdout="", stderr=str(exc))
+
+
+@dataclass(frozen=True)
+class Cond:
+    """Critério de uma regra; `values` depende do campo (portas como intervalos, endereços como redes)."""
+
+    field: str
+    values: tuple
+    negate: bool = False
+
+
+@dataclass
+class Rule:
+    family: str
+    table: str
+    chain: str
+    index: int
+    conds: list[Cond] = field(default_factory=list)
+    verdict: Optional[str] = None
+    target: Optional[str] = None
+    nat_to: Optional[str] = None
+    text: str = ""
+
+    @property
+    def known(self) -> bool:
+        return all(cond.field != "?" for cond in self.conds)
+
+    @property
+    def location(self) -> str:
+        return f"{self.family} {self.table} {self.chain} #{self.index}"
+
+    def describe(self) -> str:
+        if self.text:
+            return self.text
+        parts = []
+        for cond in self.conds:
+            value = ",".join(_format_value(cond.field, v) for v in cond.values)
+            parts.append(f"{cond.field} {'!=' if cond.negate else ''}{value}")
+        verdict = f"{self.verdict} {self.target}" if self.target else (self.verdict or "continua")
+        return " ".join(parts + [verdict])
+
+
+@dataclass
+class Chain:
+    family: str
+    table: str
+    name: str
+    hook: Optional[str] = None
+    policy: Optional[str] = None
+    priority: int = 0
+    kind: str = "filter"
+    rules: list[Rule] = field(default_factory=list)
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return (self.family, self.table, self.name)
+
+    @property
+    def label(self) -> str:
+        return f"{self.family} {self.table} {self.name}"
+
+
+@dataclass
+class Ruleset:
+    backend: str
+    chains: dict[tuple[str, str, str], Chain] = field(default_factory=dict)
+
+    def add(self, chain: Chain) -> Chain:
+        return self.chains.setdefault(chain.key, chain)
+
+    def find(self, family: str, table: str, name: str) -> Optional[Chain]:
+        return self.chains.get((family, table, name))
+
+
+def _format_value(name: str, value: object) -> str:
+    if name in ("dport", "sport") and isinstance(value, tuple):
+        low, high = value
+        return str(low) if low == high else f"{low}-{high}"
+    return str(value)
+
+
+def _port_intervals(values: Iterable[object]) -> tuple[tuple[int, int], ...]:
+    intervals = []
+    for value in values:
+        if isinstance(value, tuple):
+            intervals.append((int(value[0]), int(value[1])))
+        else:
+            text = str(value)
+            low, _, high = text.replace("-", ":").partition(":")
+            intervals.append((int(low), int(high or low)))
+    return tuple(sorted(intervals))
+
+
+def _networks(values: Iterable[str]) -> tuple:
+    return tuple(ipaddress.ip_network(value, strict=False) for value in values)
+
+
+# --- iptables-save -------------------------------------------------------------------------------
+
+_IPT_FIELDS = {
+    "-p": "proto",
+    "--protocol": "proto",
+    "-s": "saddr",
+    "--source": "saddr",
+    "-d": "daddr",
+    "--destination": "daddr",
+    "-i": "iif",
+    "--in-interface": "iif",
+    "-o": "oif",
+    "--out-interface": "oif",
+    "--dport": "dport",
+    "--destination-port": "dport",
+    "--dports": "dport",
+    "--destination-ports": "dport",
+    "--sport": "sport",
+    "--source-port": "sport",
+    "--sports": "sport",
+    "--source-ports": "sport",
+    "--ctstate": "ct_state",
+    "--state": "ct_state",
+}
+# Opções sem efeito na decisão.
+_IPT_IGNORED = {"--comment"}
+
+
+def _ipt_cond(name: str, raw: str, negate: bool) -> Cond:
+    items = raw.split(",")
+    if name in ("dport", "sport"):
+        return Cond(name, _port_intervals(items), negate)
+    if name in ("saddr", "daddr"):
+        return Cond(name, _networks(items), negate)
+    if name in ("iif", "oif"):
+        return Cond(name, tuple(item.replace("+", "*") for item in items), negate)
+    return Cond(name, tuple(item.lower() for item in items), negate)
+
+
+def _parse_iptables_rule(tokens: list[str], ruleset: Ruleset, family: str, table: str, index: int, text: str) -> Rule:
+    rule = Rule(family, table, tokens[1], index, text=text)
+    position, negate = 2, False
+    while position < len(tokens):
+        token = tokens[position]
+        if token == "!":
+            negate = True
+            position += 1
+            continue
+        if token in ("-j", "--jump", "-g", "--goto"):
+            target = tokens[position + 1]
+            lowered = target.lower()
+            if lowered in ("accept", "drop", "reject", "return"):
+                rule.verdict = lowered
+            elif lowered in ("dnat", "snat", "masquerade", "redirect"):
+                rule.verdict = lowered
+                options = tokens[position + 2 :]
+                if "--to-destination" in options:
+                    rule.nat_to = options[options.index("--to-destination") + 1]
+            elif ruleset.find(family, table, target) is None and target.isupper():
+                # Alvos de extensão (LOG, MARK, CT, TCPMSS...) não decidem o pacote; chains do usuário
+                # como DOCKER já foram declaradas no cabeçalho da tabela.
+                rule.verdict = None
+            else:
+                rule.verdict = "goto" if token in ("-g", "--goto") else "jump"
+                rule.target = target
+            break
+        if token in ("-m", "--match"):
+            position += 2
+            continue
+        following = tokens[position + 1] if position + 1 < len(tokens) else ""
+        value = following if following and not following.startswith("-") else None
+        if token in _IPT_FIELDS and value is not None:
+            rule.conds.append(_ipt_cond(_IPT_FIELDS[token], value, negate))
+        elif token not in _IPT_IGNORED:
+            rule.conds.append(Cond("?", (f"{token} {value or ''}".strip(),), negate))
+        position += 2 if value is not None else 1
+        negate = False
+    return rule
+
+
+def parse_iptables_save(text: str, family: str = "ip", ruleset: Optional[Ruleset] = None) -> Ruleset:
+    """Interpreta a saída do `iptables-save` (ou `ip6tables-save` com family="ip6")."""
+
+    ruleset = ruleset or Ruleset("iptables")
+    table = ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line == "COMMIT":
+            continue
+        if line.startswith("*"):
+            table = line[1:]
+            continue
+        if line.startswith(":"):
+            name, policy = line[1:].split()[:2]
+            hook = _IPTABLES_HOOKS.get((table, name))
+            ruleset.add(
+                Chain(
+                    family,
+                    table,
+                    name,
+                    hook=hook,
+                    policy=policy.lower() if policy != "-" else None,
+                    priority=_IPTABLES_PRIORITY.get(table, 0),
+                    kind="nat" if table == "nat" else "filter",
+                )
+            )
+            continue
+        if line.startswith("-A "):
+            tokens = shlex.split(line)
+            chain = ruleset.add(Chain(family, table, tokens[1]))
+            chain.rules.append(_parse_iptables_rule(tokens, ruleset, family, table, len(chain.rules) + 1, line))
+    return ruleset
+
+
+# --- nft -j --------------------------------------------------------------------------------------
+
+
+NftSets = dict[tuple[str, str, str], Optional[list]]
+
+
+class _UnknownValue(ValueError):
+    """Valor que não dá para avaliar estaticamente (set dinâmico, concatenação...)."""
+
+
+def _nft_values(right: object, sets: Optional[NftSets] = None, scope: tuple[str, str] = ("", "")) -> list:
+    if isinstance(right, str) and right.startswith("@"):
+        # Set nomeado: resolvido a partir dos itens {"set": ...} da mesma tabela.
+        elements = (sets or {}).get((*scope, right[1:]))
+        if elements is None:
+            raise _UnknownValue(right)
+        return _nft_values(elements, sets, scope)
+    if isinstance(right, dict):
+        if "set" in right:
+            values: list = []
+            for item in right["set"]:
+                values.extend(_nft_values(item, sets, scope))
+            return values
+        if "elem" in right:
+            return _nft_values(right["elem"].get("val"), sets, scope)
+        if "range" in right:
+            return [tuple(right["range"])]
+        if "prefix" in right:
+            prefix = right["prefix"]
+            return [f"{prefix['addr']}/{prefix['len']}"]
+        raise _UnknownValue(json.dumps(right, sort_keys=True))
+    if isinstance(right, list):
+        values = []
+        for item in right:
+            values.extend(_nft_values(item, sets, scope))
+        return values
+    return [right]
+
+
+def _nft_set_elements(data: dict) -> Optional[list]:
+    """Elementos de um set nomeado, ou None se o conteúdo muda em runtime (dynamic/timeout)."""
+
+    flags = data.get("flags", [])
+    flags = [flags] if isinstance(flags, str) else flags
+    if "dynamic" in flags or "timeout" in flags or "timeout" in data:
+        return None
+    return list(data.get("elem", []))
+
+
+def _nft_match(match: dict, sets: Optional[NftSets] = None, scope: tuple[str, str] = ("", "")) -> list[Cond]:
+    negate = match.get("op") == "!="
+    try:
+        return _nft_conds(match, negate, _nft_values(match.get("right"), sets, scope))
+    except ValueError:
+        # Set dinâmico/desconhecido, concatenação ou valor malformado: conta no custo, nunca casa nem sombreia.
+        return [Cond("?", (json.dumps(match, sort_keys=True),), negate)]
+
+
+def _nft_conds(match: dict, negate: bool, values: list) -> list[Cond]:
+    left = match.get("left")
+    if isinstance(left, dict) and "payload" in left:
+        payload = left["payload"]
+        protocol, name = payload.get("protocol"), payload.get("field")
+        if name in ("dport", "sport"):
+            conds = [Cond(name, _port_intervals(values), negate)]
+            if protocol in ("tcp", "udp"):
+                conds.insert(0, Cond("proto", (protocol,)))
+            return conds
+        if name in ("saddr", "daddr"):
+            return [Cond(name, _networks(str(v) for v in values), negate)]
+        if name in ("protocol", "nexthdr"):
+            return [Cond("proto", tuple(str(v) for v in values), negate)]
+    if isinstance(left, dict) and "meta" in left:
+        key = left["meta"].get("key")
+        if key in ("iifname", "oifname", "iif", "oif"):
+            return [Cond(key[:3], tuple(str(v) for v in values), negate)]
+        if key == "l4proto":
+            return [Cond("proto", tuple(str(v) for v in values), negate)]
+    if isinstance(left, dict) and "ct" in left and left["ct"].get("key") == "state":
+        return [Cond("ct_state", tuple(str(v) for v in values), negate)]
+    return [Cond("?", (json.dumps(match, sort_keys=True),), negate)]
+
+
+def _nft_rule(data: dict, index: int, sets: Optional[NftSets] = None) -> Rule:
+    rule = Rule(data["family"], data["table"], data["chain"], index)
+    for expr in data.get("expr", []):
+        if "match" in expr:
+            rule.conds.extend(_nft_match(expr["match"], sets, (rule.family, rule.table)))
+        elif any(key in expr for key in ("accept", "drop", "reject", "return")):
+            rule.verdict = next(key for key in ("accept", "drop", "reject", "return") if key in expr)
+        elif "jump" in expr or "goto" in expr:
+            rule.verdict = "jump" if "jump" in expr else "goto"
+            rule.target = expr[rule.verdict]["target"]
+        elif "dnat" in expr or "snat" in expr or "masquerade" in expr or "redirect" in expr:
+            rule.verdict = next(key for key in ("dnat", "snat", "masquerade", "redirect") if key in expr)
+            target = expr[rule.verdict] or {}
+            if isinstance(target, dict) and "addr" in target:
+                rule.nat_to = f"{target['addr']}:{target['port']}" if "port" in target else str(target["addr"])
+        elif "xt" in expr:
+            # Extensão do iptables-nft que o nft não traduz: critério desconhecido.
+            rule.conds.append(Cond("?", (json.dumps(expr, sort_keys=True),)))
+        elif "vmap" in expr:
+            rule.conds.append(Cond("?", ("vmap",)))
+            rule.verdict = "vmap"
+        # counter, log, limit, comment... não decidem o pacote.
+    comment = data.get("comment")
+    if comment:
+        rule.text = f"{rule.describe()}  # {comment}"
+    return rule
+
+
+def parse_nft_json(text: str) -> Ruleset:
+    """Interpreta `nft -j list ruleset`."""
+
+    ruleset = Ruleset("nft")
+    items = json.loads(text).get("nftables", [])
+    sets: NftSets = {
+        (item["set"]["family"], item["set"]["table"], item["set"]["name"]): _nft_set_elements(item["set"])
+        for item in items
+        if "set" in item
+    }
+    for item in items:
+        if "chain" in item:
+            data = item["chain"]
+            chain = ruleset.add(Chain(data["family"], data["table"], data["name"]))
+            chain.hook = data.get("hook")
+            chain.policy = data.get("policy")
+            prio = data.get("prio", 0)
+            chain.priority = prio if isinstance(prio, int) else 0
+            chain.kind = data.get("type", "filter")
+        elif "rule" in item:
+            data = item["rule"]
+            chain = ruleset.add(Chain(data["family"], data["table"], data["chain"]))
+            chain.rules.append(_nft_rule(data, len(chain.rules) + 1, sets))
+    return ruleset
+
+
+def load_ruleset(runner: Runner = _run_cmd, backend: str = "auto") -> Ruleset:
+    """Lê o ruleset pelo nft (JSON) ou pelo iptables-save; levanta RuntimeError se nenhum responder."""
+
+    if backend in ("auto", "nft"):
+        result = runner(["nft", "-j", "list", "ruleset"])
+        if result.returncode == 0 and result.stdout.strip():
+            return parse_nft_json(result.stdout)
+        if backend == "nft":
+            raise RuntimeError(f"nft falhou ({result.returncode}): {result.stderr.strip()}")
+    ruleset = Ruleset("iptables")
+    loaded = False
+    for command, family in (("iptables-save", "ip"), ("ip6tables-save", "ip6")):
+        result = runner([command])
+        if result.returncode == 0:
+            parse_iptables_save(result.stdout, family, ruleset)
+            loaded = True
+    if not loaded:
+        raise RuntimeError("nem nft nem iptables-save disponíveis (rodar como root?)")
+    return ruleset
+
+
+# --- avaliação ----------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Packet:
+    family: str
+    proto: str
+    dport: int
+    iif: str = DEFAULT_WAN_INTERFACE
+    oif: str = ""
+    saddr: str = ""
+    daddr: str = ""
+    ct_state: str = "new"
+    label: str = ""
+
+
+def _cond_matches(cond: Cond, packet: Packet) -> Optional[bool]:
+    """True/False, ou None quando o critério não é avaliável."""
+
+    if cond.field == "proto":
+        result = packet.proto in cond.values
+    elif cond.field == "dport":
+        result = any(low <= packet.dport <= high for low, high in cond.values)
+    elif cond.field == "sport":
+        return None
+    elif cond.field in ("saddr", "daddr"):
+        address = getattr(packet, cond.field)
+        if not address:
+            return None
+        ip = ipaddress.ip_address(address)
+        result = any(ip.version == net.version and ip in net for net in cond.values)
+    elif cond.field in ("iif", "oif"):
+        name = getattr(packet, cond.field)
+        result = any(fnmatch.fnmatchcase(name, pattern) for pattern in cond.values)
+    elif cond.field == "ct_state":
+        result = packet.ct_state in cond.values
+    else:
+        return None
+    return result != cond.negate
+
+
+def rule_matches(rule: Rule, packet: Packet) -> bool:
+    return all(_cond_matches(cond, packet) is True for cond in rule.conds)
+
+
+@dataclass
+class PathResult:
+    packet: Packet
+    hook: str
+    verdict: str
+    rules: int
+    path: list[str]
+
+
+def _family_applies(chain: Chain, family: str) -> bool:
+    return chain.family in (family, "inet")
+
+
+def base_chains(ruleset: Ruleset, hook: str, family: str, kind: str = "filter") -> list[Chain]:
+    chains = [
+        chain
+        for chain in ruleset.chains.values()
+        if chain.hook == hook and chain.kind == kind and _family_applies(chain, family)
+    ]
+    return sorted(chains, key=lambda chain: (chain.priority, chain.label))
+
+
+def _walk(ruleset: Ruleset, chain: Chain, packet: Packet, counter: list[int], path: list[str], depth: int) -> str:
+    """Percorre a chain; retorna o veredito final ou "return" ao cair do fim."""
+
+    path.append(chain.name)
+    if depth > 32:
+        return "return"
+    for rule in chain.rules:
+        counter[0] += 1
+        if not rule_matches(rule, packet):
+            continue
+        if rule.verdict in TERMINAL_VERDICTS:
+            path.append(f"#{rule.index} {rule.verdict}")
+            return rule.verdict
+        if rule.verdict == "return":
+            return "return"
+        if rule.verdict in ("jump", "goto") and rule.target:
+            target = ruleset.find(chain.family, chain.table, rule.target)
+            if target is None:
+                continue
+            verdict = _walk(ruleset, target, packet, counter, path, depth + 1)
+            if verdict != "return":
+                return verdict
+            if rule.verdict == "goto":
+                return "return"
+    return "return"
+
+
+def simulate(ruleset: Ruleset, packet: Packet, hook: str = "input") -> PathResult:
+    """Veredito e regras avaliadas pelo pacote em todas as chains base do hook, em ordem de prioridade."""
+
+    counter = [0]
+    path: list[str] = []
+    verdict = "accept"
+    for chain in base_chains(ruleset, hook, packet.family):
+        chain_verdict = _walk(ruleset, chain, packet, counter, path, 0)
+        if chain_verdict == "return":
+            chain_verdict = chain.policy or "accept"
+            path.append(f"política {chain_verdict}")
+        if chain_verdict != "accept":
+            verdict = chain_verdict
+            break
+    return PathResult(packet, hook, verdict, counter[0], path)
+
+
+def worst_case(ruleset: Ruleset, chain: Chain, seen: Optional[set] = None) -> int:
+    """Regras avaliadas por um pacote que casa com todos os jumps e com nenhum veredito."""
+
+    seen = set() if seen is None else seen
+    if chain.key in seen:
+        return 0
+    seen = seen | {chain.key}
+    total = 0
+    for rule in chain.rules:
+        total += 1
+        if rule.verdict in ("jump", "goto") and rule.target:
+            target = ruleset.find(chain.family, chain.table, rule.target)
+            if target is not None:
+                total += worst_case(ruleset, target, seen)
+    return total
+
+
+# --- achados ------------------------------------------------------------------------------------
+
+
+def _covers(wide: Cond, narrow: Cond) -> bool:
+    if wide.negate or narrow.negate:
+        return wide == narrow
+    if wide.field in ("dport", "sport"):
+        return all(any(lo <= n_lo and n_hi <= hi for lo, hi in wide.values) for n_lo, n_hi in narrow.values)
+    if wide.field in ("saddr", "daddr"):
+        return all(
+            any(net.version == sub.version and sub.subnet_of(net) for net in wide.values) for sub in narrow.values
+        )
+    if wide.field in ("iif", "oif"):
+        return all(any(fnmatch.fnmatchcase(name, pattern) for pattern in wide.values) for name in narrow.values)
+    return set(narrow.values) <= set(wide.values)
+
+
+def rule_covers(earlier: Rule, later: Rule) -> bool:
+    """`earlier` casa com todo pacote que `later` casaria (critérios desconhecidos não sombreiam)."""
+
+    if not earlier.known:
+        return False
+    for cond in earlier.conds:
+        if not any(other.field == cond.field and _covers(cond, other) for other in later.conds):
+            return False
+    return True
+
+
+@dataclass
+class Finding:
+    level: str  # ERRO, AVISO
+    message: str
+
+
+def find_shadowed(ruleset: Ruleset) -> list[Finding]:
+    findings: list[Finding] = []
+    for chain in ruleset.chains.values():
+        for position, later in enumerate(chain.rules):
+            for earlier in chain.rules[:position]:
+                if earlier.verdict not in TERMINAL_VERDICTS or not rule_covers(earlier, later):
+                    continue
+                if later.verdict == earlier.verdict:
+                    findings.append(
+                        Finding(
+                            "AVISO",
+                            f"Regra redundante {later.location} ({later.describe()}): "
+                            f"já coberta por #{earlier.index} ({earlier.describe()})",
+                        )
+                    )
+                else:
+                    findings.append(
+                        Finding(
+                            "ERRO",
+                            f"Regra sombreada {later.location} ({later.describe()}) nunca casa: "
+                            f"#{earlier.index} ({earlier.describe()}) decide antes com {earlier.verdict}",
+                        )
+                    )
+                break
+    return findings
+
+
+def _without_ports(rule: Rule) -> tuple:
+    return tuple(sorted((c for c in rule.conds if c.field != "dport"), key=repr))
+
+
+def find_linear_port_lists(ruleset: Ruleset, threshold: int = DEFAULT_LINEAR_THRESHOLD) -> list[Finding]:
+    """Sequências de regras que só diferem na porta de destino."""
+
+    findings: list[Finding] = []
+    for chain in ruleset.chains.values():
+        run: list[Rule] = []
+
+        def _flush() -> None:
+            if len(run) >= threshold:
+                ports = ", ".join(
+                    _format_value("dport", value) for rule in run for c in rule.conds if c.field == "dport"
+                    for value in c.values
+                )
+                targets = {rule.target for rule in run}
+                if len(targets) > 1:
+                    hint = "um verdict map (dport vmap { porta : jump chain })"
+                else:
+                    hint = "um set (dport { ... }) ou -m multiport/ipset"
+                findings.append(
+                    Finding(
+                        "AVISO",
+                        f"{len(run)} regras lineares em {chain.label} (#{run[0].index}-#{run[-1].index}) "
+                        f"só mudam a porta ({ports}): troque por {hint}",
+                    )
+                )
+
+        for rule in chain.rules:
+            has_port = any(c.field == "dport" and not c.negate for c in rule.conds)
+            same = (
+                run
+                and has_port
+                and _without_ports(rule) == _without_ports(run[-1])
+                and (rule.verdict == run[-1].verdict)
+                and (rule.verdict in ("jump", "goto") or rule.target == run[-1].target)
+            )
+            if same:
+                run.append(rule)
+                continue
+            _flush()
+            run = [rule] if has_port else []
+        _flush()
+    return findings
+
+
+@dataclass
+class DockerReport:
+    chains: list[str] = field(default_factory=list)
+    published: list[tuple[str, str, Optional[str]]] = field(default_factory=list)  # (porta/proto, família, destino)
+    user_filters: int = 0
+
+
+def docker_report(ruleset: Ruleset) -> DockerReport:
+    report = DockerReport()
+    for chain in ruleset.chains.values():
+        if chain.name.upper().startswith("DOCKER"):
+            report.chains.append(f"{chain.label} ({len(chain.rules)} regras)")
+        if chain.name.upper() == "DOCKER" and chain.table == "nat":
+            for rule in chain.rules:
+                if rule.verdict != "dnat":
+                    continue
+                proto = next((c.values[0] for c in rule.conds if c.field == "proto" and not c.negate), "?")
+                for cond in rule.conds:
+                    if cond.field == "dport" and not cond.negate:
+                        for value in cond.values:
+                            report.published.append((f"{_format_value('dport', value)}/{proto}", chain.family,
+                                                     rule.nat_to))
+        if chain.name.upper() == "DOCKER-USER":
+            report.user_filters += sum(1 for rule in chain.rules if rule.verdict != "return")
+    report.chains.sort()
+    return report
+
+
+def _sample_packets(ruleset: Ruleset, tcp: Sequence[int], udp: Sequence[int]) -> list[Packet]:
+    families = sorted({chain.family for chain in ruleset.chains.values() if chain.family in ("ip", "ip6")}) or ["ip"]
+    if any(chain.family == "inet" for chain in ruleset.chains.values()) and "ip" not in families:
+        families.insert(0, "ip")
+    packets: list[Packet] = []
+    for family in families:
+        common = {"saddr": _EXTERNAL_SOURCE[family], "daddr": _HOST_ADDRESS[family]}
+        packets.extend(Packet(family, "tcp", port, label=f"{family} tcp/{port} novo", **common) for port in tcp)
+        packets.extend(Packet(family, "udp", port, label=f"{family} udp/{port} novo", **common) for port in udp)
+        packets.append(
+            Packet(family, "tcp", CLOSED_SAMPLE_PORT, label=f"{family} tcp/{CLOSED_SAMPLE_PORT} novo", **common)
+        )
+        packets.append(
+            Packet(family, "tcp", 443, ct_state="established", label=f"{family} tcp/443 estabelecido", **common)
+        )
+    return packets
+
+
+def _published_packets(report: DockerReport) -> list[Packet]:
+    packets = []
+    for port_proto, family, destination in report.published:
+        port, _, proto = port_proto.partition("/")
+        if "-" in port or family not in _EXTERNAL_SOURCE:
+            continue
+        address, dport = (destination or "").rsplit(":", 1) if destination and ":" in destination else ("", port)
+        packets.append(
+            Packet(
+                family,
+                proto,
+                int(dport) if str(dport).isdigit() else int(port),
+                oif="docker0",
+                saddr=_EXTERNAL_SOURCE[family],
+                daddr=address,
+                label=f"{family} {port_proto} publicada -> {destination or '?'}",
+            )
+        )
+    return packets
+
+
+def analyze(
+    ruleset: Ruleset,
+    tcp: Sequence[int] = DEFAULT_SAMPLE_TCP,
+    udp: Sequence[int] = DEFAULT_SAMPLE_UDP,
+    max_rules: int = DEFAULT_MAX_RULES,
+    linear_threshold: int = DEFAULT_LINEAR_THRESHOLD,
+) -> tuple[list[str], list[Finding]]:
+    """Relatório (linhas informativas) e achados ([ERRO]/[AVISO])."""
+
+    lines: list[str] = [f"Backend: {ruleset.backend} ({len(ruleset.chains)} chains, "
+                        f"{sum(len(c.rules) for c in ruleset.chains.values())} regras)"]
+    findings: list[Finding] = []
+
+    lines.append("Custo por hook (pior caso, regras avaliadas incluindo jumps):")
+    for chain in sorted(
+        (c for c in ruleset.chains.values() if c.hook in ("input", "forward") and c.kind == "filter"),
+        key=lambda c: (c.hook, c.priority, c.label),
+    ):
+        cost = worst_case(ruleset, chain)
+        lines.append(f"  {chain.hook:<8} {chain.label} (política {chain.policy or 'accept'}): {cost}")
+        if cost > max_rules:
+            findings.append(
+                Finding("AVISO", f"{chain.label} pode avaliar {cost} regras por pacote (limite {max_rules})")
+            )
+
+    docker = docker_report(ruleset)
+    lines.append("Caminho de pacotes de exemplo:")
+    samples = [(packet, "input") for packet in _sample_packets(ruleset, tcp, udp)]
+    samples += [(packet, "forward") for packet in _published_packets(docker)]
+    for packet, hook in samples:
+        result = simulate(ruleset, packet, hook)
+        lines.append(
+            f"  {hook:<8} {packet.label}: {result.verdict.upper()} após {result.rules} regras "
+            f"({' -> '.join(result.path) or 'sem chains'})"
+        )
+        if result.rules > max_rules:
+            findings.append(
+                Finding("AVISO", f"{packet.label} percorre {result.rules} regras até {result.verdict}")
+            )
+
+    findings.extend(find_shadowed(ruleset))
+    findings.extend(find_linear_port_lists(ruleset, linear_threshold))
+
+    if docker.chains:
+        lines.append("Chains do Docker:")
+        lines.extend(f"  {chain}" for chain in docker.chains)
+        if docker.published:
+            ports = ", ".join(
+                f"{port} ({family} -> {destination or '?'})" for port, family, destination in docker.published
+            )
+            lines.append(f"  portas publicadas (DNAT): {ports}")
+            if docker.user_filters == 0:
+                findings.append(
+                    Finding(
+                        "ERRO",
+                        "Portas publicadas pelo Docker passam pelo FORWARD (DNAT antes do INPUT) e ignoram o UFW: "
+                        f"{', '.join(port for port, _, _ in docker.published)}; "
+                        "filtre em DOCKER-USER ou publique só em 127.0.0.1",
+                    )
+                )
+    return lines, findings
+
+
+def main(argv: Optional[Sequence[str]] = None, runner: Runner = _run_cmd) -> int:
+    parser = argparse.ArgumentParser(description="Analisa o ruleset nftables/iptables do homelab.")
+    parser.add_argument("--backend", choices=("auto", "nft", "iptables"), default="auto", help="Fonte do ruleset")
+    parser.add_argument("--file", help="Lê o ruleset de um arquivo (JSON do nft ou saída do iptables-save)")
+    parser.add_argument(
+        "--sample-tcp", type=int, nargs="*", default=list(DEFAULT_SAMPLE_TCP), help="Portas TCP simuladas"
+    )
+    parser.add_argument(
+        "--sample-udp", type=int, nargs="*", default=list(DEFAULT_SAMPLE_UDP), help="Portas UDP simuladas"
+    )
+    parser.add_argument(
+        "--max-rules", type=int, default=DEFAULT_MAX_RULES, help="Regras por pacote acima das quais há aviso"
+    )
+    parser.add_argument(
+        "--linear-threshold",
+        type=int,
+        default=DEFAULT_LINEAR_THRESHOLD,
+        help="Regras seguidas só com porta diferente a partir das quais sugerir set/multiport",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.file:
+            with open(args.file, encoding="utf-8") as handle:
+                content = handle.read()
+            ruleset = (
+                parse_nft_json(content) if content.lstrip().startswith("{") else parse_iptables_save(content)
+            )
+        else:
+            ruleset = load_ruleset(runner, args.backend)
+    except (OSError, RuntimeError, ValueError) as exc:
+        print(f"[ERRO] Não foi possível ler o ruleset: {exc}")
+        return 2
+
+    lines, findings = analyze(ruleset, args.sample_tcp, args.sample_udp, args.max_rules, args.linear_threshold)
+    for line in lines:
+        print(line)
+    for finding in findings:
+        print(f"[{finding.level}] {finding.message}")
+    if not findings:
+        print("[OK] Nenhuma regra sombreada, redundante ou lista linear de portas encontrada")
+    return 1 if any(finding.level == "ERRO" for finding in findings) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
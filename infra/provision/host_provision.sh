@@ -6,7 +6,7 @@ set -euo pipefail
 
 HOMELAB_USER=${HOMELAB_USER:-homelab}
 SSH_PUBLIC_KEY_PATH=${SSH_PUBLIC_KEY_PATH:-${HOME}/.ssh/id_rsa.pub}
-PACKAGES=("openssh-server" "sudo" "unattended-upgrades" "ca-certificates" "curl" "ufw")
+PACKAGES=("openssh-server" "sudo" "unattended-upgrades" "ca-certificates" "curl" "ufw" "nocache")
 UFW_WAN_INTERFACE=${UFW_WAN_INTERFACE:-eth0}
 UFW_DASHBOARD_CIDR=${UFW_DASHBOARD_CIDR:-192.168.0.0/16}
 WIREGUARD_SUBNET=${WIREGUARD_SUBNET:-10.13.13.0/24}
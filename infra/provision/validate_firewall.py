@@ -3,21 +3,72 @@
 Executa varredura TCP local para garantir que apenas as portas esperadas
 (geralmente expostas no roteador) estejam escutando. Útil para CI ou para
 rodar manualmente após ajustar regras do UFW/iptables no host.
+
+A varredura usa sockets não bloqueantes com `selectors`: até `--concurrency`
+conexões em voo ao mesmo tempo, cada uma com seu próprio timeout, e um limite
+opcional de novas conexões por segundo (`--rate`) para não disparar proteção
+contra flood no host alvo. Assim a faixa inteira (1-65535) cabe em poucos
+segundos; `--benchmark` compara com a varredura serial antiga.
+
+No próprio host a exposição sai direto da tabela de sockets do kernel
+(`/proc/net/{tcp,tcp6,udp,udp6}`), sem sonda ativa nem subprocesso: cada
+listener vem com endereço (IPv4 e IPv6, inclusive `::`), processo dono e
+contêiner (via inode do socket em `/proc/<pid>/fd` e o cgroup do processo).
+Com `--all-namespaces` os namespaces de rede dos contêineres também são lidos,
+por `/proc/<pid>/net` de um processo de cada namespace. Só listeners fora do
+loopback e no namespace do host contam como expostos; os dos contêineres são
+listados como informação (porta publicada aparece no host via docker-proxy/NAT).
+
+A auditoria por ponto de vista (`--vantage lan=192.168.1.10`, `--interfaces`)
+varre vários endereços ao mesmo tempo (cada endereço de interface, IPv4 e
+IPv6, e o endereço do host na sub-rede do WireGuard) e imprime uma matriz
+porta x ponto de vista, com portas permitidas/obrigatórias próprias de cada
+ponto (`--vantage-allow vpn=22,80,443`). A varredura sai do próprio host: mostra
+o que escuta em cada endereço, mas regras de firewall por interface de entrada
+(`-i eth0`) só valem para tráfego que chega de fora.
 """
 from __future__ import annotations
 
 import argparse
+import collections
+import errno
+import fcntl
+import ipaddress
+import os
+import re
+import resource
+import selectors
 import socket
-import subprocess
-from typing import Iterable, Set
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Set
 
 DEFAULT_ALLOWED_TCP = {22, 80, 443, 8080}
 DEFAULT_REQUIRED_TCP = {80, 443, 8080}
+DEFAULT_TIMEOUT = 0.2
+DEFAULT_CONCURRENCY = 1024
+# Descritores reservados para o resto do processo ao limitar a janela pelo RLIMIT_NOFILE.
+_FD_RESERVE = 64
+PROC_ROOT = Path("/proc")
+PROC_NET_TABLES = ("tcp", "tcp6", "udp", "udp6")
+# Estado TCP_LISTEN; sockets UDP "ouvindo" aparecem como 07 (CLOSE) sem par remoto.
+_TCP_LISTEN = "0A"
+_UDP_UNCONNECTED = "07"
+_CONTAINER_ID = re.compile(r"[0-9a-f]{64}")
+DEFAULT_WIREGUARD_SUBNET = "10.13.13.0/24"
+_SIOCGIFADDR = 0x8915
+# Escopo "global" em /proc/net/if_inet6 (link-local precisaria de %interface para conectar).
+_IPV6_SCOPE_GLOBAL = "00"
 
 
 class PortScanResult:
-    def __init__(self, open_ports: Set[int]):
+    def __init__(self, open_ports: Set[int], filtered_ports: Optional[Set[int]] = None):
         self.open_ports = open_ports
+        # Portas sem resposta dentro do timeout (DROP no firewall); vazias na varredura serial.
+        self.filtered_ports = filtered_ports if filtered_ports is not None else set()
 
     def unexpected(self, allowed: Iterable[int]) -> Set[int]:
         return self.open_ports.difference(set(allowed))
@@ -27,47 +78,634 @@ class PortScanResult:
         return required_set.difference(self.open_ports)
 
 
-def scan_tcp_ports(host: str, port_range: range) -> PortScanResult:
+def scan_tcp_ports_serial(host: str, port_range: Iterable[int], timeout: float = DEFAULT_TIMEOUT) -> PortScanResult:
+    """Varredura antiga, uma porta por vez (mantida como referência do `--benchmark`)."""
+
     open_ports: set[int] = set()
     for port in port_range:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(0.2)
+            sock.settimeout(timeout)
             result = sock.connect_ex((host, port))
             if result == 0:
                 open_ports.add(port)
     return PortScanResult(open_ports)
 
 
-def list_udp_ports() -> set[int]:
-    """Lista portas UDP em estado de listen usando ss/iptables (aproximação)."""
+def _window(concurrency: int) -> int:
+    """Janela efetiva: sobe o limite soft de descritores até o hard se a janela pedir."""
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = concurrency + _FD_RESERVE
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        raised = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (raised, hard))
+            soft = raised
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return max(1, concurrency)
+    return max(1, min(concurrency, soft - _FD_RESERVE))
+
+
+def scan_tcp_ports(
+    host: str,
+    port_range: Iterable[int],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    rate: float = 0.0,
+) -> PortScanResult:
+    """Varre `port_range` com até `concurrency` conexões não bloqueantes simultâneas.
+
+    `rate` limita novas conexões por segundo no host (0 = sem limite). Porta que
+    aceita a conexão é aberta; recusa (RST) é fechada; sem resposta no timeout é
+    filtrada.
+    """
+
+    family, _, _, _, address = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0]
+    window = _window(concurrency)
+    interval = 1.0 / rate if rate > 0 else 0.0
+    ports = iter(port_range)
+    pending = True
+    open_ports: set[int] = set()
+    filtered: set[int] = set()
+    in_flight: dict[int, tuple[socket.socket, int]] = {}
+    # Timeout igual para todos: a ordem de início já é a ordem de expiração.
+    deadlines: collections.deque[tuple[float, int, socket.socket]] = collections.deque()
+    next_start = time.monotonic()
+
+    def _finish(sock: socket.socket, port: int, err: int) -> None:
+        if err == 0:
+            # Em loopback a porta efêmera de origem pode coincidir com o destino (self-connect).
+            try:
+                self_connect = sock.getsockname() == sock.getpeername()
+            except OSError:
+                # ENOTCONN: o serviço aceitou e já mandou RST (MaxStartups, tcpwrappers); o connect
+                # completou, então a porta está aberta.
+                self_connect = False
+            if not self_connect:
+                open_ports.add(port)
+        elif err in (errno.ETIMEDOUT, errno.EHOSTUNREACH, errno.ENETUNREACH):
+            filtered.add(port)
+
+    with selectors.DefaultSelector() as selector:
+        while pending or in_flight:
+            now = time.monotonic()
+            while pending and len(in_flight) < window and now >= next_start:
+                port = next(ports, None)
+                if port is None:
+                    pending = False
+                    break
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                err = sock.connect_ex((address[0], port) + tuple(address[2:]))
+                if err in (errno.EINPROGRESS, errno.EAGAIN):
+                    fd = sock.fileno()
+                    selector.register(fd, selectors.EVENT_WRITE)
+                    in_flight[fd] = (sock, port)
+                    deadlines.append((now + timeout, fd, sock))
+                else:
+                    _finish(sock, port, err)
+                    sock.close()
+                if interval:
+                    next_start = max(next_start, now) + interval
+                    now = time.monotonic()
+
+            wait = timeout
+            if in_flight and deadlines:
+                wait = max(0.0, deadlines[0][0] - now)
+            if pending and len(in_flight) < window:
+                wait = min(wait, max(0.0, next_start - now))
+            if not in_flight:
+                if pending:
+                    time.sleep(wait)
+                continue
+
+            for key, _ in selector.select(wait):
+                sock, port = in_flight.pop(key.fd)
+                selector.unregister(key.fd)
+                _finish(sock, port, sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR))
+                sock.close()
+
+            now = time.monotonic()
+            while deadlines:
+                deadline, fd, sock = deadlines[0]
+                entry = in_flight.get(fd)
+                alive = entry is not None and entry[0] is sock
+                if alive and deadline > now:
+                    break
+                deadlines.popleft()
+                if alive:
+                    # Sem SYN-ACK nem RST dentro do timeout: o firewall descartou o pacote.
+                    del in_flight[fd]
+                    selector.unregister(fd)
+                    filtered.add(entry[1])
+                    sock.close()
+    return PortScanResult(open_ports, filtered)
+
+
+def benchmark(host: str, port_range: range, concurrency: int, timeout: float, rate: float) -> int:
+    """Compara a varredura serial com a concorrente na mesma faixa; 1 se o resultado divergir."""
+
+    started = time.perf_counter()
+    serial = scan_tcp_ports_serial(host, port_range, timeout)
+    serial_s = time.perf_counter() - started
+    started = time.perf_counter()
+    concurrent = scan_tcp_ports(host, port_range, concurrency=concurrency, timeout=timeout, rate=rate)
+    concurrent_s = time.perf_counter() - started
+    total = len(port_range)
+    print(f"serial:     {serial_s:8.2f}s  {total / serial_s:10.0f} portas/s  abertas={sorted(serial.open_ports)}")
+    print(
+        f"concorrente:{concurrent_s:8.2f}s  {total / concurrent_s:10.0f} portas/s  "
+        f"abertas={sorted(concurrent.open_ports)}  (janela={_window(concurrency)})"
+    )
+    print(f"speedup: {serial_s / concurrent_s:.1f}x")
+    if serial.open_ports != concurrent.open_ports:
+        print("[ERRO] As varreduras divergiram")
+        return 1
+    return 0
+
+
+@dataclass(frozen=True)
+class Listener:
+    proto: str  # tcp, tcp6, udp, udp6
+    address: str
+    port: int
+    inode: int
+    pids: tuple[int, ...] = ()
+    process: Optional[str] = None
+    container: Optional[str] = None
+    netns: Optional[str] = None
+    # Falso para sockets lidos de namespaces de contêiner (`--all-namespaces`).
+    host_netns: bool = True
+
+    @property
+    def transport(self) -> str:
+        return self.proto.rstrip("6")
+
+    @property
+    def exposed(self) -> bool:
+        """Falso para loopback (inclusive IPv4 mapeado em IPv6); `0.0.0.0`/`::` são expostos."""
+
+        address = ipaddress.ip_address(self.address)
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return not address.is_loopback
+
+    def describe(self) -> str:
+        host = f"[{self.address}]" if ":" in self.address else self.address
+        owner = self.process or "?"
+        if self.pids:
+            owner += f" pid {','.join(str(pid) for pid in self.pids)}"
+        if self.container:
+            owner += f", contêiner {self.container}"
+        return f"{self.port}/{self.transport} em {host} ({owner})"
+
+
+def _decode_address(value: str) -> tuple[str, int]:
+    """`0100007F:0CEA` -> ("127.0.0.1", 3306): palavras de 32 bits na ordem do host (little-endian)."""
+
+    hex_address, hex_port = value.split(":")
+    raw = bytes.fromhex(hex_address)
+    packed = b"".join(raw[i : i + 4][::-1] for i in range(0, len(raw), 4))
+    family = socket.AF_INET6 if len(packed) == 16 else socket.AF_INET
+    return socket.inet_ntop(family, packed), int(hex_port, 16)
+
+
+def parse_proc_net(text: str, proto: str) -> list[tuple[str, int, int]]:
+    """Listeners de uma tabela `/proc/net/<proto>`: (endereço, porta, inode)."""
+
+    wanted = _TCP_LISTEN if proto.startswith("tcp") else _UDP_UNCONNECTED
+    listeners: list[tuple[str, int, int]] = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 10 or fields[3] != wanted:
+            continue
+        if proto.startswith("udp") and not fields[2].endswith(":0000"):
+            continue
+        address, port = _decode_address(fields[1])
+        listeners.append((address, port, int(fields[9])))
+    return listeners
+
+
+def _pids(proc_root: Path) -> list[int]:
     try:
-        output = subprocess.check_output(["ss", "-lun"], text=True)
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return set()
-    ports: set[int] = set()
-    for line in output.splitlines():
-        if not line or line.startswith("State"):
+        return sorted(int(entry.name) for entry in os.scandir(proc_root) if entry.name.isdigit())
+    except OSError:
+        return []
+
+
+def _read(path: Path) -> str:
+    try:
+        return path.read_text()
+    except OSError:
+        return ""
+
+
+def socket_owners(proc_root: Path = PROC_ROOT, inodes: Optional[Set[int]] = None) -> dict[int, list[int]]:
+    """inode do socket -> PIDs que têm o descritor aberto (só os PIDs legíveis; root enxerga todos)."""
+
+    owners: dict[int, list[int]] = {}
+    for pid in _pids(proc_root):
+        fd_dir = proc_root / str(pid) / "fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
             continue
-        parts = line.split()
-        if len(parts) < 5:
+        for fd in fds:
+            try:
+                target = os.readlink(fd_dir / fd)
+            except OSError:
+                continue
+            if not target.startswith("socket:["):
+                continue
+            inode = int(target[8:-1])
+            if inodes is None or inode in inodes:
+                owners.setdefault(inode, []).append(pid)
+    return owners
+
+
+def container_of(pid: int, proc_root: Path = PROC_ROOT) -> Optional[str]:
+    """ID curto do contêiner (docker/containerd) a partir do cgroup do processo."""
+
+    match = _CONTAINER_ID.search(_read(proc_root / str(pid) / "cgroup"))
+    return match.group(0)[:12] if match else None
+
+
+def _netns(pid: Optional[int], proc_root: Path) -> Optional[str]:
+    try:
+        return os.readlink(proc_root / (str(pid) if pid is not None else "self") / "ns" / "net")
+    except OSError:
+        return None
+
+
+def _namespace_tables(proc_root: Path, all_namespaces: bool) -> list[tuple[Optional[str], Path]]:
+    """(namespace, diretório net) a ler: o do próprio processo e, opcionalmente, um por namespace extra."""
+
+    own = _netns(None, proc_root)
+    tables = [(own, proc_root / "net")]
+    if all_namespaces:
+        seen = {own}
+        for pid in _pids(proc_root):
+            namespace = _netns(pid, proc_root)
+            if namespace is not None and namespace not in seen:
+                seen.add(namespace)
+                tables.append((namespace, proc_root / str(pid) / "net"))
+    return tables
+
+
+def read_listeners(proc_root: Path = PROC_ROOT, all_namespaces: bool = False) -> list[Listener]:
+    """Sockets TCP em LISTEN e UDP sem par remoto, com processo/contêiner donos."""
+
+    raw: list[tuple[str, str, int, int, Optional[str]]] = []
+    tables = _namespace_tables(proc_root, all_namespaces)
+    host = tables[0][0]
+    for namespace, net_dir in tables:
+        for proto in PROC_NET_TABLES:
+            for address, port, inode in parse_proc_net(_read(net_dir / proto), proto):
+                raw.append((proto, address, port, inode, namespace))
+    owners = socket_owners(proc_root, {inode for _, _, _, inode, _ in raw})
+    listeners: list[Listener] = []
+    seen: set[tuple[str, str, int, int]] = set()
+    for proto, address, port, inode, namespace in raw:
+        if (proto, address, port, inode) in seen:
             continue
-        local_addr = parts[4]
-        if ":" in local_addr:
-            *_, port = local_addr.rsplit(":", 1)
-            if port.isdigit():
-                ports.add(int(port))
+        seen.add((proto, address, port, inode))
+        pids = tuple(owners.get(inode, ()))
+        process = (_read(proc_root / str(pids[0]) / "comm").strip() or None) if pids else None
+        container = container_of(pids[0], proc_root) if pids else None
+        listeners.append(
+            Listener(proto, address, port, inode, pids, process, container, namespace, namespace == host)
+        )
+    return sorted(listeners, key=lambda item: (item.transport, item.port, item.address))
+
+
+def exposed_ports(listeners: Iterable[Listener], transport: str) -> Set[int]:
+    """Portas fora do loopback no namespace do host; as de contêineres só valem se publicadas."""
+
+    return {item.port for item in listeners if item.transport == transport and item.host_netns and item.exposed}
+
+
+def list_udp_ports(proc_root: Path = PROC_ROOT) -> set[int]:
+    """Portas UDP expostas (fora do loopback), IPv4 e IPv6, lidas de `/proc/net/udp{,6}`."""
+
+    return exposed_ports(read_listeners(proc_root), "udp")
+
+
+def _is_local(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+@dataclass
+class Vantage:
+    """Ponto de vista da auditoria: endereços varridos e o que pode/deve estar aberto neles."""
+
+    name: str
+    hosts: list[str]
+    allowed_tcp: Set[int]
+    required_tcp: Set[int] = field(default_factory=set)
+
+
+@dataclass
+class VantageResult:
+    vantage: Vantage
+    scans: dict[str, PortScanResult]
+
+    @property
+    def open_ports(self) -> Set[int]:
+        return set().union(*(scan.open_ports for scan in self.scans.values()))
+
+    @property
+    def unexpected(self) -> Set[int]:
+        return self.open_ports.difference(self.vantage.allowed_tcp | self.vantage.required_tcp)
+
+    @property
+    def missing_required(self) -> Set[int]:
+        # Obrigatória precisa responder em todos os endereços do ponto de vista.
+        missing: set[int] = set()
+        for scan in self.scans.values():
+            missing |= scan.missing_required(self.vantage.required_tcp)
+        return missing
+
+
+def _ipv4_address(interface: str) -> Optional[str]:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            data = fcntl.ioctl(sock.fileno(), _SIOCGIFADDR, struct.pack("256s", interface[:15].encode()))
+        except OSError:
+            return None
+    return socket.inet_ntoa(data[20:24])
+
+
+def interface_addresses(proc_root: Path = PROC_ROOT) -> dict[str, list[str]]:
+    """Endereços de cada interface (menos `lo`): IPv4 primário e IPv6 globais."""
+
+    addresses: dict[str, list[str]] = {}
+    for _, name in socket.if_nameindex():
+        if name == "lo":
+            continue
+        ipv4 = _ipv4_address(name)
+        if ipv4:
+            addresses.setdefault(name, []).append(ipv4)
+    for line in _read(proc_root / "net" / "if_inet6").splitlines():
+        fields = line.split()
+        if len(fields) < 6 or fields[5] == "lo" or fields[3] != _IPV6_SCOPE_GLOBAL:
+            continue
+        packed = bytes.fromhex(fields[0])
+        addresses.setdefault(fields[5], []).append(socket.inet_ntop(socket.AF_INET6, packed))
+    return addresses
+
+
+def interface_vantages(
+    addresses: dict[str, list[str]],
+    allowed_tcp: Iterable[int],
+    required_tcp: Iterable[int],
+    wireguard_subnet: Optional[str] = DEFAULT_WIREGUARD_SUBNET,
+) -> list[Vantage]:
+    """Um ponto de vista por interface; endereços na sub-rede do WireGuard viram o ponto `vpn`."""
+
+    subnet = ipaddress.ip_network(wireguard_subnet) if wireguard_subnet else None
+    vantages: list[Vantage] = []
+    vpn_hosts: list[str] = []
+    for name, hosts in sorted(addresses.items()):
+        regular = []
+        for host in hosts:
+            if subnet is not None and ipaddress.ip_address(host) in subnet:
+                vpn_hosts.append(host)
+            else:
+                regular.append(host)
+        if regular:
+            vantages.append(Vantage(name, regular, set(allowed_tcp), set(required_tcp)))
+    if vpn_hosts:
+        vantages.append(Vantage("vpn", vpn_hosts, set(allowed_tcp), set(required_tcp)))
+    return vantages
+
+
+def _parse_ports(value: str) -> Set[int]:
+    ports: set[int] = set()
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition("-")
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise ValueError(f"porta inválida: {item!r}")
+        ports.update(range(int(start), int(end or start) + 1))
     return ports
 
 
-def main() -> int:
+def _split_assignment(value: str, option: str) -> tuple[str, str]:
+    name, sep, rest = value.partition("=")
+    if not sep or not name.strip():
+        raise ValueError(f"{option} espera NOME=VALOR: {value!r}")
+    return name.strip(), rest
+
+
+def build_vantages(
+    specs: Sequence[str],
+    allow: Sequence[str],
+    require: Sequence[str],
+    default_allowed: Iterable[int],
+    default_required: Iterable[int],
+    base: Sequence[Vantage] = (),
+) -> list[Vantage]:
+    """Monta os pontos de vista de `--vantage nome=host,...` com `--vantage-allow/--vantage-require`.
+
+    `base` (ex.: os pontos de `--interfaces`) entra primeiro e também aceita as permissões por nome.
+    """
+
+    vantages: dict[str, Vantage] = {vantage.name: vantage for vantage in base}
+    for spec in specs:
+        name, hosts = _split_assignment(spec, "--vantage")
+        entry = vantages.setdefault(name, Vantage(name, [], set(default_allowed), set(default_required)))
+        entry.hosts.extend(host.strip() for host in hosts.split(",") if host.strip())
+    for option, values, attribute in (
+        ("--vantage-allow", allow, "allowed_tcp"),
+        ("--vantage-require", require, "required_tcp"),
+    ):
+        for value in values:
+            name, ports = _split_assignment(value, option)
+            if name not in vantages:
+                raise ValueError(f"{option}: ponto de vista desconhecido: {name}")
+            setattr(vantages[name], attribute, _parse_ports(ports))
+    for vantage in vantages.values():
+        if not vantage.hosts:
+            raise ValueError(f"ponto de vista sem endereços: {vantage.name}")
+    return list(vantages.values())
+
+
+def audit(
+    vantages: Sequence[Vantage],
+    port_range: Iterable[int],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    rate: float = 0.0,
+) -> list[VantageResult]:
+    """Varre todos os endereços de todos os pontos de vista em paralelo (janela dividida entre eles)."""
+
+    ports = list(port_range)
+    targets = sorted({host for vantage in vantages for host in vantage.hosts})
+    if not targets:
+        return [VantageResult(vantage, {}) for vantage in vantages]
+    share = max(1, _window(concurrency) // len(targets))
+
+    def _scan(host: str) -> PortScanResult:
+        return scan_tcp_ports(host, ports, concurrency=share, timeout=timeout, rate=rate)
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        scans = dict(zip(targets, pool.map(_scan, targets)))
+    return [VantageResult(vantage, {host: scans[host] for host in vantage.hosts}) for vantage in vantages]
+
+
+def _cell(result: VantageResult, port: int) -> str:
+    opened = [host for host, scan in result.scans.items() if port in scan.open_ports]
+    if port in result.vantage.required_tcp and len(opened) < len(result.scans):
+        return "FALTA"
+    if opened:
+        return "ok" if port in result.vantage.allowed_tcp | result.vantage.required_tcp else "ABERTA"
+    if any(port in scan.filtered_ports for scan in result.scans.values()):
+        return "filtr"
+    return "-"
+
+
+def render_matrix(results: Sequence[VantageResult]) -> str:
+    """Matriz porta x ponto de vista com as portas abertas ou obrigatórias em algum ponto."""
+
+    ports = sorted(set().union(*(r.open_ports | r.vantage.required_tcp for r in results))) if results else []
+    width = max([6] + [len(r.vantage.name) for r in results])
+    lines = ["porta".ljust(7) + "".join(r.vantage.name.rjust(width + 2) for r in results)]
+    for port in ports:
+        lines.append(f"{port:<7}" + "".join(_cell(r, port).rjust(width + 2) for r in results))
+    lines.append("")
+    for r in results:
+        lines.append(f"{r.vantage.name}: {', '.join(r.vantage.hosts)}")
+    lines.append("ok = aberta e permitida, ABERTA = não permitida, FALTA = obrigatória sem resposta, "
+                 "filtr = sem resposta (DROP), - = fechada")
+    return "\n".join(lines)
+
+
+def _print_owners(listeners: Iterable[Listener], transport: str, ports: Set[int]) -> None:
+    for item in listeners:
+        if item.transport == transport and item.host_netns and item.exposed and item.port in ports:
+            print(f"       {item.describe()}")
+
+
+def _print_namespaced(listeners: Iterable[Listener]) -> None:
+    inside = [item for item in listeners if not item.host_netns and item.exposed]
+    if inside:
+        print("[INFO] Escutando dentro de namespaces de contêiner (não expostos no host):")
+        for item in inside:
+            print(f"       {item.describe()}")
+
+
+def run_audit(args: argparse.Namespace, port_range: range) -> int:
+    try:
+        base = []
+        if args.interfaces:
+            base = interface_vantages(
+                interface_addresses(), args.allowed_tcp, args.required_tcp, args.wireguard_subnet or None
+            )
+        vantages = build_vantages(
+            args.vantage, args.vantage_allow, args.vantage_require, args.allowed_tcp, args.required_tcp, base
+        )
+    except ValueError as exc:
+        print(f"[ERRO] {exc}")
+        return 2
+    if not vantages:
+        print("[ERRO] Nenhum ponto de vista para auditar")
+        return 2
+    results = audit(vantages, port_range, concurrency=args.concurrency, timeout=args.timeout, rate=args.rate)
+    print(render_matrix(results))
+    status = 0
+    for result in results:
+        name = result.vantage.name
+        if result.unexpected:
+            print(f"[ERRO] {name}: portas TCP não esperadas abertas: {sorted(result.unexpected)}")
+            status = 1
+        if result.missing_required:
+            print(f"[ERRO] {name}: portas TCP obrigatórias ausentes: {sorted(result.missing_required)}")
+            status = 1
+        if not (result.unexpected or result.missing_required):
+            print(f"[OK] {name}: exposição dentro do esperado")
+    return status
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
     parser = argparse.ArgumentParser(description="Valida exposição de portas do homelab.")
     parser.add_argument("--host", default="127.0.0.1", help="Host/IP para varredura TCP")
     parser.add_argument(
         "--max-port",
         type=int,
-        default=1024,
+        default=65535,
         help="Maior porta TCP a varrer (inclusive)",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Conexões TCP simultâneas na varredura (limitada pelo ulimit -n hard)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Máximo de conexões novas por segundo no host (0 = sem limite)",
+    )
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Timeout de cada conexão em segundos")
+    parser.add_argument(
+        "--method",
+        choices=("auto", "proc", "scan"),
+        default="auto",
+        help="proc = tabela de sockets do kernel (só no próprio host), scan = varredura TCP; "
+        "auto usa proc quando --host é loopback",
+    )
+    parser.add_argument(
+        "--all-namespaces",
+        action="store_true",
+        help="Com proc, lê também os namespaces de rede dos contêineres (requer root)",
+    )
+    parser.add_argument(
+        "--vantage",
+        action="append",
+        default=[],
+        metavar="NOME=HOST[,HOST]",
+        help="Ponto de vista da auditoria (repetível), ex.: lan=192.168.1.10,fd00::10",
+    )
+    parser.add_argument(
+        "--vantage-allow",
+        action="append",
+        default=[],
+        metavar="NOME=PORTAS",
+        help="Portas TCP permitidas naquele ponto de vista (ex.: vpn=22,80,443,8000-8100)",
+    )
+    parser.add_argument(
+        "--vantage-require",
+        action="append",
+        default=[],
+        metavar="NOME=PORTAS",
+        help="Portas TCP obrigatórias naquele ponto de vista",
+    )
+    parser.add_argument(
+        "--interfaces",
+        action="store_true",
+        help="Cria um ponto de vista por interface (IPv4 + IPv6 globais) e o ponto 'vpn' "
+        "(endereços na sub-rede do WireGuard)",
+    )
+    parser.add_argument(
+        "--wireguard-subnet",
+        default=os.getenv("WIREGUARD_SUBNET", DEFAULT_WIREGUARD_SUBNET),
+        help="Sub-rede do WireGuard para o ponto de vista 'vpn' (WIREGUARD_SUBNET)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compara a varredura serial com a concorrente na mesma faixa e sai",
+    )
     parser.add_argument(
         "--allowed-tcp",
         type=int,
@@ -89,18 +727,34 @@ def main() -> int:
         default=[51820],
         help="Portas UDP liberadas (WireGuard por padrão)",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    port_range = range(1, args.max_port + 1)
+    if args.benchmark:
+        return benchmark(args.host, port_range, args.concurrency, args.timeout, args.rate)
+    if args.vantage or args.interfaces:
+        return run_audit(args, port_range)
 
-    scan = scan_tcp_ports(args.host, range(1, args.max_port + 1))
+    use_proc = args.method == "proc" or (args.method == "auto" and _is_local(args.host))
+    listeners: list[Listener] = []
+    if use_proc:
+        listeners = read_listeners(all_namespaces=args.all_namespaces)
+        scan = PortScanResult(exposed_ports(listeners, "tcp"))
+        udp_ports = exposed_ports(listeners, "udp")
+        _print_namespaced(listeners)
+    else:
+        scan = scan_tcp_ports(
+            args.host, port_range, concurrency=args.concurrency, timeout=args.timeout, rate=args.rate
+        )
+        udp_ports = list_udp_ports()
     unexpected_tcp = scan.unexpected(args.allowed_tcp)
     missing_tcp = scan.missing_required(args.required_tcp)
-
-    udp_ports = list_udp_ports()
     unexpected_udp = udp_ports.difference(set(args.allowed_udp))
 
     status = 0
     if unexpected_tcp:
         print(f"[ERRO] Portas TCP não esperadas abertas: {sorted(unexpected_tcp)}")
+        _print_owners(listeners, "tcp", unexpected_tcp)
         status = 1
     else:
         print(f"[OK] Nenhuma porta TCP além das permitidas ({sorted(args.allowed_tcp)}) está aberta")
@@ -113,6 +767,7 @@ def main() -> int:
 
     if unexpected_udp:
         print(f"[ERRO] Portas UDP não esperadas abertas: {sorted(unexpected_udp)}")
+        _print_owners(listeners, "udp", unexpected_udp)
         status = 1
     else:
         print(f"[OK] Portas UDP dentro do esperado ({sorted(args.allowed_udp)})")
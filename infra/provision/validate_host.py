@@ -2,16 +2,19 @@
 
 Executa verificações rápidas:
 - SO deve ser Debian ou Ubuntu.
-- Pacotes críticos presentes (openssh-server, sudo, unattended-upgrades, ca-certificates, curl).
+- Pacotes críticos presentes (openssh-server, sudo, unattended-upgrades, ca-certificates, curl),
+  opcionalmente com versão/arquitetura (`curl>=7.88`, `libc6:arm64`).
 - SSH não aceita senha e root não faz login por senha.
 """
 from __future__ import annotations
 
 import argparse
+import re
 import subprocess
 import sys
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Optional
 
 SUPPORTED_OS = {"debian", "ubuntu"}
 DEFAULT_PACKAGES = [
@@ -21,6 +24,12 @@ DEFAULT_PACKAGES = [
     "ca-certificates",
     "curl",
 ]
+DPKG_STATUS = Path("/var/lib/dpkg/status")
+# nome[:arquitetura][ operador versão], aceitando também a forma do control file: "pkg (>= 1.0)".
+_REQUIREMENT = re.compile(
+    r"^(?P<name>[a-z0-9][a-z0-9+.-]*)(?::(?P<arch>[a-z0-9-]+))?"
+    r"\s*(?:\(?\s*(?P<op>>=|<=|>>|<<|=|>|<)\s*(?P<version>[0-9][^\s)]*)\s*\)?)?$"
+)
 
 
 def read_os_release(path: Path) -> dict[str, str]:
@@ -47,14 +56,153 @@ def _run_cmd(cmd: list[str]) -> subprocess.CompletedProcess[str]:
     return subprocess.run(cmd, check=False, capture_output=True, text=True)
 
 
+@dataclass(frozen=True)
+class InstalledPackage:
+    name: str
+    version: str
+    arch: str
+
+
+@dataclass(frozen=True)
+class Requirement:
+    name: str
+    arch: Optional[str] = None
+    op: Optional[str] = None
+    version: Optional[str] = None
+
+    @property
+    def query(self) -> str:
+        return f"{self.name}:{self.arch}" if self.arch else self.name
+
+
+def parse_requirement(spec: str) -> Requirement:
+    match = _REQUIREMENT.match(spec.strip())
+    if not match:
+        raise ValueError(f"Pacote inválido: {spec!r} (use nome[:arch][>=versão])")
+    op = {">": ">=", "<": "<="}.get(match["op"], match["op"])
+    return Requirement(match["name"], match["arch"], op, match["version"])
+
+
+def read_dpkg_status(path: Path = DPKG_STATUS) -> dict[str, list[InstalledPackage]]:
+    """Indexa os pacotes instalados do status do dpkg numa única leitura (nome -> uma entrada por arquitetura)."""
+
+    index: dict[str, list[InstalledPackage]] = {}
+    fields: dict[str, str] = {}
+
+    def _flush() -> None:
+        status = fields.get("status", "").split()
+        if "package" in fields and len(status) == 3 and status[1:] == ["ok", "installed"]:
+            package = InstalledPackage(fields["package"], fields.get("version", ""), fields.get("architecture", ""))
+            index.setdefault(package.name, []).append(package)
+        fields.clear()
+
+    with path.open(encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            if not line.strip():
+                _flush()
+            elif not line[0].isspace() and ":" in line:
+                # Linhas de continuação (Description, Conffiles) não interessam.
+                key, value = line.split(":", 1)
+                fields[key.lower()] = value.strip()
+    _flush()
+    return index
+
+
+def _version_order(char: str) -> int:
+    if char == "~":
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _compare_part(left: str, right: str) -> int:
+    """Compara upstream ou revisão pela política Debian (trechos não numéricos e numéricos alternados)."""
+
+    while left or right:
+        left_text = re.match(r"\D*", left).group()
+        right_text = re.match(r"\D*", right).group()
+        for position in range(max(len(left_text), len(right_text))):
+            a = _version_order(left_text[position]) if position < len(left_text) else 0
+            b = _version_order(right_text[position]) if position < len(right_text) else 0
+            if a != b:
+                return -1 if a < b else 1
+        left, right = left[len(left_text):], right[len(right_text):]
+        left_digits = re.match(r"\d*", left).group()
+        right_digits = re.match(r"\d*", right).group()
+        if int(left_digits or 0) != int(right_digits or 0):
+            return -1 if int(left_digits or 0) < int(right_digits or 0) else 1
+        left, right = left[len(left_digits):], right[len(right_digits):]
+    return 0
+
+
+def compare_versions(left: str, right: str) -> int:
+    """Equivalente a `dpkg --compare-versions`: -1, 0 ou 1."""
+
+    def _split(version: str) -> tuple[int, str, str]:
+        epoch, _, rest = version.rpartition(":") if ":" in version else ("0", "", version)
+        upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "0")
+        return int(epoch or 0), upstream, revision
+
+    left_epoch, left_upstream, left_revision = _split(left)
+    right_epoch, right_upstream, right_revision = _split(right)
+    if left_epoch != right_epoch:
+        return -1 if left_epoch < right_epoch else 1
+    return _compare_part(left_upstream, right_upstream) or _compare_part(left_revision, right_revision)
+
+
+def _satisfies(version: str, requirement: Requirement) -> bool:
+    if not requirement.op:
+        return True
+    result = compare_versions(version, requirement.version or "")
+    return {
+        ">=": result >= 0,
+        "<=": result <= 0,
+        ">>": result > 0,
+        "<<": result < 0,
+        "=": result == 0,
+    }[requirement.op]
+
+
+def _problem(spec: str, requirement: Requirement, candidates: list[InstalledPackage]) -> Optional[str]:
+    if requirement.arch:
+        candidates = [pkg for pkg in candidates if pkg.arch in (requirement.arch, "all")]
+    if not candidates:
+        return spec
+    if any(_satisfies(pkg.version, requirement) for pkg in candidates):
+        return None
+    found = ", ".join(f"{pkg.version} ({pkg.arch})" if pkg.arch else pkg.version for pkg in candidates)
+    return f"{spec} (instalado {found})"
+
+
 def check_packages_installed(
-    packages: Iterable[str], runner: Callable[[list[str]], subprocess.CompletedProcess[str]] = _run_cmd
+    packages: Iterable[str],
+    runner: Callable[[list[str]], subprocess.CompletedProcess[str]] = _run_cmd,
+    index: Optional[dict[str, list[InstalledPackage]]] = None,
 ) -> list[str]:
+    """Pacotes ausentes ou fora da versão pedida.
+
+    Com `index` (ver `read_dpkg_status`) a consulta é só em memória; sem ele cai no `dpkg-query`
+    por pacote via `runner`.
+    """
+
     missing = []
     for pkg in packages:
-        result = runner(["dpkg-query", "-W", "-f", "${Status}", pkg])
-        if result.returncode != 0 or "install ok installed" not in result.stdout:
-            missing.append(pkg)
+        requirement = parse_requirement(pkg)
+        if index is not None:
+            candidates = index.get(requirement.name, [])
+        else:
+            result = runner(["dpkg-query", "-W", "-f", "${Status}\t${Version}\t${Architecture}\n", requirement.query])
+            candidates = []
+            if result.returncode == 0:
+                for line in result.stdout.splitlines():
+                    status, _, rest = line.partition("\t")
+                    version, _, arch = rest.partition("\t")
+                    if "install ok installed" in status:
+                        candidates.append(InstalledPackage(requirement.name, version, arch))
+        problem = _problem(pkg, requirement, candidates)
+        if problem:
+            missing.append(problem)
     return missing
 
 
@@ -104,7 +252,15 @@ def main() -> int:
         help="Diretório de drop-ins do sshd_config",
     )
     parser.add_argument(
-        "--packages", nargs="*", default=DEFAULT_PACKAGES, help="Lista de pacotes obrigatórios a validar"
+        "--packages",
+        nargs="*",
+        default=DEFAULT_PACKAGES,
+        help="Lista de pacotes obrigatórios a validar (aceita nome:arch e restrição de versão, ex.: curl>=7.88)",
+    )
+    parser.add_argument(
+        "--dpkg-status",
+        default=str(DPKG_STATUS),
+        help="Arquivo de status do dpkg lido uma única vez; se ilegível, consulta dpkg-query por pacote",
     )
     args = parser.parse_args()
 
@@ -115,9 +271,18 @@ def main() -> int:
     else:
         print(f"[ERRO] {os_msg}")
 
-    missing = check_packages_installed(args.packages)
+    try:
+        index: Optional[dict[str, list[InstalledPackage]]] = read_dpkg_status(Path(args.dpkg_status))
+    except OSError as exc:
+        print(f"[INFO] {args.dpkg_status} indisponível ({exc}); consultando dpkg-query por pacote")
+        index = None
+    try:
+        missing = check_packages_installed(args.packages, index=index)
+    except ValueError as exc:
+        print(f"[ERRO] {exc}")
+        return 2
     if missing:
-        print(f"[ERRO] Pacotes ausentes: {', '.join(missing)}")
+        print(f"[ERRO] Pacotes ausentes ou fora da versão exigida: {', '.join(missing)}")
     else:
         print("[OK] Pacotes obrigatórios instalados")
 
@@ -0,0 +1,64 @@
+"""Testes do catálogo SQLite de snapshots."""
+from __future__ import annotations
+
+import os
+
+from core.backup import catalog
+from core.nextcloud import backup_nextcloud
+
+
+def _snapshots(tmp_path):
+    snapshots = tmp_path / "target" / "snapshots"
+    first = snapshots / "20240101_000000"
+    second = snapshots / "20240102_000000"
+    (first / "data" / "alice" / "files").mkdir(parents=True)
+    (first / "data" / "alice" / "files" / "report.ods").write_bytes(b"v1")
+    (first / "data" / "alice" / "files" / "notes.txt").write_text("n")
+    (second / "data" / "alice" / "files").mkdir(parents=True)
+    os.link(first / "data" / "alice" / "files" / "notes.txt", second / "data" / "alice" / "files" / "notes.txt")
+    (second / "data" / "alice" / "files" / "report.ods").write_bytes(b"v2 maior")
+    return first, second
+
+
+def test_record_search_and_history(tmp_path):
+    first, second = _snapshots(tmp_path)
+    db = tmp_path / "target" / catalog.CATALOG_NAME
+
+    summary = catalog.record_snapshot(db, first, batch_size=1)
+    catalog.record_snapshot(db, second)
+
+    assert (summary.files, summary.bytes) == (2, 3)
+    found = catalog.search(db, "data/alice/*.ods")
+    assert [(e.snapshot, e.size) for e in found] == [("20240101_000000", 2), ("20240102_000000", 8)]
+
+    report_versions = catalog.versions(catalog.history(db, "/data/alice/files/report.ods"))
+    notes_versions = catalog.versions(catalog.history(db, "data/alice/files/notes.txt"))
+    assert len(report_versions) == 2
+    assert len(notes_versions) == 1
+    assert notes_versions[0][1].snapshot == "20240102_000000"
+
+
+def test_forget_removes_entries_and_orphan_paths(tmp_path):
+    first, second = _snapshots(tmp_path)
+    db = tmp_path / catalog.CATALOG_NAME
+    catalog.record_snapshot(db, first)
+    catalog.record_snapshot(db, second)
+
+    assert catalog.forget_snapshots(db, [first.name]) == 1
+
+    assert [s.name for s in catalog.snapshot_stats(db)] == [second.name]
+    assert [e.snapshot for e in catalog.search(db, "*report.ods")] == [second.name]
+
+
+def test_catalog_subcommand_prints_history(tmp_path, capsys):
+    first, second = _snapshots(tmp_path)
+    target = tmp_path / "target"
+    catalog.record_snapshot(target / catalog.CATALOG_NAME, first)
+    catalog.record_snapshot(target / catalog.CATALOG_NAME, second)
+
+    code = backup_nextcloud.main(["--target", str(target), "catalog", "history", "data/alice/files/report.ods"])
+
+    out = capsys.readouterr().out
+    assert code == 0
+    assert out.count("\n") == 2
+    assert out.startswith("v1  20240101_000000 .. 20240101_000000")
@@ -0,0 +1,86 @@
+"""Testes do export tar.zst em stream com volumes e índice de offsets."""
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from core.backup import export
+
+pytestmark = pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd não instalado")
+
+
+def _snapshot(tmp_path):
+    snap = tmp_path / "snapshots" / "20240101_000000"
+    (snap / "docs" / "vazio").mkdir(parents=True)
+    (snap / "grande.bin").write_bytes(random.Random(1).randbytes(300_000))
+    (snap / "docs" / "nota.txt").write_bytes(b"nota " * 2000)
+    os.link(snap / "grande.bin", snap / "docs" / "copia.bin")
+    (snap / "atalho").symlink_to("grande.bin")
+    return snap
+
+
+def _index(path):
+    with gzip.open(path, "rt") as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_export_volumes_are_a_plain_tar_zst(tmp_path):
+    snap = _snapshot(tmp_path)
+    out = tmp_path / "out"
+
+    report = export.export_snapshot(snap, out, volume_size=40_000, frame_size=100_000)
+
+    assert report.files == 2 and report.frames > 1 and len(report.volumes) > 1
+    assert all((out / name).stat().st_size == 40_000 for name in report.volumes[:-1])
+    joined = b"".join((out / name).read_bytes() for name in report.volumes)
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    tar = subprocess.run(["zstd", "-dc"], input=joined, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-xf", "-", "-C", str(restored)], input=tar, check=True)
+    assert (restored / "docs" / "copia.bin").read_bytes() == (snap / "grande.bin").read_bytes()
+    assert os.stat(restored / "docs" / "copia.bin").st_ino == os.stat(restored / "grande.bin").st_ino
+    assert os.readlink(restored / "atalho") == "grande.bin"
+    assert (restored / "docs" / "vazio").is_dir()
+    summary = _index(out / report.index)[-1]
+    assert [v["bytes"] for v in summary["volumes"]] == [(out / name).stat().st_size for name in report.volumes]
+
+
+@pytest.mark.parametrize("member", ["grande.bin", "docs/nota.txt", "docs/copia.bin"])
+def test_extract_member_reads_only_covering_frames(tmp_path, member):
+    snap = _snapshot(tmp_path)
+    report = export.export_snapshot(snap, tmp_path / "out", volume_size=50_000, frame_size=64 * 1024)
+    buffer = io.BytesIO()
+
+    size = export.extract_member(tmp_path / "out" / report.index, member, buffer)
+
+    assert buffer.getvalue() == (snap / member).read_bytes()
+    assert size == len(buffer.getvalue())
+
+
+def test_extract_rejects_unknown_and_non_regular_members(tmp_path):
+    snap = _snapshot(tmp_path)
+    report = export.export_snapshot(snap, tmp_path / "out")
+    index = tmp_path / "out" / report.index
+
+    with pytest.raises(export.ExportError):
+        export.extract_member(index, "nao/existe", io.BytesIO())
+    with pytest.raises(export.ExportError):
+        export.extract_member(index, "docs", io.BytesIO())
+
+
+def test_failed_compressor_leaves_no_partial_output(tmp_path):
+    snap = _snapshot(tmp_path)
+    out = tmp_path / "out"
+
+    with pytest.raises(export.ExportError):
+        export.export_snapshot(snap, out, compressor=[sys.executable, "-c", "import sys; sys.exit(3)"])
+
+    assert list(out.iterdir()) == []
@@ -0,0 +1,63 @@
+"""Testes do journal de estado dos arquivos usado para atalhos de backup."""
+from __future__ import annotations
+
+import io
+import os
+
+from core.backup import journal
+
+
+def _make_tree(root):
+    (root / "a" / "x").mkdir(parents=True)
+    (root / "a-b").mkdir()
+    (root / "a" / "x" / "f.txt").write_text("1")
+    (root / "a-b" / "g.txt").write_text("2")
+    (root / "top.txt").write_text("3")
+
+
+def test_journal_roundtrip_preserves_states(tmp_path):
+    _make_tree(tmp_path)
+    states = list(journal.walk_state(tmp_path))
+    buffer = io.BytesIO()
+
+    list(journal.write_journal(buffer, "20240101_000000", iter(states)))
+    buffer.seek(0)
+    name, records = journal.read_journal(buffer)
+
+    assert name == "20240101_000000"
+    assert list(records) == states
+    assert [s.path for s in states] == ["a", "a/x", "a/x/f.txt", "a-b", "a-b/g.txt", "top.txt"]
+
+
+def test_scan_detects_noop_changes_and_deletions(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    journal_path = tmp_path / "target" / journal.JOURNAL_NAME
+
+    first = journal.scan(source, journal_path, "snap1", expected_snapshot=None)
+    assert not first.diff.comparable
+    first.commit()
+
+    noop = journal.scan(source, journal_path, "snap2", expected_snapshot="snap1")
+    assert noop.diff.unchanged
+    noop.discard()
+
+    (source / "a-b" / "g.txt").unlink()
+    (source / "new.txt").write_text("novo")
+    os.utime(source / "top.txt", ns=(1, 1))
+    changed = journal.scan(source, journal_path, "snap2", expected_snapshot="snap1")
+
+    assert changed.diff.deleted == ["a-b/g.txt"]
+    assert set(changed.diff.changed) == {"a-b", "new.txt", "top.txt"}
+
+
+def test_scan_ignores_journal_of_other_snapshot(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    journal_path = tmp_path / journal.JOURNAL_NAME
+    journal.scan(source, journal_path, "snap1", expected_snapshot=None).commit()
+
+    result = journal.scan(source, journal_path, "snap3", expected_snapshot="snap2")
+
+    assert not result.diff.comparable
+    assert result.diff.entries == 6
@@ -0,0 +1,59 @@
+"""Testes da seleção de gerações para --link-dest e do relatório de hardlinks."""
+from __future__ import annotations
+
+import os
+
+from core.backup import linkdest, native
+
+
+def _snapshots(root, *names):
+    root.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (root / name).mkdir()
+    return [root / name for name in names]
+
+
+def test_select_link_dests_puts_latest_first_and_caps_at_rsync_limit(tmp_path):
+    snaps = _snapshots(tmp_path / "snapshots", *(f"2024010{i}_000000" for i in range(1, 6)))
+    latest = snaps[3]
+
+    chosen = linkdest.select_link_dests(tmp_path / "snapshots", latest, 3, exclude=snaps[4])
+
+    assert chosen == [latest, snaps[2], snaps[1]]
+    assert linkdest.select_link_dests(tmp_path / "snapshots", latest, 1) == [latest]
+    assert linkdest.select_link_dests(tmp_path / "snapshots", None, 5) == []
+    assert len(linkdest.select_link_dests(tmp_path / "snapshots", latest, 99)) == 5
+
+
+def test_measure_links_separates_linked_copied_and_older_generations(tmp_path):
+    older, latest, current = _snapshots(tmp_path, "s1", "s2", "s3")
+    (older / "voltou.bin").write_bytes(b"v" * 1000)
+    (latest / "igual.txt").write_text("igual")
+    os.link(older / "voltou.bin", current / "voltou.bin")
+    os.link(latest / "igual.txt", current / "igual.txt")
+    (current / "novo.txt").write_text("novo!")
+
+    report = linkdest.measure_links(current, latest)
+
+    assert (report.files_linked, report.bytes_linked) == (2, 1005)
+    assert (report.files_copied, report.bytes_copied) == (1, 5)
+    assert (report.files_linked_older, report.bytes_linked_older) == (1, 1000)
+    assert report.as_dict()["savings_ratio"] == round(1005 / 1010, 4)
+
+
+def test_native_engine_links_file_that_reappeared_from_older_generation(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "doc.odt").write_bytes(b"conteudo original")
+    native.copy_tree(source, tmp_path / "s1")
+    moved = tmp_path / "fora.odt"
+    os.replace(source / "doc.odt", moved)
+    native.copy_tree(source, tmp_path / "s2", link_dest=tmp_path / "s1")
+    os.replace(moved, source / "doc.odt")
+
+    stats = native.copy_tree(source, tmp_path / "s3", link_dest=tmp_path / "s2", extra_link_dests=[tmp_path / "s1"])
+
+    assert stats.linked == 1
+    assert (tmp_path / "s3" / "doc.odt").stat().st_ino == (tmp_path / "s1" / "doc.odt").stat().st_ino
+    report = linkdest.measure_links(tmp_path / "s3", tmp_path / "s2")
+    assert report.files_linked_older == 1
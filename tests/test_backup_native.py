@@ -0,0 +1,190 @@
+"""Testes da engine de cópia nativa (copy_file_range + hardlinks do snapshot anterior)."""
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import stat
+import subprocess
+
+import pytest
+
+from core.backup import native
+
+
+def _make_tree(root):
+    (root / "sub" / "deep").mkdir(parents=True)
+    (root / "vazio").mkdir()
+    (root / "a.txt").write_text("alpha")
+    (root / "sub" / "b.bin").write_bytes(os.urandom(200_000))
+    (root / "sub" / "deep" / "c.txt").write_text("gamma")
+    os.chmod(root / "a.txt", 0o640)
+    os.chmod(root / "sub" / "deep", 0o750)
+    os.symlink("a.txt", root / "link")
+    os.mkfifo(root / "fila")
+    os.utime(root / "sub", ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+
+
+def _describe(root):
+    """Layout comparável de uma árvore: tipo, modo, mtime e conteúdo/alvo."""
+
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            rel = os.path.relpath(path, root)
+            if stat.S_ISLNK(st.st_mode):
+                result[rel] = ("l", os.readlink(path))
+            elif stat.S_ISREG(st.st_mode):
+                with open(path, "rb") as handle:
+                    result[rel] = ("f", stat.S_IMODE(st.st_mode), st.st_mtime_ns, handle.read())
+            else:
+                result[rel] = (stat.S_IFMT(st.st_mode), stat.S_IMODE(st.st_mode), st.st_mtime_ns)
+    return result
+
+
+def test_copy_tree_preserves_layout_and_metadata(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+
+    stats = native.copy_tree(source, tmp_path / "snap1", workers=3)
+
+    assert stats.errors == 0
+    assert (stats.files, stats.symlinks, stats.specials, stats.dirs) == (3, 1, 1, 3)
+    assert _describe(tmp_path / "snap1") == _describe(source)
+    assert stat.S_IMODE((tmp_path / "snap1").stat().st_mode) == stat.S_IMODE(source.stat().st_mode)
+
+
+def test_copy_tree_hardlinks_unchanged_files_from_link_dest(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    native.copy_tree(source, tmp_path / "snap1")
+    (source / "sub" / "deep" / "c.txt").write_text("gamma v2")
+
+    stats = native.copy_tree(source, tmp_path / "snap2", link_dest=tmp_path / "snap1")
+
+    assert (stats.linked, stats.copied) == (2, 1)
+    assert stats.bytes_linked == 200_005
+    snap1, snap2 = tmp_path / "snap1", tmp_path / "snap2"
+    assert (snap2 / "a.txt").stat().st_ino == (snap1 / "a.txt").stat().st_ino
+    assert (snap2 / "sub" / "deep" / "c.txt").stat().st_ino != (snap1 / "sub" / "deep" / "c.txt").stat().st_ino
+    assert (snap1 / "sub" / "deep" / "c.txt").read_text() == "gamma"
+    assert _describe(snap2) == _describe(source)
+
+
+def test_copy_tree_copies_when_hardlink_hits_link_limit(tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    _make_tree(source)
+    native.copy_tree(source, tmp_path / "snap1")
+
+    def refuse_link(src, dst, *args, **kwargs):
+        raise OSError(errno.EMLINK, os.strerror(errno.EMLINK))
+
+    monkeypatch.setattr(native.os, "link", refuse_link)
+    stats = native.copy_tree(source, tmp_path / "snap2", link_dest=tmp_path / "snap1")
+
+    assert (stats.linked, stats.copied, stats.link_fallbacks, stats.errors) == (0, 3, 3, 0)
+    assert native.returncode(stats) == 0
+    snap1, snap2 = tmp_path / "snap1", tmp_path / "snap2"
+    assert (snap2 / "a.txt").stat().st_ino != (snap1 / "a.txt").stat().st_ino
+    assert _describe(snap2) == _describe(source)
+
+
+def test_copy_tree_does_not_link_when_attributes_changed(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    native.copy_tree(source, tmp_path / "snap1")
+    os.chmod(source / "a.txt", 0o600)
+
+    native.copy_tree(source, tmp_path / "snap2", link_dest=tmp_path / "snap1")
+
+    assert (tmp_path / "snap2" / "a.txt").stat().st_ino != (tmp_path / "snap1" / "a.txt").stat().st_ino
+    assert stat.S_IMODE((tmp_path / "snap1" / "a.txt").stat().st_mode) == 0o640
+
+
+def test_copy_tree_excludes_and_dry_run(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+
+    stats = native.copy_tree(source, tmp_path / "snap", excludes=["/a.txt", "/sub/deep/"])
+    dry = native.copy_tree(source, tmp_path / "dry", dry_run=True)
+
+    assert not (tmp_path / "snap" / "a.txt").exists()
+    assert not (tmp_path / "snap" / "sub" / "deep").exists()
+    assert (tmp_path / "snap" / "sub" / "b.bin").exists()
+    assert stats.files == 1
+    assert dry.files == 3 and dry.bytes_copied == 200_010
+    assert not (tmp_path / "dry").exists()
+
+
+def test_copy_data_falls_back_when_copy_file_range_is_unsupported(tmp_path, monkeypatch):
+    src = tmp_path / "src.bin"
+    payload = os.urandom(100_000)
+    src.write_bytes(payload)
+
+    def unsupported(*args, **kwargs):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    monkeypatch.setattr(native.os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(native.os, "sendfile", unsupported, raising=False)
+    with open(src, "rb") as fin, open(tmp_path / "dst.bin", "wb") as fout:
+        copied = native.copy_data(fin.fileno(), fout.fileno(), len(payload))
+
+    assert copied == len(payload)
+    assert (tmp_path / "dst.bin").read_bytes() == payload
+
+
+def test_copy_tree_reports_partial_transfer(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    (tmp_path / "snap" / "a.txt").parent.mkdir(parents=True)
+    (tmp_path / "snap" / "a.txt").write_text("já existe")
+
+    stats = native.copy_tree(source, tmp_path / "snap")
+
+    assert stats.errors == 1
+    assert stats.messages[0].startswith("a.txt")
+    assert native.returncode(stats) == native.PARTIAL_TRANSFER_CODE
+
+
+@pytest.mark.skipif(shutil.which("rsync") is None, reason="rsync não instalado")
+def test_copy_tree_matches_rsync_link_dest(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    native.copy_tree(source, tmp_path / "native1")
+    subprocess.run(["rsync", "-a", "--numeric-ids", f"{source}/", f"{tmp_path / 'rsync1'}/"], check=True)
+    (source / "a.txt").write_text("alpha v2")
+
+    native.copy_tree(source, tmp_path / "native2", link_dest=tmp_path / "native1")
+    subprocess.run(
+        ["rsync", "-a", "--numeric-ids", f"--link-dest={tmp_path / 'rsync1'}", f"{source}/", f"{tmp_path / 'rsync2'}/"],
+        check=True,
+    )
+
+    assert _describe(tmp_path / "native2") == _describe(tmp_path / "rsync2")
+    for name in ("a.txt", "sub/b.bin"):
+        native_linked = (tmp_path / "native2" / name).stat().st_nlink > 1
+        rsync_linked = (tmp_path / "rsync2" / name).stat().st_nlink > 1
+        assert native_linked == rsync_linked
+
+
+def test_copy_tree_resume_keeps_complete_files_and_redoes_the_rest(tmp_path):
+    source = tmp_path / "source"
+    _make_tree(source)
+    snap = tmp_path / "snap"
+    native.copy_tree(source, snap)
+    complete_ino = (snap / "sub" / "b.bin").stat().st_ino
+    # Simula a interrupção: arquivo pela metade, symlink faltando e lixo que sumiu da origem.
+    (snap / "a.txt").write_text("alp")
+    (snap / "link").unlink()
+    (snap / "sub" / "removido.txt").write_text("x")
+    (snap / "vazio" / "velho").mkdir()
+
+    stats = native.copy_tree(source, snap, resume=True)
+
+    assert stats.errors == 0
+    assert stats.resumed == 2
+    assert stats.copied == 1
+    assert (snap / "sub" / "b.bin").stat().st_ino == complete_ino
+    assert _describe(snap) == _describe(source)
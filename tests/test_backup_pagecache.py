@@ -0,0 +1,113 @@
+import os
+
+from core.backup import chunkstore, native, pagecache
+
+MEMINFO = """MemTotal:        8048576 kB
+MemFree:          512000 kB
+Cached:          4000000 kB
+Active(file):    2000000 kB
+Inactive(file):  1500000 kB
+Dirty:              1024 kB
+HugePages_Total:       0
+"""
+
+
+def test_read_meminfo_converts_kb_to_bytes(tmp_path):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text(MEMINFO)
+
+    values = pagecache.read_meminfo(meminfo)
+    sample = pagecache.sample(meminfo)
+
+    assert values["HugePages_Total"] == 0
+    assert sample.cached == 4000000 * 1024
+    assert sample.active_file == 2000000 * 1024
+    assert pagecache.sample(tmp_path / "ausente") is None
+
+
+def test_compare_reports_kept_ratio():
+    before = pagecache.CacheSample(cached=100, active_file=80)
+    after = pagecache.CacheSample(cached=90, active_file=60)
+
+    info = pagecache.compare(before, after)
+
+    assert info["kept_ratio"] == 0.75
+    assert info["cached_delta"] == -10
+    assert pagecache.compare(before, None) == {}
+
+
+def test_drop_paths_counts_only_regular_files(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "a.bin").write_bytes(b"x" * 4096)
+    (tmp_path / "b.bin").write_bytes(b"y" * 10)
+    os.symlink("b.bin", tmp_path / "link")
+
+    stats = pagecache.drop_paths(tmp_path, sync=True)
+    subset = pagecache.drop_paths(tmp_path, ["b.bin", "dir", "link", "sumiu"])
+
+    assert (stats.files, stats.bytes, stats.errors) == (2, 4106, 0)
+    assert (subset.files, subset.bytes) == (1, 10)
+    assert subset.errors == 2
+
+
+def test_wrap_command_uses_nocache_when_installed(monkeypatch):
+    monkeypatch.setattr(pagecache.shutil, "which", lambda name: "/usr/bin/nocache")
+    assert pagecache.wrap_command(["rsync", "-a"]) == ["nocache", "rsync", "-a"]
+
+    monkeypatch.setattr(pagecache.shutil, "which", lambda name: None)
+    assert pagecache.wrap_command(["rsync", "-a"]) == ["rsync", "-a"]
+
+
+def test_release_syncs_only_files_written_in_this_run(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    previous = tmp_path / "prev"
+    snapshot = tmp_path / "snap"
+    for root in (source, previous, snapshot):
+        (root / "dir").mkdir(parents=True)
+    (source / "dir" / "old.bin").write_bytes(b"o" * 100)
+    (source / "new.bin").write_bytes(b"n" * 10)
+    (previous / "dir" / "old.bin").write_bytes(b"o" * 100)
+    os.link(previous / "dir" / "old.bin", snapshot / "dir" / "old.bin")
+    (snapshot / "new.bin").write_bytes(b"n" * 10)
+    calls = []
+    real_drop = pagecache.drop_file
+    monkeypatch.setattr(pagecache, "drop_file", lambda path, sync=False: calls.append((path, sync)) or real_drop(path))
+
+    info = pagecache.release(None, source, snapshot)
+
+    assert pagecache.written_files(snapshot) == ["new.bin"]
+    assert calls == [(source / "new.bin", False), (snapshot / "new.bin", True)]
+    assert info["dropped"] == {"files": 2, "bytes": 20, "errors": 0}
+
+
+def test_native_copy_drops_each_file_right_after_copying(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    for index in range(3):
+        (source / f"f{index}.bin").write_bytes(b"x" * 1000)
+    advised = []
+    monkeypatch.setattr(pagecache.os, "posix_fadvise", lambda fd, offset, length, advice: advised.append(advice))
+    dropper = pagecache.CacheDropper(lag=1)
+
+    native.copy_tree(source, tmp_path / "snap", workers=1, dropper=dropper)
+
+    # Origem e destino de cada arquivo, mais o segundo fadvise dos gravados que saíram da fila.
+    assert advised.count(os.POSIX_FADV_DONTNEED) == 3 * 2 + 2
+    assert (dropper.stats.files, dropper.stats.bytes) == (6, 6000)
+    dropper.finish()
+    assert len(advised) == 9
+
+
+def test_chunkstore_drops_read_files_and_written_chunks(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.bin").write_bytes(os.urandom(4096))
+    (source / "b.bin").write_bytes(os.urandom(2048))
+    dropper = pagecache.CacheDropper()
+
+    stats = chunkstore.backup_tree(source, tmp_path / "snap", tmp_path / "chunks", dropper=dropper)
+    dropped = dropper.finish()
+
+    assert dropped.files == stats.files + stats.chunks_new
+    assert dropped.bytes == stats.bytes_read + stats.bytes_stored
+    assert dropped.errors == 0
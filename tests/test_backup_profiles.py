@@ -0,0 +1,82 @@
+"""Testes dos perfis de exclusão (regras ancoradas, overrides e contagem do que foi pulado)."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from core.backup import chunkstore, profiles
+
+
+def _nextcloud_tree(root):
+    preview = root / "data" / "appdata_oc1" / "preview" / "1" / "2"
+    preview.mkdir(parents=True)
+    (preview / "256-256.png").write_bytes(b"p" * 300)
+    (preview / "1024-1024.png").write_bytes(b"p" * 700)
+    (root / "data" / "alice" / "cache").mkdir(parents=True)
+    (root / "data" / "alice" / "cache" / "x").write_bytes(b"c" * 50)
+    (root / "data" / "alice" / "files").mkdir()
+    (root / "data" / "alice" / "files" / "doc.txt").write_text("keep")
+    # Arquivo com o nome de um diretório de regra: "/data/*/cache/" só vale para diretórios.
+    (root / "data" / "bob").mkdir()
+    (root / "data" / "bob" / "cache").write_text("arquivo")
+
+
+def test_resolve_uses_builtins_and_overrides(tmp_path):
+    overrides = tmp_path / "perfis.json"
+    overrides.write_text(json.dumps({"nextcloud": {"previews": ["/data/appdata_oc1/preview/"], "raw": ["/raw/"]}}))
+
+    builtin = profiles.resolve("nextcloud", ["previews"])
+    custom = profiles.resolve("nextcloud", ["previews", "raw"], overrides)
+
+    assert [r.pattern for r in builtin] == ["/data/appdata_*/preview/"]
+    assert [(r.profile, r.pattern) for r in custom] == [("previews", "/data/appdata_oc1/preview/"), ("raw", "/raw/")]
+    with pytest.raises(ValueError, match="desconhecido"):
+        profiles.resolve("vaultwarden", ["previews"])
+
+
+def test_resolve_rejects_unanchored_patterns(tmp_path):
+    overrides = tmp_path / "perfis.json"
+    overrides.write_text(json.dumps({"vaultwarden": {"ruim": ["icon_cache/"]}}))
+
+    with pytest.raises(ValueError, match="ancorada"):
+        profiles.resolve("vaultwarden", ["ruim"], overrides)
+
+
+def test_measure_counts_skipped_files_and_bytes_per_rule(tmp_path):
+    _nextcloud_tree(tmp_path)
+    rules = profiles.resolve("nextcloud", ["previews", "caches"]) + [
+        profiles.ExcludeRule("dup", "/data/appdata_oc1/preview/"),
+    ]
+
+    report = profiles.measure(tmp_path, rules)
+
+    by_pattern = {rule.pattern: rule for rule in report.rules}
+    assert (by_pattern["/data/appdata_*/preview/"].files, by_pattern["/data/appdata_*/preview/"].bytes) == (2, 1000)
+    assert (by_pattern["/data/*/cache/"].matches, by_pattern["/data/*/cache/"].bytes) == (1, 50)
+    # Caminho já coberto por uma regra anterior não é contado de novo.
+    assert report.rules[-1].matches == 0
+    assert sorted(report.paths) == ["data/alice/cache", "data/appdata_oc1/preview"]
+    assert report.as_dict()["bytes"] == 1050
+
+
+def test_rebase_anchors_patterns_in_shard():
+    patterns = ["/data/appdata_*/preview/", "/data/*/cache/", "/config/"]
+
+    assert profiles.rebase(patterns, "data/appdata_oc1") == ["/preview/", "/cache/"]
+    assert profiles.rebase(patterns, "data/alice") == ["/cache/"]
+    assert profiles.rebase(["/data/bob/"], "data/bob") is None
+
+
+def test_chunkstore_skips_excluded_paths(tmp_path):
+    source = tmp_path / "source"
+    _nextcloud_tree(source)
+
+    stats = chunkstore.backup_tree(
+        source, tmp_path / "snap", tmp_path / "chunks", excludes=["data/appdata_oc1/preview", "/data/alice/cache"]
+    )
+
+    paths = {entry["path"] for entry in chunkstore.read_manifest(tmp_path / "snap")}
+    assert "data/alice/files/doc.txt" in paths
+    assert not any(path.startswith(("data/appdata_oc1/preview", "data/alice/cache")) for path in paths)
+    assert stats.files == 2
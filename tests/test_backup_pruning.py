@@ -0,0 +1,69 @@
+"""Testes da retenção em duas fases (lixeira + remoção paralela)."""
+from __future__ import annotations
+
+import os
+import time
+
+from core.backup import pruning
+
+
+def _snapshot(root, name, files):
+    snap = root / name
+    for rel, content in files.items():
+        path = snap / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return snap
+
+
+def test_move_to_trash_is_rename_and_avoids_collisions(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    trash = tmp_path / "trash"
+    (trash / "20240101_000000").mkdir(parents=True)
+    snap = _snapshot(snapshots, "20240101_000000", {"a.txt": b"a"})
+
+    moved = pruning.move_to_trash([snap], trash)
+
+    assert not snap.exists()
+    assert moved == [trash / "20240101_000000.1"]
+    assert (moved[0] / "a.txt").read_bytes() == b"a"
+
+
+def test_purge_counts_only_really_freed_inodes(tmp_path):
+    kept = _snapshot(tmp_path / "snapshots", "keep", {"shared.bin": b"s" * 8192})
+    trash = tmp_path / "trash"
+    old = _snapshot(trash, "old", {"u1/f.bin": b"x" * 8192, "u2/deep/g.bin": b"y" * 100})
+    os.link(kept / "shared.bin", old / "shared.bin")
+
+    stats = pruning.purge_trash(trash, workers=3)
+
+    assert list(trash.iterdir()) == []
+    assert (kept / "shared.bin").read_bytes() == b"s" * 8192
+    assert stats.snapshots == 1
+    # 2 arquivos exclusivos + 4 diretórios (old, u1, u2, deep); o hardlink não libera inode.
+    assert stats.inodes == 6
+    assert stats.entries == 7
+    assert stats.bytes >= 8192
+    assert stats.errors == 0
+
+
+def test_purge_resumes_partially_deleted_trash(tmp_path):
+    trash = tmp_path / "trash"
+    old = _snapshot(trash, "old", {"a/1.txt": b"1", "a/2.txt": b"2", "b/3.txt": b"3"})
+    (old / "a" / "1.txt").unlink()
+    (old / "b" / "3.txt").unlink()
+    (old / "b").rmdir()
+
+    stats = pruning.purge_trash(trash, workers=1)
+
+    assert not old.exists()
+    assert stats.entries == 3
+
+
+def test_rate_limiter_spaces_operations():
+    limiter = pruning.RateLimiter(rate=200)
+
+    started = time.monotonic()
+    for _ in range(21):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,97 @@
+"""Testes da replicação de snapshots concluídos para destinos extras."""
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from core.backup import native, replicate, staging
+
+
+def _snapshot(root, name, files):
+    snap = root / "snapshots" / name
+    snap.mkdir(parents=True)
+    for rel, content in files.items():
+        (snap / rel).parent.mkdir(parents=True, exist_ok=True)
+        (snap / rel).write_bytes(content)
+        os.utime(snap / rel, ns=(1_700_000_000_000_000_000, 1_700_000_000_000_000_000))
+    return snap
+
+
+def test_parse_targets_reads_paths_and_limits():
+    targets = replicate.parse_targets("/mnt/usb=20, /mnt/nas ,")
+
+    assert targets == [
+        replicate.ReplicaTarget(replicate.Path("/mnt/usb"), 20.0),
+        replicate.ReplicaTarget(replicate.Path("/mnt/nas"), 0.0),
+    ]
+    with pytest.raises(ValueError):
+        replicate.parse_targets("/mnt/usb=rapido")
+
+
+def test_replicate_sends_only_delta_and_keeps_hardlinks(tmp_path):
+    primary = tmp_path / "primary"
+    usb1, usb2 = tmp_path / "usb1", tmp_path / "usb2"
+    usb1.mkdir()
+    usb2.mkdir()
+    first = _snapshot(primary, "20240101_000000", {"a.txt": b"a" * 100, "sub/b.txt": b"b" * 50})
+    targets = [replicate.ReplicaTarget(usb1), replicate.ReplicaTarget(usb2, bwlimit_mib=50)]
+
+    initial = replicate.replicate(first, targets, retention=1)
+    second = _snapshot(primary, "20240102_000000", {"a.txt": b"a" * 100, "sub/b.txt": b"novo"})
+    results = replicate.replicate(second, targets, retention=1)
+
+    assert all(r.success for r in initial + results)
+    for result in results:
+        assert (result.linked, result.copied, result.bytes_copied) == (1, 1, 4)
+        assert result.link_dest == "20240101_000000"
+        assert result.pruned == ["20240101_000000"]
+    for replica in (usb1, usb2):
+        assert [p.name for p in (replica / "snapshots").iterdir()] == ["20240102_000000"]
+        assert (replica / "latest").resolve() == (replica / "snapshots" / "20240102_000000").resolve()
+        assert (replica / "latest" / "sub" / "b.txt").read_bytes() == b"novo"
+
+
+def test_replicate_reports_missing_target_without_creating_it(tmp_path):
+    snap = _snapshot(tmp_path / "primary", "20240101_000000", {"a.txt": b"a"})
+    missing = tmp_path / "nao-montado"
+
+    (result,) = replicate.replicate(snap, [replicate.ReplicaTarget(missing)], retention=3)
+
+    assert result.success is False
+    assert "indisponível" in result.message
+    assert not missing.exists()
+
+
+def test_replicate_resumes_interrupted_replica(tmp_path):
+    snap = _snapshot(tmp_path / "primary", "20240102_000000", {"a.txt": b"a" * 10, "b.txt": b"b" * 10})
+    replica = tmp_path / "usb"
+    stale = replica / staging.INCOMPLETE_DIRNAME / "20240101_000000"
+    stale.mkdir(parents=True)
+    os.link(snap / "a.txt", stale / "a.txt")
+    (stale / "sumiu.txt").write_text("x")
+
+    (result,) = replicate.replicate(snap, [replicate.ReplicaTarget(replica)], retention=3)
+
+    assert result.success and result.resumed
+    assert result.copied == 1
+    assert not (replica / "latest" / "sumiu.txt").exists()
+    assert staging.pending_snapshots(replica) == []
+
+
+def test_copy_data_charges_limiter_per_block(tmp_path):
+    payload = os.urandom(300_000)
+    (tmp_path / "src").write_bytes(payload)
+
+    class Recorder:
+        def __init__(self):
+            self.amounts = []
+
+        def acquire(self, amount=1.0):
+            self.amounts.append(amount)
+
+    recorder = Recorder()
+    with open(tmp_path / "src", "rb") as fin, open(tmp_path / "dst", "wb") as fout:
+        native.copy_data(fin.fileno(), fout.fileno(), len(payload), recorder)
+
+    assert sum(recorder.amounts) == len(payload)
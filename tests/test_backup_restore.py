@@ -0,0 +1,132 @@
+"""Testes do restore paralelo e seletivo."""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+from core.backup import chunkstore, restore
+
+
+def _make_snapshot(root):
+    (root / "data" / "alice" / "files" / "Docs").mkdir(parents=True)
+    (root / "data" / "bob" / "files").mkdir(parents=True)
+    (root / "data" / "alice" / "files" / "report.ods").write_bytes(b"r" * 5000)
+    (root / "data" / "alice" / "files" / "Docs" / "cv.pdf").write_bytes(b"cv")
+    (root / "data" / "bob" / "files" / "photo.jpg").write_bytes(b"j" * 100)
+    (root / "config.php").write_text("<?php")
+    os.symlink("config.php", root / "link")
+    os.utime(root / "data" / "alice", ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+
+
+def test_full_restore_recreates_tree_and_metadata(tmp_path):
+    snapshot = tmp_path / "snapshots" / "20240101_000000"
+    _make_snapshot(snapshot)
+
+    report = restore.restore_snapshot(snapshot, tmp_path / "out", workers=3)
+
+    out = tmp_path / "out"
+    assert report.errors == 0
+    assert (report.files, report.restored, report.bytes_restored) == (4, 5, 5107)
+    assert (out / "data" / "alice" / "files" / "report.ods").read_bytes() == b"r" * 5000
+    assert os.readlink(out / "link") == "config.php"
+    assert (out / "data" / "alice").stat().st_mtime_ns == 1_600_000_000_000_000_000
+    assert not list(out.rglob("*.restore-tmp"))
+
+
+def test_restore_skips_identical_files_and_replaces_changed(tmp_path):
+    snapshot = tmp_path / "snap"
+    _make_snapshot(snapshot)
+    out = tmp_path / "out"
+    restore.restore_snapshot(snapshot, out)
+    (out / "config.php").write_text("alterado")
+
+    report = restore.restore_snapshot(snapshot, out)
+
+    assert report.restored == 1
+    assert report.skipped == 4
+    assert (out / "config.php").read_text() == "<?php"
+
+
+def test_selective_restore_by_glob(tmp_path):
+    snapshot = tmp_path / "snap"
+    _make_snapshot(snapshot)
+
+    report = restore.restore_snapshot(snapshot, tmp_path / "out", patterns=["data/alice/files/Docs", "*.jpg"])
+
+    out = tmp_path / "out"
+    assert report.files == 2
+    assert (out / "data" / "alice" / "files" / "Docs" / "cv.pdf").exists()
+    assert (out / "data" / "bob" / "files" / "photo.jpg").exists()
+    assert not (out / "data" / "alice" / "files" / "report.ods").exists()
+    assert not (out / "config.php").exists()
+
+
+def test_dry_run_counts_without_writing(tmp_path):
+    snapshot = tmp_path / "snap"
+    _make_snapshot(snapshot)
+
+    report = restore.restore_snapshot(snapshot, tmp_path / "out", dry_run=True)
+
+    assert report.files == 4
+    assert not (tmp_path / "out").exists()
+
+
+def test_restore_chunkstore_snapshot(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("alpha")
+    chunkstore.backup_tree(source, tmp_path / "snap", tmp_path / "chunks")
+
+    report = restore.restore_snapshot(tmp_path / "snap", tmp_path / "out", store_dir=tmp_path / "chunks")
+
+    assert report.restored == 1
+    assert (tmp_path / "out" / "a.txt").read_text() == "alpha"
+
+
+def test_run_command_appends_rto_history(tmp_path, capsys):
+    target = tmp_path / "backups"
+    _make_snapshot(target / "snapshots" / "20240101_000000")
+    (target / "latest").symlink_to(target / "snapshots" / "20240101_000000")
+
+    args = argparse.Namespace(
+        snapshot="latest", destination=tmp_path / "out", include=["config.php"], workers=2, restore_dry_run=False
+    )
+
+    assert restore.run_command(args, target) == 0
+    history = [json.loads(line) for line in (target / restore.HISTORY_NAME).read_text().splitlines()]
+    assert history[0]["snapshot"] == "20240101_000000"
+    assert history[0]["restored"] == 1
+    assert "duration_s" in history[0] and "throughput_bps" in history[0]
+    assert "restaurados=1" in capsys.readouterr().out
+
+
+def test_chunkstore_restore_is_selective_parallel_and_skips_identical(tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    _make_snapshot(source)
+    store = tmp_path / "chunks"
+    chunkstore.backup_tree(source, tmp_path / "snap", store)
+    monkeypatch.setattr(restore, "FILE_BATCH_SIZE", 1)
+    out = tmp_path / "out"
+
+    partial = restore.restore_snapshot(
+        tmp_path / "snap", out, patterns=["data/alice/files/Docs", "*.jpg"], store_dir=store
+    )
+
+    assert (partial.files, partial.restored, partial.errors) == (2, 2, 0)
+    assert (out / "data" / "alice" / "files" / "Docs" / "cv.pdf").read_bytes() == b"cv"
+    assert (out / "data" / "bob" / "files" / "photo.jpg").read_bytes() == b"j" * 100
+    assert not (out / "config.php").exists()
+
+    full = restore.restore_snapshot(tmp_path / "snap", out, workers=3, store_dir=store)
+    assert (full.files, full.restored, full.skipped) == (4, 3, 2)
+    assert (out / "data" / "alice").stat().st_mtime_ns == 1_600_000_000_000_000_000
+
+    (out / "config.php").write_text("alterado")
+    inode = (out / "data" / "bob" / "files" / "photo.jpg").stat().st_ino
+    again = restore.restore_snapshot(tmp_path / "snap", out, store_dir=store)
+
+    assert (again.restored, again.skipped, again.bytes_restored) == (1, 4, 5)
+    assert (out / "config.php").read_text() == "<?php"
+    assert (out / "data" / "bob" / "files" / "photo.jpg").stat().st_ino == inode
+    assert not list(out.rglob("*.restore-tmp"))
@@ -0,0 +1,64 @@
+"""Testes da leitura em streaming da saída do rsync (progress2)."""
+from __future__ import annotations
+
+import json
+import sys
+
+from core.backup import rsync_progress
+
+
+def test_parse_progress2_line_with_check_counters():
+    line = "    105,672,192  45%   12.34MB/s    0:00:08 (xfr#12, to-chk=345/678)"
+
+    progress = rsync_progress.parse_progress2(line)
+
+    assert progress is not None
+    assert progress.bytes == 105_672_192
+    assert progress.percent == 45
+    assert progress.rate_bps == 12.34 * 1024**2
+    assert progress.transfers == 12
+    assert (progress.to_check_remaining, progress.to_check_total) == (345, 678)
+
+
+def test_parse_progress2_ignores_other_lines():
+    assert rsync_progress.parse_progress2("sending incremental file list") is None
+    assert rsync_progress.parse_progress2("          0   0%    0.00kB/s    0:00:00").percent == 0
+
+
+def test_reporter_throttles_writes(tmp_path):
+    now = [0.0]
+    progress_file = tmp_path / "progress.json"
+    reporter = rsync_progress.ProgressReporter(
+        progress_file, log_interval=10, write_interval=5, clock=lambda: now[0]
+    )
+    first = rsync_progress.Progress(bytes=1, percent=1, rate_bps=1.0, elapsed="0:00:01")
+    second = rsync_progress.Progress(bytes=2, percent=2, rate_bps=1.0, elapsed="0:00:02")
+
+    reporter.update("rsync", first)
+    now[0] = 1.0
+    reporter.update("rsync", second)
+    written = json.loads(progress_file.read_text())
+    assert written["entries"]["rsync"]["bytes"] == 1
+
+    reporter.finish()
+    final = json.loads(progress_file.read_text())
+    assert final["running"] is False
+    assert final["entries"]["rsync"]["bytes"] == 2
+
+
+def test_stream_rsync_reads_carriage_return_progress(tmp_path):
+    script = (
+        "import sys\n"
+        "for pct in (10, 55, 100):\n"
+        "    sys.stdout.write(f'  {pct * 1000:,}  {pct}%    1.00MB/s    0:00:01 (xfr#1, to-chk=0/3)\\r')\n"
+        "sys.stdout.flush()\n"
+        "sys.stderr.write('rsync: aviso qualquer\\n')\n"
+        "sys.exit(24)\n"
+    )
+    reporter = rsync_progress.ProgressReporter(tmp_path / "progress.json")
+
+    code = rsync_progress.stream_rsync([sys.executable, "-c", script], reporter=reporter, label="teste")
+
+    assert code == 24
+    assert reporter.snapshot()["teste"]["percent"] == 100
+    assert reporter.snapshot()["teste"]["bytes"] == 100_000
@@ -0,0 +1,63 @@
+"""Testes do lock de backup, da retomada de snapshots e da promoção atômica."""
+from __future__ import annotations
+
+import pytest
+
+from core.backup import pruning, staging
+
+
+def test_lock_is_exclusive_until_released(tmp_path):
+    first = staging.acquire_lock(tmp_path)
+
+    with pytest.raises(staging.LockBusy):
+        staging.acquire_lock(tmp_path)
+
+    first.release()
+    with staging.acquire_lock(tmp_path):
+        pass
+    assert (tmp_path / staging.LOCK_NAME).exists()
+
+
+def test_prepare_snapshot_resumes_newest_and_trashes_older(tmp_path):
+    pending = tmp_path / staging.INCOMPLETE_DIRNAME
+    for name in ("20240101_000000", "20240102_000000"):
+        (pending / name).mkdir(parents=True)
+
+    path, resumed = staging.prepare_snapshot(tmp_path, "20240103_000000")
+
+    assert resumed is True
+    assert path == pending / "20240102_000000"
+    assert not (pending / "20240101_000000").exists()
+    assert (tmp_path / pruning.TRASH_DIRNAME / "20240101_000000").is_dir()
+
+
+def test_prepare_snapshot_without_resume_starts_fresh(tmp_path):
+    (tmp_path / staging.INCOMPLETE_DIRNAME / "20240101_000000").mkdir(parents=True)
+
+    path, resumed = staging.prepare_snapshot(tmp_path, "20240103_000000", resume=False)
+
+    assert resumed is False
+    assert path == tmp_path / staging.INCOMPLETE_DIRNAME / "20240103_000000"
+    assert not path.exists()
+    assert staging.pending_snapshots(tmp_path) == []
+
+
+def test_promote_and_point_latest(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    (snapshots / "20240101_000000").mkdir(parents=True)
+    staging.point_latest(tmp_path, snapshots / "20240101_000000")
+    work = tmp_path / staging.INCOMPLETE_DIRNAME / "20240102_000000"
+    work.mkdir(parents=True)
+    (work / "f.txt").write_text("ok")
+
+    final = staging.promote(work, snapshots)
+    staging.point_latest(tmp_path, final)
+
+    assert final == snapshots / "20240102_000000"
+    assert not work.exists()
+    assert (tmp_path / "latest").resolve() == final.resolve()
+    assert (tmp_path / "latest" / "f.txt").read_text() == "ok"
+    assert not (tmp_path / ".latest.tmp").exists()
+    with pytest.raises(FileExistsError):
+        (tmp_path / staging.INCOMPLETE_DIRNAME / "20240102_000000").mkdir()
+        staging.promote(tmp_path / staging.INCOMPLETE_DIRNAME / "20240102_000000", snapshots)
@@ -0,0 +1,111 @@
+"""Testes do relatório de uso de disco ciente de hardlinks."""
+from __future__ import annotations
+
+import argparse
+import os
+
+from core.backup import usage
+
+BLOCK = 4096
+
+
+def _blocks(path):
+    return path.stat().st_blocks * 512
+
+
+def _make_target(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    s1, s2, s3 = (snapshots / name for name in ("s1", "s2", "s3"))
+    for snap in (s1, s2, s3):
+        (snap / "sub").mkdir(parents=True)
+    (s1 / "shared.bin").write_bytes(b"a" * BLOCK * 4)
+    (s1 / "old.bin").write_bytes(b"o" * BLOCK * 2)
+    (s2 / "sub" / "mid.bin").write_bytes(b"m" * BLOCK)
+    (s3 / "new.bin").write_bytes(b"n" * BLOCK * 3)
+    os.link(s1 / "shared.bin", s2 / "shared.bin")
+    os.link(s1 / "shared.bin", s3 / "shared.bin")
+    os.link(s2 / "sub" / "mid.bin", s3 / "sub" / "mid.bin")
+    os.link(s3 / "new.bin", s3 / "sub" / "new-again.bin")
+    return s1, s2, s3
+
+
+def test_update_reports_unique_shared_and_pruning_projection(tmp_path):
+    s1, s2, s3 = _make_target(tmp_path)
+    shared, old = _blocks(s1 / "shared.bin"), _blocks(s1 / "old.bin")
+    mid, new = _blocks(s2 / "sub" / "mid.bin"), _blocks(s3 / "new.bin")
+
+    report = usage.update(tmp_path, retention=2)
+
+    first, second, third = report.snapshots
+    assert (first.unique_bytes, first.shared_bytes) == (old, shared)
+    assert (second.unique_bytes, second.referenced_bytes) == (0, shared + mid)
+    assert (third.files, third.inodes, third.unique_bytes) == (4, 3, new)
+    assert report.total_bytes == shared + old + mid + new
+    # mid.bin também está em s3: remover s1 e s2 ainda não o libera.
+    assert report.freed_by_pruning == [old, old, old + mid + shared + new]
+    assert report.projected_free_bytes == old
+
+
+
+def test_index_snapshot_merges_sorted_runs(tmp_path, monkeypatch):
+    snapshot = tmp_path / "snap"
+    snapshot.mkdir()
+    for index in range(7):
+        (snapshot / f"f{index}.bin").write_bytes(b"x" * (index + 1) * BLOCK)
+    os.link(snapshot / "f0.bin", snapshot / "again.bin")
+    os.link(snapshot / "f5.bin", snapshot / "again5.bin")
+    whole = tmp_path / "whole.idx"
+    usage.index_snapshot(snapshot, whole)
+    monkeypatch.setattr(usage, "RUN_ENTRIES", 2)
+    monkeypatch.setattr(usage, "_READ_PAIRS", 3)
+
+    files, inodes = usage.index_snapshot(snapshot, tmp_path / "runs.idx")
+
+    assert (files, inodes) == (9, 7)
+    assert usage.read_index(tmp_path / "runs.idx") == usage.read_index(whole)
+    _, indexed, sizes = usage.read_index(whole)
+    assert list(indexed) == sorted(path.stat().st_ino for path in snapshot.glob("f*.bin"))
+    assert list(sizes) == [_blocks(path) for path in sorted(snapshot.glob("f*.bin"), key=lambda p: p.stat().st_ino)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["runs.idx", "snap", "whole.idx"]
+
+
+def test_compute_streams_indexes_larger_than_one_block(tmp_path, monkeypatch):
+    _make_target(tmp_path)
+    expected = usage.update(tmp_path, retention=2).as_dict()
+    indexes = [(name, tmp_path / usage.USAGE_DIRNAME / f"{name}.idx") for name in ("s1", "s2", "s3")]
+    monkeypatch.setattr(usage, "_READ_PAIRS", 2)
+
+    def no_full_load(*args, **kwargs):
+        raise AssertionError("compute não deveria carregar o índice inteiro")
+
+    monkeypatch.setattr(usage, "read_index", no_full_load)
+
+    assert usage.compute(indexes, retention=2).as_dict() == expected
+
+def test_update_is_incremental_and_cache_tracks_snapshot_set(tmp_path):
+    s1, _, _ = _make_target(tmp_path)
+    usage.update(tmp_path, retention=2)
+    index = tmp_path / usage.USAGE_DIRNAME / "s1.idx"
+    kept = tmp_path / usage.USAGE_DIRNAME / "s3.idx"
+    kept_mtime = kept.stat().st_mtime_ns
+
+    os.rename(s1, tmp_path / "s1-trash")
+    assert usage.load_cached(tmp_path, retention=2) is None
+    report = usage.update(tmp_path, retention=2)
+
+    assert [s.name for s in report.snapshots] == ["s2", "s3"]
+    assert not index.exists()
+    assert usage.load_cached(tmp_path, retention=2).total_bytes == report.total_bytes
+    assert kept.stat().st_mtime_ns == kept_mtime
+
+
+def test_run_command_prints_cached_report(tmp_path, capsys):
+    _make_target(tmp_path)
+    args = argparse.Namespace(refresh=False, retention=2)
+
+    assert usage.run_command(args, tmp_path) == 0
+    assert usage.run_command(args, tmp_path) == 0
+
+    out = capsys.readouterr().out
+    assert out.count("exclusivo=") == 6
+    assert "retenção 2: libera" in out
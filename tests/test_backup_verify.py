@@ -0,0 +1,117 @@
+"""Testes da verificação incremental de integridade dos snapshots."""
+from __future__ import annotations
+
+import os
+import zlib
+
+from core.backup import chunkstore, verify
+
+
+def _snapshot(snapshots, name, previous=None, files=None):
+    snap = snapshots / name
+    (snap / "sub").mkdir(parents=True)
+    if previous is not None:
+        for rel in ("a.txt", "sub/big.bin"):
+            os.link(previous / rel, snap / rel)
+    for rel, data in (files or {}).items():
+        (snap / rel).write_bytes(data)
+    return snap
+
+
+def test_hash_file_uses_same_digest_for_mmap_and_buffered_reads(tmp_path, monkeypatch):
+    path = tmp_path / "big.bin"
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+
+    mapped = verify.hash_file(str(path))
+    monkeypatch.setattr(verify, "MMAP_THRESHOLD", 1 << 40)
+
+    assert verify.hash_file(str(path)) == mapped
+
+
+def test_verify_hashes_each_inode_once_and_is_incremental(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    db = tmp_path / verify.VERIFY_DB_NAME
+    first = _snapshot(snapshots, "s1", files={"a.txt": b"alpha", "sub/big.bin": os.urandom(2 * 1024 * 1024)})
+    _snapshot(snapshots, "s2", previous=first, files={"novo.txt": b"novo"})
+
+    report = verify.verify_snapshots(snapshots, db, workers=2)
+
+    assert report.ok
+    assert (report.files, report.inodes, report.hashed) == (5, 3, 3)
+
+    _snapshot(snapshots, "s3", previous=first, files={"outro.txt": b"outro"})
+    second = verify.verify_snapshots(snapshots, db)
+
+    assert second.snapshots == ["s3"]
+    assert (second.hashed, second.reused) == (1, 2)
+
+
+def test_verify_full_detects_bit_rot_and_keeps_original_digest(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    db = tmp_path / verify.VERIFY_DB_NAME
+    first = _snapshot(snapshots, "s1", files={"a.txt": b"alpha", "sub/big.bin": b"b" * 4096})
+    verify.verify_snapshots(snapshots, db)
+    target = first / "sub" / "big.bin"
+    st = target.stat()
+    with open(target, "r+b") as handle:
+        handle.seek(100)
+        handle.write(b"X")
+    os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert verify.verify_snapshots(snapshots, db).snapshots == []
+    full = verify.verify_snapshots(snapshots, db, full=True)
+    again = verify.verify_snapshots(snapshots, db, full=True)
+
+    assert full.mismatches == [str(target)]
+    assert again.mismatches == [str(target)]
+
+
+def test_forget_snapshots_allows_reverification(tmp_path):
+    snapshots = tmp_path / "snapshots"
+    db = tmp_path / verify.VERIFY_DB_NAME
+    _snapshot(snapshots, "s1", files={"a.txt": b"alpha"})
+    verify.verify_snapshots(snapshots, db)
+
+    verify.forget_snapshots(db, ["s1"])
+
+    assert verify.verify_snapshots(snapshots, db).snapshots == ["s1"]
+
+
+def test_verify_reads_every_chunk_of_chunkstore_snapshots(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.bin").write_bytes(os.urandom(200_000))
+    (source / "b.txt").write_bytes(b"beta")
+    target = tmp_path / "target"
+    snapshots, store = target / "snapshots", target / chunkstore.CHUNKS_DIRNAME
+    chunkstore.backup_tree(source, snapshots / "s1", store)
+    chunkstore.backup_tree(source, snapshots / "s2", store, previous=snapshots / "s1")
+    db = target / verify.VERIFY_DB_NAME
+    chunk_files = sorted(path for path in store.rglob("*") if path.is_file())
+
+    report = verify.verify_snapshots(snapshots, db)
+
+    assert report.ok
+    assert (report.files, report.inodes) == (4, 0)
+    assert report.chunks == report.chunks_verified == len(chunk_files)
+    assert verify.verify_snapshots(snapshots, db, names=["s2"]).chunks_verified == 0
+
+    chunk_files[0].write_bytes(zlib.compress(b"apodreceu"))
+    chunk_files[1].unlink()
+    rotted = verify.verify_snapshots(snapshots, db, full=True)
+
+    assert rotted.mismatches == [str(chunk_files[0])]
+    assert len(rotted.errors) == 1 and str(chunk_files[1]) in rotted.errors[0]
+
+
+def test_verify_refuses_chunkstore_snapshot_without_chunk_dir(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"alpha")
+    snapshots = tmp_path / "target" / "snapshots"
+    chunkstore.backup_tree(source, snapshots / "s1", tmp_path / "elsewhere")
+
+    report = verify.verify_snapshots(snapshots, tmp_path / verify.VERIFY_DB_NAME)
+
+    assert not report.ok
+    assert "diretório de chunks inexistente" in report.errors[0]
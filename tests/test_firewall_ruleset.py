@@ -0,0 +1,268 @@
+"""Testes da análise de ruleset (nft JSON e iptables-save) com runner falso."""
+from __future__ import annotations
+
+import json
+import subprocess
+
+from infra.provision import analyze_firewall
+
+IPTABLES_SAVE = """\
+# Generated by iptables-save v1.8.7
+*nat
+:PREROUTING ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+:DOCKER - [0:0]
+-A PREROUTING -m addrtype --dst-type LOCAL -j DOCKER
+-A POSTROUTING -s 172.17.0.0/16 ! -o docker0 -j MASQUERADE
+-A DOCKER -i docker0 -j RETURN
+-A DOCKER ! -i docker0 -p tcp -m tcp --dport 8080 -j DNAT --to-destination 172.17.0.2:80
+-A DOCKER ! -i docker0 -p tcp -m tcp --dport 8443 -j DNAT --to-destination 172.17.0.3:443
+COMMIT
+*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+:DOCKER - [0:0]
+:DOCKER-USER - [0:0]
+:ufw-user-input - [0:0]
+-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT
+-A INPUT -i lo -j ACCEPT
+-A INPUT -j ufw-user-input
+-A FORWARD -j DOCKER-USER
+-A FORWARD -o docker0 -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT
+-A FORWARD -o docker0 -j DOCKER
+-A DOCKER -d 172.17.0.2/32 ! -i docker0 -o docker0 -p tcp -m tcp --dport 80 -j ACCEPT
+-A DOCKER -d 172.17.0.3/32 ! -i docker0 -o docker0 -p tcp -m tcp --dport 443 -j ACCEPT
+-A DOCKER-USER -j RETURN
+-A ufw-user-input -p tcp -m tcp --dport 22 -j ACCEPT
+-A ufw-user-input -p tcp -m tcp --dport 80 -j ACCEPT
+-A ufw-user-input -p tcp -m tcp --dport 443 -j ACCEPT
+-A ufw-user-input -p tcp -m tcp --dport 8096 -j ACCEPT
+-A ufw-user-input -p udp -m udp --dport 51820 -j ACCEPT
+-A ufw-user-input -s 192.168.1.0/24 -p tcp -m tcp --dport 443 -j ACCEPT
+-A ufw-user-input -p tcp -m tcp --dport 0:1023 -j DROP
+-A ufw-user-input -p tcp -m tcp --dport 22 -j DROP
+COMMIT
+"""
+
+
+def _nft_ruleset() -> str:
+    def port_rule(handle, port, verdict):
+        return {
+            "rule": {
+                "family": "inet",
+                "table": "filter",
+                "chain": "input",
+                "handle": handle,
+                "expr": [
+                    {"match": {"op": "==", "left": {"payload": {"protocol": "tcp", "field": "dport"}}, "right": port}},
+                    {"counter": {"packets": 0, "bytes": 0}},
+                    verdict,
+                ],
+            }
+        }
+
+    items = [
+        {"table": {"family": "inet", "name": "filter"}},
+        {
+            "chain": {
+                "family": "inet", "table": "filter", "name": "input",
+                "type": "filter", "hook": "input", "prio": 0, "policy": "drop",
+            }
+        },
+        {"chain": {"family": "inet", "table": "filter", "name": "ssh"}},
+        {
+            "rule": {
+                "family": "inet", "table": "filter", "chain": "input",
+                "expr": [
+                    {"match": {"op": "in", "left": {"ct": {"key": "state"}}, "right": ["established", "related"]}},
+                    {"accept": None},
+                ],
+            }
+        },
+        port_rule(2, 22, {"jump": {"target": "ssh"}}),
+        port_rule(3, 80, {"accept": None}),
+        port_rule(4, 443, {"accept": None}),
+        port_rule(5, 8080, {"accept": None}),
+        port_rule(6, 9000, {"accept": None}),
+        port_rule(7, {"set": [80, {"range": [8000, 8100]}]}, {"drop": None}),
+        port_rule(8, 9000, {"drop": None}),
+        {
+            "rule": {
+                "family": "inet", "table": "filter", "chain": "ssh",
+                "expr": [
+                    {
+                        "match": {
+                            "op": "==",
+                            "left": {"payload": {"protocol": "ip", "field": "saddr"}},
+                            "right": {"prefix": {"addr": "10.8.0.0", "len": 24}},
+                        }
+                    },
+                    {"accept": None},
+                ],
+            }
+        },
+    ]
+    return json.dumps({"nftables": [{"metainfo": {"json_schema_version": 1}}] + items})
+
+
+def _runner(outputs):
+    calls = []
+
+    def fake(cmd):
+        calls.append(cmd)
+        returncode, stdout = outputs.get(cmd[0], (127, ""))
+        return subprocess.CompletedProcess(cmd, returncode, stdout=stdout, stderr="")
+
+    fake.calls = calls
+    return fake
+
+
+def test_load_ruleset_falls_back_to_iptables_save():
+    runner = _runner({"nft": (1, ""), "iptables-save": (0, IPTABLES_SAVE), "ip6tables-save": (0, "")})
+
+    ruleset = analyze_firewall.load_ruleset(runner)
+
+    assert ruleset.backend == "iptables"
+    assert [call[0] for call in runner.calls] == ["nft", "iptables-save", "ip6tables-save"]
+    chain = ruleset.find("ip", "filter", "ufw-user-input")
+    assert len(chain.rules) == 8
+    assert ruleset.find("ip", "filter", "INPUT").policy == "drop"
+
+
+def test_simulate_counts_rules_through_jumps():
+    ruleset = analyze_firewall.parse_iptables_save(IPTABLES_SAVE)
+    packet = analyze_firewall.Packet("ip", "tcp", 443, saddr="203.0.113.10", daddr="192.0.2.2")
+
+    result = analyze_firewall.simulate(ruleset, packet)
+    closed = analyze_firewall.simulate(ruleset, analyze_firewall.Packet("ip", "tcp", 3306, saddr="203.0.113.10"))
+    established = analyze_firewall.simulate(
+        ruleset, analyze_firewall.Packet("ip", "tcp", 3306, ct_state="established")
+    )
+
+    assert (result.verdict, result.rules) == ("accept", 6)
+    assert result.path == ["INPUT", "ufw-user-input", "#3 accept"]
+    assert (closed.verdict, closed.rules) == ("drop", 11)
+    assert closed.path[-1] == "política drop"
+    assert (established.verdict, established.rules) == ("accept", 1)
+    assert analyze_firewall.worst_case(ruleset, ruleset.find("ip", "filter", "INPUT")) == 11
+
+
+def test_shadowed_and_redundant_rules_are_reported():
+    ruleset = analyze_firewall.parse_iptables_save(IPTABLES_SAVE)
+
+    findings = analyze_firewall.find_shadowed(ruleset)
+
+    messages = [(f.level, f.message.split(" (")[0]) for f in findings]
+    assert ("AVISO", "Regra redundante ip filter ufw-user-input #6") in messages
+    assert ("ERRO", "Regra sombreada ip filter ufw-user-input #8") in messages
+    assert len(findings) == 2
+
+
+def test_linear_port_lists_suggest_sets_and_vmaps():
+    iptables = analyze_firewall.find_linear_port_lists(analyze_firewall.parse_iptables_save(IPTABLES_SAVE))
+    nft = analyze_firewall.parse_nft_json(_nft_ruleset())
+    runs = analyze_firewall.find_linear_port_lists(nft)
+
+    assert len(iptables) == 1 and "#1-#4" in iptables[0].message and "multiport" in iptables[0].message
+    # A regra do ssh é um jump e quebra a sequência de accepts.
+    assert len(runs) == 1 and "#3-#6" in runs[0].message and "80, 443, 8080, 9000" in runs[0].message
+    jumps = "\n".join(f"-A INPUT -p tcp --dport {port} -j svc{port}" for port in (22, 80, 443, 8080))
+    vmap = analyze_firewall.find_linear_port_lists(analyze_firewall.parse_iptables_save(f"*filter\n{jumps}\n"))
+    assert len(vmap) == 1 and "verdict map" in vmap[0].message
+
+
+def test_nft_json_ranges_sets_and_prefixes():
+    ruleset = analyze_firewall.parse_nft_json(_nft_ruleset())
+    source = {"saddr": "203.0.113.10"}
+
+    vpn = analyze_firewall.simulate(ruleset, analyze_firewall.Packet("ip", "tcp", 22, saddr="10.8.0.5"))
+    wan = analyze_firewall.simulate(ruleset, analyze_firewall.Packet("ip", "tcp", 22, **source))
+    ranged = analyze_firewall.simulate(ruleset, analyze_firewall.Packet("ip", "tcp", 8050, **source))
+
+    assert (vpn.verdict, vpn.path) == ("accept", ["input", "ssh", "#1 accept"])
+    assert wan.verdict == "drop" and wan.path[-1] == "política drop"
+    assert ranged.path[-1] == "#7 drop"
+    shadowed = analyze_firewall.find_shadowed(ruleset)
+    assert [f.level for f in shadowed] == ["ERRO"]
+    # O #7 só é coberto em parte (80 e 8080); o #8 repete a porta do #6 com veredito oposto.
+    assert "input #8" in shadowed[0].message and "#6" in shadowed[0].message
+
+
+def test_docker_published_ports_bypass_ufw(capsys):
+    runner = _runner({"iptables-save": (0, IPTABLES_SAVE), "ip6tables-save": (0, "")})
+
+    code = analyze_firewall.main(["--backend", "iptables"], runner=runner)
+
+    output = capsys.readouterr().out
+    assert code == 1
+    assert "ip 8080/tcp publicada -> 172.17.0.2:80: ACCEPT" in output
+    assert "[ERRO] Portas publicadas pelo Docker passam pelo FORWARD" in output
+    assert "8080/tcp, 8443/tcp" in output
+
+
+def test_docker_user_filter_silences_bypass_error():
+    filtered = IPTABLES_SAVE.replace(
+        "-A DOCKER-USER -j RETURN", "-A DOCKER-USER -i eth0 -p tcp -m tcp --dport 80 -j DROP\n-A DOCKER-USER -j RETURN"
+    )
+    ruleset = analyze_firewall.parse_iptables_save(filtered)
+
+    lines, findings = analyze_firewall.analyze(ruleset)
+
+    assert not any("FORWARD" in f.message for f in findings)
+    assert any("8080/tcp publicada -> 172.17.0.2:80: DROP" in line for line in lines)
+
+
+def test_main_reports_missing_backends(capsys):
+    code = analyze_firewall.main([], runner=_runner({}))
+
+    assert code == 2
+    assert "[ERRO] Não foi possível ler o ruleset" in capsys.readouterr().out
+
+
+def test_nft_named_sets_are_resolved(tmp_path, capsys):
+    def rule(handle, match, verdict):
+        return {
+            "rule": {
+                "family": "inet", "table": "filter", "chain": "input", "handle": handle,
+                "expr": [{"match": match}, verdict],
+            }
+        }
+
+    dport = {"payload": {"protocol": "tcp", "field": "dport"}}
+    saddr = {"payload": {"protocol": "ip", "field": "saddr"}}
+    items = [
+        {
+            "chain": {
+                "family": "inet", "table": "filter", "name": "input",
+                "type": "filter", "hook": "input", "prio": 0, "policy": "drop",
+            }
+        },
+        {
+            "set": {
+                "family": "inet", "table": "filter", "name": "allowed", "type": "inet_service", "flags": ["interval"],
+                "elem": [22, {"elem": {"val": 443, "counter": {"packets": 0, "bytes": 0}}}, {"range": [8000, 8100]}],
+            }
+        },
+        {
+            "set": {
+                "family": "inet", "table": "filter", "name": "blocklist", "type": "ipv4_addr",
+                "flags": ["dynamic", "timeout"],
+            }
+        },
+        rule(1, {"op": "==", "left": saddr, "right": "@blocklist"}, {"drop": None}),
+        rule(2, {"op": "==", "left": dport, "right": "@allowed"}, {"accept": None}),
+        rule(3, {"op": "==", "left": dport, "right": 443}, {"drop": None}),
+    ]
+    path = tmp_path / "ruleset.json"
+    path.write_text(json.dumps({"nftables": items}))
+
+    ruleset = analyze_firewall.parse_nft_json(path.read_text())
+    packet = analyze_firewall.Packet("ip", "tcp", 8050, saddr="203.0.113.10")
+
+    # Set dinâmico vira critério desconhecido: conta no custo mas não casa.
+    assert analyze_firewall.simulate(ruleset, packet).path[-1] == "#2 accept"
+    shadowed = analyze_firewall.find_shadowed(ruleset)
+    assert len(shadowed) == 1 and "input #3" in shadowed[0].message and "#2" in shadowed[0].message
+    assert analyze_firewall.main(["--file", str(path)]) == 1
+    assert "Não foi possível ler o ruleset" not in capsys.readouterr().out
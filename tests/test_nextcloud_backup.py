@@ -1,9 +1,16 @@
 import json
+import subprocess
 from pathlib import Path
 
+import pytest
+
+from core.backup import profiles, replicate, staging
+from core.nextcloud import backup_nextcloud
 from core.nextcloud.backup_nextcloud import (
     build_rsync_command,
+    build_shard_command,
     parse_args,
+    partition_source,
     prune_snapshots,
     _write_status,
 )
@@ -21,6 +28,7 @@ def test_build_rsync_command_includes_link_dest(tmp_path):
 
     assert "--link-dest" in cmd
     assert "--dry-run" in cmd
+    assert "--partial-dir=.rsync-partial" in cmd
     assert str(link_dest.resolve()) in cmd
     assert str(snapshot.resolve()) in cmd[-1]
 
@@ -67,3 +75,313 @@ def test_parse_args_overrides_defaults(tmp_path, monkeypatch):
     assert Path(args.target) == Path("/tmp/target")
     assert args.retention == 10
     assert args.log_file == env_log
+
+
+def test_partition_source_splits_users_and_appdata(tmp_path):
+    source = tmp_path / "html"
+    for rel in ["data/alice/files", "data/bob/files", "data/appdata_oc123/preview", "apps/files", "config"]:
+        (source / rel).mkdir(parents=True)
+    (source / "data" / "nextcloud.log").write_text("log")
+
+    shards = partition_source(source)
+
+    names = [s.name for s in shards]
+    assert names == ["data/alice", "data/appdata_oc123", "data/bob", "_resto"]
+    rest = shards[-1]
+    assert rest.relative is None
+    assert rest.excludes == ("/data/alice/", "/data/appdata_oc123/", "/data/bob/")
+
+
+def test_build_shard_command_scopes_link_dest(tmp_path):
+    source = tmp_path / "html"
+    (source / "data" / "alice").mkdir(parents=True)
+    previous = tmp_path / "previous"
+    (previous / "data" / "alice").mkdir(parents=True)
+    snapshot = tmp_path / "snapshot"
+
+    shard, rest = partition_source(source)
+    cmd = build_shard_command(source, snapshot, previous, shard)
+    rest_cmd = build_shard_command(source, snapshot, previous, rest)
+
+    assert cmd[-2] == f"{(source / 'data' / 'alice').resolve()}/"
+    assert cmd[-1] == f"{(snapshot / 'data' / 'alice').resolve()}/"
+    assert str((previous / "data" / "alice").resolve()) in cmd
+    assert "--exclude=/data/alice/" in rest_cmd
+    assert str(previous.resolve()) in rest_cmd
+
+
+def test_run_backup_sharded_reports_failures_per_shard(tmp_path, monkeypatch):
+    source = tmp_path / "html"
+    for rel in ["data/alice", "data/bob"]:
+        (source / rel).mkdir(parents=True)
+    target = tmp_path / "target"
+    calls = []
+
+    def fake_rsync(cmd, *args, **kwargs):
+        calls.append(cmd)
+        return 23 if cmd[-2].rstrip("/").endswith("bob") else 0
+
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", fake_rsync)
+
+    code = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=3, jobs=3)
+
+    assert code == 23
+    assert len(calls) == 3
+    assert not (target / "latest").exists()
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["success"] is False
+    by_name = {shard["name"]: shard["returncode"] for shard in status["shards"]}
+    assert by_name == {"data/alice": 0, "data/bob": 23, "_resto": 0}
+
+
+def test_run_backup_sharded_rebases_exclusion_profiles(tmp_path, monkeypatch):
+    source = tmp_path / "html"
+    (source / "data" / "appdata_oc1" / "preview").mkdir(parents=True)
+    (source / "data" / "appdata_oc1" / "preview" / "p.png").write_bytes(b"p" * 10)
+    (source / "data" / "alice" / "files").mkdir(parents=True)
+    target = tmp_path / "target"
+    calls = []
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", lambda cmd, *a, **kw: calls.append(cmd) or 0)
+    rules = profiles.resolve("nextcloud", ["previews"])
+
+    code = backup_nextcloud.run_backup(
+        source, target, tmp_path / "backup.log", retention=3, jobs=2, exclude_rules=rules
+    )
+
+    assert code == 0
+    by_source = {Path(cmd[-2]).name: cmd for cmd in calls}
+    assert "--exclude=/preview/" in by_source["appdata_oc1"]
+    assert not any(arg.startswith("--exclude=/preview") for arg in by_source["alice"])
+    assert "--exclude=/data/appdata_*/preview/" in by_source["html"]
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["exclusions"]["rules"] == [
+        {"profile": "previews", "pattern": "/data/appdata_*/preview/", "matches": 1, "files": 1, "bytes": 10}
+    ]
+
+
+class FakeOcc:
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = set(fail_on)
+
+    def __call__(self, cmd):
+        self.calls.append(cmd[-1])
+        code = 1 if cmd[-1] in self.fail_on else 0
+        return subprocess.CompletedProcess(cmd, code, stdout=f"maintenance {cmd[-1]}", stderr="")
+
+
+def test_build_occ_command_runs_as_www_data(tmp_path):
+    cmd = backup_nextcloud.build_occ_command(tmp_path / "compose.yml", ["maintenance:mode", "--on"])
+
+    assert cmd[:4] == ["docker", "compose", "-f", str(tmp_path / "compose.yml")]
+    assert cmd[cmd.index("-u") + 1] == "www-data"
+    assert cmd[-4:] == ["php", "occ", "maintenance:mode", "--on"]
+
+
+def test_run_backup_two_phase_runs_delta_inside_maintenance(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    occ = FakeOcc()
+    passes = []
+
+    def fake_rsync(cmd, *args, **kwargs):
+        passes.append((kwargs.get("label", "rsync"), list(occ.calls)))
+        return 0
+
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", fake_rsync)
+
+    code = backup_nextcloud.run_backup(
+        source, target, tmp_path / "backup.log", retention=3, two_phase=True, occ_runner=occ
+    )
+
+    assert code == 0
+    assert passes == [("rsync", []), ("delta", ["--on"])]
+    assert occ.calls == ["--on", "--off"]
+    status = json.loads((target / "last_run.json").read_text())
+    maintenance = status["maintenance"]
+    assert maintenance["disabled"] is True
+    assert maintenance["downtime_s"] >= 0
+    assert "warm_pass_s" in maintenance and "final_pass_s" in maintenance
+
+
+def test_run_backup_two_phase_disables_maintenance_on_failure(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    occ = FakeOcc()
+
+    def fake_rsync(cmd, *args, **kwargs):
+        if kwargs.get("label") == "delta":
+            raise OSError("disco cheio")
+        return 0
+
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", fake_rsync)
+
+    with pytest.raises(OSError):
+        backup_nextcloud.run_backup(
+            source, target, tmp_path / "backup.log", retention=3, two_phase=True, occ_runner=occ
+        )
+
+    assert occ.calls == ["--on", "--off"]
+
+
+def test_run_backup_two_phase_aborts_when_maintenance_fails(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    occ = FakeOcc(fail_on={"--on"})
+    labels = []
+    monkeypatch.setattr(
+        backup_nextcloud, "_run_rsync", lambda cmd, *a, **kw: labels.append(kw.get("label", "rsync")) or 0
+    )
+
+    code = backup_nextcloud.run_backup(
+        source, target, tmp_path / "backup.log", retention=3, two_phase=True, occ_runner=occ
+    )
+
+    assert code == 1
+    assert labels == ["rsync"]
+    assert not (target / "latest").exists()
+
+
+def test_run_backup_cache_friendly_releases_pages(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "arquivo.txt").write_text("conteudo")
+    target = tmp_path / "backups"
+    commands = []
+
+    def fake_rsync(cmd, *args, **kwargs):
+        commands.append(kwargs.get("cache_friendly"))
+        (Path(cmd[-1]) / "arquivo.txt").write_text("conteudo")
+        return 0
+
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", fake_rsync)
+
+    code = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=3, cache_friendly=True)
+
+    assert code == 0
+    assert commands == [True]
+    page_cache = json.loads((target / "last_run.json").read_text())["page_cache"]
+    assert page_cache["dropped"]["files"] == 2
+    assert "kept_ratio" in page_cache
+
+
+def test_run_backup_passes_older_generations_as_link_dest(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    snapshots = target / "snapshots"
+    for name in ("20240101_000000", "20240102_000000", "20240103_000000"):
+        (snapshots / name).mkdir(parents=True)
+    (target / "latest").symlink_to(snapshots / "20240103_000000")
+    commands = []
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", lambda cmd, *a, **kw: commands.append(cmd) or 0)
+
+    code = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=5, link_generations=3)
+
+    assert code == 0
+    link_dests = [commands[0][i + 1] for i, arg in enumerate(commands[0]) if arg == "--link-dest"]
+    assert [Path(p).name for p in link_dests] == ["20240103_000000", "20240102_000000", "20240101_000000"]
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["links"]["files_copied"] == 0
+
+
+def test_run_backup_skips_link_measurement_with_single_generation(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", lambda cmd, *a, **kw: 0)
+
+    def fail_walk(*args, **kwargs):
+        raise AssertionError("measure_links não deveria percorrer o snapshot")
+
+    monkeypatch.setattr(backup_nextcloud.linkdest, "measure_links", fail_walk)
+
+    code = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=5)
+
+    assert code == 0
+    assert "links" not in json.loads((target / "last_run.json").read_text())
+
+
+def test_run_backup_resumes_interrupted_snapshot(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    stamps = iter(["20240101_000000", "20240102_000000"])
+    monkeypatch.setattr(backup_nextcloud, "_timestamp", stamps.__next__)
+    destinations = []
+
+    def fake_rsync(cmd, *args, **kwargs):
+        destination = Path(cmd[-1])
+        destinations.append(destination)
+        (destination / "parte.txt").write_text("x")
+        return 23 if len(destinations) == 1 else 0
+
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", fake_rsync)
+
+    first = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=3)
+    assert first == 23
+    assert not (target / "latest").exists()
+    assert list((target / "snapshots").iterdir()) == []
+    assert (target / "incomplete" / "20240101_000000" / "parte.txt").exists()
+
+    second = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=3)
+
+    assert second == 0
+    assert destinations[0] == destinations[1]
+    assert [p.name for p in (target / "snapshots").iterdir()] == ["20240101_000000"]
+    assert (target / "latest").resolve() == (target / "snapshots" / "20240101_000000").resolve()
+    assert not (target / "incomplete" / "20240101_000000").exists()
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["resumed"] is True
+
+
+def test_run_backup_refuses_to_run_while_locked(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    target = tmp_path / "backups"
+    target.mkdir()
+    calls = []
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", lambda cmd, *a, **kw: calls.append(cmd) or 0)
+
+    with staging.acquire_lock(target):
+        code = backup_nextcloud.run_backup(source, target, tmp_path / "backup.log", retention=3)
+
+    assert code == staging.LOCK_BUSY_CODE
+    assert calls == []
+    assert not (target / "latest").exists()
+
+
+def test_run_backup_replicates_finished_snapshot(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "doc.txt").write_text("conteudo")
+    target = tmp_path / "backups"
+    usb = tmp_path / "usb"
+    usb.mkdir()
+    replicas = replicate.parse_targets(f"{usb}=10,{tmp_path / 'ausente'}")
+
+    code = backup_nextcloud.run_backup(
+        source, target, tmp_path / "backup.log", retention=3, engine="native", replicas=replicas
+    )
+
+    assert code == 0
+    status = json.loads((target / "last_run.json").read_text())
+    ok, missing = status["replication"]
+    assert ok["success"] is True and ok["copied"] == 1
+    assert missing["success"] is False
+    assert (usb / "latest" / "doc.txt").read_text() == "conteudo"
+
+
+def test_main_verify_subcommand_reports_snapshots(tmp_path, capsys):
+    snapshot = tmp_path / "backups" / "snapshots" / "20240101_000000"
+    snapshot.mkdir(parents=True)
+    (snapshot / "arquivo.txt").write_text("conteudo")
+
+    code = backup_nextcloud.main(["--target", str(tmp_path / "backups"), "verify", "--workers", "1"])
+
+    assert code == 0
+    assert "snapshots=1" in capsys.readouterr().out
+    assert (tmp_path / "backups" / "verify.sqlite3").exists()
@@ -0,0 +1,88 @@
+"""Testes do estágio de dump do PostgreSQL do Nextcloud (sem Docker, via runner fake)."""
+from __future__ import annotations
+
+import gzip
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from core.nextcloud import backup_nextcloud, db_dump
+
+
+class FakeRunner:
+    """Substitui `docker compose exec` por processos Python locais."""
+
+    def __init__(self, payload: bytes = b"-- dump do nextcloud\n" * 1000, fail_dump: bool = False):
+        self.payload = payload
+        self.fail_dump = fail_dump
+        self.calls: list[list[str]] = []
+
+    def __call__(self, cmd):
+        self.calls.append(list(cmd))
+        inner = cmd[cmd.index("-T") + 2 :]
+        if inner[0] == "pg_dump" and self.fail_dump:
+            script = "import sys; sys.stderr.write('connection refused'); sys.exit(1)"
+        elif inner[0] == "pg_dump" and "--format=directory" in inner:
+            script = "pass"
+        elif inner[0] in ("pg_dump", "tar"):
+            script = f"import sys; sys.stdout.buffer.write({self.payload!r})"
+        else:
+            script = "pass"
+        return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_build_pg_dump_command_runs_inside_postgres_service():
+    compose = Path("/srv/homelab/core/docker-compose.yml")
+    config = db_dump.DumpConfig(compose_file=compose, dump_format="directory", jobs=4)
+
+    cmd = db_dump.build_pg_dump_command(config)
+
+    assert cmd[:7] == ["docker", "compose", "-f", str(compose), "exec", "-T", "postgres"]
+    assert "--format=directory" in cmd
+    assert "--jobs=4" in cmd
+
+
+def test_dump_database_streams_through_compressor(tmp_path):
+    runner = FakeRunner()
+    config = db_dump.DumpConfig(compressor=["gzip", "-c"])
+
+    info = db_dump.dump_database(config, tmp_path / "db", runner=runner)
+
+    dump_file = Path(info["file"])
+    assert dump_file.name == "nextcloud.custom.gz"
+    assert gzip.decompress(dump_file.read_bytes()) == runner.payload
+    assert info["bytes"] < len(runner.payload)
+    assert "--compress=0" in runner.calls[0]
+
+
+def test_dump_database_directory_format_exports_tar_and_cleans_up(tmp_path):
+    runner = FakeRunner(payload=b"tar-bytes")
+
+    info = db_dump.dump_database(db_dump.DumpConfig(dump_format="directory"), tmp_path, runner=runner)
+
+    assert Path(info["file"]).read_bytes() == b"tar-bytes"
+    inner = [call[call.index("-T") + 2] for call in runner.calls]
+    assert inner == ["rm", "pg_dump", "tar", "rm"]
+
+
+def test_run_backup_fails_when_dump_fails(tmp_path, monkeypatch):
+    source = tmp_path / "html"
+    source.mkdir()
+    target = tmp_path / "target"
+    monkeypatch.setattr(backup_nextcloud, "_run_rsync", lambda cmd, *args, **kwargs: 0)
+
+    code = backup_nextcloud.run_backup(
+        source,
+        target,
+        tmp_path / "nc.log",
+        retention=3,
+        db_config=db_dump.DumpConfig(compressor=["gzip", "-c"]),
+        db_runner=FakeRunner(fail_dump=True),
+    )
+
+    assert code == 1
+    status = json.loads((target / "last_run.json").read_text())
+    assert "connection refused" in status["db_dump"]["error"]
+    assert not (target / "latest").exists()
+    assert not list((target / "db").rglob("*.tmp"))
@@ -1,4 +1,4 @@
-"""Testes da validação do host (US-001).
+"""Testes da validação do host (US-001) e da varredura de portas do firewall (US-012).
 
 Usa mocks para evitar alterações reais no host. Garante que:
 - Apenas Debian/Ubuntu são aceitos.
@@ -7,10 +7,18 @@ Usa mocks para evitar alterações reais no host. Garante que:
 """
 from __future__ import annotations
 
+import errno
+import os
+import socket
+import struct
 import subprocess
+import threading
+import time
 from pathlib import Path
 
-from infra.provision import validate_host
+import pytest
+
+from infra.provision import validate_firewall, validate_host
 
 
 def test_accepts_debian_os():
@@ -42,6 +50,108 @@ def test_missing_packages_are_reported(tmp_path: Path):
     assert missing == ["unattended-upgrades"]
 
 
+DPKG_STATUS = """\
+Package: openssh-server
+Status: install ok installed
+Priority: optional
+Architecture: arm64
+Version: 1:9.2p1-2+deb12u3
+Description: secure shell (SSH) server
+ Linha de continuação que cita Package: falso
+ .
+ Outra linha.
+
+Package: curl
+Status: install ok installed
+Architecture: arm64
+Version: 7.88.1-10+deb12u8
+
+Package: libc6
+Status: install ok installed
+Multi-Arch: same
+Architecture: arm64
+Version: 2.36-9+deb12u13
+
+Package: libc6
+Status: install ok installed
+Multi-Arch: same
+Architecture: armhf
+Version: 2.36-9+deb12u13
+
+Package: sudo
+Status: deinstall ok config-files
+Architecture: arm64
+Version: 1.9.13p3-1+deb12u1
+
+Package: ca-certificates
+Status: install ok installed
+Architecture: all
+Version: 20230311
+"""
+
+
+def test_dpkg_status_index_is_read_once(tmp_path: Path):
+    status = tmp_path / "status"
+    status.write_text(DPKG_STATUS)
+
+    index = validate_host.read_dpkg_status(status)
+
+    assert sorted(index) == ["ca-certificates", "curl", "libc6", "openssh-server"]
+    assert [pkg.arch for pkg in index["libc6"]] == ["arm64", "armhf"]
+    assert index["openssh-server"][0].version == "1:9.2p1-2+deb12u3"
+
+
+def test_packages_checked_against_index_with_constraints(tmp_path: Path):
+    status = tmp_path / "status"
+    status.write_text(DPKG_STATUS)
+
+    def failing_runner(cmd: list[str]) -> subprocess.CompletedProcess[str]:
+        raise AssertionError("com índice não deve haver subprocess")
+
+    missing = validate_host.check_packages_installed(
+        [
+            "openssh-server (>= 1:9.0)",
+            "curl>=7.88",
+            "curl<<7.88.1",
+            "libc6:armhf",
+            "libc6:amd64",
+            "ca-certificates:arm64",
+            "sudo",
+        ],
+        runner=failing_runner,
+        index=validate_host.read_dpkg_status(status),
+    )
+
+    assert missing == ["curl<<7.88.1 (instalado 7.88.1-10+deb12u8 (arm64))", "libc6:amd64", "sudo"]
+
+
+@pytest.mark.parametrize(
+    ("left", "right", "expected"),
+    [
+        ("1.0~rc1", "1.0", -1),
+        ("1:0.9", "2.0", 1),
+        ("1.0-1", "1.0-1+b1", -1),
+        ("2.36-9+deb12u13", "2.36-9+deb12u4", 1),
+        ("1.00", "1.0", 0),
+        ("1.0a", "1.0+", -1),
+    ],
+)
+def test_compare_versions_follows_dpkg(left: str, right: str, expected: int):
+    assert validate_host.compare_versions(left, right) == expected
+
+
+def test_runner_fallback_checks_versions():
+    def fake_runner(cmd: list[str]) -> subprocess.CompletedProcess[str]:
+        assert cmd[-1] == "curl:arm64"
+        return subprocess.CompletedProcess(cmd, 0, stdout="install ok installed\t7.74.0-1.3\tarm64\n", stderr="")
+
+    missing = validate_host.check_packages_installed(["curl:arm64>=7.88"], runner=fake_runner)
+
+    assert missing == ["curl:arm64>=7.88 (instalado 7.74.0-1.3 (arm64))"]
+    with pytest.raises(ValueError):
+        validate_host.check_packages_installed(["curl >= "], runner=fake_runner)
+
+
 def test_sshd_password_auth_is_detected(tmp_path: Path):
     sshd_config = tmp_path / "sshd_config"
     dropin_dir = tmp_path / "sshd_config.d"
@@ -69,3 +179,301 @@ def test_sshd_hardening_passes_when_secure(tmp_path: Path):
     ssh_ok, issues = validate_host.check_ssh_hardening(directives)
     assert ssh_ok
     assert issues == []
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def dropping_port():
+    """Porta cuja fila de accept está cheia: o kernel descarta o SYN, como um DROP do firewall."""
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(0)
+    port = sock.getsockname()[1]
+    backlog = []
+    for _ in range(3):
+        client = socket.socket()
+        client.setblocking(False)
+        client.connect_ex(("127.0.0.1", port))
+        backlog.append(client)
+    time.sleep(0.1)
+    yield port
+    for client in backlog:
+        client.close()
+    sock.close()
+
+
+def test_concurrent_scan_matches_serial_scan(listener):
+    ports = range(max(1, listener - 50), min(65535, listener + 50))
+
+    concurrent = validate_firewall.scan_tcp_ports("127.0.0.1", ports, concurrency=8)
+    serial = validate_firewall.scan_tcp_ports_serial("127.0.0.1", ports)
+
+    assert listener in concurrent.open_ports
+    assert concurrent.open_ports == serial.open_ports
+
+
+def test_concurrent_scan_reports_dropped_ports_as_filtered_within_one_timeout(dropping_port, listener):
+    started = time.monotonic()
+    scan = validate_firewall.scan_tcp_ports("127.0.0.1", [dropping_port, listener], timeout=0.3)
+
+    assert time.monotonic() - started < 1.0
+    assert scan.open_ports == {listener}
+    assert scan.filtered_ports == {dropping_port}
+
+
+def test_concurrent_scan_counts_port_reset_right_after_accept_as_open(listener, monkeypatch):
+    """Serviço que aceita e derruba na hora (RST) não pode abortar a varredura."""
+
+    resetting = socket.socket()
+    resetting.bind(("127.0.0.1", 0))
+    resetting.listen(16)
+    reset_port = resetting.getsockname()[1]
+
+    def _accept_and_reset():
+        conn, _ = resetting.accept()
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        conn.close()
+
+    server = threading.Thread(target=_accept_and_reset, daemon=True)
+    server.start()
+
+    class _ResetBeforeSelect(socket.socket):
+        # Torna determinístico o caso em que o RST chega antes do selector reportar o socket.
+        def getpeername(self):
+            raise OSError(errno.ENOTCONN, os.strerror(errno.ENOTCONN))
+
+    monkeypatch.setattr(validate_firewall.socket, "socket", _ResetBeforeSelect)
+    try:
+        scan = validate_firewall.scan_tcp_ports("127.0.0.1", [reset_port, listener], timeout=0.5)
+    finally:
+        monkeypatch.undo()
+        server.join(timeout=1)
+        resetting.close()
+
+    assert scan.open_ports == {reset_port, listener}
+
+
+def test_concurrent_scan_respects_rate_limit(listener):
+    started = time.monotonic()
+    scan = validate_firewall.scan_tcp_ports("127.0.0.1", range(listener, listener + 50), rate=200)
+
+    assert time.monotonic() - started >= 0.2
+    assert listener in scan.open_ports
+
+
+def test_concurrent_scan_supports_ipv6():
+    try:
+        sock = socket.socket(socket.AF_INET6)
+        sock.bind(("::1", 0))
+    except OSError:
+        pytest.skip("IPv6 indisponível")
+    sock.listen(4)
+    port = sock.getsockname()[1]
+    try:
+        scan = validate_firewall.scan_tcp_ports("::1", range(port, port + 1))
+    finally:
+        sock.close()
+
+    assert scan.open_ports == {port}
+
+
+_TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+
+def _proc_line(local: str, remote: str, state: str, inode: int) -> str:
+    return f"   0: {local} {remote} {state} 00000000:00000000 00:00000000 00000000     0        0 {inode} 1\n"
+
+
+def _fake_proc(root: Path) -> Path:
+    net = root / "net"
+    net.mkdir(parents=True)
+    (net / "tcp").write_text(
+        _TCP_HEADER
+        + _proc_line("00000000:01BB", "00000000:0000", "0A", 101)  # 0.0.0.0:443
+        + _proc_line("0100007F:0CEA", "00000000:0000", "0A", 102)  # 127.0.0.1:3306
+        + _proc_line("0100007F:0CEA", "0100007F:D2F0", "01", 103)  # conexão estabelecida
+    )
+    (net / "tcp6").write_text(
+        _TCP_HEADER
+        + _proc_line("00000000000000000000000000000000:1F90", "00000000000000000000000000000000:0000", "0A", 104)
+        + _proc_line("00000000000000000000000001000000:2382", "00000000000000000000000000000000:0000", "0A", 105)
+    )
+    (net / "udp").write_text(_TCP_HEADER + _proc_line("00000000:CA6C", "00000000:0000", "07", 106))
+    (net / "udp6").write_text(_TCP_HEADER)
+    for pid, comm, inodes, cgroup in (
+        (10, "traefik", [101, 104], "0::/system.slice/docker-" + "ab" * 32 + ".scope\n"),
+        (20, "mysqld", [102], "0::/user.slice\n"),
+    ):
+        proc = root / str(pid)
+        (proc / "fd").mkdir(parents=True)
+        (proc / "comm").write_text(comm + "\n")
+        (proc / "cgroup").write_text(cgroup)
+        (proc / "fd" / "0").symlink_to("/dev/null")
+        for number, inode in enumerate(inodes, 3):
+            (proc / "fd" / str(number)).symlink_to(f"socket:[{inode}]")
+    return root
+
+
+def test_read_listeners_parses_proc_net_with_owners(tmp_path: Path):
+    listeners = validate_firewall.read_listeners(_fake_proc(tmp_path))
+
+    summary = {(item.proto, item.address, item.port): item for item in listeners}
+    assert set(summary) == {
+        ("tcp", "0.0.0.0", 443),
+        ("tcp", "127.0.0.1", 3306),
+        ("tcp6", "::", 8080),
+        ("tcp6", "::1", 9090),
+        ("udp", "0.0.0.0", 51820),
+    }
+    https = summary[("tcp", "0.0.0.0", 443)]
+    assert (https.pids, https.process, https.container) == ((10,), "traefik", "ab" * 6)
+    assert summary[("tcp", "127.0.0.1", 3306)].process == "mysqld"
+    assert summary[("udp", "0.0.0.0", 51820)].pids == ()
+
+
+def test_exposed_ports_ignore_loopback_and_include_ipv6_wildcard(tmp_path: Path):
+    listeners = validate_firewall.read_listeners(_fake_proc(tmp_path))
+
+    assert validate_firewall.exposed_ports(listeners, "tcp") == {443, 8080}
+    assert validate_firewall.list_udp_ports(tmp_path) == {51820}
+
+
+def test_container_namespace_listeners_are_not_exposed_on_host(tmp_path: Path, capsys):
+    proc = _fake_proc(tmp_path)
+    (proc / "self" / "ns").mkdir(parents=True)
+    (proc / "self" / "ns" / "net").symlink_to("net:[4026531840]")
+    container = proc / "30"
+    (container / "ns").mkdir(parents=True)
+    (container / "ns" / "net").symlink_to("net:[4026532999]")
+    (container / "net").mkdir()
+    (container / "net" / "tcp").write_text(
+        _TCP_HEADER + _proc_line("00000000:1538", "00000000:0000", "0A", 201)  # 0.0.0.0:5432 (postgres)
+    )
+    (container / "comm").write_text("postgres\n")
+
+    listeners = validate_firewall.read_listeners(proc, all_namespaces=True)
+
+    (postgres,) = [item for item in listeners if item.port == 5432]
+    assert (postgres.netns, postgres.host_netns) == ("net:[4026532999]", False)
+    assert validate_firewall.exposed_ports(listeners, "tcp") == {443, 8080}
+    validate_firewall._print_namespaced(listeners)
+    assert "5432/tcp em 0.0.0.0" in capsys.readouterr().out
+
+
+def test_read_listeners_sees_real_socket_of_this_process():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1)
+    port = sock.getsockname()[1]
+    try:
+        listeners = validate_firewall.read_listeners()
+    finally:
+        sock.close()
+
+    (mine,) = [item for item in listeners if item.port == port and item.proto == "tcp"]
+    assert mine.address == "127.0.0.1"
+    assert not mine.exposed
+    assert os.getpid() in mine.pids
+
+
+def _listen_on(host: str) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.bind((host, 0))
+    sock.listen(4)
+    return sock
+
+
+def test_audit_matrix_uses_per_vantage_allowed_sets():
+    lan = _listen_on("127.0.0.2")
+    port = lan.getsockname()[1]
+    try:
+        vantages = validate_firewall.build_vantages(
+            ["lan=127.0.0.2", "vpn=127.0.0.3"],
+            allow=[f"lan=22,{port}", "vpn=22"],
+            require=[f"vpn={port}"],
+            default_allowed=[],
+            default_required=[],
+        )
+        results = validate_firewall.audit(vantages, range(port, port + 1), concurrency=8)
+    finally:
+        lan.close()
+
+    by_name = {result.vantage.name: result for result in results}
+    assert by_name["lan"].open_ports == {port}
+    assert not by_name["lan"].unexpected
+    assert by_name["vpn"].missing_required == {port}
+    matrix = validate_firewall.render_matrix(results).splitlines()
+    assert matrix[0].split() == ["porta", "lan", "vpn"]
+    assert matrix[1].split() == [str(port), "ok", "FALTA"]
+
+
+def test_audit_flags_port_not_allowed_at_one_vantage():
+    sock = _listen_on("0.0.0.0")
+    port = sock.getsockname()[1]
+    try:
+        vantages = [
+            validate_firewall.Vantage("lan", ["127.0.0.2"], {port}),
+            validate_firewall.Vantage("vpn", ["127.0.0.3"], set()),
+        ]
+        lan, vpn = validate_firewall.audit(vantages, [port])
+    finally:
+        sock.close()
+
+    assert not lan.unexpected
+    assert vpn.unexpected == {port}
+    assert validate_firewall._cell(vpn, port) == "ABERTA"
+
+
+def test_interface_vantages_split_wireguard_subnet():
+    addresses = {"eth0": ["192.168.1.10", "2001:db8::10"], "wg0": ["10.13.13.1"], "docker0": ["172.17.0.1"]}
+
+    vantages = validate_firewall.interface_vantages(addresses, [22, 80], [80], "10.13.13.0/24")
+
+    assert [(v.name, v.hosts) for v in vantages] == [
+        ("docker0", ["172.17.0.1"]),
+        ("eth0", ["192.168.1.10", "2001:db8::10"]),
+        ("vpn", ["10.13.13.1"]),
+    ]
+    assert vantages[0].allowed_tcp == {22, 80} and vantages[0].required_tcp == {80}
+
+
+def test_build_vantages_rejects_unknown_names_and_bad_ports():
+    with pytest.raises(ValueError):
+        validate_firewall.build_vantages(["lan=127.0.0.2"], ["wan=22"], [], [], [])
+    with pytest.raises(ValueError):
+        validate_firewall.build_vantages(["lan=127.0.0.2"], ["lan=ssh"], [], [], [])
+    with pytest.raises(ValueError):
+        validate_firewall.build_vantages(["lan"], [], [], [], [])
+
+
+def test_main_audit_mode_returns_error_for_unexpected_port(capsys):
+    sock = _listen_on("127.0.0.4")
+    port = sock.getsockname()[1]
+    try:
+        code = validate_firewall.main(
+            ["--vantage", "lan=127.0.0.4", "--max-port", str(port), "--required-tcp", "--allowed-tcp", "22"]
+        )
+    finally:
+        sock.close()
+
+    output = capsys.readouterr().out
+    assert code == 1
+    (line,) = [line for line in output.splitlines() if line.startswith("[ERRO] lan: portas TCP não esperadas")]
+    assert str(port) in line
+
+
+def test_build_vantages_applies_permissions_to_interface_vantages():
+    base = validate_firewall.interface_vantages({"wg0": ["10.13.13.1"]}, [22, 80], [], "10.13.13.0/24")
+
+    (vpn,) = validate_firewall.build_vantages([], ["vpn=22"], [], [], [], base)
+
+    assert vpn.allowed_tcp == {22}
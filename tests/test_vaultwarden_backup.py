@@ -1,6 +1,13 @@
 import json
+import shutil
+import sqlite3
+from contextlib import closing
 from pathlib import Path
 
+import pytest
+
+from apps.vaultwarden import backup_vaultwarden
+from core.backup import chunkstore
 from apps.vaultwarden.backup_vaultwarden import (
     build_rsync_command,
     parse_args,
@@ -65,3 +72,229 @@ def test_parse_args_uses_env_defaults(monkeypatch, tmp_path):
     assert Path(args.target) == Path("/tmp/target")
     assert args.retention == 5
     assert args.log_file == env_log
+
+
+def test_run_backup_chunkstore_engine_writes_manifest(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "config.json").write_bytes(b"x" * 5000)
+    target = tmp_path / "target"
+
+    code = backup_vaultwarden.run_backup(source, target, tmp_path / "vw.log", retention=3, engine="chunkstore")
+
+    assert code == 0
+    latest = (target / "latest").resolve()
+    assert (latest / "manifest.jsonl.gz").is_file()
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["engine"] == "chunkstore"
+    assert status["chunkstore"]["files"] == 1
+
+
+def test_run_backup_chunkstore_uses_online_sqlite_copy(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    live = sqlite3.connect(source / "db.sqlite3")
+    live.execute("PRAGMA journal_mode=WAL")
+    live.execute("PRAGMA wal_autocheckpoint=0")
+    live.execute("CREATE TABLE ciphers (id INTEGER PRIMARY KEY, data TEXT)")
+    live.executemany("INSERT INTO ciphers (data) VALUES (?)", [(f"c{i}",) for i in range(200)])
+    live.commit()
+    target = tmp_path / "target"
+
+    try:
+        # Conexão aberta e sem checkpoint: as linhas só existem no -wal do diretório vivo.
+        assert (source / "db.sqlite3-wal").stat().st_size > 0
+        code = backup_vaultwarden.run_backup(source, target, tmp_path / "vw.log", retention=3, engine="chunkstore")
+    finally:
+        live.close()
+
+    assert code == 0
+    latest = (target / "latest").resolve()
+    paths = [record["path"] for record in chunkstore.read_manifest(latest)]
+    assert paths == ["db.sqlite3"]
+    assert not list(latest.glob("*.stage"))
+    restored = tmp_path / "restored"
+    chunkstore.restore_tree(latest, target / chunkstore.CHUNKS_DIRNAME, restored)
+    with closing(sqlite3.connect(restored / "db.sqlite3")) as db:
+        assert db.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        assert db.execute("SELECT count(*) FROM ciphers").fetchone() == (200,)
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["sqlite"]["pages"] > 0
+
+
+def test_run_backup_journal_skips_unchanged_and_lists_changes(tmp_path, monkeypatch):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "db.sqlite3").write_text("v1")
+    (source / "config.json").write_text("{}")
+    target = tmp_path / "target"
+    copied = []
+
+    def fake_rsync(cmd, *args, **kwargs):
+        files_from = next((arg.split("=", 1)[1] for arg in cmd if arg.startswith("--files-from=")), None)
+        if files_from:
+            copied.extend(Path(files_from).read_bytes().split(b"\0")[:-1])
+        snapshot = Path(cmd[-1])
+        snapshot.mkdir(parents=True, exist_ok=True)
+        return 0
+
+    monkeypatch.setattr(backup_vaultwarden, "_run_rsync", fake_rsync)
+    stamps = iter(["20240101_000000", "20240102_000000", "20240103_000000"])
+    monkeypatch.setattr(backup_vaultwarden, "_timestamp", stamps.__next__)
+    log = tmp_path / "vw.log"
+
+    def _run():
+        return backup_vaultwarden.run_backup(
+            source, target, log, retention=3, use_journal=True, sqlite_stage=False
+        )
+
+    assert _run() == 0
+    assert _run() == 0
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["noop"] is True
+    assert status["snapshot"].endswith("20240101_000000")
+
+    (source / "db.sqlite3").write_text("v2-maior")
+    assert _run() == 0
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["journal"]["mode"] == "files-from"
+    assert copied == [b"db.sqlite3"]
+    assert (target / "latest").resolve().name == "20240103_000000"
+
+
+def _make_wal_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE ciphers (id INTEGER PRIMARY KEY, data TEXT)")
+    conn.executemany("INSERT INTO ciphers (data) VALUES (?)", [("x" * 500,) for _ in range(200)])
+    conn.commit()
+    return conn
+
+
+def test_build_rsync_command_excludes_live_sqlite_files(tmp_path):
+    cmd = build_rsync_command(tmp_path, tmp_path / "snap", None, excludes=backup_vaultwarden.SQLITE_EXCLUDES)
+
+    assert "--exclude=/db.sqlite3" in cmd
+    assert "--exclude=/db.sqlite3-wal" in cmd
+    assert "--exclude=/db.sqlite3-shm" in cmd
+
+
+def test_backup_sqlite_db_copies_uncheckpointed_wal(tmp_path):
+    source_db = tmp_path / "db.sqlite3"
+    live = _make_wal_db(source_db)
+    dest_db = tmp_path / "snap" / "db.sqlite3"
+    dest_db.parent.mkdir()
+
+    info = backup_vaultwarden.backup_sqlite_db(source_db, dest_db, pages=2, sleep=0)
+    live.close()
+
+    assert info["pages"] > 2
+    assert info["steps"] >= info["pages"] // 2
+    assert not (dest_db.parent / "db.sqlite3-wal").exists()
+    with sqlite3.connect(dest_db) as copy:
+        assert copy.execute("SELECT count(*) FROM ciphers").fetchone()[0] == 200
+        assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def test_sqlite_stage_hardlinks_unchanged_db(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    _make_wal_db(source / "db.sqlite3").close()
+    previous = tmp_path / "snap1"
+    current = tmp_path / "snap2"
+    previous.mkdir()
+    current.mkdir()
+
+    code, _ = backup_vaultwarden._run_sqlite_stage(source, previous, None, pages=-1, sleep=0)
+    code2, extra = backup_vaultwarden._run_sqlite_stage(source, current, previous, pages=-1, sleep=0)
+
+    assert code == code2 == 0
+    assert extra["sqlite"]["deduplicated"] is True
+    assert (current / "db.sqlite3").stat().st_ino == (previous / "db.sqlite3").stat().st_ino
+
+
+def test_run_backup_native_engine_skips_live_db_and_runs_sqlite_stage(tmp_path):
+    source = tmp_path / "data"
+    (source / "attachments").mkdir(parents=True)
+    (source / "attachments" / "file.bin").write_bytes(b"anexo")
+    live = _make_wal_db(source / "db.sqlite3")
+    target = tmp_path / "backups"
+
+    code = backup_vaultwarden.run_backup(
+        source, target, tmp_path / "backup.log", retention=3, engine=backup_vaultwarden.ENGINE_NATIVE
+    )
+    live.close()
+
+    assert code == 0
+    latest = target / "latest"
+    assert (latest / "attachments" / "file.bin").read_bytes() == b"anexo"
+    assert not (latest / "db.sqlite3-wal").exists()
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["native"]["files"] == 1
+    assert status["sqlite"]["pages"] > 0
+
+
+def test_main_native_engine_applies_exclusion_profile(tmp_path):
+    source = tmp_path / "data"
+    (source / "icon_cache").mkdir(parents=True)
+    (source / "icon_cache" / "example.com.png").write_bytes(b"i" * 64)
+    (source / "attachments").mkdir()
+    (source / "attachments" / "file.bin").write_bytes(b"anexo")
+    target = tmp_path / "backups"
+
+    code = backup_vaultwarden.main(
+        [
+            "--source",
+            str(source),
+            "--target",
+            str(target),
+            "--log-file",
+            str(tmp_path / "backup.log"),
+            "--engine",
+            "native",
+            "--no-sqlite-stage",
+            "--exclude-profiles",
+            "icon_cache",
+        ]
+    )
+
+    assert code == 0
+    assert not (target / "latest" / "icon_cache").exists()
+    assert (target / "latest" / "attachments" / "file.bin").exists()
+    status = json.loads((target / "last_run.json").read_text())
+    assert status["exclusions"]["profiles"] == ["icon_cache"]
+    assert (status["exclusions"]["files"], status["exclusions"]["bytes"]) == (1, 64)
+    assert backup_vaultwarden.main(["--source", str(source), "--exclude-profiles", "previews"]) == 2
+
+
+def test_main_restore_subcommand_restores_latest_snapshot(tmp_path):
+    target = tmp_path / "backups"
+    snapshot = target / "snapshots" / "20240101_000000"
+    (snapshot / "attachments").mkdir(parents=True)
+    (snapshot / "attachments" / "file.bin").write_bytes(b"anexo")
+    (target / "latest").symlink_to(snapshot)
+
+    code = backup_vaultwarden.main(["--target", str(target), "restore", "latest", str(tmp_path / "out")])
+
+    assert code == 0
+    assert (tmp_path / "out" / "attachments" / "file.bin").read_bytes() == b"anexo"
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd não instalado")
+def test_main_export_and_extract_subcommands(tmp_path):
+    target = tmp_path / "backups"
+    snapshot = target / "snapshots" / "20240101_000000"
+    (snapshot / "attachments").mkdir(parents=True)
+    (snapshot / "attachments" / "file.bin").write_bytes(b"anexo" * 100)
+    (target / "latest").symlink_to(snapshot)
+    out = tmp_path / "export"
+
+    assert backup_vaultwarden.main(["--target", str(target), "export", "latest", str(out)]) == 0
+    index = out / "20240101_000000.index.jsonl.gz"
+    code = backup_vaultwarden.main(
+        ["--target", str(target), "extract", str(index), "attachments/file.bin", str(tmp_path / "file.bin")]
+    )
+
+    assert code == 0
+    assert (out / "20240101_000000.tar.zst").is_file()
+    assert (tmp_path / "file.bin").read_bytes() == b"anexo" * 100